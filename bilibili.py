@@ -1,5 +1,7 @@
 import requests
+import contextlib
 import re
+import errno
 import json
 import os
 import subprocess
@@ -7,8 +9,16 @@ import tempfile
 import time
 import sys
 import shutil
+import threading
+import uuid
 from urllib.parse import unquote
 
+import mp4box
+from mp4remux import remux_fragmented_mp4, build_metadata_box, detect_image_type
+from muxer import mux_pool, DEFAULT_MERGE_TIMEOUT, TRANSCODE_THREADS
+from danmaku import start_extras_fetch
+from preview import generate_preview
+
 def get_playinfo_from_bilibili(url, cookies=None):
     """
     访问B站视频页面，获取window.__playinfo__中的JSON数据
@@ -87,7 +97,7 @@ def get_video_title_and_cover(url, cookies=None):
         cookies (dict or str): Cookie信息，可以是字典或字符串格式
     
     Returns:
-        dict: 包含title和cover的字典，如果失败返回None
+        dict: 包含title、cover、owner(UP主名称)以及aid、bvid、cid的字典，如果失败返回None
     """
     
     # 设置请求头，模拟浏览器访问
@@ -122,7 +132,8 @@ def get_video_title_and_cover(url, cookies=None):
         
         result = {
             'title': '',
-            'cover': ''
+            'cover': '',
+            'owner': ''
         }
         
         # 提取视频标题
@@ -134,6 +145,22 @@ def get_video_title_and_cover(url, cookies=None):
             title = re.sub(r'_哔哩哔哩_bilibili$', '', title)
             result['title'] = title
         
+        # 提取UP主名称
+        owner_patterns = [
+            r'"owner"\s*:\s*\{\s*"mid"\s*:\s*\d+\s*,\s*"name"\s*:\s*"([^"]+)"',
+            r'<meta\s+name="author"\s+content="([^"]+)"'
+        ]
+        for pattern in owner_patterns:
+            owner_match = re.search(pattern, html_content, re.IGNORECASE)
+            if owner_match:
+                owner = owner_match.group(1)
+                try:
+                    owner = json.loads(f'"{owner}"')
+                except ValueError:
+                    pass
+                result['owner'] = owner
+                break
+        
         # 提取视频封面 - 尝试多种方式
         # 方式1: 从meta标签获取
         cover_patterns = [
@@ -184,6 +211,9 @@ def get_video_title_and_cover(url, cookies=None):
                 except json.JSONDecodeError:
                     pass
         
+        # 同一次页面解析中提取aid/bvid/cid，弹幕和字幕获取无需再次解析页面
+        result.update(extract_video_ids(html_content, url))
+        
         return result
         
     except requests.RequestException as e:
@@ -193,6 +223,70 @@ def get_video_title_and_cover(url, cookies=None):
         print(f"获取视频信息发生错误: {e}")
         return None
 
+def extract_video_ids(html_content, url=None):
+    """
+    从视频页面HTML中提取aid、bvid和当前分P的cid
+
+    Args:
+        html_content (str): 视频页面HTML
+        url (str): 视频URL，用于读取分P参数p
+
+    Returns:
+        dict: 包含aid、bvid、cid字段，未找到的字段为None
+    """
+    ids = {'aid': None, 'bvid': None, 'cid': None}
+    page_match = re.search(r'[?&]p=(\d+)', url or '')
+    page_number = int(page_match.group(1)) if page_match else 1
+
+    initial_match = re.search(r'window\.__INITIAL_STATE__\s*=\s*({.*?});', html_content, re.DOTALL)
+    if initial_match:
+        try:
+            video_data = json.loads(initial_match.group(1)).get('videoData') or {}
+            ids['aid'] = video_data.get('aid')
+            ids['bvid'] = video_data.get('bvid')
+            ids['cid'] = video_data.get('cid')
+            pages = video_data.get('pages') or []
+            if 0 < page_number <= len(pages):
+                ids['cid'] = pages[page_number - 1].get('cid', ids['cid'])
+        except (json.JSONDecodeError, AttributeError):
+            pass
+
+    if not ids['cid']:
+        cid_match = re.search(r'"cid"\s*:\s*(\d+)', html_content)
+        if cid_match:
+            ids['cid'] = int(cid_match.group(1))
+    if not ids['aid']:
+        aid_match = re.search(r'"aid"\s*:\s*(\d+)', html_content)
+        if aid_match:
+            ids['aid'] = int(aid_match.group(1))
+    if not ids['bvid']:
+        bv_match = re.search(r'BV[a-zA-Z0-9]{10}', url or '') or re.search(r'"bvid"\s*:\s*"(BV[a-zA-Z0-9]+)"', html_content)
+        if bv_match:
+            ids['bvid'] = bv_match.group(1) if bv_match.groups() else bv_match.group()
+    return ids
+
+def canonicalize_video_url(url):
+    """
+    将视频URL规范化为视频标识，同一视频分P的不同写法（参数顺序、追踪参数、
+    移动端域名、末尾斜杠等）得到相同的标识
+
+    Args:
+        url (str): B站视频URL
+
+    Returns:
+        str: 形如 BV1xx411c7mu:p1 或 av170001:p2 的标识，无法识别视频号时返回去除参数后的URL
+    """
+    url = (url or '').strip()
+    page_match = re.search(r'[?&]p=(\d+)', url)
+    page = int(page_match.group(1)) if page_match else 1
+    bv_match = re.search(r'BV[a-zA-Z0-9]{10}', url)
+    if bv_match:
+        return f"{bv_match.group()}:p{page}"
+    av_match = re.search(r'/av(\d+)', url, re.IGNORECASE)
+    if av_match:
+        return f"av{av_match.group(1)}:p{page}"
+    return re.split(r'[?#]', url, 1)[0].rstrip('/')
+
 def load_cookies_from_file(cookie_file_path):
     """
     从文件中加载cookie
@@ -237,7 +331,37 @@ def get_highest_quality_streams(playinfo_data, url=None, cookies=None):
     
     return result
 
-def extract_video_info(playinfo_data, url=None, cookies=None):
+def get_segment_base(stream):
+    """
+    从DASH流信息中提取SegmentBase字节范围（初始化段和sidx索引段）
+    
+    Args:
+        stream (dict): playinfo中的单个视频流或音频流
+    
+    Returns:
+        dict: {'initialization': (起始, 结束), 'index_range': (起始, 结束)}，不存在时返回None
+    """
+    segment_base = stream.get('SegmentBase') or stream.get('segment_base')
+    if not isinstance(segment_base, dict):
+        return None
+    
+    initialization = segment_base.get('Initialization') or segment_base.get('initialization')
+    index_range = segment_base.get('indexRange') or segment_base.get('index_range')
+    if not initialization or not index_range:
+        return None
+    
+    try:
+        init_start, init_end = (int(x) for x in initialization.split('-'))
+        index_start, index_end = (int(x) for x in index_range.split('-'))
+    except (ValueError, AttributeError):
+        return None
+    
+    return {
+        'initialization': (init_start, init_end),
+        'index_range': (index_start, index_end)
+    }
+
+def extract_video_info(playinfo_data, url=None, cookies=None, prefer_codecs=None):
     """
     从playinfo数据中提取视频信息
     
@@ -245,6 +369,9 @@ def extract_video_info(playinfo_data, url=None, cookies=None):
         playinfo_data (dict): playinfo JSON数据
         url (str): 视频URL，用于获取标题和封面
         cookies (dict or str): Cookie信息
+        prefer_codecs (dict): 优先选择的编码，如{'video': ('avc1',), 'audio': ('mp4a',)}。
+                              同一清晰度下优先排列匹配的视频流，匹配的音频流排在最前，
+                              使输出配置可以直接使用兼容编码而无需转码
     
     Returns:
         dict: 提取的视频信息
@@ -256,6 +383,10 @@ def extract_video_info(playinfo_data, url=None, cookies=None):
         video_info = {
             'title': '',
             'cover': '',
+            'owner': '',
+            'aid': None,
+            'bvid': None,
+            'cid': None,
             'duration': 0,
             'video_urls': [],
             'audio_urls': [],
@@ -269,6 +400,9 @@ def extract_video_info(playinfo_data, url=None, cookies=None):
             if title_cover_info:
                 video_info['title'] = title_cover_info.get('title', '')
                 video_info['cover'] = title_cover_info.get('cover', '')
+                video_info['owner'] = title_cover_info.get('owner', '')
+                for key in ('aid', 'bvid', 'cid'):
+                    video_info[key] = title_cover_info.get(key)
         
         # 提取视频流信息
         if 'data' in playinfo_data and 'dash' in playinfo_data['data']:
@@ -295,11 +429,16 @@ def extract_video_info(playinfo_data, url=None, cookies=None):
                         'codecs': video.get('codecs', ''),
                         'width': video.get('width', 0),
                         'height': video.get('height', 0),
-                        'frameRate': video.get('frameRate', 0)
+                        'frameRate': video.get('frameRate', 0),
+                        'segment_base': get_segment_base(video)
                     })
                 
-                # 按质量ID降序排序视频流（质量ID越高代表质量越好）
-                video_info['video_urls'].sort(key=lambda x: x['quality'], reverse=True)
+                # 按质量ID降序排序视频流（质量ID越高代表质量越好），同一质量下优先兼容编码
+                preferred_video = (prefer_codecs or {}).get('video')
+                video_info['video_urls'].sort(
+                    key=lambda x: (x['quality'], codec_matches(x['codecs'], preferred_video)),
+                    reverse=True
+                )
                 
                 # 获取最高质量的视频流（排序后第一个就是最高质量）
                 if video_info['video_urls']:
@@ -323,7 +462,8 @@ def extract_video_info(playinfo_data, url=None, cookies=None):
                         'quality': audio.get('id', 0),
                         'url': url,
                         'bandwidth': audio.get('bandwidth', 0),
-                        'codecs': audio.get('codecs', '')
+                        'codecs': audio.get('codecs', ''),
+                        'segment_base': get_segment_base(audio)
                     })
             
             # 检查是否存在dolby音频流
@@ -347,7 +487,8 @@ def extract_video_info(playinfo_data, url=None, cookies=None):
                         'quality': dolby_stream.get('id', 0),
                         'url': dolby_url,
                         'bandwidth': dolby_stream.get('bandwidth', 0),
-                        'codecs': dolby_stream.get('codecs', '')
+                        'codecs': dolby_stream.get('codecs', ''),
+                        'segment_base': get_segment_base(dolby_stream)
                     }
                     
                     # 将dolby音频流添加到音频流列表中
@@ -374,7 +515,8 @@ def extract_video_info(playinfo_data, url=None, cookies=None):
                                 'quality': flac_stream.get('id', 30251),  # 默认FLAC质量ID
                                 'url': flac_url,
                                 'bandwidth': max(flac_stream.get('bandwidth', 1), 1),  # 确保带宽至少为1
-                                'codecs': flac_stream.get('codecs', 'fLaC')
+                                'codecs': flac_stream.get('codecs', 'fLaC'),
+                                'segment_base': get_segment_base(flac_stream)
                             }
                             
                             # 将flac音频流添加到音频流列表中
@@ -402,6 +544,12 @@ def extract_video_info(playinfo_data, url=None, cookies=None):
                             return (1, bandwidth)
                     
                     video_info['audio_urls'].sort(key=audio_sort_key, reverse=True)
+                    preferred_audio = (prefer_codecs or {}).get('audio')
+                    if preferred_audio:
+                        # 稳定排序：兼容编码的音频流排在前面，各自内部保持原有质量顺序
+                        video_info['audio_urls'].sort(
+                            key=lambda x: codec_matches(x['codecs'], preferred_audio), reverse=True
+                        )
                     
                     # 获取最高质量的音频流（排序后第一个就是最高质量）
                     video_info['highest_audio_url'] = video_info['audio_urls'][0]
@@ -428,6 +576,103 @@ def extract_video_info(playinfo_data, url=None, cookies=None):
         print(f"提取视频信息失败: {e}")
         return None
 
+# 编码别名到DASH codecs前缀的映射
+CODEC_ALIASES = {
+    'avc': ('avc1', 'avc3'),
+    'h264': ('avc1', 'avc3'),
+    'hevc': ('hev1', 'hvc1'),
+    'h265': ('hev1', 'hvc1'),
+    'av1': ('av01',)
+}
+
+# 流选择策略
+SELECTION_POLICIES = {
+    'quality': '按清晰度索引选择（默认）',
+    'smallest': '满足最低分辨率时体积最小',
+    'bandwidth': '带宽上限内清晰度最高',
+    'codec': '优先指定编码'
+}
+
+def resolve_codec_prefixes(codec):
+    """
+    将编码名称（avc/hevc/av1或codecs前缀）转换为codecs前缀元组
+
+    Args:
+        codec (str or tuple): 编码名称、前缀或前缀元组
+
+    Returns:
+        tuple: codecs前缀，codec为空时返回None
+    """
+    if not codec:
+        return None
+    if isinstance(codec, (tuple, list)):
+        return tuple(codec)
+    codec = codec.lower()
+    return CODEC_ALIASES.get(codec, (codec,))
+
+def select_video_stream_by_policy(video_streams, policy='quality', min_height=None, max_bandwidth=None, codec=None, index=0):
+    """
+    根据策略从视频流中选择一个，综合考虑bandwidth、codecs、width/height和frameRate
+
+    - quality: 按索引在完整列表中选择清晰度（与原有行为一致）
+    - smallest: 高度不低于min_height的流中带宽最小的（同一分辨率下通常是AV1/HEVC），
+                没有满足条件的流时选择分辨率最高的流中带宽最小的
+    - bandwidth: 带宽不超过max_bandwidth的流中清晰度最高的，同清晰度取带宽较小者；
+                 全部超出时选择带宽最小的流
+    - codec: 指定编码中清晰度最高的流
+
+    codec参数对所有策略生效：存在匹配编码的流时只在这些流中选择，不存在时忽略；
+    quality策略下索引始终对应完整列表，codec只在索引选中的清晰度内挑选编码
+
+    Args:
+        video_streams (list): extract_video_info返回的video_urls
+        policy (str): 策略名，见SELECTION_POLICIES
+        min_height (int): smallest策略的最低分辨率高度（如1080）
+        max_bandwidth (int): bandwidth策略的视频带宽上限（bps）
+        codec (str or tuple): 优先编码，如'avc'、'hevc'、'av1'
+        index (int): quality策略下的清晰度索引
+
+    Returns:
+        dict: 选中的视频流，列表为空时返回None
+    """
+    if not video_streams:
+        return None
+
+    candidates = video_streams
+    prefixes = resolve_codec_prefixes(codec)
+    if prefixes:
+        matched = [stream for stream in video_streams if codec_matches(stream.get('codecs'), prefixes)]
+        if matched:
+            candidates = matched
+
+    def quality_key(stream):
+        return (stream.get('quality', 0), stream.get('height', 0), float(stream.get('frameRate') or 0))
+
+    if policy == 'smallest':
+        eligible = [stream for stream in candidates if stream.get('height', 0) >= min_height] if min_height else []
+        if not eligible:
+            # 未指定或没有满足最低分辨率的流时，在分辨率最高的流中选择
+            top_height = max(stream.get('height', 0) for stream in candidates)
+            eligible = [stream for stream in candidates if stream.get('height', 0) == top_height]
+        return min(eligible, key=lambda stream: (stream.get('bandwidth', 0), tuple(-value for value in quality_key(stream))))
+
+    if policy == 'bandwidth':
+        if max_bandwidth:
+            eligible = [stream for stream in candidates if stream.get('bandwidth', 0) <= max_bandwidth]
+            if eligible:
+                return max(eligible, key=lambda stream: (quality_key(stream), -stream.get('bandwidth', 0)))
+        return min(candidates, key=lambda stream: stream.get('bandwidth', 0))
+
+    if policy == 'codec':
+        return max(candidates, key=lambda stream: (quality_key(stream), -stream.get('bandwidth', 0)))
+
+    # quality策略：索引对应完整列表中的清晰度，指定编码时在同一清晰度中优先选择匹配编码的流
+    if index >= len(video_streams) or index < 0:
+        index = 0
+    chosen = video_streams[index]
+    same_quality = [stream for stream in candidates if stream.get('quality') == chosen.get('quality')]
+    return same_quality[0] if same_quality else chosen
+
 def get_quality_name(quality_id):
     """
     根据质量ID获取中文质量名称
@@ -484,17 +729,240 @@ def format_bytes(bytes_num):
         bytes_num /= 1024.0
     return f"{bytes_num:.1f}TB"
 
+class DiskSpaceManager:
+    """
+    磁盘空间预留管理
+
+    下载任务开始前按预计大小预留空间，预留无法满足时拒绝或排队等待，
+    避免多个大文件并发下载时中途写满磁盘导致全部失败。
+    """
+
+    def __init__(self, safety_margin=512 * 1024 * 1024):
+        """
+        Args:
+            safety_margin (int): 始终保留的磁盘余量（字节）
+        """
+        self.safety_margin = safety_margin
+        self.condition = threading.Condition()
+        self.reservations = {}
+        self.next_id = 1
+
+    def get_free_bytes(self, directory):
+        """
+        获取目录所在磁盘的剩余空间
+
+        Args:
+            directory (str): 目录路径
+
+        Returns:
+            int: 剩余字节数
+        """
+        os.makedirs(directory, exist_ok=True)
+        return shutil.disk_usage(directory).free
+
+    def get_outstanding_bytes(self, directory):
+        """
+        获取目录所在磁盘上已预留但尚未实际占用的字节数
+
+        Args:
+            directory (str): 目录路径
+
+        Returns:
+            int: 未占用的预留字节数
+        """
+        device = os.stat(directory).st_dev
+        with self.condition:
+            return sum(
+                max(r['size'] - r['committed'], 0)
+                for r in self.reservations.values() if r['device'] == device
+            )
+
+    def get_available_bytes(self, directory):
+        """
+        获取扣除预留和安全余量后仍可分配的字节数
+
+        Args:
+            directory (str): 目录路径
+
+        Returns:
+            int: 可分配字节数，可能为负
+        """
+        return self.get_free_bytes(directory) - self.get_outstanding_bytes(directory) - self.safety_margin
+
+    def try_reserve(self, directory, size):
+        """
+        尝试立即预留空间
+
+        Args:
+            directory (str): 下载目录
+            size (int): 预计需要的字节数
+
+        Returns:
+            int: 预留ID，空间不足时返回None
+        """
+        os.makedirs(directory, exist_ok=True)
+        with self.condition:
+            if self.get_available_bytes(directory) < size:
+                return None
+            reservation_id = self.next_id
+            self.next_id += 1
+            self.reservations[reservation_id] = {
+                'device': os.stat(directory).st_dev,
+                'directory': directory,
+                'size': size,
+                'committed': 0
+            }
+            return reservation_id
+
+    def reserve(self, directory, size, timeout=0, wait_callback=None, cancel_event=None):
+        """
+        预留空间，空间不足时最多排队等待timeout秒
+
+        Args:
+            directory (str): 下载目录
+            size (int): 预计需要的字节数
+            timeout (float): 最长等待时间（秒），0表示不等待直接拒绝
+            wait_callback (function): 开始排队时调用一次，无参数
+            cancel_event (threading.Event): 等待期间被设置时放弃预留
+
+        Returns:
+            int: 预留ID，超时仍无法满足或被取消时返回None
+        """
+        deadline = time.time() + (timeout or 0)
+        notified = False
+        with self.condition:
+            while True:
+                reservation_id = self.try_reserve(directory, size)
+                if reservation_id is not None:
+                    return reservation_id
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return None
+                if cancel_event is not None and cancel_event.is_set():
+                    return None
+                if wait_callback and not notified:
+                    wait_callback()
+                    notified = True
+                # 其他任务释放预留时会被唤醒；同时定期复查，兼顾外部进程释放的空间和取消标志
+                self.condition.wait(min(remaining, 0.5 if cancel_event is not None else 5))
+
+    def commit(self, reservation_id, size):
+        """
+        记录预留中已实际分配到磁盘的字节数（如文件预分配后）
+
+        Args:
+            reservation_id (int): 预留ID
+            size (int): 新增已分配字节数
+        """
+        with self.condition:
+            if reservation_id in self.reservations:
+                self.reservations[reservation_id]['committed'] += size
+
+    def release(self, reservation_id):
+        """
+        释放预留并唤醒排队中的任务
+
+        Args:
+            reservation_id (int): 预留ID
+        """
+        with self.condition:
+            if self.reservations.pop(reservation_id, None) is not None:
+                self.condition.notify_all()
+
+    def get_stats(self, directory):
+        """
+        获取目录所在磁盘的空间统计
+
+        Args:
+            directory (str): 目录路径
+
+        Returns:
+            dict: 包含total、free、reserved、available、reservations字段
+        """
+        os.makedirs(directory, exist_ok=True)
+        usage = shutil.disk_usage(directory)
+        device = os.stat(directory).st_dev
+        with self.condition:
+            reservations = [r for r in self.reservations.values() if r['device'] == device]
+        reserved = sum(max(r['size'] - r['committed'], 0) for r in reservations)
+        return {
+            'total': usage.total,
+            'free': usage.free,
+            'reserved': reserved,
+            'safety_margin': self.safety_margin,
+            'available': usage.free - reserved - self.safety_margin,
+            'reservations': len(reservations)
+        }
+
+# 全局磁盘空间管理器
+disk_space_manager = DiskSpaceManager()
+
+def estimate_stream_size(stream, duration):
+    """
+    根据带宽和时长估算流的大小
+
+    Args:
+        stream (dict): extract_video_info返回的视频流或音频流信息
+        duration (float): 时长（秒）
+
+    Returns:
+        int: 估算字节数（含10%余量）
+    """
+    if not stream or not duration:
+        return 0
+    return int(stream.get('bandwidth', 0) * duration / 8 * 1.1)
+
+def preallocate_file(f, size):
+    """
+    为文件预分配磁盘空间，空间不足时立即失败而不是写到一半才失败
+
+    Args:
+        f (file): 以二进制写模式打开的文件对象
+        size (int): 需要预分配的字节数
+
+    Returns:
+        bool: 是否完成了预分配（系统不支持时返回False）
+
+    Raises:
+        OSError: 磁盘空间不足
+    """
+    if size <= 0 or not hasattr(os, 'posix_fallocate'):
+        return False
+    try:
+        os.posix_fallocate(f.fileno(), 0, size)
+        return True
+    except OSError as e:
+        # 部分文件系统不支持fallocate，此时跳过预分配
+        if e.errno in (errno.EOPNOTSUPP, errno.ENOSYS, errno.EINVAL):
+            return False
+        raise
+
 # 已移除show_progress_bar函数，改为直接在download_stream中显示百分比进度
 
-def download_stream(url, output_path, headers=None, progress_callback=None):
+# 下载数据不完整时，使用Range请求断点续传的最大次数
+MAX_RESUME_ATTEMPTS = 3
+
+def is_paused(cancel_event):
+    """判断停止标志是否表示暂停（暂停时保留已下载的部分文件以便续传）"""
+    return cancel_event is not None and cancel_event.is_set() and getattr(cancel_event, 'paused', False)
+
+def download_stream(url, output_path, headers=None, progress_callback=None, reservation_id=None, cancel_event=None, resume=False):
     """
     下载视频流或音频流
     
+    连接提前结束导致数据少于content-length时自动用Range请求续传缺失部分；
+    下载完成后校验字节数和MP4 box结构，box被截断时截断到最后一个完整的顶层box，
+    从该位置用Range请求重新获取，与续传共用MAX_RESUME_ATTEMPTS次重试，仍失败时返回False
+    
     Args:
         url (str): 流地址
         output_path (str): 输出文件路径
         headers (dict): 请求头
         progress_callback (function): 进度回调函数，接收(current, total, message)参数
+        reservation_id (int): 准入时通过disk_space_manager获得的预留ID，为None时下载前单独检查剩余空间
+        cancel_event (threading.Event): 每写入一块数据检查一次，被设置时停止下载；
+                                        停止标志表示暂停时保留已下载部分，否则删除文件
+        resume (bool): 输出文件已存在时从其末尾用Range请求继续下载（用于恢复暂停的任务）
     
     Returns:
         bool: 下载是否成功
@@ -505,50 +973,150 @@ def download_stream(url, output_path, headers=None, progress_callback=None):
             'Referer': 'https://www.bilibili.com/'
         }
     
+    preallocated = False
+    downloaded_size = 0
+    existing_size = os.path.getsize(output_path) if resume and os.path.exists(output_path) else 0
     try:
-        print(f"开始下载: {output_path}", flush=True)
-        response = requests.get(url, headers=headers, stream=True, timeout=30)
-        response.raise_for_status()
-        
-        total_size = int(response.headers.get('content-length', 0))
-        downloaded_size = 0
+        response = None
+        if existing_size:
+            print(f"从已下载的 {format_bytes(existing_size)} 处继续下载: {output_path}", flush=True)
+            response = requests.get(url, headers={**headers, 'Range': f'bytes={existing_size}-'}, stream=True, timeout=30)
+            content_range = response.headers.get('content-range', '')
+            if response.status_code == 206 and content_range.startswith(f"bytes {existing_size}-"):
+                total_size = int(content_range.rsplit('/', 1)[-1]) if not content_range.endswith('/*') else 0
+                downloaded_size = existing_size
+            elif response.status_code == 416 and content_range == f"bytes */{existing_size}":
+                # 暂停前已下载完整，只需重新校验
+                response.close()
+                verification = mp4box.verify_mp4_file(output_path, existing_size)
+                if verification['ok']:
+                    print(f"文件已完整下载: {output_path}", flush=True)
+                    return True
+                print(f"已下载的文件校验失败，重新下载: {verification['error']}", flush=True)
+                response = None
+                existing_size = 0
+            else:
+                # 服务器不支持续传或文件已变化，从头下载
+                print(f"无法续传 (HTTP {response.status_code})，重新下载", flush=True)
+                response.close()
+                response = None
+                existing_size = 0
+        if response is None:
+            print(f"开始下载: {output_path}", flush=True)
+            response = requests.get(url, headers=headers, stream=True, timeout=30)
+            response.raise_for_status()
+            total_size = int(response.headers.get('content-length', 0))
         start_time = time.time()
+        start_size = downloaded_size
+        
+        # 未经过准入预留的下载，开始写入前先确认磁盘空间足够
+        if total_size > 0 and reservation_id is None:
+            output_dir = os.path.dirname(os.path.abspath(output_path))
+            if disk_space_manager.get_available_bytes(output_dir) < total_size:
+                print(f"\n磁盘空间不足: 需要 {format_bytes(total_size)}，"
+                      f"可用 {format_bytes(max(disk_space_manager.get_available_bytes(output_dir), 0))}", flush=True)
+                return False
+        
+        def report_progress():
+            elapsed_time = time.time() - start_time
+            if elapsed_time > 0:
+                speed = (downloaded_size - start_size) / elapsed_time
+                speed_str = f"{format_bytes(speed)}/s"
+            else:
+                speed_str = "--/s"
+            
+            # 显示下载进度百分比
+            if total_size > 0:
+                progress = (downloaded_size / total_size) * 100
+                
+                # 控制台输出
+                print(f"\r下载进度: {progress:.1f}% ({format_bytes(downloaded_size)}/{format_bytes(total_size)}) 速度: {speed_str}", end='', flush=True)
+                
+                # API回调
+                if progress_callback:
+                    progress_callback(downloaded_size, total_size, f"下载进度: {progress:.1f}%")
+            else:
+                # 如果无法获取总大小，显示已下载大小
+                print(f"\r已下载: {format_bytes(downloaded_size)} 速度: {speed_str}", end='', flush=True)
+                
+                # API回调
+                if progress_callback:
+                    progress_callback(downloaded_size, 0, f"已下载: {format_bytes(downloaded_size)}")
+        
+        with open(output_path, 'r+b' if existing_size else 'wb') as f:
+            f.seek(existing_size)
+            # 预分配文件空间，磁盘不足时在下载开始前就失败
+            preallocated = preallocate_file(f, total_size)
+            if preallocated and reservation_id is not None:
+                disk_space_manager.commit(reservation_id, total_size)
+            
+            resume_attempts = 0
+            while True:
+                try:
+                    for chunk in response.iter_content(chunk_size=8192):
+                        if cancel_event is not None and cancel_event.is_set():
+                            raise InterruptedError("下载已暂停" if is_paused(cancel_event) else "下载已取消")
+                        if chunk:
+                            f.write(chunk)
+                            downloaded_size += len(chunk)
+                            report_progress()
+                except requests.exceptions.RequestException as stream_error:
+                    print(f"\n下载中断: {stream_error}", flush=True)
+                except InterruptedError:
+                    f.truncate(downloaded_size)
+                    raise
+                finally:
+                    response.close()
+                
+                if total_size <= 0 or downloaded_size >= total_size:
+                    # 字节数完整（或无法得知总大小，只能靠box结构发现截断）时校验box结构
+                    f.flush()
+                    verification = mp4box.verify_mp4_file(output_path, total_size or None)
+                    if verification['ok'] or resume_attempts >= MAX_RESUME_ATTEMPTS:
+                        break
+                    # 从最后一个完整的顶层box之后重新获取；box都完整但结构不对时无法定位损坏位置，从头获取
+                    valid_bytes = verification['valid_bytes'] if verification['valid_bytes'] < downloaded_size else 0
+                    f.seek(valid_bytes)
+                    f.truncate()
+                    downloaded_size = valid_bytes
+                    resume_attempts += 1
+                    print(f"\n文件校验失败: {verification['error']}，从 {format_bytes(downloaded_size)} 处重新获取 "
+                          f"(第{resume_attempts}次)...", flush=True)
+                elif resume_attempts >= MAX_RESUME_ATTEMPTS:
+                    break
+                else:
+                    # 连接提前结束：用Range请求从断点处重新获取缺失的数据
+                    resume_attempts += 1
+                    print(f"\n数据不完整 ({format_bytes(downloaded_size)}/{format_bytes(total_size)})，"
+                          f"从断点续传 (第{resume_attempts}次)...", flush=True)
+                try:
+                    response = requests.get(url, headers={**headers, 'Range': f'bytes={downloaded_size}-'},
+                                            stream=True, timeout=30)
+                except requests.exceptions.RequestException as resume_error:
+                    print(f"续传请求失败: {resume_error}", flush=True)
+                    continue
+                content_range = response.headers.get('content-range', '')
+                if response.status_code != 206 or not content_range.startswith(f"bytes {downloaded_size}-"):
+                    print(f"服务器不支持断点续传 (HTTP {response.status_code})", flush=True)
+                    response.close()
+                    break
+                if total_size <= 0 and not content_range.endswith('/*'):
+                    # 首次响应没有content-length时，从Content-Range得到总大小
+                    total_size = int(content_range.rsplit('/', 1)[-1])
+            
+            # 预分配后数据不足时截断多余的空白部分
+            if preallocated and downloaded_size != total_size:
+                f.truncate(downloaded_size)
         
-        with open(output_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
-                    downloaded_size += len(chunk)
-                    
-                    # 显示下载进度百分比
-                    if total_size > 0:
-                        progress = (downloaded_size / total_size) * 100
-                        elapsed_time = time.time() - start_time
-                        if elapsed_time > 0:
-                            speed = downloaded_size / elapsed_time
-                            speed_str = f"{format_bytes(speed)}/s"
-                        else:
-                            speed_str = "--/s"
-                        
-                        # 控制台输出
-                        print(f"\r下载进度: {progress:.1f}% ({format_bytes(downloaded_size)}/{format_bytes(total_size)}) 速度: {speed_str}", end='', flush=True)
-                        
-                        # API回调
-                        if progress_callback:
-                            progress_callback(downloaded_size, total_size, f"下载进度: {progress:.1f}%")
-                    else:
-                        # 如果无法获取总大小，显示已下载大小
-                        elapsed_time = time.time() - start_time
-                        if elapsed_time > 0:
-                            speed = downloaded_size / elapsed_time
-                            speed_str = f"{format_bytes(speed)}/s"
-                        else:
-                            speed_str = "--/s"
-                        print(f"\r已下载: {format_bytes(downloaded_size)} 速度: {speed_str}", end='', flush=True)
-                        
-                        # API回调
-                        if progress_callback:
-                            progress_callback(downloaded_size, 0, f"已下载: {format_bytes(downloaded_size)}")
+        if total_size > 0 and downloaded_size != total_size:
+            print(f"\n下载不完整: {format_bytes(downloaded_size)}/{format_bytes(total_size)}", flush=True)
+            return False
+        
+        # 只读取box头部校验容器结构，避免把截断的文件交给合并步骤
+        verification = mp4box.verify_mp4_file(output_path, total_size or None)
+        if not verification['ok']:
+            print(f"\n文件校验失败: {verification['error']}", flush=True)
+            return False
         
         print(f"\n下载完成: {output_path}", flush=True)
         return True
@@ -563,10 +1131,77 @@ def download_stream(url, output_path, headers=None, progress_callback=None):
         except Exception as cleanup_error:
             print(f"❌ 清理临时文件失败: {cleanup_error}", flush=True)
         raise  # 重新抛出KeyboardInterrupt异常
+    except InterruptedError as e:
+        print(f"\n{e}: {output_path} ({format_bytes(downloaded_size)})", flush=True)
+        if not is_paused(cancel_event):
+            # 取消时立即删除部分文件并释放磁盘空间
+            try:
+                os.remove(output_path)
+            except OSError:
+                pass
+        return False
     except Exception as e:
         print(f"\n下载失败: {e}", flush=True)
+        # 释放预分配但未写入的空间
+        if preallocated and os.path.exists(output_path):
+            try:
+                os.truncate(output_path, downloaded_size)
+            except OSError:
+                pass
         return False
 
+def fetch_cover_image(cover_url, output_path, headers=None, max_size=10 * 1024 * 1024):
+    """
+    下载视频封面图片
+
+    Args:
+        cover_url (str): 封面地址
+        output_path (str): 保存路径
+        headers (dict): 请求头
+        max_size (int): 允许的最大图片大小（字节）
+
+    Returns:
+        str: 封面文件路径，下载失败或不是JPEG/PNG时返回None
+    """
+    if not cover_url:
+        return None
+    if cover_url.startswith('//'):
+        cover_url = 'https:' + cover_url
+    try:
+        response = requests.get(cover_url, headers=headers, timeout=15)
+        response.raise_for_status()
+        image_data = response.content
+        if len(image_data) > max_size or not detect_image_type(image_data):
+            print(f"封面格式不受支持，跳过嵌入封面: {cover_url}", flush=True)
+            return None
+        with open(output_path, 'wb') as f:
+            f.write(image_data)
+        return output_path
+    except Exception as e:
+        print(f"下载封面失败: {e}", flush=True)
+        return None
+
+def start_cover_fetch(cover_url, output_path, headers=None):
+    """
+    在后台线程中下载封面，与视频流/音频流下载并行进行
+
+    Args:
+        cover_url (str): 封面地址
+        output_path (str): 保存路径
+        headers (dict): 请求头
+
+    Returns:
+        tuple: (线程, 结果字典)，线程结束后结果字典的path字段为封面路径或None
+    """
+    result = {'path': None}
+
+    def fetch():
+        result['path'] = fetch_cover_image(cover_url, output_path, headers)
+
+    thread = threading.Thread(target=fetch, name="cover-fetch", daemon=True)
+    thread.start()
+    return thread, result
+
 def check_ffmpeg_available():
     """
     检测系统中是否安装了FFmpeg
@@ -576,41 +1211,222 @@ def check_ffmpeg_available():
     """
     return shutil.which('ffmpeg') is not None
 
-def merge_video_audio_with_ffmpeg(video_path, audio_path, output_path):
+# 输出配置：video_codecs/audio_codecs为可直接复制的编码前缀（None表示任何编码都直接复制），
+# 不匹配时使用video_args/audio_args转码。转码使用CPU预设并限制每个任务的线程数
+OUTPUT_PROFILES = {
+    'copy': {
+        'name': '原始流（不转码）',
+        'audio_only': False,
+        'video_codecs': None,
+        'audio_codecs': None,
+        'video_args': [],
+        'audio_args': []
+    },
+    'compat': {
+        'name': 'H.264/AAC 兼容',
+        'audio_only': False,
+        'video_codecs': ('avc1',),
+        'audio_codecs': ('mp4a',),
+        'video_args': ['-c:v', 'libx264', '-preset', 'veryfast', '-crf', '23',
+                       '-pix_fmt', 'yuv420p', '-threads', str(TRANSCODE_THREADS)],
+        'audio_args': ['-c:a', 'aac', '-b:a', '192k']
+    },
+    'audio_aac': {
+        'name': '仅音频 AAC',
+        'audio_only': True,
+        'video_codecs': None,
+        'audio_codecs': ('mp4a',),
+        'video_args': [],
+        'audio_args': ['-c:a', 'aac', '-b:a', '192k']
+    }
+}
+
+def codec_matches(codecs, prefixes):
+    """
+    判断编码字符串是否匹配任一编码前缀
+
+    Args:
+        codecs (str): 流的编码，如'avc1.640032'、'hev1.1.6.L150.90'
+        prefixes (tuple): 编码前缀，为None时视为不限制
+
+    Returns:
+        bool: 是否匹配
+    """
+    if not prefixes:
+        return False
+    codecs = (codecs or '').lower()
+    return any(codecs.startswith(prefix) for prefix in prefixes)
+
+def get_profile_codec_args(profile, video_codecs=None, audio_codecs=None):
+    """
+    根据输出配置和输入流编码，决定每个流是直接复制还是转码
+
+    Args:
+        profile (str): OUTPUT_PROFILES中的配置名
+        video_codecs (str): 视频流编码，None表示没有视频流
+        audio_codecs (str): 音频流编码
+
+    Returns:
+        tuple: (视频编码参数, 音频编码参数, 是否需要转码)
+    """
+    config = OUTPUT_PROFILES.get(profile or 'copy', OUTPUT_PROFILES['copy'])
+    video_args = ['-c:v', 'copy']
+    audio_args = ['-c:a', 'copy']
+    transcode = False
+    if video_codecs is not None and config['video_codecs'] and not codec_matches(video_codecs, config['video_codecs']):
+        video_args = config['video_args']
+        transcode = True
+    if config['audio_codecs'] and not codec_matches(audio_codecs, config['audio_codecs']):
+        audio_args = config['audio_args']
+        transcode = True
+    return video_args, audio_args, transcode
+
+def build_metadata_args(metadata):
+    """
+    将标签信息转换为ffmpeg的-metadata参数
+
+    Args:
+        metadata (dict): 标签信息，如{'title': ..., 'artist': ..., 'comment': ...}
+
+    Returns:
+        list: ffmpeg参数
+    """
+    args = []
+    for key, value in (metadata or {}).items():
+        if value:
+            args += ['-metadata', f"{key}={value}"]
+    return args
+
+def build_merge_command(video_path, audio_path, output_path, video_args=None, audio_args=None, metadata=None, cover_path=None):
+    """
+    构建合并视频和音频的ffmpeg命令
+    
+    Args:
+        video_path (str): 视频文件路径
+        audio_path (str): 音频文件路径
+        output_path (str): 输出文件路径
+        video_args (list): 视频编码参数，默认直接复制
+        audio_args (list): 音频编码参数，默认直接复制
+        metadata (dict): 在同一次合并中写入的标签信息
+        cover_path (str): 封面图片路径，作为attached_pic写入
+    
+    Returns:
+        list: ffmpeg命令及参数
+    """
+    cmd = [
+        'ffmpeg',
+        '-nostdin',
+        '-progress', 'pipe:1',  # 进度信息以key=value形式输出到标准输出
+        '-nostats',
+        '-i', video_path,
+        '-i', audio_path
+    ]
+    if cover_path:
+        cmd += ['-i', cover_path]
+    cmd += [
+        '-map', '0:v:0',
+        '-map', '1:a:0',
+        *(video_args or ['-c:v', 'copy']),  # 默认视频流直接复制，不重新编码
+        *(audio_args or ['-c:a', 'copy'])  # 默认音频流直接复制，不重新编码
+    ]
+    if cover_path:
+        # 封面作为第二个视频流直接复制，标记为附加图片，不受视频转码参数影响
+        cmd += ['-map', '2:v:0', '-c:v:1', 'copy', '-disposition:v:1', 'attached_pic']
+    cmd += build_metadata_args(metadata)
+    cmd += ['-y', output_path]  # 覆盖输出文件
+    return cmd
+
+def make_ffmpeg_progress_handler(duration, progress_callback, start=80, end=99, message="正在合并视频和音频"):
+    """
+    创建解析ffmpeg -progress输出的回调，将已处理时长换算为任务进度
+
+    Args:
+        duration (float): 媒体总时长（秒），来自playinfo
+        progress_callback (function): 进度回调函数
+        start (int): 合并开始时的进度值
+        end (int): 合并完成前的最大进度值
+        message (str): 进度消息前缀
+
+    Returns:
+        function: 接收ffmpeg标准输出行的回调，无法计算进度时返回None
+    """
+    if not progress_callback or not duration or duration <= 0:
+        return None
+    state = {'last': -1}
+
+    def handle_line(line):
+        key, _, value = line.partition('=')
+        # out_time_ms的单位实际上是微秒，新版ffmpeg另外提供out_time_us
+        if key not in ('out_time_us', 'out_time_ms'):
+            return
+        try:
+            seconds = int(value) / 1000000
+        except ValueError:
+            return  # 开始阶段可能输出N/A
+        ratio = min(max(seconds / duration, 0), 1)
+        percent = int(ratio * 100)
+        if percent != state['last']:
+            state['last'] = percent
+            progress_callback(start + int(ratio * (end - start)), 100, f"{message}... {percent}%")
+
+    return handle_line
+
+def merge_video_audio_with_ffmpeg(video_path, audio_path, output_path, duration=None, progress_callback=None, cancel_event=None, timeout=DEFAULT_MERGE_TIMEOUT, video_args=None, audio_args=None, transcode=False, metadata=None, cover_path=None):
     """
-    使用ffmpeg合并视频和音频
+    使用ffmpeg合并视频和音频（在独立的合并进程池中排队执行）
     
     Args:
         video_path (str): 视频文件路径
         audio_path (str): 音频文件路径
         output_path (str): 输出文件路径
+        duration (float): 视频时长（秒），用于根据ffmpeg进度输出计算合并进度
+        progress_callback (function): 进度回调函数
+        cancel_event (threading.Event): 被设置时结束ffmpeg进程并删除未完成的输出
+        timeout (float): 合并超时时间（秒）
+        video_args (list): 视频编码参数，默认直接复制
+        audio_args (list): 音频编码参数，默认直接复制
+        transcode (bool): 是否为转码任务，转码在合并池的独立通道中排队
+        metadata (dict): 在合并时一并写入的标签信息
+        cover_path (str): 在合并时一并写入的封面图片
     
     Returns:
         bool: 合并是否成功
     """
+    # 先写入临时文件，成功后原子重命名，进程崩溃或被结束时不会留下半成品
+    root, ext = os.path.splitext(output_path)
+    temp_output_path = f"{root}.part{ext}"
     try:
         # 构建ffmpeg命令
-        cmd = [
-            'ffmpeg',
-            '-i', video_path,
-            '-i', audio_path,
-            '-c:v', 'copy',  # 视频流直接复制，不重新编码
-            '-c:a', 'copy',  # 音频流直接复制，不重新编码
-            '-y',  # 覆盖输出文件
-            output_path
-        ]
+        cmd = build_merge_command(video_path, audio_path, temp_output_path, video_args, audio_args, metadata, cover_path)
         
-        print(f"开始合并视频和音频...", flush=True)
+        print(f"开始{'转码' if transcode else '合并'}视频和音频...", flush=True)
         print(f"命令: {' '.join(cmd)}", flush=True)
         
-        # 执行ffmpeg命令
-        result = subprocess.run(cmd, capture_output=True, text=True, encoding='utf-8')
-        
-        if result.returncode == 0:
+        # 在合并进程池中执行ffmpeg命令，进度从标准输出解析，错误输出按行流式读取
+        result = mux_pool.run(
+            cmd,
+            stdout_callback=make_ffmpeg_progress_handler(
+                duration, progress_callback, message="正在转码视频和音频" if transcode else "正在合并视频和音频"
+            ),
+            cancel_event=cancel_event,
+            timeout=timeout,
+            lane='transcode' if transcode else 'copy'
+        )
+        
+        if result.returncode == 0 and not result.cancelled:
+            # 不只相信退出码，发布前校验输出文件的box结构
+            verification = mp4box.verify_mp4_file(temp_output_path)
+            if not verification['ok']:
+                print(f"合并输出校验失败: {verification['error']}", flush=True)
+                return False
+            os.replace(temp_output_path, output_path)
             print(f"合并成功: {output_path}", flush=True)
             return True
         else:
-            print(f"合并失败: {result.stderr}", flush=True)
+            if result.cancelled:
+                print(f"合并已{'取消' if result.stop_reason == 'cancelled' else '超时'}，已结束ffmpeg进程", flush=True)
+            else:
+                print(f"合并失败: {result.stderr}", flush=True)
             return False
             
     except FileNotFoundError:
@@ -619,48 +1435,415 @@ def merge_video_audio_with_ffmpeg(video_path, audio_path, output_path):
     except Exception as e:
         print(f"合并过程中发生错误: {e}", flush=True)
         return False
+    finally:
+        if os.path.exists(temp_output_path):
+            try:
+                os.remove(temp_output_path)
+            except OSError:
+                pass
 
-def merge_video_audio_smart(video_path, audio_path, output_path):
+def merge_video_audio_smart(video_path, audio_path, output_path, duration=None, progress_callback=None, cancel_event=None, timeout=DEFAULT_MERGE_TIMEOUT, profile='copy', video_codecs=None, audio_codecs=None, metadata=None, cover_path=None):
     """
-    使用FFmpeg合并视频和音频
+    合并视频和音频：优先使用纯Python分片交织（无需FFmpeg、零拷贝），
+    输入不是可直接交织的分片MP4时回退到FFmpeg
     
     Args:
         video_path (str): 视频文件路径
         audio_path (str): 音频文件路径
         output_path (str): 输出文件路径
+        duration (float): 视频时长（秒），用于计算FFmpeg合并进度
+        progress_callback (function): 进度回调函数
+        cancel_event (threading.Event): 被设置时中止合并
+        timeout (float): FFmpeg合并超时时间（秒）
+        profile (str): 输出配置（OUTPUT_PROFILES），编码不满足配置时使用FFmpeg转码
+        video_codecs (str): 视频流编码，用于判断是否需要转码
+        audio_codecs (str): 音频流编码
+        metadata (dict): 标签信息（title/artist/comment），与封面一起在同一次合并中写入，无需二次重写文件
+        cover_path (str): 封面图片路径（JPEG/PNG）
     
     Returns:
-        tuple: (是否成功, 使用的方法)
+        tuple: (是否成功, 使用的方法)，方法为"python"、"ffmpeg"、"transcode"、"cancelled"或"error"
     """
+    if cover_path and not os.path.exists(cover_path):
+        cover_path = None
+    video_args, audio_args, transcode = get_profile_codec_args(profile, video_codecs or '', audio_codecs)
+    if transcode:
+        if not check_ffmpeg_available():
+            print("错误：未检测到FFmpeg，无法按输出配置转码！", flush=True)
+            return False, "error"
+        print(f"输出配置 {profile} 需要转码: 视频{' '.join(video_args)} 音频{' '.join(audio_args)}", flush=True)
+        success = merge_video_audio_with_ffmpeg(video_path, audio_path, output_path, duration, progress_callback,
+                                                cancel_event, timeout, video_args, audio_args, transcode=True,
+                                                metadata=metadata, cover_path=cover_path)
+        if not success and cancel_event is not None and cancel_event.is_set():
+            return False, "cancelled"
+        return success, "transcode"
+    
+    metadata_boxes = None
+    if metadata or cover_path:
+        cover_data = None
+        if cover_path:
+            with open(cover_path, 'rb') as f:
+                cover_data = f.read()
+        udta = build_metadata_box(metadata, cover_data)
+        metadata_boxes = [udta] if udta else None
+    if remux_fragmented_mp4(video_path, audio_path, output_path, metadata_boxes, cancel_event=cancel_event):
+        return True, "python"
+    if cancel_event is not None and cancel_event.is_set():
+        return False, "cancelled"
     if check_ffmpeg_available():
         print("检测到FFmpeg，使用FFmpeg进行合并", flush=True)
-        success = merge_video_audio_with_ffmpeg(video_path, audio_path, output_path)
+        success = merge_video_audio_with_ffmpeg(video_path, audio_path, output_path, duration, progress_callback, cancel_event, timeout,
+                                                metadata=metadata, cover_path=cover_path)
+        if not success and cancel_event is not None and cancel_event.is_set():
+            return False, "cancelled"
         return success, "ffmpeg"
     else:
         print("错误：未检测到FFmpeg，无法进行视频合并！请安装FFmpeg并添加到系统PATH中。", flush=True)
         return False, "error"
 
-def download_only_bilibili_video(url, output_dir="downloads", cookies=None, output_filename=None, progress_callback=None):
+def check_fifo_supported():
     """
-    只下载B站视频流和音频流，不进行合并
-    
-    Args:
-        url (str): B站视频URL
-        output_dir (str): 输出目录
-        cookies (str or dict): Cookie信息
-        output_filename (str): 输出文件名前缀（不包含扩展名）
-        progress_callback (function): 进度回调函数，接收(current, total, message)参数
-    
+    检测当前系统是否支持命名管道(FIFO)，Windows下不支持
+
     Returns:
-        tuple: (视频文件路径, 音频文件路径)，失败返回(None, None)
+        bool: 是否支持命名管道
+    """
+    return hasattr(os, 'mkfifo')
+
+def feed_stream_to_pipe(url, pipe_path, headers, result, progress_callback=None, cancel_event=None):
+    """
+    将HTTP流边下载边写入命名管道，供ffmpeg读取
+
+    Args:
+        url (str): 流地址
+        pipe_path (str): 命名管道路径
+        headers (dict): 请求头
+        result (dict): 共享结果字典，写入downloaded/total/error字段
+        progress_callback (function): 每写入一块数据后调用，无参数
+        cancel_event (threading.Event): 每写入一块数据检查一次，被设置时停止下载
     """
-    video_path = None
-    audio_path = None
-    
     try:
-        # 创建输出目录
-        os.makedirs(output_dir, exist_ok=True)
-        
+        # 先打开管道，保证无论下载是否成功，ffmpeg都能读到EOF而不会永久阻塞
+        with open(pipe_path, 'wb') as pipe:
+            response = requests.get(url, headers=headers, stream=True, timeout=30)
+            response.raise_for_status()
+            result['total'] = int(response.headers.get('content-length', 0))
+
+            for chunk in response.iter_content(chunk_size=65536):
+                if cancel_event is not None and cancel_event.is_set():
+                    raise InterruptedError("下载已暂停" if is_paused(cancel_event) else "下载已取消")
+                if chunk:
+                    pipe.write(chunk)
+                    result['downloaded'] += len(chunk)
+                    if progress_callback:
+                        progress_callback()
+
+        if result['total'] > 0 and result['downloaded'] < result['total']:
+            result['error'] = f"数据不完整: {result['downloaded']}/{result['total']} 字节"
+    except Exception as e:
+        result['error'] = str(e)
+
+def start_streaming_ffmpeg(video_url, audio_url, output_args, headers=None, progress_callback=None, progress_label="边下载边合并", cancel_event=None):
+    """
+    启动流水线ffmpeg：创建命名管道，后台线程把两路HTTP流写入管道，ffmpeg同时读取并合并
+
+    Args:
+        video_url (str): 视频流地址
+        audio_url (str): 音频流地址
+        output_args (list): ffmpeg输出相关参数（输出格式、输出路径等）
+        headers (dict): 请求头
+        progress_callback (function): 进度回调函数，接收(current, total, message)参数
+        progress_label (str): 进度消息前缀
+        cancel_event (threading.Event): 被设置时写入线程停止下载
+
+    Returns:
+        dict: 流水线上下文，需要通过stop_streaming_ffmpeg清理
+    """
+    if not headers:
+        headers = {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+            'Referer': 'https://www.bilibili.com/'
+        }
+
+    pipe_dir = tempfile.mkdtemp(prefix='bili_pipe_')
+    context = {
+        'pipe_dir': pipe_dir,
+        'pipes': [os.path.join(pipe_dir, 'video.m4v'), os.path.join(pipe_dir, 'audio.m4a')],
+        'results': [{'downloaded': 0, 'total': 0, 'error': None}, {'downloaded': 0, 'total': 0, 'error': None}],
+        'writers': [],
+        'process': None,
+        # ffmpeg的错误输出写入临时文件，避免管道写满导致阻塞
+        'stderr': tempfile.TemporaryFile()
+    }
+    start_time = time.time()
+
+    def report_progress():
+        downloaded = sum(r['downloaded'] for r in context['results'])
+        total = sum(r['total'] for r in context['results'])
+        elapsed_time = time.time() - start_time
+        speed_str = f"{format_bytes(downloaded / elapsed_time)}/s" if elapsed_time > 0 else "--/s"
+        if total > 0:
+            progress = (downloaded / total) * 100
+            print(f"\r{progress_label}: {progress:.1f}% ({format_bytes(downloaded)}/{format_bytes(total)}) 速度: {speed_str}", end='', flush=True)
+            if progress_callback:
+                progress_callback(downloaded, total, f"{progress_label}: {progress:.1f}%")
+        else:
+            print(f"\r{progress_label}: 已下载 {format_bytes(downloaded)} 速度: {speed_str}", end='', flush=True)
+            if progress_callback:
+                progress_callback(downloaded, 0, f"{progress_label}: 已下载 {format_bytes(downloaded)}")
+
+    for pipe_path in context['pipes']:
+        os.mkfifo(pipe_path)
+
+    cmd = [
+        'ffmpeg',
+        '-nostdin',
+        '-loglevel', 'error',
+        '-i', context['pipes'][0],
+        '-i', context['pipes'][1],
+        '-map', '0:v:0',
+        '-map', '1:a:0',
+        '-c:v', 'copy',
+        '-c:a', 'copy'
+    ] + list(output_args)
+
+    context['process'] = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=context['stderr'])
+
+    for url, pipe_path, result in zip((video_url, audio_url), context['pipes'], context['results']):
+        writer = threading.Thread(
+            target=feed_stream_to_pipe,
+            args=(url, pipe_path, headers, result, report_progress, cancel_event),
+            daemon=True
+        )
+        writer.start()
+        context['writers'].append(writer)
+
+    return context
+
+def get_streaming_errors(context):
+    """
+    获取流水线中两路下载线程的错误信息
+
+    Args:
+        context (dict): start_streaming_ffmpeg返回的上下文
+
+    Returns:
+        list: 错误信息列表，没有错误时为空
+    """
+    for writer in context['writers']:
+        writer.join(timeout=5)
+    return [r['error'] for r in context['results'] if r['error']]
+
+def read_streaming_stderr(context):
+    """
+    读取流水线ffmpeg的错误输出
+
+    Args:
+        context (dict): start_streaming_ffmpeg返回的上下文
+
+    Returns:
+        str: ffmpeg错误输出
+    """
+    try:
+        context['stderr'].seek(0)
+        return context['stderr'].read().decode('utf-8', errors='replace')
+    except Exception:
+        return ''
+
+def stop_streaming_ffmpeg(context):
+    """
+    结束流水线：终止ffmpeg，唤醒阻塞的写入线程并删除命名管道
+
+    Args:
+        context (dict): start_streaming_ffmpeg返回的上下文
+    """
+    process = context.get('process')
+    if process and process.poll() is None:
+        process.kill()
+        process.wait()
+    if process and process.stdout:
+        process.stdout.close()
+    # ffmpeg提前退出时写入线程可能阻塞在打开管道上，以非阻塞方式打开读端将其唤醒
+    for pipe_path, writer in zip(context['pipes'], context['writers']):
+        if writer.is_alive():
+            try:
+                fd = os.open(pipe_path, os.O_RDONLY | os.O_NONBLOCK)
+                os.close(fd)
+            except OSError:
+                pass
+    context['stderr'].close()
+    shutil.rmtree(context['pipe_dir'], ignore_errors=True)
+
+def wait_streaming_ffmpeg(context, cancel_event=None):
+    """
+    等待流水线ffmpeg结束，期间轮询停止标志，被设置时立即结束ffmpeg
+
+    Args:
+        context (dict): start_streaming_ffmpeg返回的上下文
+        cancel_event (threading.Event): 停止标志
+
+    Returns:
+        bool: ffmpeg是否因停止标志被结束
+    """
+    process = context['process']
+    while True:
+        try:
+            process.wait(timeout=0.5)
+            return False
+        except subprocess.TimeoutExpired:
+            if cancel_event is not None and cancel_event.is_set():
+                process.kill()
+                process.wait()
+                return True
+
+def download_and_merge_streaming(video_url, audio_url, output_path, headers=None, progress_callback=None, metadata=None, cancel_event=None):
+    """
+    流水线模式：视频流和音频流通过命名管道直接送入ffmpeg，下载与合并同时进行，不落地临时文件
+
+    流水线没有可续传的中间文件，暂停和取消都会结束ffmpeg和写入线程并删除未完成的输出。
+
+    Args:
+        video_url (str): 视频流地址
+        audio_url (str): 音频流地址
+        output_path (str): 输出文件路径
+        headers (dict): 请求头
+        progress_callback (function): 进度回调函数，接收(current, total, message)参数
+        metadata (dict): 合并时一并写入的标签信息
+        cancel_event (threading.Event): 被设置时停止下载和合并
+
+    Returns:
+        bool: 下载合并是否成功
+    """
+    context = None
+    try:
+        print(f"开始流水线下载合并: {output_path}", flush=True)
+        context = start_streaming_ffmpeg(video_url, audio_url, build_metadata_args(metadata) + ['-y', output_path],
+                                         headers, progress_callback, cancel_event=cancel_event)
+        stopped = wait_streaming_ffmpeg(context, cancel_event)
+        if stopped or (cancel_event is not None and cancel_event.is_set()):
+            # 写入线程停止后ffmpeg可能读到EOF正常退出，输出不完整，同样删除
+            print(f"\n流水线下载已{'暂停' if is_paused(cancel_event) else '取消'}，已结束ffmpeg进程", flush=True)
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            return False
+
+        errors = get_streaming_errors(context)
+        if context['process'].returncode == 0 and not errors:
+            print(f"\n流水线合并成功: {output_path}", flush=True)
+            return True
+
+        if errors:
+            print(f"\n流水线下载失败: {'; '.join(errors)}", flush=True)
+        else:
+            print(f"\n流水线合并失败: {read_streaming_stderr(context)}", flush=True)
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        return False
+
+    except KeyboardInterrupt:
+        print(f"\n\n⚠️ 下载被用户中断，正在清理输出文件: {output_path}", flush=True)
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        raise
+    except Exception as e:
+        print(f"\n流水线下载合并过程中发生错误: {e}", flush=True)
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        return False
+    finally:
+        if context:
+            stop_streaming_ffmpeg(context)
+
+def stream_merged_fmp4(video_url, audio_url, output_path=None, headers=None, progress_callback=None, chunk_size=65536, cancel_event=None):
+    """
+    边下载边合并并实时输出分片MP4(fMP4)数据，可同时保存到本地文件
+
+    生成器在下载开始后约一秒内即可产出第一块数据，适合直接作为HTTP响应体。
+    输出先写入本次调用独有的临时文件，完整输出后才原子重命名为output_path，
+    同一视频的并发推流不会写入同一个文件；中途失败或被关闭时删除临时文件。
+
+    Args:
+        video_url (str): 视频流地址
+        audio_url (str): 音频流地址
+        output_path (str): 同时保存的本地文件路径，为None时不保存
+        headers (dict): 请求头
+        progress_callback (function): 进度回调函数，接收(current, total, message)参数
+        chunk_size (int): 每次产出的数据块大小
+        cancel_event (threading.Event): 被设置时停止下载并结束推流
+
+    Yields:
+        bytes: fMP4数据块
+
+    Raises:
+        RuntimeError: 下载或合并失败
+        InterruptedError: 推流被取消
+    """
+    context = None
+    part_path = f"{output_path}.{uuid.uuid4().hex[:8]}.part" if output_path else None
+    output_file = None
+    completed = False
+    try:
+        context = start_streaming_ffmpeg(
+            video_url, audio_url,
+            ['-movflags', 'frag_keyframe+empty_moov+default_base_moof', '-f', 'mp4', 'pipe:1'],
+            headers, progress_callback, progress_label="边下载边推流", cancel_event=cancel_event
+        )
+        if part_path:
+            output_file = open(part_path, 'wb')
+
+        while True:
+            # 写入线程停止后ffmpeg读到EOF退出，这里随之读到EOF，不会一直阻塞
+            chunk = context['process'].stdout.read1(chunk_size)
+            if cancel_event is not None and cancel_event.is_set():
+                raise InterruptedError("推流已取消")
+            if not chunk:
+                break
+            if output_file:
+                output_file.write(chunk)
+            yield chunk
+
+        context['process'].wait()
+        errors = get_streaming_errors(context)
+        if errors:
+            raise RuntimeError(f"流水线下载失败: {'; '.join(errors)}")
+        if context['process'].returncode != 0:
+            raise RuntimeError(f"流水线合并失败: {read_streaming_stderr(context)}")
+
+        if output_file:
+            output_file.close()
+            os.replace(part_path, output_path)
+        completed = True
+        print(f"\n推流完成: {output_path or '(未保存)'}", flush=True)
+    finally:
+        if output_file and not output_file.closed:
+            output_file.close()
+        if not completed and part_path and os.path.exists(part_path):
+            os.remove(part_path)
+        if context:
+            stop_streaming_ffmpeg(context)
+
+def download_only_bilibili_video(url, output_dir="downloads", cookies=None, output_filename=None, progress_callback=None):
+    """
+    只下载B站视频流和音频流，不进行合并
+    
+    Args:
+        url (str): B站视频URL
+        output_dir (str): 输出目录
+        cookies (str or dict): Cookie信息
+        output_filename (str): 输出文件名前缀（不包含扩展名）
+        progress_callback (function): 进度回调函数，接收(current, total, message)参数
+    
+    Returns:
+        tuple: (视频文件路径, 音频文件路径)，失败返回(None, None)
+    """
+    video_path = None
+    audio_path = None
+    
+    try:
+        # 创建输出目录
+        os.makedirs(output_dir, exist_ok=True)
+        
         # 获取视频信息
         if progress_callback:
             progress_callback(10, 100, "正在解析视频信息...")
@@ -845,7 +2028,9 @@ def download_and_merge_bilibili_video(url, output_dir="downloads", cookies=None,
         # 合并视频和音频
         if progress_callback:
             progress_callback(80, 100, "正在合并视频和音频...")
-        success, method = merge_video_audio_smart(temp_video_path, temp_audio_path, final_output_path)
+        success, method = merge_video_audio_smart(temp_video_path, temp_audio_path, final_output_path,
+                                                  duration=video_info.get('duration', 0),
+                                                  progress_callback=progress_callback)
         if success:
             # 清理临时文件
             try:
@@ -956,7 +2141,396 @@ def get_video_quality_options(url, cookies=None):
     except Exception as e:
         return None
 
-def select_quality_and_download(url, cookies=None, output_dir="downloads", merge=True, video_quality_index=0, audio_quality_index=0, filename=None, progress_callback=None):
+def remux_audio(input_path, output_path, metadata=None, audio_args=None, cancel_event=None):
+    """
+    使用ffmpeg将DASH音频流重新封装为独立的音频文件并写入标签
+
+    Args:
+        input_path (str): 原始音频流文件路径
+        output_path (str): 输出文件路径，扩展名决定封装格式(.m4a/.flac)
+        metadata (dict): 标签信息，如{'title': ..., 'artist': ...}
+        audio_args (list): 音频编码参数，默认直接复制（无损）；指定时作为转码任务排队
+        cancel_event (threading.Event): 被设置时结束ffmpeg进程
+
+    Returns:
+        bool: 封装是否成功
+    """
+    cmd = ['ffmpeg', '-nostdin', '-loglevel', 'error', '-i', input_path, '-vn', *(audio_args or ['-c:a', 'copy'])]
+    cmd += build_metadata_args(metadata)
+    cmd += ['-y', output_path]
+
+    try:
+        result = mux_pool.run(cmd, cancel_event=cancel_event, lane='transcode' if audio_args else 'copy')
+        if result.cancelled:
+            print(f"音频封装已{'取消' if result.stop_reason == 'cancelled' else '超时'}", flush=True)
+            return False
+        if result.returncode == 0:
+            print(f"音频封装成功: {output_path}", flush=True)
+            return True
+        print(f"音频封装失败: {result.stderr}", flush=True)
+        return False
+    except FileNotFoundError:
+        print("错误: 未找到ffmpeg，请确保ffmpeg已安装并添加到系统PATH中")
+        return False
+    except Exception as e:
+        print(f"音频封装过程中发生错误: {e}", flush=True)
+        return False
+
+def download_audio_only(selected_audio, output_dir, output_basename, headers=None, audio_format=None, metadata=None, progress_callback=None, reservation_id=None, profile='copy', cancel_event=None, resume=False, extra_files=None, transfer_slot=None):
+    """
+    仅下载音频流，可选封装为.m4a/.flac并写入标签
+
+    Args:
+        selected_audio (dict): extract_video_info返回的音频流信息
+        output_dir (str): 输出目录
+        output_basename (str): 输出文件名（不包含扩展名）
+        headers (dict): 请求头
+        audio_format (str): None保留原始音频流，'auto'按编码自动选择，'m4a'或'flac'
+        metadata (dict): 封装时写入的标签信息
+        progress_callback (function): 进度回调函数，接收(current, total, message)参数
+        reservation_id (int): 磁盘空间预留ID
+        profile (str): 输出配置（OUTPUT_PROFILES），音频编码不满足配置时转码为.m4a
+        cancel_event (threading.Event): 被设置时停止下载和封装；暂停时保留已下载的音频流以便续传
+        resume (bool): 从暂停时保留的音频流文件继续下载
+        extra_files (dict): 暂停时在partial_files中记录保留的部分文件
+        transfer_slot (function): 无参数，返回占用网络传输槽位的上下文管理器，只包住下载部分，封装时已释放
+
+    Returns:
+        str: 音频文件路径，失败、暂停或取消时返回None
+    """
+    is_flac = selected_audio['quality'] == 30251 or 'flac' in selected_audio.get('codecs', '').lower()
+    raw_extension = ".flac" if is_flac else ".m4a"
+    _, audio_args, transcode = get_profile_codec_args(profile, None, selected_audio.get('codecs', ''))
+    if not transcode:
+        audio_args = None
+    elif not check_ffmpeg_available():
+        print("未检测到FFmpeg，无法按输出配置转码，保留原始音频流", flush=True)
+        audio_args = None
+    else:
+        audio_format = 'm4a'
+
+    if audio_format == 'auto':
+        audio_format = 'flac' if is_flac else 'm4a'
+    if audio_format == 'flac' and not is_flac:
+        print("非FLAC音频流无法无损封装为.flac，改为封装为.m4a", flush=True)
+        audio_format = 'm4a'
+    if audio_format and not check_ffmpeg_available():
+        print("未检测到FFmpeg，跳过音频封装，保留原始音频流", flush=True)
+        audio_format = None
+
+    def keep_partial_file(path):
+        # 暂停时保留部分文件，恢复任务时从断点继续下载
+        if extra_files is not None:
+            extra_files['partial_files'] = [path] if os.path.exists(path) else []
+        if progress_callback:
+            progress_callback(0, 100, "任务已暂停")
+
+    if not audio_format:
+        audio_path = os.path.join(output_dir, f"{output_basename}_audio{raw_extension}")
+        if progress_callback:
+            progress_callback(30, 100, "正在下载音频流...")
+        with transfer_slot() if transfer_slot else contextlib.nullcontext():
+            downloaded = download_stream(selected_audio['url'], audio_path, headers, progress_callback, reservation_id,
+                                         cancel_event, resume)
+        if not downloaded:
+            if is_paused(cancel_event):
+                keep_partial_file(audio_path)
+            elif progress_callback:
+                progress_callback(0, 100, "音频流下载失败")
+            return None
+        if progress_callback:
+            progress_callback(100, 100, "音频文件下载完成")
+        return audio_path
+
+    temp_audio_path = os.path.join(output_dir, f"{output_basename}_temp_audio{raw_extension}")
+    audio_path = os.path.join(output_dir, f"{output_basename}.{audio_format}")
+    try:
+        if progress_callback:
+            progress_callback(30, 100, "正在下载音频流...")
+        with transfer_slot() if transfer_slot else contextlib.nullcontext():
+            downloaded = download_stream(selected_audio['url'], temp_audio_path, headers, progress_callback, reservation_id,
+                                         cancel_event, resume)
+        if not downloaded:
+            if is_paused(cancel_event):
+                keep_partial_file(temp_audio_path)
+            elif progress_callback:
+                progress_callback(0, 100, "音频流下载失败")
+            return None
+
+        if progress_callback:
+            progress_callback(90, 100, f"正在{'转码' if audio_args else '封装'}为.{audio_format}...")
+        if not remux_audio(temp_audio_path, audio_path, metadata, audio_args, cancel_event):
+            if os.path.exists(audio_path):
+                os.remove(audio_path)
+            if is_paused(cancel_event):
+                # 封装期间暂停：音频流已完整，恢复时直接重新封装
+                keep_partial_file(temp_audio_path)
+            elif progress_callback:
+                progress_callback(0, 100, "音频封装失败")
+            return None
+
+        if progress_callback:
+            progress_callback(100, 100, f"音频下载完成 ({audio_format})")
+        return audio_path
+    finally:
+        if os.path.exists(temp_audio_path) and not is_paused(cancel_event):
+            try:
+                os.remove(temp_audio_path)
+            except Exception:
+                pass  # 忽略清理错误
+
+def parse_time_value(value):
+    """
+    将时间参数解析为秒数，支持"90"、"90.5"、"01:30"、"00:01:30"等格式
+    
+    Args:
+        value (str or int or float): 时间参数
+    
+    Returns:
+        float: 秒数，value为空时返回None
+    
+    Raises:
+        ValueError: 格式无效
+    """
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float)):
+        seconds = float(value)
+    else:
+        seconds = 0.0
+        for part in str(value).strip().split(':'):
+            seconds = seconds * 60 + float(part)
+    if seconds < 0:
+        raise ValueError(f"时间不能为负数: {value}")
+    return seconds
+
+def fetch_byte_range(url, start, end, headers=None):
+    """
+    使用HTTP Range请求获取指定字节范围的数据
+    
+    Args:
+        url (str): 流地址
+        start (int): 起始字节
+        end (int): 结束字节（包含）
+        headers (dict): 请求头
+    
+    Returns:
+        bytes: 获取到的数据
+    """
+    range_headers = dict(headers or {})
+    range_headers['Range'] = f"bytes={start}-{end}"
+    expected_size = end - start + 1
+    with requests.get(url, headers=range_headers, stream=True, timeout=30) as response:
+        response.raise_for_status()
+        if response.status_code != 206 and start > 0:
+            raise RuntimeError("服务器不支持Range请求")
+        # 服务器忽略Range返回完整内容时，只读取所需的部分
+        data = b''
+        for chunk in response.iter_content(chunk_size=65536):
+            data += chunk
+            if len(data) >= expected_size:
+                break
+    data = data[:expected_size]
+    if len(data) < expected_size:
+        raise RuntimeError(f"Range数据不完整: {len(data)}/{expected_size} 字节")
+    return data
+
+def download_clip_stream(stream, output_path, start_time, end_time, headers=None, progress_callback=None, cancel_event=None):
+    """
+    根据sidx索引只下载覆盖指定时间范围的分段，写出一个可直接被ffmpeg读取的片段文件
+    
+    连接提前结束时从断点处用Range请求续传，下载完成后校验MP4 box结构，
+    校验失败时重新获取整个分段范围，与download_stream一致最多重试MAX_RESUME_ATTEMPTS次
+    
+    Args:
+        stream (dict): extract_video_info返回的视频流或音频流信息（需包含segment_base）
+        output_path (str): 输出文件路径
+        start_time (float): 起始时间（秒）
+        end_time (float): 结束时间（秒），None表示到结尾
+        headers (dict): 请求头
+        progress_callback (function): 进度回调函数，接收(current, total, message)参数
+        cancel_event (threading.Event): 每写入一块数据检查一次，被设置时停止下载并删除片段文件
+    
+    Returns:
+        float: 片段文件中第一个分段的起始时间（秒），失败、暂停或取消时返回None
+    """
+    segment_base = stream.get('segment_base')
+    if not segment_base:
+        print("该流缺少SegmentBase索引信息，无法按时间范围下载", flush=True)
+        return None
+    
+    try:
+        init_start, init_end = segment_base['initialization']
+        index_start, index_end = segment_base['index_range']
+        
+        # 初始化段和索引段通常相邻，合并为一次Range请求
+        head_data = fetch_byte_range(stream['url'], 0, max(init_end, index_end), headers)
+        sidx_pos = mp4box.find_box(head_data, 'sidx', index_start)
+        if not sidx_pos:
+            print("索引范围内未找到sidx", flush=True)
+            return None
+        sidx = mp4box.parse_sidx(head_data, sidx_pos[0])
+        segments = mp4box.select_segments(
+            mp4box.sidx_segments(sidx, sidx['box_end']),
+            start_time, end_time
+        )
+        if not segments:
+            print("指定的时间范围超出视频时长", flush=True)
+            return None
+        
+        range_start = segments[0]['start_byte']
+        range_end = segments[-1]['end_byte']
+        total_size = (init_end + 1) + (range_end - range_start + 1)
+        print(f"片段下载: {segments[0]['start_time']:.2f}s-{segments[-1]['end_time']:.2f}s, "
+              f"共{len(segments)}个分段, {format_bytes(total_size)}", flush=True)
+        
+        init_size = init_end + 1
+        downloaded_size = init_size
+        verification = None
+        attempts = 0
+        with open(output_path, 'wb') as f:
+            f.write(head_data[:init_size])
+            while True:
+                fetch_start = range_start + downloaded_size - init_size
+                range_headers = dict(headers or {})
+                range_headers['Range'] = f"bytes={fetch_start}-{range_end}"
+                try:
+                    response = requests.get(stream['url'], headers=range_headers, stream=True, timeout=30)
+                    response.raise_for_status()
+                    content_range = response.headers.get('content-range', '')
+                    if response.status_code != 206 or not content_range.startswith(f"bytes {fetch_start}-"):
+                        response.close()
+                        print("服务器不支持Range请求，无法按时间范围下载", flush=True)
+                        break
+                    try:
+                        for chunk in response.iter_content(chunk_size=65536):
+                            if cancel_event is not None and cancel_event.is_set():
+                                raise InterruptedError("下载已暂停" if is_paused(cancel_event) else "下载已取消")
+                            if chunk:
+                                chunk = chunk[:total_size - downloaded_size]
+                                f.write(chunk)
+                                downloaded_size += len(chunk)
+                                if progress_callback:
+                                    progress_callback(downloaded_size, total_size, f"片段下载进度: {downloaded_size / total_size * 100:.1f}%")
+                                if downloaded_size >= total_size:
+                                    break
+                    finally:
+                        response.close()
+                except requests.exceptions.RequestException as stream_error:
+                    print(f"片段下载中断: {stream_error}", flush=True)
+                
+                if downloaded_size >= total_size:
+                    f.flush()
+                    # 只读取box头部校验片段结构，避免把错位或损坏的分段交给ffmpeg
+                    verification = mp4box.verify_mp4_file(output_path, total_size)
+                    if verification['ok']:
+                        break
+                    print(f"片段校验失败: {verification['error']}", flush=True)
+                    # 无法判断损坏位置，保留初始化段后重新获取整个分段范围
+                    f.seek(init_size)
+                    f.truncate()
+                    downloaded_size = init_size
+                
+                if attempts >= MAX_RESUME_ATTEMPTS:
+                    break
+                attempts += 1
+                print(f"从 {downloaded_size}/{total_size} 字节处重新获取片段分段 (第{attempts}次)...", flush=True)
+        
+        if not verification or not verification['ok']:
+            print(f"片段下载失败: {downloaded_size}/{total_size} 字节", flush=True)
+            os.remove(output_path)
+            return None
+        
+        return segments[0]['start_time']
+    
+    except Exception as e:
+        print(f"片段下载失败: {e}", flush=True)
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        return None
+
+def download_clip_and_merge(selected_video, selected_audio, output_path, start_time, end_time, headers=None, progress_callback=None, cancel_event=None, timeout=DEFAULT_MERGE_TIMEOUT, transfer_slot=None):
+    """
+    按时间范围下载视频片段：只获取覆盖该时间段的DASH分段，再用ffmpeg无损裁剪合并
+    
+    Args:
+        selected_video (dict): 视频流信息，为None时只处理音频
+        selected_audio (dict): 音频流信息
+        output_path (str): 输出文件路径
+        start_time (float): 起始时间（秒）
+        end_time (float): 结束时间（秒），None表示到结尾
+        headers (dict): 请求头
+        progress_callback (function): 进度回调函数，接收(current, total, message)参数
+        cancel_event (threading.Event): 被设置时停止分段下载或结束ffmpeg进程，并删除片段文件
+                                        （片段模式没有可续传的中间文件，暂停后重新下载）
+        timeout (float): 裁剪合并的超时时间（秒）
+        transfer_slot (function): 无参数，返回占用网络传输槽位的上下文管理器，只包住分段下载，裁剪合并时已释放
+    
+    Returns:
+        bool: 是否成功
+    """
+    if not check_ffmpeg_available():
+        print("错误：未检测到FFmpeg，无法裁剪片段！", flush=True)
+        return False
+    
+    base_path = os.path.splitext(output_path)[0]
+    streams = []
+    if selected_video:
+        streams.append((selected_video, f"{base_path}_clip_video.m4v"))
+    streams.append((selected_audio, f"{base_path}_clip_audio.m4a"))
+    
+    try:
+        cmd = ['ffmpeg', '-nostdin', '-loglevel', 'error']
+        with transfer_slot() if transfer_slot else contextlib.nullcontext():
+            for stream, clip_path in streams:
+                if progress_callback:
+                    progress_callback(30, 100, "正在按时间范围下载分段...")
+                clip_base_time = download_clip_stream(stream, clip_path, start_time, end_time, headers, progress_callback,
+                                                      cancel_event)
+                if clip_base_time is None:
+                    if progress_callback and not (cancel_event is not None and cancel_event.is_set()):
+                        progress_callback(0, 100, "片段下载失败")
+                    return False
+                # 片段文件以第一个分段的起始时间为零点，-ss需相对该时间计算
+                cmd += ['-ss', f"{max(start_time - clip_base_time, 0):.3f}", '-i', clip_path]
+        
+        if end_time is not None:
+            cmd += ['-t', f"{end_time - start_time:.3f}"]
+        if selected_video:
+            cmd += ['-map', '0:v:0', '-map', '1:a:0']
+        cmd += ['-c', 'copy', '-y', output_path]
+        
+        if progress_callback:
+            progress_callback(90, 100, "正在裁剪合并片段...")
+        result = mux_pool.run(cmd, cancel_event=cancel_event, timeout=timeout)
+        if result.returncode != 0 or result.cancelled:
+            print(f"片段合并失败: {result.stop_reason or result.stderr}", flush=True)
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            return False
+        
+        print(f"片段下载完成: {output_path}", flush=True)
+        return True
+    finally:
+        for _, clip_path in streams:
+            if os.path.exists(clip_path):
+                try:
+                    os.remove(clip_path)
+                except Exception:
+                    pass  # 忽略清理错误
+
+# 下载结束后等待后台弹幕、字幕获取完成的最长时间（秒）；任务被取消或暂停时只短暂等待
+EXTRAS_JOIN_TIMEOUT = 60
+EXTRAS_STOP_JOIN_TIMEOUT = 1
+
+def task_file_tag(task_id):
+    """由任务ID生成select_quality_and_download的name_tag（任务ID的前8个字符）"""
+    return str(task_id).replace('-', '')[:8]
+
+def select_quality_and_download(url, cookies=None, output_dir="downloads", merge=True, video_quality_index=0, audio_quality_index=0, filename=None, progress_callback=None, streaming=False, audio_only=False, audio_format=None, clip_start=None, clip_end=None, disk_wait_timeout=0, cancel_event=None, merge_timeout=DEFAULT_MERGE_TIMEOUT, profile='copy',
+                                policy='quality', min_height=None, max_bandwidth=None, codec=None, embed_metadata=True,
+                                danmaku=False, subtitles=False, extra_files=None, preview=False, stage_gate=None, resume=False,
+                                name_tag=None):
     """
     选择视频质量并下载（API版本）
     
@@ -968,48 +2542,104 @@ def select_quality_and_download(url, cookies=None, output_dir="downloads", merge
         video_quality_index (int): 视频质量索引，0表示最高质量
         audio_quality_index (int): 音频质量索引，0表示最高质量
         progress_callback (function): 进度回调函数，接收(current, total, message)参数
+        streaming (bool): 合并模式下是否使用流水线模式（边下载边合并，不生成临时文件）
+        audio_only (bool): 仅下载音频流，完全跳过视频流（忽略merge参数）
+        audio_format (str): 仅音频模式下的封装格式，None保留原始音频流，'auto'按编码自动选择，'m4a'或'flac'
+        clip_start (float): 片段起始时间（秒），与clip_end任一不为None时只下载该时间范围
+        clip_end (float): 片段结束时间（秒），None表示到结尾
+        disk_wait_timeout (float): 磁盘空间不足时排队等待的最长秒数，0表示直接拒绝
+        cancel_event (threading.Event): 被设置时停止下载和合并，结束ffmpeg进程并清理临时文件；
+                                        停止标志表示暂停（paused属性为True）时保留已下载的部分文件
+        merge_timeout (float): 合并阶段的超时时间（秒）
+        profile (str): 输出配置（OUTPUT_PROFILES）。'copy'不转码；'compat'优先选择H.264/AAC流，
+                       不存在时转码；'audio_aac'仅输出AAC音频。片段模式始终直接复制
+        policy (str): 视频流选择策略（SELECTION_POLICIES），非'quality'时忽略video_quality_index
+        min_height (int): smallest策略的最低分辨率高度
+        max_bandwidth (int): bandwidth策略的总带宽上限（bps，视频+音频）
+        codec (str): 优先编码（avc/hevc/av1），未指定时使用输出配置要求的编码
+        embed_metadata (bool): 合并时写入标题、UP主、来源链接和封面（封面与流下载并行获取）
+        danmaku (bool): 同时获取弹幕并转换为ASS字幕文件（与流下载并行获取）
+        subtitles (bool): 同时获取CC/AI字幕并转换为SRT文件（与流下载并行获取）
+        extra_files (dict): 传入时在返回前写入附加文件，danmaku为ASS路径或None，subtitles为字幕信息列表，
+                            preview为预览描述信息或None
+        preview (bool): 合并完成后生成预览雪碧图和封面（只解码关键帧，在合并进程池中执行）
+        stage_gate (function): 接收阶段名称('resolve'/'transfer')和cancel_event并返回上下文管理器，用于限制该阶段的并发数；
+                               'transfer'只包住网络下载，解析和合并阶段不占用传输槽位
+        resume (bool): 从暂停时保留的部分文件继续下载（临时文件合并模式、仅下载模式和仅音频模式）
+        name_tag (str): 任务标记（如任务ID的前8位），加在所有临时文件、封面、弹幕字幕和输出文件的文件名中，
+                        使同一视频按不同选项同时下载的任务不会写入同一个文件；恢复任务时须传入相同的标记
     
     Returns:
-        str or tuple: 如果merge=True返回合并后的文件路径，否则返回(视频路径, 音频路径)
+        str or tuple: 如果merge=True、audio_only=True或片段模式返回输出文件路径，否则返回(视频路径, 音频路径)
     """
+    clip_mode = clip_start is not None or clip_end is not None
+    profile_config = OUTPUT_PROFILES.get(profile or 'copy', OUTPUT_PROFILES['copy'])
+    if profile_config['audio_only']:
+        audio_only = True
+    failed_result = None if merge or audio_only or clip_mode else (None, None)
+    reservation_id = None
+    temp_cover_path = None
+    extras_fetch = None
+    
+    def transfer_slot():
+        # 网络下载占用调度器的传输槽位（如果提供），下载结束即释放，合并在合并进程池中单独排队
+        return stage_gate('transfer', cancel_event) if stage_gate else contextlib.nullcontext()
+    
     try:
         # 获取视频信息
         if progress_callback:
             progress_callback(10, 100, "正在解析视频信息...")
-        playinfo = get_playinfo_from_bilibili(url, cookies)
-        
-        if not playinfo:
-            if progress_callback:
-                progress_callback(0, 100, "获取视频信息失败")
-            return None if merge else (None, None)
-        
-        video_info = extract_video_info(playinfo, url, cookies)
+        # 页面解析占用调度器的解析并发槽位（如果提供），与网络传输分开限流
+        with stage_gate('resolve', cancel_event) if stage_gate else contextlib.nullcontext():
+            playinfo = get_playinfo_from_bilibili(url, cookies)
+            
+            if not playinfo:
+                if progress_callback:
+                    progress_callback(0, 100, "获取视频信息失败")
+                return failed_result
+            
+            # 输出配置要求特定编码时，优先选择已有的兼容编码流以避免转码
+            prefer_codecs = {'video': profile_config['video_codecs'], 'audio': profile_config['audio_codecs']}
+            video_info = extract_video_info(playinfo, url, cookies, prefer_codecs)
         if not video_info:
             if progress_callback:
                 progress_callback(0, 100, "提取视频信息失败")
-            return None if merge else (None, None)
+            return failed_result
+        if cancel_event is not None and cancel_event.is_set():
+            return failed_result
         
-        if not video_info['video_urls'] or not video_info['audio_urls']:
+        if audio_only and not video_info['audio_urls']:
             if progress_callback:
-                progress_callback(0, 100, "未找到可用的视频流或音频流")
-            return None if merge else (None, None)
+                progress_callback(0, 100, "未找到可用的音频流")
+            return None
         
-        # 选择视频质量（默认选择最高质量）
-        if video_quality_index >= len(video_info['video_urls']):
-            video_quality_index = 0
-        selected_video = video_info['video_urls'][video_quality_index]
+        if not audio_only and (not video_info['video_urls'] or not video_info['audio_urls']):
+            if progress_callback:
+                progress_callback(0, 100, "未找到可用的视频流或音频流")
+            return failed_result
         
         # 选择音频质量（默认选择最高质量）
         if audio_quality_index >= len(video_info['audio_urls']):
             audio_quality_index = 0
         selected_audio = video_info['audio_urls'][audio_quality_index]
-        
-        # 获取质量名称
-        video_quality_name = get_quality_name(selected_video['quality'])
         audio_quality_name = get_audio_quality_name(selected_audio['quality'])
         
-        if progress_callback:
-            progress_callback(20, 100, f"已选择视频质量: {video_quality_name}, 音频质量: {audio_quality_name}")
+        # 选择视频质量（默认选择最高质量），仅音频模式不需要视频流
+        selected_video = None
+        if not audio_only:
+            if (policy and policy != 'quality') or codec:
+                # 带宽上限包含已选音频流的带宽
+                video_budget = max_bandwidth - selected_audio.get('bandwidth', 0) if max_bandwidth else None
+                selected_video = select_video_stream_by_policy(
+                    video_info['video_urls'], policy, min_height, video_budget,
+                    codec or profile_config['video_codecs'], video_quality_index
+                )
+                print(f"按策略 {policy} 选择视频流: {selected_video['width']}x{selected_video['height']} "
+                      f"{selected_video['codecs']} {selected_video['bandwidth']} bps", flush=True)
+            else:
+                if video_quality_index >= len(video_info['video_urls']):
+                    video_quality_index = 0
+                selected_video = video_info['video_urls'][video_quality_index]
         
         # 生成文件名
         if filename:
@@ -1020,6 +2650,11 @@ def select_quality_and_download(url, cookies=None, output_dir="downloads", merge
                 output_filename = bv_match.group()
             else:
                 output_filename = f"bilibili_video_{int(time.time())}"
+        if name_tag:
+            output_filename = f"{output_filename}_{name_tag}"
+        # 输出文件名包含音频质量和非默认的输出配置，不同选项的结果互不覆盖
+        audio_name = audio_quality_name.replace(' ', '_')
+        profile_suffix = '' if profile in (None, 'copy') else f"_{profile}"
         
         # 创建输出目录
         os.makedirs(output_dir, exist_ok=True)
@@ -1030,26 +2665,163 @@ def select_quality_and_download(url, cookies=None, output_dir="downloads", merge
             'Referer': 'https://www.bilibili.com/'
         }
         
-        if merge:
+        # 弹幕和字幕使用页面解析得到的cid，在后台与流下载并行获取
+        if (danmaku or subtitles) and video_info.get('cid'):
+            extras_fetch = start_extras_fetch(video_info, os.path.join(output_dir, output_filename), headers, cookies,
+                                              danmaku, subtitles, cancel_event)
+        
+        if clip_mode:
+            clip_start = clip_start or 0
+            if clip_end is not None and clip_end <= clip_start:
+                if progress_callback:
+                    progress_callback(0, 100, "片段结束时间必须大于起始时间")
+                return failed_result
+            clip_suffix = f"clip_{int(clip_start)}-{int(clip_end) if clip_end is not None else 'end'}"
+        
+        if merge and streaming and not (check_ffmpeg_available() and check_fifo_supported()):
+            print("当前环境不支持流水线模式（需要FFmpeg和命名管道），改用临时文件模式", flush=True)
+            streaming = False
+        if merge and streaming and not audio_only and get_profile_codec_args(profile, selected_video['codecs'], selected_audio['codecs'])[2]:
+            print(f"输出配置 {profile} 需要转码，改用临时文件模式", flush=True)
+            streaming = False
+        
+        # 磁盘空间准入：按带宽×时长估算所需空间并预留，不足时排队或拒绝
+        estimate_duration = video_info.get('duration', 0)
+        if clip_mode:
+            estimate_duration = (clip_end if clip_end is not None else estimate_duration) - clip_start
+        required_bytes = estimate_stream_size(selected_video, estimate_duration) + estimate_stream_size(selected_audio, estimate_duration)
+        # 片段裁剪、音频封装、临时文件合并时，中间文件与输出文件会同时存在
+        if clip_mode or (audio_only and audio_format) or (merge and not streaming and not audio_only):
+            required_bytes *= 2
+        
+        def on_disk_wait():
+            if progress_callback:
+                progress_callback(0, 100, f"磁盘空间不足，排队等待中（需要约{format_bytes(required_bytes)}）...")
+        
+        reservation_id = disk_space_manager.reserve(output_dir, required_bytes, disk_wait_timeout, on_disk_wait, cancel_event)
+        if reservation_id is None:
+            if cancel_event is not None and cancel_event.is_set():
+                return failed_result
+            available = max(disk_space_manager.get_available_bytes(output_dir), 0)
+            if progress_callback:
+                progress_callback(0, 100, f"磁盘空间不足: 需要约{format_bytes(required_bytes)}，可用{format_bytes(available)}")
+            return failed_result
+        
+        if audio_only and clip_mode:
+            # 仅音频片段
+            audio_extension = ".flac" if selected_audio['quality'] == 30251 else ".m4a"
+            clip_output_path = os.path.join(output_dir, f"{output_filename}_{audio_name}_{clip_suffix}{audio_extension}")
+            if download_clip_and_merge(None, selected_audio, clip_output_path, clip_start, clip_end, headers, progress_callback, cancel_event, merge_timeout,
+                                       transfer_slot):
+                if progress_callback:
+                    progress_callback(100, 100, "音频片段下载完成")
+                return clip_output_path
+            return None
+        
+        if audio_only:
+            # 仅音频模式：不下载视频流
+            if progress_callback:
+                progress_callback(20, 100, f"已选择音频质量: {audio_quality_name}（仅音频）")
+            return download_audio_only(selected_audio, output_dir, f"{output_filename}_{audio_name}{profile_suffix}",
+                                       headers, audio_format,
+                                       {'title': video_info.get('title', ''), 'artist': video_info.get('owner', ''), 'comment': url},
+                                       progress_callback, reservation_id, profile, cancel_event, resume, extra_files,
+                                       transfer_slot)
+        
+        # 获取质量名称
+        video_quality_name = get_quality_name(selected_video['quality'])
+        
+        if progress_callback:
+            progress_callback(20, 100, f"已选择视频质量: {video_quality_name}, 音频质量: {audio_quality_name}")
+        
+        if clip_mode:
+            # 片段模式：只下载覆盖时间范围的分段并裁剪合并（总是输出合并文件）
+            clip_output_path = os.path.join(output_dir, f"{output_filename}_{video_quality_name.replace(' ', '_')}_{audio_name}_{clip_suffix}.mp4")
+            if download_clip_and_merge(selected_video, selected_audio, clip_output_path, clip_start, clip_end, headers, progress_callback, cancel_event, merge_timeout,
+                                       transfer_slot):
+                if progress_callback:
+                    progress_callback(100, 100, "视频片段下载完成")
+                return clip_output_path
+            if progress_callback:
+                progress_callback(0, 100, "视频片段下载失败")
+            return failed_result
+        
+        if merge and streaming:
+            # 流水线模式：边下载边合并
+            final_output_path = os.path.join(output_dir, f"{output_filename}_{video_quality_name.replace(' ', '_')}_{audio_name}{profile_suffix}.mp4")
+            if progress_callback:
+                progress_callback(30, 100, "正在边下载边合并视频和音频...")
+            streaming_metadata = None
+            if embed_metadata:
+                streaming_metadata = {'title': video_info.get('title', ''), 'artist': video_info.get('owner', ''), 'comment': url}
+            # 流水线模式的合并与下载同时进行，整个过程都占用传输槽位
+            with transfer_slot():
+                streamed = download_and_merge_streaming(selected_video['url'], selected_audio['url'], final_output_path,
+                                                        headers, progress_callback, streaming_metadata, cancel_event)
+            if streamed:
+                if preview:
+                    # 流水线模式没有单独的视频流文件，直接对输出文件只解码关键帧
+                    if progress_callback:
+                        progress_callback(99, 100, "正在生成预览图...")
+                    preview_info = generate_preview(final_output_path, None, video_info.get('duration', 0), cancel_event)
+                    if extra_files is not None:
+                        extra_files['preview'] = preview_info
+                if progress_callback:
+                    progress_callback(100, 100, "视频下载和合并完成 (使用ffmpeg流水线)")
+                return final_output_path
+            if progress_callback and not (cancel_event is not None and cancel_event.is_set()):
+                progress_callback(0, 100, "流水线下载合并失败")
+            return None
+        elif merge:
             # 下载并合并模式
             temp_video_path = os.path.join(output_dir, f"{output_filename}_temp_video.m4v")
             # 如果是Hi-Res音质，使用flac扩展名作为临时文件
             temp_audio_extension = ".flac" if selected_audio['quality'] == 30251 else ".m4a"
             temp_audio_path = os.path.join(output_dir, f"{output_filename}_temp_audio{temp_audio_extension}")
-            final_output_path = os.path.join(output_dir, f"{output_filename}_{video_quality_name.replace(' ', '_')}.mp4")
+            final_output_path = os.path.join(output_dir, f"{output_filename}_{video_quality_name.replace(' ', '_')}_{audio_name}{profile_suffix}.mp4")
             
-            # 下载视频流
-            if progress_callback:
-                progress_callback(30, 100, "正在下载视频流...")
-            if not download_stream(selected_video['url'], temp_video_path, headers, progress_callback):
+            # 封面在后台与流下载并行获取，合并时与标签一起写入
+            metadata = None
+            cover_fetch = None
+            if embed_metadata:
+                metadata = {'title': video_info.get('title', ''), 'artist': video_info.get('owner', ''), 'comment': url}
+                if video_info.get('cover'):
+                    temp_cover_path = os.path.join(output_dir, f"{output_filename}_temp_cover.img")
+                    cover_fetch = start_cover_fetch(video_info['cover'], temp_cover_path, headers)
+            
+            def keep_partial_files():
+                # 暂停时保留部分文件，恢复任务时从断点继续下载
+                if extra_files is not None:
+                    extra_files['partial_files'] = [path for path in (temp_video_path, temp_audio_path) if os.path.exists(path)]
+                if progress_callback:
+                    progress_callback(0, 100, "任务已暂停")
+            
+            with transfer_slot():
+                # 下载视频流
+                if progress_callback:
+                    progress_callback(30, 100, "正在下载视频流...")
+                video_success = download_stream(selected_video['url'], temp_video_path, headers, progress_callback,
+                                                reservation_id, cancel_event, resume)
+                
+                # 下载音频流
+                audio_success = False
+                if video_success:
+                    if progress_callback:
+                        progress_callback(60, 100, "正在下载音频流...")
+                    audio_success = download_stream(selected_audio['url'], temp_audio_path, headers, progress_callback,
+                                                    reservation_id, cancel_event, resume)
+            
+            if not video_success:
+                if is_paused(cancel_event):
+                    keep_partial_files()
+                    return None
                 if progress_callback:
                     progress_callback(0, 100, "视频流下载失败")
                 return None
-            
-            # 下载音频流
-            if progress_callback:
-                progress_callback(60, 100, "正在下载音频流...")
-            if not download_stream(selected_audio['url'], temp_audio_path, headers, progress_callback):
+            if not audio_success:
+                if is_paused(cancel_event):
+                    keep_partial_files()
+                    return None
                 if os.path.exists(temp_video_path):
                     os.remove(temp_video_path)
                 if progress_callback:
@@ -1059,8 +2831,31 @@ def select_quality_and_download(url, cookies=None, output_dir="downloads", merge
             # 合并视频和音频
             if progress_callback:
                 progress_callback(80, 100, "正在合并视频和音频...")
-            success, method = merge_video_audio_smart(temp_video_path, temp_audio_path, final_output_path)
+            cover_path = None
+            if cover_fetch:
+                cover_thread, cover_result = cover_fetch
+                cover_thread.join(timeout=15)
+                cover_path = cover_result['path']
+            success, method = merge_video_audio_smart(
+                temp_video_path, temp_audio_path, final_output_path,
+                duration=video_info.get('duration', 0),
+                progress_callback=progress_callback,
+                cancel_event=cancel_event,
+                timeout=merge_timeout,
+                profile=profile,
+                video_codecs=selected_video['codecs'],
+                audio_codecs=selected_audio['codecs'],
+                metadata=metadata,
+                cover_path=cover_path
+            )
             if success:
+                if preview:
+                    # 临时视频流仍在，按其分片索引只抽取关键帧生成预览
+                    if progress_callback:
+                        progress_callback(99, 100, "正在生成预览图...")
+                    preview_info = generate_preview(final_output_path, temp_video_path, video_info.get('duration', 0), cancel_event)
+                    if extra_files is not None:
+                        extra_files['preview'] = preview_info
                 # 清理临时文件
                 try:
                     os.remove(temp_video_path)
@@ -1071,6 +2866,10 @@ def select_quality_and_download(url, cookies=None, output_dir="downloads", merge
                 if progress_callback:
                     progress_callback(100, 100, f"视频下载和合并完成 (使用{method})")
                 return final_output_path
+            elif is_paused(cancel_event):
+                # 合并期间暂停：流文件已完整，恢复时直接重新合并
+                keep_partial_files()
+                return None
             else:
                 # 合并失败，清理临时文件
                 try:
@@ -1081,24 +2880,36 @@ def select_quality_and_download(url, cookies=None, output_dir="downloads", merge
                 except Exception as e:
                     pass  # 忽略清理错误
                 if progress_callback:
-                    progress_callback(0, 100, "视频合并失败")
+                    progress_callback(0, 100, "合并已取消" if method == "cancelled" else "视频合并失败")
                 return None
         else:
             # 仅下载模式
             video_path = os.path.join(output_dir, f"{output_filename}_{video_quality_name.replace(' ', '_')}_video.m4v")
             # 如果是Hi-Res音质，使用flac扩展名
             audio_extension = ".flac" if selected_audio['quality'] == 30251 else ".m4a"
-            audio_path = os.path.join(output_dir, f"{output_filename}_{audio_quality_name}_audio{audio_extension}")
+            audio_path = os.path.join(output_dir, f"{output_filename}_{audio_name}_audio{audio_extension}")
             
-            # 下载视频流
-            if progress_callback:
-                progress_callback(30, 100, "正在下载视频流...")
-            video_success = download_stream(selected_video['url'], video_path, headers, progress_callback)
+            with transfer_slot():
+                # 下载视频流
+                if progress_callback:
+                    progress_callback(30, 100, "正在下载视频流...")
+                video_success = download_stream(selected_video['url'], video_path, headers, progress_callback, reservation_id,
+                                                cancel_event, resume)
+                
+                # 下载音频流（视频流因暂停或取消而停止时不再开始）
+                audio_success = False
+                if video_success or not (cancel_event is not None and cancel_event.is_set()):
+                    if progress_callback:
+                        progress_callback(70, 100, "正在下载音频流...")
+                    audio_success = download_stream(selected_audio['url'], audio_path, headers, progress_callback, reservation_id,
+                                                    cancel_event, resume)
             
-            # 下载音频流
-            if progress_callback:
-                progress_callback(70, 100, "正在下载音频流...")
-            audio_success = download_stream(selected_audio['url'], audio_path, headers, progress_callback)
+            if is_paused(cancel_event) and not (video_success and audio_success):
+                if extra_files is not None:
+                    extra_files['partial_files'] = [path for path in (video_path, audio_path) if os.path.exists(path)]
+                if progress_callback:
+                    progress_callback(0, 100, "任务已暂停")
+                return None, None
             
             if video_success and audio_success:
                 if progress_callback:
@@ -1117,7 +2928,22 @@ def select_quality_and_download(url, cookies=None, output_dir="downloads", merge
     except Exception as e:
         if progress_callback:
             progress_callback(0, 100, f"选择质量下载过程中发生错误: {e}")
-        return None if merge else (None, None)
+        return failed_result
+    finally:
+        if extras_fetch:
+            extras_thread, extras_result = extras_fetch
+            # 取消或暂停时不等待弹幕和字幕，尽快让出调度槽位；获取线程在当前请求结束后自行停止
+            stopped = cancel_event is not None and cancel_event.is_set()
+            extras_thread.join(timeout=EXTRAS_STOP_JOIN_TIMEOUT if stopped else EXTRAS_JOIN_TIMEOUT)
+            if extra_files is not None:
+                extra_files.update(extras_result)
+        if reservation_id is not None:
+            disk_space_manager.release(reservation_id)
+        if temp_cover_path and os.path.exists(temp_cover_path):
+            try:
+                os.remove(temp_cover_path)
+            except OSError:
+                pass  # 忽略清理错误
 
 # 示例使用
 if __name__ == "__main__":
@@ -1155,9 +2981,11 @@ if __name__ == "__main__":
         print("3. 选择质量下载并合并 (用户选择质量，生成完整MP4文件)")
         print("4. 选择质量仅下载 (用户选择质量，不合并，保留原始文件)")
         print("5. 只显示视频信息 (不下载)")
+        print("6. 仅下载音频 (用户选择音质，跳过视频流，可封装为m4a/flac)")
+        print("7. 按策略选择流下载并合并 (最小体积/带宽上限/指定编码)")
         
         try:
-            choice = input("\n请输入选项 (1/2/3/4/5): ").strip()
+            choice = input("\n请输入选项 (1/2/3/4/5/6/7): ").strip()
         except KeyboardInterrupt:
             print("\n\n👋 用户中断，程序退出！")
             break
@@ -1358,6 +3186,128 @@ if __name__ == "__main__":
             except KeyboardInterrupt:
                 print("\n⚠️ 用户取消操作")
                 continue
+        elif choice == '6':
+            # 仅下载音频
+            print(f"正在解析视频: {video_url}", flush=True)
+            playinfo = get_playinfo_from_bilibili(video_url, cookies)
+            
+            if not playinfo:
+                print("❌ 获取视频信息失败！")
+                continue
+                
+            video_info = extract_video_info(playinfo, video_url, cookies)
+            if not video_info:
+                print("❌ 提取视频信息失败！")
+                continue
+                
+            if not video_info['audio_urls']:
+                print("❌ 未找到可用的音频流！")
+                continue
+                
+            print("\n=== 可用音频质量 ===")
+            for i, audio in enumerate(video_info['audio_urls']):
+                audio_quality_name = get_audio_quality_name(audio['quality'])
+                print(f"  [{i+1}] {audio_quality_name} - {audio['bandwidth']} bps - {audio['codecs']}")
+                
+            try:
+                audio_choice = input(f"\n请选择音频质量 (1-{len(video_info['audio_urls'])}，默认1): ").strip()
+                if not audio_choice:
+                    audio_index = 0
+                else:
+                    audio_index = int(audio_choice) - 1
+                    if audio_index < 0 or audio_index >= len(video_info['audio_urls']):
+                        print("❌ 无效的音频质量选择！")
+                        continue
+                        
+                format_choice = input("请选择封装格式 (1. 自动m4a/flac并写入标签 2. 保留原始音频流，默认1): ").strip()
+                audio_format = None if format_choice == '2' else 'auto'
+                
+                audio_path = select_quality_and_download(video_url, cookies=cookies, audio_only=True,
+                                                         audio_quality_index=audio_index,
+                                                         audio_format=audio_format)
+                if audio_path:
+                    print(f"\n✅ 音频下载完成！文件保存在: {audio_path}")
+                else:
+                    print("\n❌ 音频下载失败！")
+                    
+            except ValueError:
+                print("❌ 请输入有效的数字！")
+                continue
+            except KeyboardInterrupt:
+                print("\n⚠️ 用户取消操作")
+                continue
+        elif choice == '7':
+            # 按策略选择流下载并合并
+            print(f"正在解析视频: {video_url}", flush=True)
+            playinfo = get_playinfo_from_bilibili(video_url, cookies)
+            
+            if not playinfo:
+                print("❌ 获取视频信息失败！")
+                continue
+                
+            video_info = extract_video_info(playinfo, video_url, cookies)
+            if not video_info:
+                print("❌ 提取视频信息失败！")
+                continue
+                
+            if not video_info['video_urls'] or not video_info['audio_urls']:
+                print("❌ 未找到可用的视频流或音频流！")
+                continue
+                
+            print("\n=== 可用视频流 ===")
+            for video in video_info['video_urls']:
+                quality_name = get_quality_name(video['quality'])
+                print(f"  {quality_name} - {video['width']}x{video['height']} - {video['frameRate']}fps - "
+                      f"{video['codecs']} - {video['bandwidth'] // 1000} kbps")
+                
+            print("\n=== 选择策略 ===")
+            policy_names = list(SELECTION_POLICIES)
+            for i, name in enumerate(policy_names):
+                print(f"  [{i+1}] {name} - {SELECTION_POLICIES[name]}")
+                
+            try:
+                policy_choice = input(f"\n请选择策略 (1-{len(policy_names)}，默认2): ").strip()
+                if policy_choice and not 1 <= int(policy_choice) <= len(policy_names):
+                    print("❌ 无效的策略选择！")
+                    continue
+                policy = policy_names[int(policy_choice) - 1] if policy_choice else 'smallest'
+                min_height = None
+                max_bandwidth = None
+                codec = None
+                if policy == 'smallest':
+                    height_input = input("请输入最低分辨率高度 (如1080，默认不限制): ").strip()
+                    min_height = int(height_input) if height_input else None
+                elif policy == 'bandwidth':
+                    bandwidth_input = input("请输入总带宽上限 kbps (如3000): ").strip()
+                    max_bandwidth = int(bandwidth_input) * 1000 if bandwidth_input else None
+                codec_input = input("请输入优先编码 avc/hevc/av1 (默认不限制): ").strip()
+                codec = codec_input or None
+                if policy == 'codec' and not codec:
+                    print("❌ codec策略需要指定编码！")
+                    continue
+                
+                # 与select_quality_and_download一致：总带宽上限扣除默认音频流的带宽
+                audio_bandwidth = video_info['audio_urls'][0].get('bandwidth', 0)
+                video_budget = max_bandwidth - audio_bandwidth if max_bandwidth else None
+                selected = select_video_stream_by_policy(video_info['video_urls'], policy, min_height,
+                                                         video_budget, codec)
+                print(f"\n📺 将使用: {get_quality_name(selected['quality'])} ({selected['width']}x{selected['height']}, "
+                      f"{selected['codecs']}, {selected['bandwidth'] // 1000} kbps)")
+                
+                output_path = select_quality_and_download(video_url, cookies=cookies, merge=True,
+                                                          policy=policy, min_height=min_height,
+                                                          max_bandwidth=max_bandwidth, codec=codec)
+                if output_path:
+                    print(f"\n✅ 视频下载并合并完成！文件保存在: {output_path}")
+                else:
+                    print("\n❌ 视频下载失败！")
+                    
+            except (ValueError, IndexError):
+                print("❌ 请输入有效的数字！")
+                continue
+            except KeyboardInterrupt:
+                print("\n⚠️ 用户取消操作")
+                continue
         elif choice == '5':
              # 只显示视频信息（原有功能）
              # 获取playinfo数据
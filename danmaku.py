@@ -0,0 +1,446 @@
+import requests
+import json
+import math
+import os
+import threading
+import xml.etree.ElementTree as ET
+
+# 弹幕分段接口每段覆盖6分钟
+DANMAKU_SEGMENT_SECONDS = 360
+DANMAKU_SEGMENT_API = "https://api.bilibili.com/x/v2/dm/web/seg.so"
+DANMAKU_XML_API = "https://comment.bilibili.com/{cid}.xml"
+PLAYER_INFO_API = "https://api.bilibili.com/x/player/v2"
+
+# ASS画布与弹幕显示参数
+ASS_WIDTH = 1920
+ASS_HEIGHT = 1080
+ASS_FONT_SIZE = 48
+ASS_LINE_HEIGHT = 56
+SCROLL_DURATION = 8.0
+STATIC_DURATION = 4.0
+
+def read_varint(data, pos):
+    """
+    读取protobuf变长整数
+
+    Args:
+        data (bytes): 数据
+        pos (int): 起始偏移
+
+    Returns:
+        tuple: (数值, 新偏移)
+    """
+    result = 0
+    shift = 0
+    while True:
+        if pos >= len(data):
+            raise ValueError("protobuf数据被截断")
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+def iter_protobuf_fields(data):
+    """
+    遍历protobuf消息的字段（不支持已废弃的group类型）
+
+    Args:
+        data (bytes): 消息数据
+
+    Returns:
+        generator: 依次产生(字段号, 值)，length-delimited字段的值为bytes
+    """
+    pos = 0
+    while pos < len(data):
+        key, pos = read_varint(data, pos)
+        field_number, wire_type = key >> 3, key & 0x07
+        if wire_type == 0:
+            value, pos = read_varint(data, pos)
+        elif wire_type == 2:
+            length, pos = read_varint(data, pos)
+            value = data[pos:pos + length]
+            pos += length
+        elif wire_type == 1:
+            value = data[pos:pos + 8]
+            pos += 8
+        elif wire_type == 5:
+            value = data[pos:pos + 4]
+            pos += 4
+        else:
+            raise ValueError(f"不支持的protobuf字段类型: {wire_type}")
+        yield field_number, value
+
+def parse_danmaku_segment(data):
+    """
+    解析分段弹幕接口返回的DmSegMobileReply消息
+
+    Args:
+        data (bytes): 接口返回的protobuf数据
+
+    Returns:
+        list: 弹幕字典列表，包含time(秒)、mode、size、color、content
+    """
+    items = []
+    for field_number, value in iter_protobuf_fields(data):
+        if field_number != 1:
+            continue
+        item = {'time': 0.0, 'mode': 1, 'size': 25, 'color': 0xffffff, 'content': ''}
+        for elem_field, elem_value in iter_protobuf_fields(value):
+            if elem_field == 2:
+                item['time'] = elem_value / 1000
+            elif elem_field == 3:
+                item['mode'] = elem_value
+            elif elem_field == 4:
+                item['size'] = elem_value
+            elif elem_field == 5:
+                item['color'] = elem_value
+            elif elem_field == 7:
+                item['content'] = elem_value.decode('utf-8', errors='replace')
+        if item['content']:
+            items.append(item)
+    return items
+
+def iter_danmaku_xml(source):
+    """
+    以流式方式解析XML弹幕，逐条产生弹幕而不构建整棵DOM树
+
+    Args:
+        source: 文件路径或可读取的文件对象
+
+    Returns:
+        generator: 依次产生弹幕字典，包含time(秒)、mode、size、color、content
+    """
+    for _, elem in ET.iterparse(source, events=('end',)):
+        if elem.tag == 'd':
+            attrs = (elem.get('p') or '').split(',')
+            if len(attrs) >= 4 and elem.text:
+                try:
+                    yield {
+                        'time': float(attrs[0]),
+                        'mode': int(attrs[1]),
+                        'size': int(attrs[2]),
+                        'color': int(attrs[3]),
+                        'content': elem.text
+                    }
+                except ValueError:
+                    pass
+            # 及时释放已处理的节点，保持内存占用与弹幕总数无关
+            elem.clear()
+
+def format_ass_time(seconds):
+    """将秒数格式化为ASS时间 H:MM:SS.cc"""
+    centiseconds = int(round(max(seconds, 0) * 100))
+    hours, centiseconds = divmod(centiseconds, 360000)
+    minutes, centiseconds = divmod(centiseconds, 6000)
+    secs, centiseconds = divmod(centiseconds, 100)
+    return f"{hours}:{minutes:02d}:{secs:02d}.{centiseconds:02d}"
+
+def format_srt_time(seconds):
+    """将秒数格式化为SRT时间 HH:MM:SS,mmm"""
+    milliseconds = int(round(max(seconds, 0) * 1000))
+    hours, milliseconds = divmod(milliseconds, 3600000)
+    minutes, milliseconds = divmod(milliseconds, 60000)
+    secs, milliseconds = divmod(milliseconds, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d},{milliseconds:03d}"
+
+def escape_ass_text(text):
+    """转义ASS对话文本中的特殊字符"""
+    return text.replace('\\', '\\\\').replace('{', '\\{').replace('}', '\\}').replace('\r', '').replace('\n', '\\N')
+
+class DanmakuAssWriter:
+    """
+    将弹幕逐条写入ASS字幕文件
+
+    按时间顺序写入时为滚动、顶部、底部弹幕分配互不重叠的行，
+    已写入的弹幕不在内存中保留。
+    """
+
+    def __init__(self, path, width=ASS_WIDTH, height=ASS_HEIGHT, font_size=ASS_FONT_SIZE):
+        self.path = path
+        self.width = width
+        self.font_size = font_size
+        self.line_count = max(1, int(height * 0.8) // ASS_LINE_HEIGHT)
+        self.height = height
+        # 每行最近一条弹幕完全进入屏幕的时间，以及静止弹幕的结束时间
+        self.scroll_lanes = [0.0] * self.line_count
+        self.top_lanes = [0.0] * self.line_count
+        self.bottom_lanes = [0.0] * self.line_count
+        self.count = 0
+        self.file = open(path, 'w', encoding='utf-8-sig')
+        self.file.write(
+            "[Script Info]\n"
+            "ScriptType: v4.00+\n"
+            f"PlayResX: {width}\n"
+            f"PlayResY: {height}\n"
+            "WrapStyle: 2\n"
+            "ScaledBorderAndShadow: yes\n\n"
+            "[V4+ Styles]\n"
+            "Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, "
+            "Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, "
+            "Alignment, MarginL, MarginR, MarginV, Encoding\n"
+            f"Style: Danmaku,Microsoft YaHei,{font_size},&H33FFFFFF,&H33FFFFFF,&H33000000,&H33000000,"
+            "0,0,0,0,100,100,0,0,1,1,0,7,0,0,0,1\n\n"
+            "[Events]\n"
+            "Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text\n"
+        )
+
+    def _pick_lane(self, lanes, start):
+        # 优先使用已空闲的行，全部占用时选择最早空闲的行
+        for index, free_at in enumerate(lanes):
+            if free_at <= start:
+                return index
+        return min(range(len(lanes)), key=lambda i: lanes[i])
+
+    def add(self, item):
+        """
+        写入一条弹幕
+
+        Args:
+            item (dict): 弹幕字典，包含time、mode、size、color、content
+        """
+        content = item['content']
+        start = item['time']
+        size = max(12, int(self.font_size * item.get('size', 25) / 25))
+        text_width = len(content) * size
+        color = item.get('color', 0xffffff)
+        # ASS颜色为BGR顺序
+        ass_color = f"&H{color & 0xff:02X}{(color >> 8) & 0xff:02X}{(color >> 16) & 0xff:02X}"
+        mode = item.get('mode', 1)
+
+        if mode == 5:
+            lane = self._pick_lane(self.top_lanes, start)
+            end = start + STATIC_DURATION
+            self.top_lanes[lane] = end
+            position = f"\\an8\\pos({self.width // 2},{lane * ASS_LINE_HEIGHT})"
+        elif mode == 4:
+            lane = self._pick_lane(self.bottom_lanes, start)
+            end = start + STATIC_DURATION
+            self.bottom_lanes[lane] = end
+            position = f"\\an2\\pos({self.width // 2},{self.height - lane * ASS_LINE_HEIGHT})"
+        elif mode in (1, 2, 3, 6):
+            lane = self._pick_lane(self.scroll_lanes, start)
+            end = start + SCROLL_DURATION
+            # 弹幕尾部完全进入屏幕后该行才可再次使用
+            self.scroll_lanes[lane] = start + SCROLL_DURATION * text_width / (self.width + text_width)
+            y = lane * ASS_LINE_HEIGHT
+            position = f"\\move({self.width},{y},{-text_width},{y})"
+        else:
+            # 高级弹幕、代码弹幕等无法转换为ASS
+            return
+
+        self.file.write(
+            f"Dialogue: 2,{format_ass_time(start)},{format_ass_time(end)},Danmaku,,0,0,0,,"
+            f"{{{position}\\c{ass_color}\\fs{size}}}{escape_ass_text(content)}\n"
+        )
+        self.count += 1
+
+    def close(self):
+        self.file.close()
+
+def fetch_danmaku_protobuf(cid, duration, writer, headers=None, cancel_event=None):
+    """
+    按分段接口获取protobuf弹幕并写入ASS
+
+    每次只在内存中保留一个分段（6分钟）的弹幕，分段内排序后写入，
+    因此整体输出保持时间顺序。
+
+    Args:
+        cid (int): 视频分P的cid
+        duration (float): 视频时长（秒）
+        writer (DanmakuAssWriter): ASS写入器
+        headers (dict): 请求头
+        cancel_event (threading.Event): 每个分段请求前检查，被设置时停止获取
+
+    Returns:
+        bool: 是否成功获取
+    """
+    segment_count = max(1, math.ceil((duration or 0) / DANMAKU_SEGMENT_SECONDS))
+    for segment_index in range(1, segment_count + 1):
+        if cancel_event is not None and cancel_event.is_set():
+            return False
+        response = requests.get(DANMAKU_SEGMENT_API, params={'type': 1, 'oid': cid, 'segment_index': segment_index},
+                                headers=headers, timeout=15)
+        response.raise_for_status()
+        if response.headers.get('Content-Type', '').startswith('application/json'):
+            # 接口出错时返回JSON错误信息而不是protobuf
+            print(f"分段弹幕接口返回错误: {response.text[:200]}", flush=True)
+            return False
+        for item in sorted(parse_danmaku_segment(response.content), key=lambda d: d['time']):
+            writer.add(item)
+    return True
+
+def fetch_danmaku_xml(cid, writer, headers=None):
+    """
+    从XML弹幕接口流式获取弹幕并写入ASS（分段接口不可用时的后备方案）
+
+    Args:
+        cid (int): 视频分P的cid
+        writer (DanmakuAssWriter): ASS写入器
+        headers (dict): 请求头
+
+    Returns:
+        bool: 是否成功获取
+    """
+    with requests.get(DANMAKU_XML_API.format(cid=cid), headers=headers, timeout=15, stream=True) as response:
+        response.raise_for_status()
+        # XML接口使用deflate压缩，由urllib3边读边解压
+        response.raw.decode_content = True
+        # XML中的弹幕不保证时间顺序，只保留写入所需字段后排序
+        items = sorted(iter_danmaku_xml(response.raw), key=lambda d: d['time'])
+    for item in items:
+        writer.add(item)
+    return True
+
+def download_danmaku_ass(cid, output_path, duration=0, headers=None, cancel_event=None):
+    """
+    下载视频弹幕并转换为ASS字幕文件
+
+    Args:
+        cid (int): 视频分P的cid
+        output_path (str): ASS文件保存路径
+        duration (float): 视频时长（秒），用于计算分段数
+        headers (dict): 请求头
+        cancel_event (threading.Event): 被设置时停止获取，不再尝试XML接口
+
+    Returns:
+        str: ASS文件路径，失败、没有弹幕或已取消时返回None
+    """
+    if not cid:
+        return None
+    temp_path = output_path + ".part"
+    for fetch in (lambda w: fetch_danmaku_protobuf(cid, duration, w, headers, cancel_event),
+                  lambda w: fetch_danmaku_xml(cid, w, headers)):
+        if cancel_event is not None and cancel_event.is_set():
+            break
+        writer = DanmakuAssWriter(temp_path)
+        try:
+            success = fetch(writer)
+        except Exception as e:
+            print(f"获取弹幕失败: {e}", flush=True)
+            success = False
+        finally:
+            writer.close()
+        if success:
+            if writer.count == 0:
+                break
+            os.replace(temp_path, output_path)
+            print(f"弹幕已保存: {output_path} ({writer.count}条)", flush=True)
+            return output_path
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+    return None
+
+def write_srt(subtitle_body, output_path):
+    """
+    将B站字幕JSON的body转换为SRT文件
+
+    Args:
+        subtitle_body (list): 字幕条目列表，每项包含from、to、content
+        output_path (str): SRT文件保存路径
+
+    Returns:
+        int: 写入的字幕条数
+    """
+    count = 0
+    with open(output_path, 'w', encoding='utf-8') as f:
+        for entry in subtitle_body:
+            content = (entry.get('content') or '').strip()
+            if not content:
+                continue
+            count += 1
+            f.write(f"{count}\n{format_srt_time(entry.get('from', 0))} --> {format_srt_time(entry.get('to', 0))}\n{content}\n\n")
+    return count
+
+def download_subtitles_srt(cid, output_base, aid=None, bvid=None, headers=None, cookies=None, cancel_event=None):
+    """
+    下载视频的CC/AI字幕并转换为SRT文件
+
+    Args:
+        cid (int): 视频分P的cid
+        output_base (str): 输出路径前缀，文件名为 {output_base}.{语言}.srt
+        aid (int): 视频aid
+        bvid (str): 视频BV号，与aid至少提供一个
+        headers (dict): 请求头
+        cookies (str or dict): Cookie信息，部分字幕需要登录后才能获取
+        cancel_event (threading.Event): 每个字幕请求前检查，被设置时停止获取
+
+    Returns:
+        list: 字幕信息列表，每项包含lan、lan_doc、path
+    """
+    if not cid or not (aid or bvid):
+        return []
+    if isinstance(cookies, str):
+        cookies = dict(item.strip().split('=', 1) for item in cookies.split(';') if '=' in item)
+    params = {'cid': cid}
+    if bvid:
+        params['bvid'] = bvid
+    else:
+        params['aid'] = aid
+    try:
+        response = requests.get(PLAYER_INFO_API, params=params, headers=headers, cookies=cookies, timeout=15)
+        response.raise_for_status()
+        data = response.json()
+        if data.get('code') != 0:
+            print(f"获取字幕列表失败: {data.get('message')}", flush=True)
+            return []
+        subtitle_list = ((data.get('data') or {}).get('subtitle') or {}).get('subtitles') or []
+    except (requests.RequestException, json.JSONDecodeError) as e:
+        print(f"获取字幕列表失败: {e}", flush=True)
+        return []
+
+    results = []
+    for subtitle in subtitle_list:
+        if cancel_event is not None and cancel_event.is_set():
+            break
+        subtitle_url = subtitle.get('subtitle_url')
+        if not subtitle_url:
+            continue
+        if subtitle_url.startswith('//'):
+            subtitle_url = 'https:' + subtitle_url
+        lan = subtitle.get('lan') or 'unknown'
+        output_path = f"{output_base}.{lan}.srt"
+        try:
+            subtitle_response = requests.get(subtitle_url, headers=headers, timeout=15)
+            subtitle_response.raise_for_status()
+            if write_srt(subtitle_response.json().get('body') or [], output_path):
+                results.append({'lan': lan, 'lan_doc': subtitle.get('lan_doc', lan), 'path': output_path})
+                print(f"字幕已保存: {output_path}", flush=True)
+            elif os.path.exists(output_path):
+                os.remove(output_path)
+        except (requests.RequestException, json.JSONDecodeError, OSError) as e:
+            print(f"下载字幕 {lan} 失败: {e}", flush=True)
+    return results
+
+def start_extras_fetch(video_info, output_base, headers=None, cookies=None, danmaku=True, subtitles=True, cancel_event=None):
+    """
+    在后台线程中获取弹幕和字幕，与视频流/音频流下载并行进行
+
+    Args:
+        video_info (dict): extract_video_info的结果，需包含cid，字幕还需要aid或bvid
+        output_base (str): 输出路径前缀
+        headers (dict): 请求头
+        cookies (str or dict): Cookie信息
+        danmaku (bool): 是否获取弹幕（ASS）
+        subtitles (bool): 是否获取字幕（SRT）
+        cancel_event (threading.Event): 任务的取消标志，被设置时在当前请求结束后停止获取
+
+    Returns:
+        tuple: (线程, 结果字典)，线程结束后结果字典的danmaku字段为ASS路径或None，
+               subtitles字段为字幕信息列表
+    """
+    result = {'danmaku': None, 'subtitles': []}
+    cid = video_info.get('cid')
+
+    def fetch():
+        if danmaku:
+            result['danmaku'] = download_danmaku_ass(cid, f"{output_base}.danmaku.ass", video_info.get('duration', 0), headers,
+                                                     cancel_event)
+        if subtitles:
+            result['subtitles'] = download_subtitles_srt(cid, output_base, video_info.get('aid'), video_info.get('bvid'),
+                                                         headers, cookies, cancel_event)
+
+    thread = threading.Thread(target=fetch, name="extras-fetch", daemon=True)
+    thread.start()
+    return thread, result
@@ -1,19 +1,20 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks, Query
-from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, HTMLResponse
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, HTMLResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 import os
-import sys
+import re
+import json
 import tempfile
 import threading
 import uuid
 from datetime import datetime
 import time
-import subprocess
 from collections import OrderedDict
+from urllib.parse import quote, urlencode
 from typing import Optional, Dict, Any
-from concurrent.futures import ThreadPoolExecutor
+import functools
 import asyncio
-import threading
 from bilibili import (
     get_playinfo_from_bilibili,
     extract_video_info,
@@ -25,7 +26,44 @@ from bilibili import (
     get_video_title_and_cover,
     get_quality_name,
     get_audio_quality_name,
-    check_ffmpeg_available
+    check_ffmpeg_available,
+    check_fifo_supported,
+    stream_merged_fmp4,
+    parse_time_value,
+    disk_space_manager,
+    estimate_stream_size,
+    format_bytes,
+    build_merge_command,
+    canonicalize_video_url,
+    task_file_tag,
+    OUTPUT_PROFILES,
+    SELECTION_POLICIES,
+    CODEC_ALIASES
+)
+from mp4remux import remux_fragmented_mp4
+from mp4box import verify_mp4_file
+from muxer import mux_pool, MergeCache, SingleFlight
+from task_store import create_task_store, encode_cursor, TASK_STATUSES, TERMINAL_STATUSES
+from scheduler import JobScheduler, CancelToken, PRIORITY_CLASSES
+from job_queue import create_job_queue
+from worker import build_job_payload
+from playlist import list_source_videos, resolve_video_urls, SOURCE_TYPES
+from file_serving import serve_file
+from progress import ProgressBroker, make_task_event, FINAL_STATUSES, DEFAULT_PUSH_INTERVAL
+from schemas import (
+    FastJSONResponse,
+    ErrorResponse,
+    VideoInfoResponse,
+    QualityOptionsResponse,
+    DownloadRequest,
+    BatchRequest,
+    BatchResponse,
+    DOWNLOAD_OPTION_FIELDS,
+    TaskResponse,
+    TaskCreatedResponse,
+    TaskListResponse,
+    TaskActionResponse,
+    serialize_task
 )
 
 app = FastAPI(
@@ -47,7 +85,7 @@ app = FastAPI(
 4. 使用 `/api/download/status/{task_id}` 查询进度
 
 ### 💡 提示
-- 所有接口均返回纯文本格式，便于阅读
+- 所有接口均返回纯文本格式，便于阅读；程序调用请使用返回JSON的 `/api/v2` 接口
 - 支持自动合并视频音频文件
 - 下载的文件保存在 `downloads` 目录
     """,
@@ -66,6 +104,10 @@ app = FastAPI(
         {
             "name": "任务管理",
             "description": "查看和管理所有下载任务"
+        },
+        {
+            "name": "JSON API (v2)",
+            "description": "与上述接口功能相同，返回JSON格式数据，便于程序调用"
         }
     ]
 )
@@ -85,29 +127,76 @@ async def api_console():
     """返回API控制台HTML页面"""
     return FileResponse("api_console.html", media_type="text/html")
 
-# 全局变量存储下载任务状态
-download_tasks = {}
+# 每个任务的取消标志（threading.Event），不放入任务状态中以便状态可以直接复制和序列化
+task_cancel_events = {}
+
+# 检查其他工作进程写入任务存储的停止请求的间隔（秒）
+STOP_POLL_INTERVAL = 0.5
+
+# 排队中的任务被直接移除时写入的状态
+STOPPED_FIELDS = {
+    'cancel': {'status': 'cancelled', 'message': '任务已取消'},
+    'pause': {'status': 'paused', 'message': '任务已暂停，可通过恢复接口继续下载'}
+}
 
 # 配置
 DOWNLOAD_DIR = "downloads"
 COOKIE_FILE = "cookies.txt"
 
-# 线程池配置
-MAX_CONCURRENT_DOWNLOADS = 5  # 最大并发下载数
-thread_pool = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_DOWNLOADS, thread_name_prefix="download")
+# 磁盘空间不足时任务排队等待的最长时间（秒），超时后任务失败
+DISK_WAIT_TIMEOUT = 600
+
+# 合并阶段的超时时间（秒），超时后结束ffmpeg进程并清理临时文件
+MERGE_TIMEOUT = 1800
 
-# 线程安全锁
-task_lock = threading.Lock()
+# 合并结果缓存：按输入内容寻址，超过容量上限时淘汰最久未使用的结果
+MERGE_CACHE_DIR = os.path.join(DOWNLOAD_DIR, ".merge_cache")
+MERGE_CACHE_MAX_BYTES = 20 * 1024 ** 3
+
+# 任务存储：'sqlite'持久化保存并可在多个工作进程之间共享，'memory'仅保存在当前进程中
+TASK_STORE_BACKEND = "sqlite"
+TASK_DB_PATH = os.path.join(DOWNLOAD_DIR, "tasks.db")
+# 已结束（完成/失败/取消）的任务保留时间（秒），超过后从任务列表中淘汰（不删除已下载的文件）
+TASK_RETENTION_SECONDS = 7 * 24 * 3600
+
+# 调度器配置（可通过 /api/system/scheduler 在运行时调整）
+MAX_CONCURRENT_DOWNLOADS = 5  # 最大并发下载数（只计网络传输阶段，解析和合并不占用）
+MAX_CONCURRENT_RESOLVES = 4  # 同时解析视频页面的请求数
+MAX_TASKS_PER_CLIENT = 2  # 每个客户端同时运行的任务数
+scheduler = JobScheduler(MAX_CONCURRENT_DOWNLOADS, MAX_CONCURRENT_RESOLVES, MAX_TASKS_PER_CLIENT)
+
+# 单个批量下载请求最多包含的视频数（去重后）
+MAX_BATCH_SIZE = 500
+
+# 任务分发模式：'local'由本进程的调度器执行下载；'queue'只把任务放入共享任务队列，
+# 由 worker.py 启动的工作节点认领执行（工作节点需与API服务共享下载目录）
+DISPATCH_MODE = "local"
+JOB_QUEUE_BACKEND = "sqlite"  # 'sqlite'：同一台机器上的工作进程；'redis'：多台机器
+JOB_QUEUE_PATH = os.path.join(DOWNLOAD_DIR, "jobs.db")
+JOB_QUEUE_URL = "redis://localhost:6379/0"
 
 # 确保下载目录存在
 os.makedirs(DOWNLOAD_DIR, exist_ok=True)
 
+task_store = create_task_store(TASK_STORE_BACKEND, TASK_DB_PATH, TASK_RETENTION_SECONDS)
+job_queue = create_job_queue(JOB_QUEUE_BACKEND, JOB_QUEUE_PATH, JOB_QUEUE_URL) if DISPATCH_MODE == "queue" else None
+
+# 任务进度的发布/订阅中心，向SSE和WebSocket连接推送更新；
+# 使用SQLite任务存储时通过其中的事件表在多个uvicorn工作进程之间转发，订阅者能收到其他进程中任务的进度
+progress_broker = ProgressBroker()
+if TASK_STORE_BACKEND == "sqlite":
+    progress_broker.start_relay(task_store)
+
+merge_cache = MergeCache(MERGE_CACHE_DIR, MERGE_CACHE_MAX_BYTES)
+merge_flights = SingleFlight()
+
 # 检查FFmpeg是否可用
 def check_ffmpeg_on_startup():
     """在应用启动时检查FFmpeg是否可用"""
     if not check_ffmpeg_available():
-        print("\n❌ 错误：未检测到FFmpeg！")
-        print("📋 FFmpeg是视频合并的必需工具，请按以下步骤安装：")
+        print("\n⚠️  警告：未检测到FFmpeg！")
+        print("📋 B站分片MP4流将使用内置的纯Python合并，但流式合并、片段下载、音频格式转换")
+        print("   以及非分片文件的合并仍需要FFmpeg，请按以下步骤安装：")
         print("\n🔧 Windows安装方法：")
         print("   1. 访问 https://ffmpeg.org/download.html")
         print("   2. 下载Windows版本的FFmpeg")
@@ -125,8 +214,7 @@ def check_ffmpeg_on_startup():
         print("\n🍎 macOS安装方法：")
         print("   - 使用Homebrew: brew install ffmpeg")
         print("   - 使用MacPorts: sudo port install ffmpeg")
-        print("\n⚠️  应用将停止运行，请安装FFmpeg后重试。")
-        sys.exit(1)
+        print("\n⚠️  应用将以受限模式运行，安装FFmpeg后重启即可使用全部功能。")
     else:
         print("✅ FFmpeg检测成功，应用正常启动")
 
@@ -153,21 +241,109 @@ def safe_delete_file(file_path, max_retries=3, delay=1):
     return False
 
 def update_task_status(task_id: str, **kwargs):
-    """线程安全地更新任务状态"""
-    with task_lock:
-        if task_id in download_tasks:
-            for key, value in kwargs.items():
-                download_tasks[task_id][key] = value
+    """更新任务状态（只更新进度和消息时由任务存储批量写入），同时推送给订阅该任务的客户端"""
+    task_store.update(task_id, **kwargs)
+    progress_broker.publish(task_id, kwargs)
 
 def get_task_status(task_id: str) -> Optional[Dict[str, Any]]:
-    """线程安全地获取任务状态"""
-    with task_lock:
-        return download_tasks.get(task_id, None).copy() if task_id in download_tasks else None
+    """获取任务状态的副本"""
+    return task_store.get(task_id)
 
 def create_task(task_id: str, task_data: Dict[str, Any]):
-    """线程安全地创建任务"""
-    with task_lock:
-        download_tasks[task_id] = task_data
+    """创建任务，记录视频标识和所属工作进程"""
+    task_data.setdefault("video_key", canonicalize_video_url(task_data.get("url")))
+    task_data.setdefault("worker_pid", os.getpid())
+    task_store.create(task_data)
+
+def create_or_get_task(task_data: Dict[str, Any]):
+    """按去重键原子地创建任务或返回已有任务，返回(任务, 是否新建)"""
+    task_data.setdefault("video_key", canonicalize_video_url(task_data.get("url")))
+    task_data.setdefault("worker_pid", os.getpid())
+    task, created = task_store.create_or_get(task_data)
+    if created:
+        progress_broker.publish(task['id'], {'status': task['status'], 'progress': 0, 'message': task['message']})
+    return task, created
+
+def make_dedupe_key(video_key, **options):
+    """由视频标识和影响输出的下载选项（质量选择、合并模式等）组成去重键"""
+    return f"{video_key}|{json.dumps(options, sort_keys=True, ensure_ascii=False)}"
+
+def is_process_alive(pid):
+    """判断进程是否仍在运行（Windows上无法安全探测，视为已退出）"""
+    if not pid or pid == os.getpid() or os.name == 'nt':
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def recover_interrupted_tasks():
+    """将所属工作进程已退出的未完成任务标记为失败，避免重启后任务永远停留在下载中"""
+    for task in task_store.list_tasks(statuses=['pending', 'downloading']):
+        if not is_process_alive(task.get('worker_pid')):
+            update_task_status(task['id'], status="failed", message="服务重启，任务已中断", error="服务重启，任务已中断")
+            print(f"任务 {task['id']} 因服务重启而中断", flush=True)
+
+def apply_job_updates():
+    """把工作节点发布到任务队列的状态更新写入任务存储，其中的字节进度用于推送速度和剩余时间"""
+    while True:
+        try:
+            updates = job_queue.consume_updates()
+        except Exception as e:
+            print(f"读取工作节点状态更新失败: {e}", flush=True)
+            updates = []
+        for task_id, fields in updates:
+            current, total = fields.pop('current_bytes', None), fields.pop('total_bytes', None)
+            if current is not None and total:
+                progress_broker.record_transfer(task_id, current, total)
+            if fields:
+                update_task_status(task_id, **fields)
+        if not updates:
+            time.sleep(0.5)
+
+def apply_stop_requests():
+    """
+    把其他工作进程写入任务存储的停止请求应用到本进程执行的任务
+
+    取消或暂停请求可能落在任何一个uvicorn工作进程上，只有执行任务的进程持有CancelToken，
+    其他进程只能把请求写入共享的任务存储，由本线程按间隔取到后执行
+    """
+    while True:
+        time.sleep(STOP_POLL_INTERVAL)
+        task_ids = list(task_cancel_events)
+        if not task_ids:
+            continue
+        try:
+            tasks = task_store.get_many(task_ids)
+        except Exception as e:
+            print(f"读取停止请求失败: {e}", flush=True)
+            continue
+        for task in tasks:
+            mode = task.get('stop_request')
+            if mode not in STOPPED_FIELDS or task['id'] not in task_cancel_events:
+                continue
+            print(f"任务 {task['id']} 收到其他工作进程转发的{'暂停' if mode == 'pause' else '取消'}请求", flush=True)
+            fields = {'stop_request': None}
+            if stop_local_task(task['id'], mode):
+                fields.update(STOPPED_FIELDS[mode])
+            update_task_status(task['id'], **fields)
+
+if job_queue is None:
+    recover_interrupted_tasks()
+    threading.Thread(target=apply_stop_requests, name="stop-requests", daemon=True).start()
+else:
+    # 队列模式下任务由工作节点执行，工作节点失联时由任务队列重新排队
+    threading.Thread(target=apply_job_updates, name="job-updates", daemon=True).start()
+
+@app.on_event("shutdown")
+def close_task_store():
+    """退出前写入尚未落盘的进度更新"""
+    task_store.close()
+    if job_queue is not None:
+        job_queue.close()
 
 def load_cookies():
     """加载cookies"""
@@ -193,10 +369,25 @@ async def index():
   GET  /api/video/info             - 获取视频信息 (支持 &q=auto 参数获取全部视频和音频流)
   GET  /api/video/quality          - 获取视频质量选项
   GET  /api/video/download         - 下载视频
+  GET  /api/video/stream           - 边下载边推流 (实时返回fMP4)
   GET  /api/download/status/<id>   - 查询下载状态
+  GET  /api/download/events        - 实时推送下载进度 (SSE，可选 ?task_id=)
+  WS   /api/download/ws            - 实时推送下载进度 (WebSocket，可选 ?task_id=)
   GET  /api/download/file/<id>     - 下载文件
   GET  /api/download/merge/<id>    - 合并下载视频音频
+  GET  /api/download/extra/<id>    - 下载弹幕、字幕或预览图
+  GET  /api/download/cancel/<id>   - 取消下载任务
+  GET  /api/download/pause/<id>    - 暂停下载任务
+  GET  /api/download/resume/<id>   - 恢复已暂停的任务
   GET  /api/tasks                  - 获取所有任务
+  GET  /api/batch/status/<id>      - 查询批量下载进度 (批次通过 POST /api/v2/batch 创建)
+  GET  /api/system/disk            - 查看磁盘空间与预留情况
+  GET  /api/system/mux             - 查看合并进程池状态
+  GET  /api/system/scheduler       - 查看和调整任务调度器
+  GET  /api/system/workers         - 查看共享任务队列和工作节点
+  GET  /api/v2/...                 - 以上接口的JSON版本 (video/info、video/quality、POST video/download、
+                                     download/status/<id>、POST download/<id>/cancel|pause|resume、tasks、system、
+                                     POST batch 批量下载、batch/<id>)
 
 参数说明:
   url           - B站视频URL (必需)
@@ -204,6 +395,18 @@ async def index():
   filename      - 自定义文件名 (可选)
   video_quality - 视频质量索引 (可选，默认0-最高质量)
   audio_quality - 音频质量索引 (可选，默认0-最高质量)
+  streaming     - 边下载边合并，不生成临时文件 (可选，默认false)
+  audio_only    - 仅下载音频，跳过视频流 (可选，默认false)
+  audio_format  - 仅音频封装格式 auto/m4a/flac (可选，默认保留原始音频流)
+  start / end   - 片段起止时间，秒数或mm:ss (可选，只下载该时间范围的分段)
+  profile       - 输出配置 copy/compat/audio_aac (可选，默认copy不转码)
+  policy        - 视频流选择策略 quality/smallest/bandwidth/codec (可选，默认quality)
+  min_height / max_bandwidth / codec - 策略参数：最低分辨率高度、总带宽上限kbps、优先编码avc/hevc/av1
+  embed_metadata - 合并时写入标题、UP主和封面 (可选，默认true)
+  danmaku / subtitles - 同时获取弹幕(ASS)和CC/AI字幕(SRT) (可选，默认false)
+  preview       - 合并完成后生成预览雪碧图和封面 (可选，默认false)
+  priority      - 调度优先级 high/normal/low (可选，默认normal)
+  client        - 客户端标识，用于公平调度 (可选，默认为请求方IP)
   q             - 设置为'auto'获取全部流信息 (可选)
 
 使用示例:
@@ -217,6 +420,56 @@ API调试在 http://localhost:8000/api
     
     return PlainTextResponse(text_result)
 
+def collect_stream_lists(video_info, stream_type='all', include_urls=False):
+    """
+    整理视频信息中的视频流和音频流列表，按质量ID降序排列（高质量在前）
+    
+    Args:
+        video_info (dict): extract_video_info的返回值
+        stream_type (str): 'video'仅视频流，'audio'仅音频流，'all'全部
+        include_urls (bool): 是否包含流地址
+    
+    Returns:
+        tuple: (视频流列表, 音频流列表)
+    """
+    video_streams = []
+    audio_streams = []
+    
+    # 处理视频流（当stream_type为'video'或'all'时）
+    if stream_type in ['video', 'all']:
+        for video in video_info.get('video_urls', []):
+            quality_id = video.get('quality', 0)
+            stream_data = {
+                'quality_id': quality_id,
+                'quality_name': get_quality_name(quality_id),
+                'width': video.get('width', 0),
+                'height': video.get('height', 0),
+                'bandwidth': video.get('bandwidth', 0),
+                'frame_rate': video.get('frameRate', 0),
+                'codecs': video.get('codecs', '')
+            }
+            if include_urls:
+                stream_data['url'] = video.get('url', '')
+            video_streams.append(stream_data)
+        video_streams.sort(key=lambda x: x['quality_id'], reverse=True)
+    
+    # 处理音频流（当stream_type为'audio'或'all'时）
+    if stream_type in ['audio', 'all']:
+        for audio in video_info.get('audio_urls', []):
+            quality_id = audio.get('quality', 0)
+            stream_data = {
+                'quality_id': quality_id,
+                'quality_name': get_audio_quality_name(quality_id),
+                'bandwidth': audio.get('bandwidth', 0),
+                'codecs': audio.get('codecs', '')
+            }
+            if include_urls:
+                stream_data['url'] = audio.get('url', '')
+            audio_streams.append(stream_data)
+        audio_streams.sort(key=lambda x: x['quality_id'], reverse=True)
+    
+    return video_streams, audio_streams
+
 @app.get("/api/video/info", tags=["视频信息"], summary="获取视频详细信息")
 async def get_video_info(url: str, q: Optional[str] = None, stream_type: Optional[str] = "all"):
     """获取B站视频的详细信息
@@ -256,45 +509,7 @@ async def get_video_info(url: str, q: Optional[str] = None, stream_type: Optiona
         stream_type_param = stream_type.lower() if stream_type else 'all'
         
         # 根据q参数决定返回的流信息
-        video_streams = []
-        audio_streams = []
-        
-        # 处理视频流（当stream_type为'video'或'all'时）
-        if stream_type_param in ['video', 'all']:
-            for video in video_info.get('video_urls', []):
-                quality_id = video.get('quality', 0)
-                stream_data = {
-                    'quality_id': quality_id,
-                    'quality_name': get_quality_name(quality_id),
-                    'width': video.get('width', 0),
-                    'height': video.get('height', 0),
-                    'bandwidth': video.get('bandwidth', 0),
-                    'frame_rate': video.get('frameRate', 0),
-                    'codecs': video.get('codecs', '')
-                }
-                # 如果q=auto，添加流地址
-                if q_param == 'auto':
-                    stream_data['url'] = video.get('url', '')
-                video_streams.append(stream_data)
-            # 按质量ID降序排序（高质量在前）
-            video_streams.sort(key=lambda x: x['quality_id'], reverse=True)
-        
-        # 处理音频流（当stream_type为'audio'或'all'时）
-        if stream_type_param in ['audio', 'all']:
-            for audio in video_info.get('audio_urls', []):
-                quality_id = audio.get('quality', 0)
-                stream_data = {
-                    'quality_id': quality_id,
-                    'quality_name': get_audio_quality_name(quality_id),
-                    'bandwidth': audio.get('bandwidth', 0),
-                    'codecs': audio.get('codecs', '')
-                }
-                # 如果q=auto，添加流地址
-                if q_param == 'auto':
-                    stream_data['url'] = audio.get('url', '')
-                audio_streams.append(stream_data)
-            # 按质量ID降序排序（高质量在前）
-            audio_streams.sort(key=lambda x: x['quality_id'], reverse=True)
+        video_streams, audio_streams = collect_stream_lists(video_info, stream_type_param, q_param == 'auto')
         
         # 处理最高质量视频和音频的中文名称
         highest_video = video_info.get('highest_video_url')
@@ -429,14 +644,130 @@ async def get_video_quality(url: str):
         return PlainTextResponse(f'服务器错误: {str(e)}', status_code=500)
 
 
+def build_download_task(url, merge=True, filename=None, video_quality=0, audio_quality=0, streaming=False,
+                        audio_only=False, audio_format=None, start=None, end=None, profile="copy", policy="quality",
+                        min_height=None, max_bandwidth=None, codec=None, embed_metadata=True, danmaku=False,
+                        subtitles=False, preview=False, priority="normal", client_id="anonymous"):
+    """
+    校验下载参数并生成新任务的记录（尚未保存）
+    
+    参数与 /api/video/download 相同，client_id为已确定的客户端标识。
+    
+    Returns:
+        dict: 任务记录，包含去重键
+    
+    Raises:
+        ValueError: 参数无效，异常信息为返回给客户端的错误说明
+    """
+    if not url:
+        raise ValueError("缺少必要参数 url")
+    
+    if audio_format and audio_format not in ('auto', 'm4a', 'flac'):
+        raise ValueError("audio_format 仅支持 auto、m4a、flac")
+    
+    if profile not in OUTPUT_PROFILES:
+        raise ValueError(f"profile 仅支持 {'、'.join(OUTPUT_PROFILES)}")
+    if OUTPUT_PROFILES[profile]['audio_only']:
+        audio_only = True
+    
+    if priority not in PRIORITY_CLASSES:
+        raise ValueError(f"priority 仅支持 {'、'.join(PRIORITY_CLASSES)}")
+    
+    if policy not in SELECTION_POLICIES:
+        raise ValueError(f"policy 仅支持 {'、'.join(SELECTION_POLICIES)}")
+    if codec and codec.lower() not in CODEC_ALIASES:
+        raise ValueError(f"codec 仅支持 {'、'.join(CODEC_ALIASES)}")
+    if policy == 'bandwidth' and not max_bandwidth:
+        raise ValueError("bandwidth 策略需要提供 max_bandwidth (kbps)")
+    if policy == 'codec' and not codec:
+        raise ValueError("codec 策略需要提供 codec")
+    codec = codec.lower() if codec else None
+    selection = {
+        'policy': policy,
+        'min_height': min_height,
+        'max_bandwidth': max_bandwidth * 1000 if max_bandwidth else None,
+        'codec': codec
+    }
+    
+    try:
+        clip_start = parse_time_value(start)
+        clip_end = parse_time_value(end)
+    except ValueError:
+        raise ValueError("start/end 时间格式无效，应为秒数或 mm:ss / hh:mm:ss")
+    if clip_start is not None and clip_end is not None and clip_end <= clip_start:
+        raise ValueError("end 必须大于 start")
+    if clip_start is not None or clip_end is not None:
+        # 片段模式总是输出合并后的文件
+        merge = True
+    
+    video_key = canonicalize_video_url(url)
+    dedupe_key = make_dedupe_key(
+        video_key, merge=merge, filename=filename, video_quality=video_quality, audio_quality=audio_quality,
+        audio_only=audio_only, audio_format=audio_format, clip_start=clip_start, clip_end=clip_end,
+        profile=profile, selection=selection, embed_metadata=embed_metadata,
+        danmaku=danmaku, subtitles=subtitles, preview=preview
+    )
+    
+    return {
+        "id": str(uuid.uuid4()),
+        "url": url,
+        "video_key": video_key,
+        "dedupe_key": dedupe_key,
+        "status": "pending",
+        "progress": 0,
+        "message": "任务已创建，等待开始下载...",
+        "created_at": datetime.now().isoformat(),
+        "merge": merge,
+        "filename": filename,
+        "video_quality_index": video_quality,
+        "audio_quality_index": audio_quality,
+        "streaming": streaming,
+        "audio_only": audio_only,
+        "audio_format": audio_format,
+        "clip_start": clip_start,
+        "clip_end": clip_end,
+        "profile": profile,
+        "selection": selection,
+        "embed_metadata": embed_metadata,
+        "danmaku": danmaku,
+        "subtitles": subtitles,
+        "danmaku_path": None,
+        "subtitle_files": [],
+        "preview": preview,
+        "preview_info": None,
+        "priority": priority,
+        "client": client_id,
+        "file_path": None,
+        "video_path": None,
+        "audio_path": None,
+        "error": None
+    }
+
 @app.get("/api/video/download", tags=["下载管理"], summary="开始下载视频")
 async def download_video(
     background_tasks: BackgroundTasks,
+    request: Request,
     url: str,
     merge: bool = True,
     filename: Optional[str] = None,
     video_quality: int = 0,
-    audio_quality: int = 0
+    audio_quality: int = 0,
+    streaming: bool = False,
+    audio_only: bool = False,
+    audio_format: Optional[str] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    profile: str = "copy",
+    policy: str = "quality",
+    min_height: Optional[int] = None,
+    max_bandwidth: Optional[int] = None,
+    codec: Optional[str] = None,
+    embed_metadata: bool = True,
+    danmaku: bool = False,
+    subtitles: bool = False,
+    preview: bool = False,
+    priority: str = "normal",
+    client: Optional[str] = None
 ):
     """开始下载B站视频
     
@@ -446,72 +777,81 @@ async def download_video(
         filename: 自定义文件名 (可选)
         video_quality: 视频质量索引 (默认0-最高质量)
         audio_quality: 音频质量索引 (默认0-最高质量)
+        streaming: 合并模式下边下载边合并，不生成临时文件 (默认为False)
+        audio_only: 仅下载音频，跳过视频流 (默认为False)
+        audio_format: 仅音频模式的封装格式 ('auto'/'m4a'/'flac'，不填则保留原始音频流)
+        start: 片段起始时间 (秒数或 mm:ss / hh:mm:ss，填写start或end时只下载该时间范围)
+        end: 片段结束时间 (同上，不填则到结尾)
+        profile: 输出配置 ('copy'不转码，'compat'输出H.264/AAC兼容格式，'audio_aac'仅输出AAC音频)
+        policy: 视频流选择策略 ('quality'按video_quality索引，'smallest'满足min_height时体积最小，
+                'bandwidth'在max_bandwidth内清晰度最高，'codec'优先codec指定的编码)
+        min_height: smallest策略的最低分辨率高度，如1080
+        max_bandwidth: bandwidth策略的总带宽上限 (kbps)
+        codec: 优先编码 ('avc'/'hevc'/'av1')
+        embed_metadata: 合并时写入标题、UP主、来源链接和封面 (默认为True)
+        danmaku: 同时获取弹幕并转换为ASS字幕文件 (默认为False)
+        subtitles: 同时获取CC/AI字幕并转换为SRT文件 (默认为False)
+        preview: 合并完成后生成预览雪碧图和封面 (默认为False)
+        priority: 优先级 ('high'/'normal'/'low'，默认normal)
+        client: 客户端标识，用于公平调度和每客户端并发配额 (不填则使用请求方IP)
     
     Returns:
         包含任务ID和下载信息的文本格式响应
     """
-    if not url:
-        return PlainTextResponse("错误: 缺少必要参数 url", status_code=400)
+    try:
+        task_data = build_download_task(
+            url, merge, filename, video_quality, audio_quality, streaming, audio_only, audio_format, start, end,
+            profile, policy, min_height, max_bandwidth, codec, embed_metadata, danmaku, subtitles, preview, priority,
+            client or (request.client.host if request.client else "anonymous")
+        )
+    except ValueError as e:
+        return PlainTextResponse(f"错误: {e}", status_code=400)
     
     try:
-        # 检查是否已存在相同URL的下载任务
-        for existing_task_id, task_info in download_tasks.items():
-            if task_info['url'] == url and task_info['status'] in ['pending', 'downloading', 'completed']:
-                text_result = f"""下载任务创建失败
+        task_id = task_data['id']
+        merge, audio_only = task_data['merge'], task_data['audio_only']
+        clip_start, clip_end = task_data['clip_start'], task_data['clip_end']
+        clip_mode = clip_start is not None or clip_end is not None
+        codec = task_data['selection']['codec']
+        
+        # 查找与创建在任务存储中原子完成：相同请求（包括并发请求）关联到同一个进行中或已完成的任务
+        existing_task, created = await run_in_threadpool(create_and_submit_task, task_data)
+        if not created:
+            text_result = f"""已存在相同的下载任务，本次请求已关联到该任务
 
-错误: 当前解析已经存在，请勿重复请求
-已存在任务ID: {existing_task_id}
-任务状态: {task_info['status']}
+任务ID: {existing_task['id']}
+任务状态: {existing_task['status']}
+进度: {existing_task.get('progress', 0)}%
 
-请使用已存在的任务ID查询状态或下载文件。"""
-                return PlainTextResponse(text_result, status_code=409)
-        
-        # 生成任务ID
-        task_id = str(uuid.uuid4())
-        
-        # 加载cookies
-        cookies = load_cookies()
-        
-        # 初始化任务状态
-        task_data = {
-            "id": task_id,
-            "url": url,
-            "status": "pending",
-            "progress": 0,
-            "message": "任务已创建，等待开始下载...",
-            "created_at": datetime.now().isoformat(),
-            "merge": merge,
-            "filename": filename,
-            "video_quality_index": video_quality,
-            "audio_quality_index": audio_quality,
-            "file_path": None,
-            "video_path": None,
-            "audio_path": None,
-            "error": None
-        }
-        
-        # 创建任务
-        create_task(task_id, task_data)
+查询状态: /api/download/status/{existing_task['id']}
+下载文件: /api/download/file/{existing_task['id']}"""
+            return PlainTextResponse(text_result)
         
-        # 提交到线程池
-        future = thread_pool.submit(
-            download_video_task,
-            task_id, url, cookies, merge, filename, video_quality, audio_quality
-        )
+        if clip_mode:
+            clip_desc = f"{clip_start or 0:g}s - " + (f"{clip_end:g}s" if clip_end is not None else "结尾")
+        else:
+            clip_desc = "完整视频"
         
         text_result = f"""下载任务创建成功
 
 任务ID: {task_id}
 视频URL: {url}
-合并模式: {'是' if merge else '否'}
+合并模式: {'是' if merge and not audio_only else '否'}
+流水线模式: {'是' if merge and streaming and not audio_only else '否'}
+仅音频模式: {'是 (封装格式: ' + (audio_format or '原始音频流') + ')' if audio_only else '否'}
+片段范围: {clip_desc}
+输出配置: {OUTPUT_PROFILES[profile]['name']} ({profile})
+选择策略: {SELECTION_POLICIES[policy]}{f" (最低{min_height}p)" if min_height else ''}{f" (上限{max_bandwidth}kbps)" if max_bandwidth else ''}{f" (优先{codec})" if codec else ''}
 视频质量索引: {video_quality}
 音频质量索引: {audio_quality}
 自定义文件名: {filename if filename else '使用默认名称'}
+弹幕/字幕: {'弹幕ASS' if danmaku else ''}{' ' if danmaku and subtitles else ''}{'字幕SRT' if subtitles else ''}{'' if danmaku or subtitles else '不获取'}
 
 任务状态: 已创建，等待开始下载...
 
 查询状态: /api/download/status/{task_id}
 下载文件: /api/download/file/{task_id}
+取消任务: /api/download/cancel/{task_id}
 
 提示: 请保存任务ID以便后续查询和下载。"""
         
@@ -520,30 +860,155 @@ async def download_video(
     except Exception as e:
         return PlainTextResponse(f"服务器错误: {str(e)}", status_code=500)
 
-def download_video_task(task_id, url, cookies, merge, filename, video_quality_index=0, audio_quality_index=0):
-    """线程池中执行的下载任务"""
+def submit_download_task(task, cookies, resume=False):
+    """
+    按任务记录中的下载选项把任务提交到本进程的调度器，队列模式下放入共享任务队列
+    
+    Args:
+        task (dict): 任务记录
+        cookies (dict): 请求使用的cookies（队列模式下工作节点使用自己的cookie文件）
+        resume (bool): 从暂停时保留的部分文件继续下载
+    """
+    if job_queue is not None:
+        job_queue.enqueue(task['id'], build_job_payload(task, resume), task['priority'])
+        return
+    cancel_event = CancelToken()
+    task_cancel_events[task['id']] = cancel_event
+    scheduler.submit(task['id'], functools.partial(
+        download_video_task,
+        task['id'], task['url'], cookies, task['merge'], task['filename'],
+        task['video_quality_index'], task['audio_quality_index'], task['streaming'],
+        task['audio_only'], task['audio_format'], task['clip_start'], task['clip_end'], cancel_event,
+        task['profile'], task['selection'], task['embed_metadata'],
+        task['danmaku'], task['subtitles'], task['preview'], resume
+    ), task['priority'], task['client'])
+
+def create_and_submit_task(task_data):
+    """
+    创建任务并提交到调度器（按优先级和客户端公平调度）或共享任务队列
+    
+    已有相同的进行中或已完成任务时不再提交，直接返回该任务。读写任务存储，应在线程池中调用。
+    
+    Args:
+        task_data (dict): build_download_task生成的任务记录
+    
+    Returns:
+        tuple: (任务记录, 是否新建)
+    """
+    task, created = create_or_get_task(task_data)
+    if created:
+        submit_download_task(task_data, load_cookies())
+    return task, created
+
+def download_video_task(task_id, url, cookies, merge, filename, video_quality_index=0, audio_quality_index=0, streaming=False,
+                        audio_only=False, audio_format=None, clip_start=None, clip_end=None, cancel_event=None, profile="copy", selection=None, embed_metadata=True,
+                        danmaku=False, subtitles=False, preview=False, resume=False):
+    """由调度器在工作线程中执行的下载任务"""
+    selection = selection or {}
+    extra_files = {}
+    extra_options = {'danmaku': danmaku, 'subtitles': subtitles, 'extra_files': extra_files, 'preview': preview,
+                     'stage_gate': scheduler.stage, 'resume': resume, 'name_tag': task_file_tag(task_id)}
+    
+    def record_extra_files():
+        # 弹幕、字幕和预览图在标记完成前写入任务，客户端看到completed时附加文件已可下载
+        update_task_status(task_id, danmaku_path=extra_files.get('danmaku'),
+                           subtitle_files=extra_files.get('subtitles') or [],
+                           preview_info=extra_files.get('preview'),
+                           partial_files=extra_files.get('partial_files') or [])
+
+    def mark_finished_or_failed():
+        # 暂停和取消导致的停止单独标记为paused/cancelled
+        if getattr(cancel_event, 'paused', False):
+            update_task_status(task_id, status="paused", message="任务已暂停，可通过恢复接口继续下载")
+        elif cancel_event is not None and cancel_event.is_set():
+            update_task_status(task_id, status="cancelled", progress=0, message="任务已取消")
+        else:
+            update_task_status(task_id, status="failed", message="下载失败")
+    
+    def discard_if_cancelled(paths):
+        # 取消请求在最后一步完成之后才生效时，输出已完整但任务应按取消处理：删除输出文件；
+        # 暂停请求到达时任务已经完成，没有可暂停的内容，按完成处理
+        if cancel_event is None or not cancel_event.is_set() or getattr(cancel_event, 'paused', False):
+            return False
+        for path in paths:
+            safe_delete_file(path, delay=0)
+        update_task_status(task_id, status="cancelled", progress=0, message="任务已取消")
+        return True
+    
     try:
+        if cancel_event is not None and cancel_event.is_set():
+            mark_finished_or_failed()
+            return
+        
         # 更新任务状态
         update_task_status(task_id, status="downloading", message="正在下载视频...")
         
         def progress_callback(current, total, message):
+            if total > 100:
+                # 下载阶段回调的是字节数（阶段标记和合并进度以100为总数），用于推送速度和剩余时间
+                progress_broker.record_transfer(task_id, current, total)
             if total > 0:
                 progress = int((current / total) * 100)
                 update_task_status(task_id, progress=progress, message=message)
             else:
                 update_task_status(task_id, message=message)
         
-        if merge:
+        if audio_only:
+            # 仅下载音频
+            result = select_quality_and_download(
+                url, cookies=cookies, output_dir=DOWNLOAD_DIR,
+                audio_quality_index=audio_quality_index,
+                filename=filename,
+                progress_callback=progress_callback,
+                audio_only=True,
+                audio_format=audio_format,
+                clip_start=clip_start,
+                clip_end=clip_end,
+                disk_wait_timeout=DISK_WAIT_TIMEOUT,
+                cancel_event=cancel_event,
+                merge_timeout=MERGE_TIMEOUT,
+                profile=profile,
+                **extra_options
+            )
+            record_extra_files()
+            
+            if result and isinstance(result, str):
+                if discard_if_cancelled([result]):
+                    return
+                update_task_status(
+                    task_id, 
+                    status="completed", 
+                    progress=100, 
+                    message="音频下载完成", 
+                    file_path=result,
+                    audio_path=result
+                )
+            else:
+                mark_finished_or_failed()
+        elif merge:
             # 下载并合并
             result = select_quality_and_download(
                 url, cookies=cookies, output_dir=DOWNLOAD_DIR, merge=True,
                 video_quality_index=video_quality_index,
                 audio_quality_index=audio_quality_index,
                 filename=filename,
-                progress_callback=progress_callback
+                progress_callback=progress_callback,
+                streaming=streaming,
+                clip_start=clip_start,
+                clip_end=clip_end,
+                disk_wait_timeout=DISK_WAIT_TIMEOUT,
+                cancel_event=cancel_event,
+                merge_timeout=MERGE_TIMEOUT,
+                profile=profile,
+                embed_metadata=embed_metadata,
+                **selection,
+                **extra_options
             )
+            record_extra_files()
             
             if result and isinstance(result, str):
+                if discard_if_cancelled([result]):
+                    return
                 update_task_status(
                     task_id, 
                     status="completed", 
@@ -552,7 +1017,7 @@ def download_video_task(task_id, url, cookies, merge, filename, video_quality_in
                     file_path=result
                 )
             else:
-                update_task_status(task_id, status="failed", message="下载失败")
+                mark_finished_or_failed()
         else:
             # 只下载，不合并
             result = select_quality_and_download(
@@ -560,10 +1025,17 @@ def download_video_task(task_id, url, cookies, merge, filename, video_quality_in
                 video_quality_index=video_quality_index,
                 audio_quality_index=audio_quality_index,
                 filename=filename,
-                progress_callback=progress_callback
+                progress_callback=progress_callback,
+                disk_wait_timeout=DISK_WAIT_TIMEOUT,
+                cancel_event=cancel_event,
+                **selection,
+                **extra_options
             )
+            record_extra_files()
             
-            if result and isinstance(result, tuple) and len(result) == 2:
+            if result and isinstance(result, tuple) and len(result) == 2 and all(result):
+                if discard_if_cancelled(result):
+                    return
                 video_path, audio_path = result
                 update_task_status(
                     task_id, 
@@ -574,7 +1046,7 @@ def download_video_task(task_id, url, cookies, merge, filename, video_quality_in
                     audio_path=audio_path
                 )
             else:
-                update_task_status(task_id, status="failed", message="下载失败")
+                mark_finished_or_failed()
     
     except Exception as e:
         print(f"下载任务执行失败: {e}")
@@ -584,6 +1056,143 @@ def download_video_task(task_id, url, cookies, merge, filename, video_quality_in
             message=f"下载失败: {str(e)}", 
             error=str(e)
         )
+    finally:
+        task_cancel_events.pop(task_id, None)
+
+@app.get("/api/video/stream", tags=["下载管理"], summary="边下载边播放/接收视频")
+async def stream_video(
+    url: str,
+    filename: Optional[str] = None,
+    video_quality: int = 0,
+    audio_quality: int = 0
+):
+    """创建下载任务并实时推送合并后的分片MP4(fMP4)数据
+    
+    视频流和音频流边下载边合并，客户端约一秒内即可收到首个字节，
+    无需等待整个下载和合并完成。输出同时保存到下载目录，完成后可通过任务ID再次下载。
+    
+    推流任务不经过调度器、去重和磁盘空间排队：响应体就是这次下载本身，
+    排队会让客户端等不到首字节，关联到其他请求的任务也无法把数据推给本次连接。
+    因此每个请求单独创建任务，磁盘空间不足时直接拒绝；任务可以取消，但不能暂停。
+    
+    Args:
+        url: B站视频链接
+        filename: 自定义文件名 (可选)
+        video_quality: 视频质量索引 (默认0-最高质量)
+        audio_quality: 音频质量索引 (默认0-最高质量)
+    
+    Returns:
+        video/mp4 分片流响应
+    """
+    if not url:
+        return PlainTextResponse("错误: 缺少必要参数 url", status_code=400)
+    
+    if not check_fifo_supported():
+        return PlainTextResponse("错误: 当前系统不支持命名管道，无法使用边下载边推流模式", status_code=501)
+    
+    cookies = load_cookies()
+    
+    # 解析视频信息（阻塞请求放到线程池中执行，避免阻塞事件循环）
+    playinfo = await run_in_threadpool(get_playinfo_from_bilibili, url, cookies)
+    if not playinfo:
+        return PlainTextResponse("错误: 获取视频信息失败，请检查URL或cookie", status_code=400)
+    
+    video_info = await run_in_threadpool(extract_video_info, playinfo, url, cookies)
+    if not video_info or not video_info['video_urls'] or not video_info['audio_urls']:
+        return PlainTextResponse("错误: 未找到可用的视频流或音频流", status_code=400)
+    
+    if video_quality >= len(video_info['video_urls']):
+        video_quality = 0
+    if audio_quality >= len(video_info['audio_urls']):
+        audio_quality = 0
+    selected_video = video_info['video_urls'][video_quality]
+    selected_audio = video_info['audio_urls'][audio_quality]
+    
+    # 生成文件名
+    if filename:
+        output_filename = filename
+    else:
+        bv_match = re.search(r'BV[a-zA-Z0-9]+', url)
+        output_filename = bv_match.group() if bv_match else f"bilibili_video_{int(time.time())}"
+    video_quality_name = get_quality_name(selected_video['quality'])
+    output_name = f"{output_filename}_{video_quality_name.replace(' ', '_')}.mp4"
+    output_path = os.path.join(DOWNLOAD_DIR, output_name)
+    
+    # 推流模式无法排队，磁盘空间不足时直接拒绝
+    duration = video_info.get('duration', 0)
+    required_bytes = estimate_stream_size(selected_video, duration) + estimate_stream_size(selected_audio, duration)
+    reservation_id = disk_space_manager.try_reserve(DOWNLOAD_DIR, required_bytes)
+    if reservation_id is None:
+        return PlainTextResponse(f"错误: 磁盘空间不足，需要约 {format_bytes(required_bytes)}", status_code=507)
+    
+    task_id = str(uuid.uuid4())
+    await run_in_threadpool(create_task, task_id, {
+        "id": task_id,
+        "url": url,
+        "status": "downloading",
+        "progress": 0,
+        "message": "正在边下载边推流...",
+        "created_at": datetime.now().isoformat(),
+        "merge": True,
+        "filename": filename,
+        "video_quality_index": video_quality,
+        "audio_quality_index": audio_quality,
+        "streaming": True,
+        "live_stream": True,
+        "file_path": None,
+        "video_path": None,
+        "audio_path": None,
+        "error": None
+    })
+    
+    def progress_callback(current, total, message):
+        if total > 0:
+            update_task_status(task_id, progress=int((current / total) * 100), message=message)
+        else:
+            update_task_status(task_id, message=message)
+    
+    # 推流任务由本次请求直接执行，取消请求通过停止标志结束生成器
+    cancel_event = CancelToken()
+    task_cancel_events[task_id] = cancel_event
+    
+    def body():
+        completed = False
+        try:
+            for chunk in stream_merged_fmp4(selected_video['url'], selected_audio['url'], output_path,
+                                            progress_callback=progress_callback, cancel_event=cancel_event):
+                yield chunk
+            completed = True
+            update_task_status(task_id, status="completed", progress=100, message="推流完成", file_path=output_path)
+        except InterruptedError:
+            update_task_status(task_id, status="cancelled", progress=0, message="任务已取消")
+        except Exception as e:
+            print(f"推流任务执行失败: {e}")
+            update_task_status(task_id, status="failed", message=f"推流失败: {str(e)}", error=str(e))
+        finally:
+            task_cancel_events.pop(task_id, None)
+            disk_space_manager.release(reservation_id)
+            if not completed and get_task_status(task_id)['status'] == 'downloading':
+                update_task_status(task_id, status="failed", message="客户端已断开连接", error="客户端已断开连接")
+    
+    return StreamingResponse(
+        body(),
+        media_type='video/mp4',
+        headers={
+            'Content-Disposition': f"inline; filename*=UTF-8''{quote(output_name)}",
+            'X-Task-Id': task_id
+        }
+    )
+
+def format_queue_position(task_id):
+    """生成排队位置和预计开始时间的文本，任务不在调度队列（或共享任务队列）中时返回空字符串"""
+    queue_info = (job_queue or scheduler).get_position(task_id)
+    if not queue_info:
+        return ""
+    text = f"\n排队位置: 第{queue_info['position']}位 (前面还有{queue_info['ahead']}个任务，优先级 {queue_info['priority']})"
+    if 'estimated_start' in queue_info:
+        estimated_start = datetime.fromtimestamp(queue_info['estimated_start']).strftime('%Y-%m-%d %H:%M:%S')
+        text += f"\n预计开始: {estimated_start} (约{queue_info['estimated_wait']}秒后)"
+    return text
 
 @app.get("/api/download/status/{task_id}", tags=["下载管理"], summary="查询下载状态")
 async def get_download_status(task_id: str):
@@ -595,16 +1204,19 @@ async def get_download_status(task_id: str):
     Returns:
         包含任务状态、进度、文件信息等的详细文本
     """
-    task = get_task_status(task_id)
+    task = await run_in_threadpool(get_task_status, task_id)
     if not task:
         return PlainTextResponse("错误: 任务不存在", status_code=404)
+    queue_text = await run_in_threadpool(format_queue_position, task_id) if task['status'] == 'pending' else ''
     
     # 状态图标映射
     status_icons = {
         'pending': '⏳',
         'downloading': '⬇️',
         'completed': '✅',
-        'failed': '❌'
+        'failed': '❌',
+        'cancelled': '🚫',
+        'paused': '⏸️'
     }
     
     status_icon = status_icons.get(task['status'], '❓')
@@ -622,59 +1234,178 @@ async def get_download_status(task_id: str):
 状态: {status_icon} {task['status'].upper()}
 进度: {task['progress']}%
 消息: {task['message']}
-创建时间: {formatted_time}
+创建时间: {formatted_time}{queue_text}
 
 任务详情:
   视频URL: {task['url']}
   合并模式: {'是' if task['merge'] else '否'}
+  仅音频模式: {'是' if task.get('audio_only') else '否'}
+  输出配置: {task.get('profile', 'copy')}
   视频质量索引: {task['video_quality_index']}
   音频质量索引: {task['audio_quality_index']}
   自定义文件名: {task['filename'] if task['filename'] else '使用默认名称'}"""
+    if task.get('worker'):
+        text_result += f"\n  工作节点: {task['worker']}"
+    if task.get('batch_id'):
+        text_result += f"\n  所属批次: {task['batch_id']} (/api/batch/status/{task['batch_id']})"
     
     # 添加文件路径信息
     if task['status'] == 'completed':
-        if task['merge'] and task.get('file_path'):
+        if task.get('audio_only') and task.get('file_path'):
+            text_result += f"\n\n文件信息:\n  音频文件: {task['file_path']}"
+            text_result += f"\n\n下载链接: /api/download/file/{task_id}"
+        elif task['merge'] and task.get('file_path'):
             text_result += f"\n\n文件信息:\n  合并文件: {task['file_path']}"
             text_result += f"\n\n下载链接: /api/download/file/{task_id}"
         elif not task['merge'] and task.get('video_path') and task.get('audio_path'):
             text_result += f"\n\n文件信息:\n  视频文件: {task['video_path']}\n  音频文件: {task['audio_path']}"
             text_result += f"\n\n下载链接:\n  视频: /api/download/file/{task_id}\n  合并: /api/download/merge/{task_id}"
     
+    # 添加弹幕和字幕文件信息
+    if task.get('danmaku_path'):
+        text_result += f"\n\n弹幕文件: {task['danmaku_path']}\n  下载: /api/download/extra/{task_id}?kind=danmaku"
+    for subtitle in task.get('subtitle_files') or []:
+        text_result += f"\n字幕文件 ({subtitle['lan_doc']}): {subtitle['path']}\n  下载: /api/download/extra/{task_id}?kind=subtitle&lan={subtitle['lan']}"
+    preview_info = task.get('preview_info')
+    if preview_info:
+        text_result += (f"\n预览雪碧图: {preview_info['columns']}x{preview_info['rows']} ({len(preview_info['times'])}张)"
+                        f"\n  下载: /api/download/extra/{task_id}?kind=sprite")
+        if preview_info.get('poster'):
+            text_result += f"\n预览封面: /api/download/extra/{task_id}?kind=poster"
+    
+    if task['status'] == 'paused':
+        text_result += f"\n\n恢复下载: /api/download/resume/{task_id}"
+    
     # 添加错误信息
     if task['status'] == 'failed' and task.get('error'):
         text_result += f"\n\n错误信息: {task['error']}"
     
     return PlainTextResponse(text_result)
 
-@app.get("/api/download/file/{task_id}", tags=["下载管理"], summary="下载已完成的文件")
-async def download_file(task_id: str):
+async def iter_progress_events(task_id=None):
+    """
+    生成推送给客户端的进度事件
+    
+    先发送当前状态的快照，之后推送更新（每个任务只推送间隔内的最新状态）；
+    其他工作进程中任务的更新经progress_broker的事件转发在1秒内到达。
+    单任务订阅在任务结束（完成、失败、取消或暂停）后停止。没有更新时生成None作为保活信号，
+    单任务订阅同时从任务存储核对一次状态，防止错过转发之前的更新。任务存储的读取都在线程池中执行。
+    
+    Args:
+        task_id (str): 只推送该任务，None表示推送全部任务
+    """
+    subscription = progress_broker.subscribe(task_id)
+    try:
+        if task_id:
+            task = await run_in_threadpool(get_task_status, task_id)
+            if task is None:
+                return
+            last_event = {**make_task_event(task), 'type': 'snapshot'}
+            yield last_event
+            if task.get('status') in FINAL_STATUSES:
+                return
+        else:
+            active_tasks = await run_in_threadpool(task_store.list_tasks, statuses=['pending', 'downloading', 'paused'])
+            for task in active_tasks:
+                yield {**make_task_event(task), 'type': 'snapshot'}
+        
+        while True:
+            events = await subscription.next_events()
+            if not events and task_id:
+                task = await run_in_threadpool(get_task_status, task_id)
+                if task and (task.get('status'), task.get('progress')) != (last_event.get('status'), last_event.get('progress')):
+                    events = [make_task_event(task)]
+            if not events:
+                yield None
+                continue
+            for event in events:
+                last_event = {**event, 'type': 'update'}
+                yield last_event
+            if task_id and last_event.get('status') in FINAL_STATUSES:
+                return
+            await asyncio.sleep(DEFAULT_PUSH_INTERVAL)
+    finally:
+        progress_broker.unsubscribe(subscription)
+
+@app.get("/api/download/events", tags=["下载管理"], summary="实时推送下载进度 (SSE)")
+async def download_events(task_id: Optional[str] = None):
+    """以Server-Sent Events推送任务的进度、速度、剩余时间和状态变化，代替轮询状态接口
+    
+    每条消息的data为JSON：task_id、type(snapshot/update)、status、progress、message，
+    下载阶段另有speed(字节/秒)和eta(秒)，任务完成时包含file_path等字段。
+    
+    Args:
+        task_id: 只推送该任务 (不填则推送全部任务)
+    
+    Returns:
+        text/event-stream 事件流
+    """
+    if task_id and not await run_in_threadpool(get_task_status, task_id):
+        return PlainTextResponse("错误: 任务不存在", status_code=404)
+    
+    async def event_stream():
+        async for event in iter_progress_events(task_id):
+            if event is None:
+                yield ": keepalive\n\n"
+            else:
+                yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.websocket("/api/download/ws")
+async def download_events_ws(websocket: WebSocket, task_id: Optional[str] = None):
+    """以WebSocket推送任务进度，消息格式与 /api/download/events 相同"""
+    await websocket.accept()
+    if task_id and not await run_in_threadpool(get_task_status, task_id):
+        await websocket.send_json({'type': 'error', 'message': '任务不存在'})
+        await websocket.close()
+        return
+    try:
+        async for event in iter_progress_events(task_id):
+            await websocket.send_json(event if event is not None else {'type': 'keepalive'})
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+
+def file_download_response(request, path, filename, media_type='application/octet-stream'):
+    """
+    返回支持断点续传和条件请求的文件响应
+    
+    Raises:
+        HTTPException: 文件不存在
+    """
+    try:
+        return serve_file(request, path, filename, media_type)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="文件不存在")
+
+@app.api_route("/api/download/file/{task_id}", methods=["GET", "HEAD"], tags=["下载管理"], summary="下载已完成的文件")
+async def download_file(task_id: str, request: Request):
     """下载已完成任务的文件
     
+    支持Range请求（断点续传、播放器拖动、多区间）、ETag和If-None-Match/If-Range等条件请求。
+    
     Args:
         task_id: 下载任务的唯一标识符
     
     Returns:
         文件流响应，浏览器将自动下载文件
     """
-    task = get_task_status(task_id)
+    task = await run_in_threadpool(get_task_status, task_id)
     if not task:
         raise HTTPException(status_code=404, detail="任务不存在")
     
     if task["status"] != "completed":
         raise HTTPException(status_code=400, detail="任务尚未完成")
     
-    # 检查是否是合并的文件
-    if task["merge"] and task.get("file_path"):
+    # 检查是否是合并的文件或仅音频文件
+    if (task["merge"] or task.get("audio_only")) and task.get("file_path"):
         file_path = task["file_path"]
         if not os.path.exists(file_path):
             raise HTTPException(status_code=404, detail="文件不存在")
         
-        filename = os.path.basename(file_path)
-        return FileResponse(
-            path=file_path,
-            filename=filename,
-            media_type='application/octet-stream'
-        )
+        return await run_in_threadpool(file_download_response, request, file_path, os.path.basename(file_path))
     
     # 如果是分离的文件，返回视频文件
     elif not task["merge"] and task.get("video_path"):
@@ -682,33 +1413,99 @@ async def download_file(task_id: str):
         if not os.path.exists(video_path):
             raise HTTPException(status_code=404, detail="视频文件不存在")
         
-        filename = os.path.basename(video_path)
-        return FileResponse(
-            path=video_path,
-            filename=filename,
-            media_type='application/octet-stream'
-        )
+        return await run_in_threadpool(file_download_response, request, video_path, os.path.basename(video_path))
+    
+    else:
+        raise HTTPException(status_code=404, detail="文件不存在")
+
+@app.get("/api/download/extra/{task_id}", tags=["下载管理"], summary="下载弹幕、字幕或预览图")
+async def download_extra_file(task_id: str, kind: str = "danmaku", lan: Optional[str] = None):
+    """下载任务附带获取的弹幕(ASS)、字幕(SRT)或预览图文件
     
+    Args:
+        task_id: 下载任务的唯一标识符
+        kind: 文件类型 ('danmaku'弹幕ASS，'subtitle'字幕SRT，'sprite'预览雪碧图，'poster'预览封面，
+              'preview'预览描述JSON，包含雪碧图布局和每张缩略图对应的时间)
+        lan: 字幕语言代码，如 zh-CN、ai-zh (不填则返回第一个字幕)
+    
+    Returns:
+        文件流响应
+    """
+    task = await run_in_threadpool(get_task_status, task_id)
+    if not task:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    
+    if kind == "danmaku":
+        file_path = task.get("danmaku_path")
+    elif kind == "subtitle":
+        subtitle_files = task.get("subtitle_files") or []
+        if lan:
+            subtitle_files = [subtitle for subtitle in subtitle_files if subtitle['lan'] == lan]
+        file_path = subtitle_files[0]['path'] if subtitle_files else None
+    elif kind in ("sprite", "poster", "preview"):
+        preview_info = task.get("preview_info") or {}
+        file_path = preview_info.get("index" if kind == "preview" else kind)
     else:
+        raise HTTPException(status_code=400, detail="kind 仅支持 danmaku、subtitle、sprite、poster、preview")
+    
+    if not file_path or not os.path.exists(file_path):
         raise HTTPException(status_code=404, detail="文件不存在")
+    
+    return FileResponse(
+        path=file_path,
+        filename=os.path.basename(file_path),
+        media_type='application/octet-stream'
+    )
 
-@app.get("/api/download/merge/{task_id}", tags=["下载管理"], summary="合并视频和音频")
-async def download_merged_file(task_id: str):
+async def merge_into_cache(cache_key, video_path, audio_path):
+    """合并视频和音频到临时文件，成功后原子发布为缓存项，返回缓存文件路径"""
+    cached = merge_cache.get(cache_key)
+    if cached:
+        return cached
+    
+    temp_path = merge_cache.temp_path_for(cache_key)
+    try:
+        # 优先在线程池中进行纯Python分片交织，失败时在独立的合并进程池中异步执行ffmpeg
+        if not await run_in_threadpool(remux_fragmented_mp4, video_path, audio_path, temp_path):
+            cmd = build_merge_command(video_path, audio_path, temp_path)
+            try:
+                result = await mux_pool.run_async(cmd, timeout=MERGE_TIMEOUT)
+            except FileNotFoundError:
+                raise HTTPException(status_code=500, detail="视频合并失败：文件不是分片MP4且未安装FFmpeg")
+            if result.returncode != 0 or result.cancelled or not os.path.exists(temp_path):
+                print(f"FFmpeg合并失败: {result.stop_reason or result.stderr}")
+                raise HTTPException(status_code=500, detail="视频合并失败")
+            verification = verify_mp4_file(temp_path)
+            if not verification['ok']:
+                print(f"合并输出校验失败: {verification['error']}")
+                raise HTTPException(status_code=500, detail="视频合并失败：输出文件不完整")
+        return merge_cache.put(cache_key, temp_path)
+    finally:
+        if os.path.exists(temp_path):
+            safe_delete_file(temp_path, max_retries=1, delay=0)
+
+@app.api_route("/api/download/merge/{task_id}", methods=["GET", "HEAD"], tags=["下载管理"], summary="合并视频和音频")
+async def download_merged_file(task_id: str, request: Request):
     """合并指定任务的视频和音频文件
     
+    合并结果来自合并缓存，与 /api/download/file 一样支持Range和条件请求。
+    
     Args:
         task_id: 下载任务的唯一标识符
     
     Returns:
         合并后的视频文件流响应
     """
-    task = get_task_status(task_id)
+    task = await run_in_threadpool(get_task_status, task_id)
     if not task:
         raise HTTPException(status_code=404, detail="任务不存在")
     
     if task["status"] != "completed":
         raise HTTPException(status_code=400, detail="任务尚未完成")
     
+    if task.get("audio_only"):
+        raise HTTPException(status_code=400, detail="仅音频任务没有可合并的视频")
+    
     if task["merge"]:
         raise HTTPException(status_code=400, detail="该任务已经是合并文件")
     
@@ -728,52 +1525,463 @@ async def download_merged_file(task_id: str):
             base_name = base_name[:-6]  # 移除 '_video' 后缀
         
         merged_filename = f"{base_name}_merged.mp4"
-        merged_path = os.path.join(DOWNLOAD_DIR, merged_filename)
-        
-        # 检查是否已经存在合并文件
-        if os.path.exists(merged_path):
-            return FileResponse(
-                path=merged_path,
-                filename=merged_filename,
-                media_type='video/mp4'
-            )
         
-        # 使用ffmpeg合并视频和音频
-        cmd = [
-            'ffmpeg',
-            '-i', video_path,
-            '-i', audio_path,
-            '-c:v', 'copy',
-            '-c:a', 'copy',
-            '-y',  # 覆盖输出文件
-            merged_path
-        ]
-        
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        
-        if result.returncode == 0 and os.path.exists(merged_path):
-            # 合并成功，返回文件
-            return FileResponse(
-                path=merged_path,
-                filename=merged_filename,
-                media_type='video/mp4'
+        # 按输入内容查找已合并的结果，命中时直接返回
+        cache_key = await run_in_threadpool(merge_cache.make_key, [video_path, audio_path])
+        merged_path = merge_cache.get(cache_key)
+        if not merged_path:
+            # 相同内容的并发请求只执行一次合并，其余请求等待同一个结果
+            merged_path = await merge_flights.run_async(
+                cache_key, lambda: merge_into_cache(cache_key, video_path, audio_path)
             )
-        else:
-            print(f"FFmpeg合并失败: {result.stderr}")
-            raise HTTPException(status_code=500, detail="视频合并失败")
+        
+        return await run_in_threadpool(file_download_response, request, merged_path, merged_filename, 'video/mp4')
     
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"合并文件时发生错误: {e}")
         raise HTTPException(status_code=500, detail=f"合并失败: {str(e)}")
 
+def request_task_stop(task, mode):
+    """
+    请求停止排队中或进行中的任务
+    
+    任务由本进程执行时直接设置其CancelToken；队列模式下通过任务队列转发给工作节点；
+    由同一台机器上的其他uvicorn工作进程执行时写入任务存储的stop_request字段，
+    由该进程的apply_stop_requests线程取到后执行
+    
+    Args:
+        task (dict): 任务记录
+        mode (str): 'cancel'或'pause'
+    
+    Returns:
+        bool: 任务仍在排队并已直接移除时为True，已向执行中的任务发出停止请求时为False，
+              任务不在运行时返回None
+    """
+    task_id = task['id']
+    if task_id in task_cancel_events:
+        return stop_local_task(task_id, mode)
+    if job_queue is not None:
+        if job_queue.remove(task_id):
+            return True
+        # 执行中的任务由工作节点在下次心跳时取到停止请求
+        return False if job_queue.request_stop(task_id, mode) else None
+    if is_process_alive(task.get('worker_pid')):
+        update_task_status(task_id, stop_request=mode)
+        return False
+    return None
+
+def stop_local_task(task_id, mode):
+    """
+    停止本进程调度器中排队或执行的任务
+    
+    Returns:
+        bool: 任务仍在排队并已直接移除时为True，已向执行中的任务发出停止请求时为False，
+              任务不在本进程中运行时返回None
+    """
+    cancel_event = task_cancel_events.get(task_id)
+    if cancel_event is None:
+        return None
+    if mode == 'pause':
+        cancel_event.pause()
+    else:
+        cancel_event.cancel()
+    if scheduler.remove(task_id):
+        task_cancel_events.pop(task_id, None)
+        return True
+    return False
+
+def cancel_task(task):
+    """
+    取消任务：已暂停的任务删除保留的部分文件，排队中的任务从队列中移除，执行中的任务发出停止请求
+    
+    Args:
+        task (dict): 任务记录
+    
+    Returns:
+        bool: 任务是否已立即取消，False表示已请求停止，任务稍后结束
+    
+    Raises:
+        ValueError: 任务已结束
+    """
+    task_id = task['id']
+    if task['status'] == 'paused':
+        # 已暂停的任务没有在运行，直接删除保留的部分文件（文件未被占用，无需等待句柄释放）
+        for path in task.get('partial_files') or []:
+            safe_delete_file(path, delay=0)
+        update_task_status(task_id, status="cancelled", progress=0, message="任务已取消", partial_files=[])
+        return True
+    
+    removed = request_task_stop(task, 'cancel') if task['status'] in ['pending', 'downloading'] else None
+    if removed is None:
+        raise ValueError(f"任务已结束，无法取消 (状态: {task['status']})")
+    if removed:
+        # 任务仍在排队，直接从队列中移除
+        update_task_status(task_id, **STOPPED_FIELDS['cancel'])
+    else:
+        update_task_status(task_id, message="正在取消任务...")
+    return removed
+
+def pause_task(task):
+    """
+    暂停排队中或进行中的任务
+    
+    Returns:
+        bool: 任务是否已立即暂停，False表示已请求暂停，任务稍后停止
+    
+    Raises:
+        ValueError: 任务未在运行
+    """
+    task_id = task['id']
+    if task.get('live_stream'):
+        raise ValueError("边下载边推流的任务没有可续传的中间文件，无法暂停，只能取消")
+    removed = request_task_stop(task, 'pause') if task['status'] in ['pending', 'downloading'] else None
+    if removed is None:
+        raise ValueError(f"任务未在运行，无法暂停 (状态: {task['status']})")
+    if removed:
+        # 任务仍在排队，从队列中移除，恢复时重新排队
+        update_task_status(task_id, **STOPPED_FIELDS['pause'])
+    else:
+        update_task_status(task_id, message="正在暂停...")
+    return removed
+
+def resume_task(task):
+    """
+    恢复已暂停的任务，重新排队后从保留的部分文件继续下载
+    
+    Raises:
+        ValueError: 任务不是暂停状态
+    """
+    if task['status'] != 'paused':
+        raise ValueError(f"只能恢复已暂停的任务 (状态: {task['status']})")
+    update_task_status(task['id'], status="pending", message="任务已恢复，等待继续下载...", worker_pid=os.getpid(),
+                       stop_request=None)
+    submit_download_task(task, load_cookies(), resume=True)
+
+@app.get("/api/download/cancel/{task_id}", tags=["下载管理"], summary="取消下载任务")
+async def cancel_download(task_id: str):
+    """取消排队中、进行中或已暂停的下载任务
+    
+    下载和合并阶段都会立即停止（结束ffmpeg进程），并删除已下载的临时文件释放磁盘空间。
+    
+    Args:
+        task_id: 下载任务的唯一标识符
+    
+    Returns:
+        取消结果文本
+    """
+    task = await run_in_threadpool(get_task_status, task_id)
+    if not task:
+        return PlainTextResponse("错误: 任务不存在", status_code=404)
+    
+    try:
+        # 删除部分文件和写入任务存储都是阻塞操作，放到线程池中执行
+        await run_in_threadpool(cancel_task, task)
+    except ValueError as e:
+        return PlainTextResponse(f"错误: {e}", status_code=400)
+    
+    if task['status'] == 'paused':
+        return PlainTextResponse(f"""任务已取消
+
+任务ID: {task_id}
+已删除暂停时保留的临时文件
+
+查询状态: /api/download/status/{task_id}""")
+    return PlainTextResponse(f"""取消请求已提交
+
+任务ID: {task_id}
+当前进度: {task['progress']}%
+
+查询状态: /api/download/status/{task_id}""")
+
+@app.get("/api/download/pause/{task_id}", tags=["下载管理"], summary="暂停下载任务")
+async def pause_download(task_id: str):
+    """暂停排队中或进行中的下载任务
+    
+    下载阶段立即停止并保留已下载的部分文件，任务让出调度槽位；
+    之后可通过恢复接口从断点继续下载。合并阶段暂停时保留已下载完整的流文件，恢复后重新合并。
+    
+    Args:
+        task_id: 下载任务的唯一标识符
+    
+    Returns:
+        暂停结果文本
+    """
+    task = await run_in_threadpool(get_task_status, task_id)
+    if not task:
+        return PlainTextResponse("错误: 任务不存在", status_code=404)
+    
+    try:
+        await run_in_threadpool(pause_task, task)
+    except ValueError as e:
+        return PlainTextResponse(f"错误: {e}", status_code=400)
+    return PlainTextResponse(f"""暂停请求已提交
+
+任务ID: {task_id}
+当前进度: {task['progress']}%
+
+查询状态: /api/download/status/{task_id}
+恢复下载: /api/download/resume/{task_id}""")
+
+@app.get("/api/download/resume/{task_id}", tags=["下载管理"], summary="恢复已暂停的下载任务")
+async def resume_download(task_id: str):
+    """恢复已暂停的下载任务
+    
+    任务按原来的优先级重新排队，开始后从暂停时保留的部分文件继续下载
+    （临时文件合并模式、仅下载模式和仅音频模式；边下载边合并和片段模式重新下载）。
+    
+    Args:
+        task_id: 下载任务的唯一标识符
+    
+    Returns:
+        恢复结果文本
+    """
+    task = await run_in_threadpool(get_task_status, task_id)
+    if not task:
+        return PlainTextResponse("错误: 任务不存在", status_code=404)
+    try:
+        await run_in_threadpool(resume_task, task)
+    except ValueError as e:
+        return PlainTextResponse(f"错误: {e}", status_code=400)
+    queue_text = await run_in_threadpool(format_queue_position, task_id)
+    return PlainTextResponse(f"""任务已恢复
+
+任务ID: {task_id}
+已保留的部分文件: {len(task.get('partial_files') or [])} 个
+{queue_text.strip()}
+
+查询状态: /api/download/status/{task_id}""")
+
+def parse_task_filters(status=None, since=None, until=None):
+    """
+    解析任务列表的筛选参数
+    
+    Args:
+        status (str): 逗号分隔的任务状态
+        since (str): 创建时间下限（含），ISO格式日期或时间，如 2025-09-01 或 2025-09-01T08:00
+        until (str): 创建时间上限（不含），格式同上
+    
+    Returns:
+        tuple: (状态列表或None, since, until)，时间转换为可与任务created_at直接比较的ISO字符串
+    
+    Raises:
+        ValueError: 参数无效，异常信息为返回给客户端的错误说明
+    """
+    statuses = None
+    if status:
+        statuses = [value.strip() for value in status.split(',') if value.strip()]
+        unknown = [value for value in statuses if value not in TASK_STATUSES]
+        if unknown:
+            raise ValueError(f"未知的任务状态: {'、'.join(unknown)}")
+    
+    bounds = []
+    for name, value in (('since', since), ('until', until)):
+        if not value:
+            bounds.append(None)
+            continue
+        try:
+            moment = datetime.fromisoformat(value)
+        except ValueError:
+            raise ValueError(f"{name} 时间格式无效，应为 YYYY-MM-DD 或 YYYY-MM-DDTHH:MM:SS")
+        if moment.tzinfo is not None:
+            # 任务创建时间为服务器本地时间
+            moment = moment.astimezone().replace(tzinfo=None)
+        bounds.append(moment.isoformat())
+    return statuses, bounds[0], bounds[1]
+
+def create_download_batch(urls, source, options, client_id, max_videos=MAX_BATCH_SIZE):
+    """
+    解析、去重并在一个事务中创建一批下载任务，新建的任务提交到调度器或共享任务队列
+    
+    cookies只加载一次；来源列表的分页和短链接并发解析；按视频标识去重后统一校验下载选项，
+    整批任务在任务存储的一个事务中按去重键查找或创建。
+    
+    Args:
+        urls (list): 视频URL、短链接、BV号或av号
+        source (dict): 视频来源，包含type(favorites/collection/uploader)、id和可选的mid，可为None
+        options (dict): build_download_task的下载选项（不含url和client_id）
+        client_id (str): 客户端标识
+        max_videos (int): 从来源中最多取的视频数
+    
+    Returns:
+        dict: 批次记录，task_ids为关联的任务ID
+    
+    Raises:
+        ValueError: 参数无效或无法获取来源列表，异常信息为返回给客户端的错误说明
+    """
+    cookies = load_cookies()
+    items = [url.strip() for url in urls if url and url.strip()]
+    if source:
+        if source['type'] not in SOURCE_TYPES:
+            raise ValueError(f"source.type 仅支持 {'、'.join(SOURCE_TYPES)}")
+        listed = list_source_videos(source['type'], source['id'], cookies, source.get('mid'),
+                                    min(max_videos, MAX_BATCH_SIZE), MAX_CONCURRENT_RESOLVES)
+        if listed is None:
+            raise ValueError(f"获取{SOURCE_TYPES[source['type']]}列表失败，请检查ID或cookie")
+        items.extend(listed)
+    if not items:
+        raise ValueError("没有需要下载的视频，请提供 urls 或 source")
+    
+    resolved = resolve_video_urls(items, MAX_CONCURRENT_RESOLVES)
+    invalid = []
+    unique = []
+    seen = set()
+    for item, url in zip(items, resolved):
+        if url is None:
+            invalid.append(item)
+            continue
+        video_key = canonicalize_video_url(url)
+        if video_key not in seen:
+            seen.add(video_key)
+            unique.append(url)
+    if not unique:
+        raise ValueError("没有可识别的视频地址")
+    if len(unique) > MAX_BATCH_SIZE:
+        raise ValueError(f"单个批次最多 {MAX_BATCH_SIZE} 个视频 (本次 {len(unique)} 个)")
+    
+    batch = {
+        'id': str(uuid.uuid4()),
+        'created_at': datetime.now().isoformat(),
+        'source': source,
+        'client': client_id,
+        'requested': len(items),
+        'duplicates': len(items) - len(invalid) - len(unique),
+        'invalid': invalid
+    }
+    tasks = []
+    for url in unique:
+        task = build_download_task(url, client_id=client_id, **options)
+        task.update(worker_pid=os.getpid(), batch_id=batch['id'])
+        tasks.append(task)
+    
+    results = task_store.create_batch(batch, tasks)
+    created_count = 0
+    for task, created in results:
+        if created:
+            created_count += 1
+            progress_broker.publish(task['id'], {'status': task['status'], 'progress': 0, 'message': task['message']})
+            submit_download_task(task, cookies)
+    print(f"批次 {batch['id']}: 提交 {len(items)} 项，新建 {created_count} 个任务，"
+          f"关联已有任务 {len(results) - created_count} 个", flush=True)
+    batch['task_ids'] = [task['id'] for task, _ in results]
+    return batch
+
+def summarize_batch(batch):
+    """
+    汇总批次内任务的状态和整体进度
+    
+    Args:
+        batch (dict): 批次记录
+    
+    Returns:
+        tuple: (汇总数据, 任务列表)；汇总数据的created为本批次新建的任务数，
+               progress为各任务进度的平均值（已完成按100%计），finished表示全部任务已结束
+    """
+    tasks = task_store.get_many(batch['task_ids'])
+    by_status = {}
+    for task in tasks:
+        by_status[task['status']] = by_status.get(task['status'], 0) + 1
+    progress = sum(100 if task['status'] == 'completed' else task.get('progress') or 0 for task in tasks)
+    summary = {
+        'id': batch['id'],
+        'created_at': batch['created_at'],
+        'source': batch.get('source'),
+        'requested': batch.get('requested', len(tasks)),
+        'duplicates': batch.get('duplicates', 0),
+        'invalid': batch.get('invalid') or [],
+        'total': len(tasks),
+        'created': sum(1 for task in tasks if task.get('batch_id') == batch['id']),
+        'progress': round(progress / len(tasks), 1) if tasks else 0,
+        'by_status': by_status,
+        'finished': all(task['status'] in TERMINAL_STATUSES for task in tasks)
+    }
+    return summary, tasks
+
+@app.get("/api/batch/status/{batch_id}", tags=["任务管理"], summary="查询批量下载进度")
+async def get_batch_status(batch_id: str):
+    """查询批量下载的整体进度和批次内每个任务的状态
+    
+    批次通过 POST /api/v2/batch 创建。
+    
+    Args:
+        batch_id: 批次ID
+    
+    Returns:
+        批次汇总和任务列表的文本
+    """
+    batch = await run_in_threadpool(task_store.get_batch, batch_id)
+    if not batch:
+        return PlainTextResponse("错误: 批次不存在", status_code=404)
+    summary, tasks = await run_in_threadpool(summarize_batch, batch)
+    
+    status_icons = {
+        'pending': '⏳',
+        'downloading': '⬇️',
+        'completed': '✅',
+        'failed': '❌',
+        'cancelled': '🚫',
+        'paused': '⏸️'
+    }
+    
+    source = summary['source']
+    lines = [f"""批量下载进度
+
+批次ID: {batch_id}
+创建时间: {summary['created_at'].replace('T', ' ').split('.')[0]}
+来源: {f"{SOURCE_TYPES.get(source['type'], source['type'])} {source['id']}" if source else 'URL列表'}
+提交数: {summary['requested']} (重复 {summary['duplicates']}，无法识别 {len(summary['invalid'])})
+任务数: {summary['total']} (新建 {summary['created']}，其余关联到已有的相同任务)
+整体进度: {summary['progress']}%{' (全部结束)' if summary['finished'] else ''}
+状态统计: {'，'.join(f"{status_icons.get(status, '❓')} {status} {count}" for status, count in summary['by_status'].items())}
+
+任务列表:
+"""]
+    for i, task in enumerate(tasks, 1):
+        lines.append(f"  {i}. {status_icons.get(task['status'], '❓')} {task['progress']}% {task['url']}\n"
+                     f"     任务ID: {task['id']}\n")
+    if summary['invalid']:
+        lines.append("\n无法识别的地址:\n")
+        lines.extend(f"  {item}\n" for item in summary['invalid'])
+    lines.append(f"\n查询任务状态: /api/download/status/<task_id>\nJSON格式: /api/v2/batch/{batch_id}")
+    return PlainTextResponse("".join(lines))
+
 @app.get("/api/tasks", tags=["任务管理"], summary="获取所有下载任务")
-async def get_all_tasks():
-    """获取所有下载任务的详细列表
+async def get_all_tasks(
+    status: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    with_total: bool = False
+):
+    """分页获取下载任务列表，按创建时间倒序
+    
+    Args:
+        status: 只显示这些状态的任务，多个状态用逗号分隔，如 pending,downloading
+        since: 只显示创建时间不早于该时间的任务，如 2025-09-01 或 2025-09-01T08:00
+        until: 只显示创建时间早于该时间的任务
+        cursor: 上一页末尾给出的游标，不填为第一页
+        limit: 每页任务数 (默认50，最大500)
+        with_total: 同时统计符合条件的任务总数 (需要扫描全部匹配的任务，默认不统计)
     
     Returns:
-        包含所有任务状态、进度、创建时间等信息的格式化文本列表
+        包含任务状态、进度、创建时间等信息的格式化文本列表，末尾给出下一页的链接
     """
-    if not download_tasks:
+    try:
+        statuses, since_value, until_value = parse_task_filters(status, since, until)
+        
+        def load_page():
+            tasks, next_cursor = task_store.list_page(statuses, since_value, until_value, cursor, limit)
+            total = task_store.count(statuses, since_value, until_value) if with_total else None
+            return total, tasks, next_cursor
+        
+        total, tasks, next_cursor = await run_in_threadpool(load_page)
+    except ValueError as e:
+        return PlainTextResponse(f"错误: {e}", status_code=400)
+    if not tasks:
+        if status or since or until or cursor:
+            return PlainTextResponse('没有符合条件的下载任务')
         return PlainTextResponse('当前没有任何下载任务')
     
     # 状态图标映射
@@ -781,55 +1989,446 @@ async def get_all_tasks():
         'pending': '⏳',
         'downloading': '⬇️',
         'completed': '✅',
-        'failed': '❌'
+        'failed': '❌',
+        'cancelled': '🚫',
+        'paused': '⏸️'
     }
     
-    # 线程安全地获取所有任务
-    with task_lock:
-        tasks_copy = download_tasks.copy()
-    
-    text_result = f"下载任务列表 (共 {len(tasks_copy)} 个任务)\n\n"
-    
-    # 按创建时间排序任务
-    sorted_tasks = sorted(tasks_copy.items(), key=lambda x: x[1]['created_at'], reverse=True)
+    if total is not None:
+        lines = [f"下载任务列表 (共 {total} 个任务，本页 {len(tasks)} 个)\n"]
+    else:
+        lines = [f"下载任务列表 (本页 {len(tasks)} 个)\n"]
+    if status or since or until:
+        lines.append(f"筛选条件: 状态 {status or '全部'}，创建时间 {since or '不限'} 至 {until or '不限'}\n")
+    lines.append("\n")
     
-    for i, (task_id, task) in enumerate(sorted_tasks, 1):
+    # 任务存储已按创建时间倒序返回
+    for i, task in enumerate(tasks, 1):
+        task_id = task['id']
         status_icon = status_icons.get(task['status'], '❓')
         
-        text_result += f"{i}. 任务ID: {task_id}\n"
-        text_result += f"   状态: {status_icon} {task['status'].upper()}\n"
-        text_result += f"   进度: {task['progress']}%\n"
-        text_result += f"   消息: {task['message']}\n"
+        lines.append(f"{i}. 任务ID: {task_id}\n")
+        lines.append(f"   状态: {status_icon} {task['status'].upper()}\n")
+        lines.append(f"   进度: {task['progress']}%\n")
+        lines.append(f"   消息: {task['message']}\n")
         # created_at 是 ISO 格式字符串，需要解析后格式化
         try:
             created_time = datetime.fromisoformat(task['created_at'].replace('T', ' ').split('.')[0])
             formatted_time = created_time.strftime('%Y-%m-%d %H:%M:%S')
         except:
             formatted_time = task['created_at']  # 如果解析失败，直接使用原字符串
-        text_result += f"   创建时间: {formatted_time}\n"
-        text_result += f"   视频URL: {task['url'][:50]}{'...' if len(task['url']) > 50 else ''}\n"
-        text_result += f"   合并模式: {'是' if task['merge'] else '否'}\n"
+        lines.append(f"   创建时间: {formatted_time}\n")
+        lines.append(f"   视频URL: {task['url'][:50]}{'...' if len(task['url']) > 50 else ''}\n")
+        lines.append(f"   合并模式: {'是' if task['merge'] else '否'}\n")
         
         # 添加文件信息
         if task['status'] == 'completed':
-            if task['merge'] and task.get('file_path'):
+            if (task['merge'] or task.get('audio_only')) and task.get('file_path'):
                 filename = os.path.basename(task['file_path'])
-                text_result += f"   文件: {filename}\n"
+                lines.append(f"   文件: {filename}\n")
             elif not task['merge'] and task.get('video_path'):
                 video_filename = os.path.basename(task['video_path'])
-                text_result += f"   视频文件: {video_filename}\n"
+                lines.append(f"   视频文件: {video_filename}\n")
         
-        text_result += "\n"  # 任务间空行
+        lines.append("\n")  # 任务间空行
+    
+    if next_cursor:
+        query = {key: value for key, value in (('status', status), ('since', since), ('until', until)) if value}
+        query.update(cursor=next_cursor, limit=limit)
+        lines.append(f"下一页: /api/tasks?{urlencode(query)}\n\n")
+    
+    lines.append("=== 操作说明 ===\n")
+    lines.append("筛选任务: /api/tasks?status=pending,downloading&since=2025-09-01&until=2025-09-08&limit=50\n")
+    lines.append("统计总数: /api/tasks?with_total=1\n")
+    lines.append("查询任务状态: /api/download/status/<task_id>\n")
+    lines.append("下载文件: /api/download/file/<task_id>\n")
+    lines.append("合并文件: /api/download/merge/<task_id>\n")
+    lines.append("取消任务: /api/download/cancel/<task_id>\n")
+    lines.append("暂停任务: /api/download/pause/<task_id>\n")
+    lines.append("恢复任务: /api/download/resume/<task_id>\n")
+    
+    text_result = "".join(lines)
+    return PlainTextResponse(text_result)
+
+@app.get("/api/system/disk", tags=["任务管理"], summary="查看磁盘空间与预留情况")
+async def get_disk_status():
+    """查看下载目录所在磁盘的空间使用和下载任务预留情况
     
-    text_result += "=== 操作说明 ===\n"
-    text_result += "查询任务状态: /api/download/status/<task_id>\n"
-    text_result += "下载文件: /api/download/file/<task_id>\n"
-    text_result += "合并文件: /api/download/merge/<task_id>\n"
+    Returns:
+        包含总空间、剩余空间、已预留空间和可分配空间的文本信息
+    """
+    stats = disk_space_manager.get_stats(DOWNLOAD_DIR)
+    text_result = f"""磁盘空间状态
+
+下载目录: {os.path.abspath(DOWNLOAD_DIR)}
+总空间: {format_bytes(stats['total'])}
+剩余空间: {format_bytes(stats['free'])}
+已预留空间: {format_bytes(stats['reserved'])} ({stats['reservations']} 个任务)
+安全余量: {format_bytes(stats['safety_margin'])}
+可分配空间: {format_bytes(max(stats['available'], 0))}
+
+说明: 下载任务开始前按 带宽×时长 预留空间，空间不足时排队等待最多 {DISK_WAIT_TIMEOUT} 秒。"""
+    return PlainTextResponse(text_result)
+
+@app.get("/api/system/mux", tags=["任务管理"], summary="查看合并进程池状态")
+async def get_mux_status():
+    """查看ffmpeg合并进程池的并发上限、运行中和排队中的合并数量
     
+    Returns:
+        合并进程池状态文本
+    """
+    stats = mux_pool.get_stats()
+    cache_stats = merge_cache.get_stats()
+    text_result = f"""合并进程池状态
+
+并发上限: {stats['max_workers']}
+运行中: {stats['running']}
+排队中: {stats['queued']}
+已完成: {stats['completed']}
+
+分通道状态:
+  流复制合并: 运行中 {stats['lanes']['copy']['running']}/{stats['lanes']['copy']['limit']}，排队中 {stats['lanes']['copy']['queued']}
+  转码: 运行中 {stats['lanes']['transcode']['running']}/{stats['lanes']['transcode']['limit']}，排队中 {stats['lanes']['transcode']['queued']}
+
+合并结果缓存:
+  缓存数量: {cache_stats['entries']}
+  占用空间: {format_bytes(cache_stats['total_bytes'])} / {format_bytes(cache_stats['max_bytes'])}
+  命中/未命中: {cache_stats['hits']} / {cache_stats['misses']}
+
+说明: 合并任务在独立的进程池中执行，与下载任务的传输并发互不占用；转码在单独的通道中排队，不会阻塞流复制合并。"""
     return PlainTextResponse(text_result)
 
+@app.get("/api/system/scheduler", tags=["任务管理"], summary="查看和调整任务调度器")
+async def get_scheduler_status(
+    transfer: Optional[int] = None,
+    resolve: Optional[int] = None,
+    per_client: Optional[int] = None,
+    mux: Optional[int] = None,
+    transcode: Optional[int] = None
+):
+    """查看调度器各并发池的状态，提供参数时在运行时调整对应的并发上限
+    
+    Args:
+        transfer: 网络传输（下载流数据）的并发任务数，解析和合并阶段不占用
+        resolve: 页面解析的并发数
+        per_client: 每个客户端同时运行的任务数
+        mux: 流复制合并的ffmpeg并发进程数
+        transcode: 转码的ffmpeg并发进程数
+    
+    Returns:
+        调度器状态文本
+    """
+    for value in (transfer, resolve, per_client, mux, transcode):
+        if value is not None and value < 1:
+            return PlainTextResponse("错误: 并发上限必须大于0", status_code=400)
+    scheduler.resize(transfer=transfer, resolve=resolve, per_client=per_client)
+    if mux:
+        mux_pool.resize('copy', mux)
+    if transcode:
+        mux_pool.resize('transcode', transcode)
+    
+    stats = scheduler.get_stats()
+    mux_stats = mux_pool.get_stats()
+    text_result = f"""任务调度器状态
+
+调度任务: 执行中 {stats['jobs']['running']}（解析或传输阶段 {stats['jobs']['active']}/{stats['jobs']['limit']}），排队中 {stats['jobs']['queued']}
+网络传输: 运行中 {stats['transfer']['running']}/{stats['transfer']['limit']}，等待中 {stats['transfer']['queued']}
+页面解析: 运行中 {stats['resolve']['running']}/{stats['resolve']['limit']}，等待中 {stats['resolve']['queued']}
+合并: 运行中 {mux_stats['lanes']['copy']['running']}/{mux_stats['lanes']['copy']['limit']}，排队中 {mux_stats['lanes']['copy']['queued']}
+转码: 运行中 {mux_stats['lanes']['transcode']['running']}/{mux_stats['lanes']['transcode']['limit']}，排队中 {mux_stats['lanes']['transcode']['queued']}
+每客户端并发上限: {stats['per_client_limit']}
+排队任务: 高 {stats['queued_by_priority']['high']} / 普通 {stats['queued_by_priority']['normal']} / 低 {stats['queued_by_priority']['low']}
+已完成: {stats['completed']} (平均耗时约{stats['average_seconds']}秒)
+"""
+    if stats['clients']:
+        text_result += "\n客户端:\n"
+        for client_id, client_stats in sorted(stats['clients'].items()):
+            text_result += f"  {client_id}: 运行中 {client_stats['running']}，排队中 {client_stats['queued']}\n"
+    text_result += "\n调整并发: /api/system/scheduler?transfer=8&resolve=4&per_client=2&mux=2&transcode=1"
+    return PlainTextResponse(text_result)
+
+@app.get("/api/system/workers", tags=["任务管理"], summary="查看共享任务队列和工作节点")
+async def get_worker_status():
+    """查看队列模式下共享任务队列的排队和执行数量，以及各工作节点的心跳
+    
+    Returns:
+        任务队列和工作节点状态文本
+    """
+    if job_queue is None:
+        return PlainTextResponse(f"当前为本地执行模式 (DISPATCH_MODE={DISPATCH_MODE})，下载由API进程的调度器执行\n\n查看调度器: /api/system/scheduler")
+    stats = await run_in_threadpool(job_queue.get_stats)
+    text_result = f"""共享任务队列状态
+
+队列类型: {stats['backend']}
+排队中: {stats['queued']}
+执行中: {stats['running']}
+待写入的状态更新: {stats['pending_updates']}
+
+工作节点 ({len(stats['workers'])} 个):
+"""
+    now = time.time()
+    for worker_id, worker in stats['workers'].items():
+        text_result += f"  {worker_id}: 执行中 {worker['running']}/{worker['capacity']}，{now - worker['heartbeat_at']:.0f}秒前心跳\n"
+    if not stats['workers']:
+        text_result += "  (无在线的工作节点，请使用 python worker.py 启动)\n"
+    return PlainTextResponse(text_result)
+
+def fetch_video_info(url, cookies):
+    """
+    获取并解析视频信息，合并标题和封面
+    
+    Returns:
+        dict: extract_video_info的返回值，失败返回None
+    """
+    playinfo = get_playinfo_from_bilibili(url, cookies)
+    if not playinfo:
+        return None
+    video_info = extract_video_info(playinfo, url, cookies)
+    if not video_info:
+        return None
+    title_cover_info = get_video_title_and_cover(url, cookies)
+    if title_cover_info:
+        video_info.update(title_cover_info)
+    return video_info
+
+def json_error(message, status_code):
+    return FastJSONResponse({'error': message}, status_code=status_code)
+
+def task_queue_position(task):
+    if task.get('status') != 'pending':
+        return None
+    return (job_queue or scheduler).get_position(task['id'])
+
+def serialize_tasks(tasks):
+    """序列化一组任务，排队位置从同一份队列快照中批量计算"""
+    pending = [task['id'] for task in tasks if task.get('status') == 'pending']
+    positions = (job_queue or scheduler).get_positions(pending) if pending else {}
+    return [serialize_task(task, positions.get(task['id'])) for task in tasks]
+
+@app.get("/api/v2/video/info", tags=["JSON API (v2)"], summary="获取视频详细信息 (JSON)",
+         response_model=VideoInfoResponse, responses={400: {"model": ErrorResponse}})
+async def get_video_info_v2(url: str, q: Optional[str] = None, stream_type: str = "all"):
+    """与 /api/video/info 相同，返回JSON
+    
+    Args:
+        url: B站视频链接
+        q: 设置为'auto'时包含流地址
+        stream_type: 'video'、'audio'或'all'
+    """
+    stream_type = stream_type.lower()
+    if stream_type not in ('video', 'audio', 'all'):
+        return json_error("stream_type 仅支持 video、audio、all", 400)
+    try:
+        video_info = await run_in_threadpool(fetch_video_info, url, load_cookies())
+        if not video_info:
+            return json_error("获取视频信息失败，请检查URL或cookie", 400)
+        include_urls = (q or '').lower() == 'auto'
+        video_streams, audio_streams = collect_stream_lists(video_info, stream_type, include_urls)
+        cover_url = video_info.get('cover')
+        if cover_url and cover_url.startswith('http://'):
+            cover_url = cover_url.replace('http://', 'https://')
+        return FastJSONResponse({
+            'url': url,
+            'title': video_info.get('title'),
+            'cover': cover_url,
+            'duration': video_info.get('duration', 0),
+            'highest_video': video_streams[0] if video_streams else None,
+            'highest_audio': audio_streams[0] if audio_streams else None,
+            'video_streams': video_streams,
+            'audio_streams': audio_streams
+        })
+    except Exception as e:
+        return json_error(f"服务器错误: {e}", 500)
+
+@app.get("/api/v2/video/quality", tags=["JSON API (v2)"], summary="获取可用质量选项 (JSON)",
+         response_model=QualityOptionsResponse, responses={404: {"model": ErrorResponse}})
+async def get_video_quality_v2(url: str):
+    """与 /api/video/quality 相同，返回JSON；选项中的index即下载时的video_quality/audio_quality"""
+    try:
+        quality_options = await run_in_threadpool(get_video_quality_options, url, load_cookies())
+        if not quality_options:
+            return json_error("无法获取视频质量选项，请检查URL或cookie", 404)
+        return FastJSONResponse({'url': url, **quality_options})
+    except Exception as e:
+        return json_error(f"服务器错误: {e}", 500)
+
+@app.post("/api/v2/video/download", tags=["JSON API (v2)"], summary="开始下载视频 (JSON)",
+          response_model=TaskCreatedResponse, responses={400: {"model": ErrorResponse}})
+async def download_video_v2(body: DownloadRequest, request: Request):
+    """与 /api/video/download 相同，参数放在JSON请求体中
+    
+    相同请求已有进行中或已完成的任务时返回该任务，created为false。
+    """
+    try:
+        task_data = build_download_task(
+            body.url, body.merge, body.filename, body.video_quality, body.audio_quality, body.streaming,
+            body.audio_only, body.audio_format, body.start, body.end, body.profile, body.policy, body.min_height,
+            body.max_bandwidth, body.codec, body.embed_metadata, body.danmaku, body.subtitles, body.preview,
+            body.priority, body.client or (request.client.host if request.client else "anonymous")
+        )
+    except ValueError as e:
+        return json_error(str(e), 400)
+    
+    def create():
+        task, created = create_and_submit_task(task_data)
+        return created, serialize_task(task, task_queue_position(task))
+    
+    try:
+        created, item = await run_in_threadpool(create)
+        return FastJSONResponse({'created': created, 'task': item}, status_code=201 if created else 200)
+    except Exception as e:
+        return json_error(f"服务器错误: {e}", 500)
+
+def batch_response(batch):
+    summary, tasks = summarize_batch(batch)
+    summary['items'] = serialize_tasks(tasks)
+    return summary
+
+@app.post("/api/v2/batch", tags=["JSON API (v2)"], summary="批量创建下载任务 (JSON)",
+          response_model=BatchResponse, status_code=201, responses={400: {"model": ErrorResponse}})
+async def create_batch_v2(body: BatchRequest, request: Request):
+    """一次提交一批视频：URL列表，或收藏夹、合集、UP主投稿，下载选项对全部视频生效
+    
+    地址规范化并去重后，所有任务在一个事务中创建；与已有任务相同的视频关联到该任务。
+    返回批次ID和批次汇总，之后通过 GET /api/v2/batch/{batch_id} 查询整体进度。
+    """
+    options = {name: getattr(body, name) for name in DOWNLOAD_OPTION_FIELDS}
+    source = None
+    if body.source is not None:
+        source = {'type': body.source.type, 'id': body.source.id, 'mid': body.source.mid}
+    client_id = body.client or (request.client.host if request.client else "anonymous")
+    try:
+        batch = await run_in_threadpool(create_download_batch, body.urls, source, options, client_id, body.max_videos)
+    except ValueError as e:
+        return json_error(str(e), 400)
+    except Exception as e:
+        return json_error(f"服务器错误: {e}", 500)
+    return FastJSONResponse(await run_in_threadpool(batch_response, batch), status_code=201)
+
+@app.get("/api/v2/batch/{batch_id}", tags=["JSON API (v2)"], summary="查询批量下载进度 (JSON)",
+         response_model=BatchResponse, responses={404: {"model": ErrorResponse}})
+async def get_batch_v2(batch_id: str):
+    """返回批次的整体进度、各状态的任务数和批次内每个任务的状态"""
+    batch = await run_in_threadpool(task_store.get_batch, batch_id)
+    if not batch:
+        return json_error("批次不存在", 404)
+    return FastJSONResponse(await run_in_threadpool(batch_response, batch))
+
+@app.get("/api/v2/download/status/{task_id}", tags=["JSON API (v2)"], summary="查询下载状态 (JSON)",
+         response_model=TaskResponse, responses={404: {"model": ErrorResponse}})
+async def get_download_status_v2(task_id: str):
+    """与 /api/download/status/{task_id} 相同，返回JSON；排队中的任务包含queue排队位置"""
+    def load_task():
+        task = get_task_status(task_id)
+        return task and serialize_task(task, task_queue_position(task))
+    
+    item = await run_in_threadpool(load_task)
+    if not item:
+        return json_error("任务不存在", 404)
+    return FastJSONResponse(item)
+
+@app.post("/api/v2/download/{task_id}/{action}", tags=["JSON API (v2)"], summary="取消、暂停或恢复任务 (JSON)",
+          response_model=TaskActionResponse, responses={404: {"model": ErrorResponse}, 409: {"model": ErrorResponse}})
+async def task_action_v2(task_id: str, action: str):
+    """对任务执行操作
+    
+    Args:
+        task_id: 任务ID
+        action: 'cancel'、'pause'或'resume'
+    
+    Returns:
+        操作后的任务状态；done为false表示已向执行中的任务发出请求，任务稍后停止
+    """
+    actions = {'cancel': cancel_task, 'pause': pause_task, 'resume': resume_task}
+    if action not in actions:
+        return json_error(f"action 仅支持 {'、'.join(actions)}", 404)
+    task = await run_in_threadpool(get_task_status, task_id)
+    if not task:
+        return json_error("任务不存在", 404)
+    try:
+        # 取消已暂停的任务会删除部分文件，与写入任务存储一样放到线程池中执行
+        done = await run_in_threadpool(actions[action], task)
+    except ValueError as e:
+        return json_error(str(e), 409)
+    task = await run_in_threadpool(get_task_status, task_id)
+    return FastJSONResponse({'id': task_id, 'status': task['status'], 'message': task.get('message'),
+                             'done': done is not False})
+
+@app.get("/api/v2/tasks", tags=["JSON API (v2)"], summary="获取下载任务列表 (JSON)",
+         response_model=TaskListResponse, responses={400: {"model": ErrorResponse}})
+async def get_tasks_v2(
+    status: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+    with_total: bool = False
+):
+    """分页获取下载任务，按创建时间倒序
+    
+    推荐使用游标翻页：把返回的next_cursor作为下一次请求的cursor，直到next_cursor为null，
+    每页的耗时与任务总数无关。offset翻页需要跳过前面的任务，只适合浏览前几页，不能与cursor同时使用。
+    
+    Args:
+        status: 只返回这些状态的任务，多个状态用逗号分隔，如 pending,downloading
+        since: 只返回创建时间不早于该时间的任务，如 2025-09-01 或 2025-09-01T08:00
+        until: 只返回创建时间早于该时间的任务
+        cursor: 上一页返回的next_cursor
+        limit: 每页任务数 (默认50，最大500)
+        offset: 跳过的任务数
+        with_total: 同时统计符合条件的任务总数；统计需要扫描全部匹配的任务，只在需要时请求
+    
+    Returns:
+        total为符合条件的任务总数（未请求with_total时为null），items为当前页的任务，next_cursor为下一页的游标
+    """
+    if cursor and offset:
+        return json_error("cursor 和 offset 不能同时使用", 400)
+    try:
+        statuses, since_value, until_value = parse_task_filters(status, since, until)
+        
+        def load_page():
+            total = task_store.count(statuses, since_value, until_value) if with_total else None
+            if offset:
+                tasks, has_more = task_store.list_page(statuses, since_value, until_value, None, offset + limit)
+                tasks = tasks[offset:]
+                next_cursor = encode_cursor(tasks[-1]) if tasks and has_more else None
+            else:
+                tasks, next_cursor = task_store.list_page(statuses, since_value, until_value, cursor, limit)
+            return total, serialize_tasks(tasks), next_cursor
+        
+        total, items, next_cursor = await run_in_threadpool(load_page)
+    except ValueError as e:
+        return json_error(str(e), 400)
+    return FastJSONResponse({
+        'total': total,
+        'offset': offset,
+        'limit': limit,
+        'next_cursor': next_cursor,
+        'items': items
+    })
+
+@app.get("/api/v2/system", tags=["JSON API (v2)"], summary="查看服务状态 (JSON)")
+async def get_system_status_v2():
+    """返回任务存储、调度器、合并进程池、磁盘空间和共享任务队列的统计数据"""
+    def collect():
+        return {
+            'version': app.version,
+            'dispatch_mode': DISPATCH_MODE,
+            'tasks': task_store.get_stats(),
+            'scheduler': scheduler.get_stats(),
+            'mux': mux_pool.get_stats(),
+            'merge_cache': merge_cache.get_stats(),
+            'disk': disk_space_manager.get_stats(DOWNLOAD_DIR),
+            'job_queue': job_queue.get_stats() if job_queue is not None else None,
+            'progress': progress_broker.get_stats()
+        }
+    return FastJSONResponse(await run_in_threadpool(collect))
+
 @app.exception_handler(404)
 async def not_found_handler(request, exc):
+    if request.url.path.startswith("/api/v2/"):
+        return json_error("接口不存在", 404)
     text_result = """❌ 404 - 接口不存在
 
 请求的接口路径不存在，请检查URL是否正确。
@@ -839,10 +2438,25 @@ async def not_found_handler(request, exc):
   GET  /api/video/info             - 获取视频信息
   GET  /api/video/quality          - 获取视频质量选项
   GET  /api/video/download         - 下载视频
+  GET  /api/video/stream           - 边下载边推流 (实时返回fMP4)
   GET  /api/download/status/<id>   - 查询下载状态
+  GET  /api/download/events        - 实时推送下载进度 (SSE，可选 ?task_id=)
+  WS   /api/download/ws            - 实时推送下载进度 (WebSocket，可选 ?task_id=)
   GET  /api/download/file/<id>     - 下载文件
   GET  /api/download/merge/<id>    - 合并下载视频音频
+  GET  /api/download/extra/<id>    - 下载弹幕、字幕或预览图
+  GET  /api/download/cancel/<id>   - 取消下载任务
+  GET  /api/download/pause/<id>    - 暂停下载任务
+  GET  /api/download/resume/<id>   - 恢复已暂停的任务
   GET  /api/tasks                  - 获取所有任务
+  GET  /api/batch/status/<id>      - 查询批量下载进度 (批次通过 POST /api/v2/batch 创建)
+  GET  /api/system/disk            - 查看磁盘空间与预留情况
+  GET  /api/system/mux             - 查看合并进程池状态
+  GET  /api/system/scheduler       - 查看和调整任务调度器
+  GET  /api/system/workers         - 查看共享任务队列和工作节点
+  GET  /api/v2/...                 - 以上接口的JSON版本 (video/info、video/quality、POST video/download、
+                                     download/status/<id>、POST download/<id>/cancel|pause|resume、tasks、system、
+                                     POST batch 批量下载、batch/<id>)
 
 如需帮助，请访问首页获取详细API文档。"""
     return PlainTextResponse(text_result, status_code=404)
@@ -869,10 +2483,23 @@ if __name__ == "__main__":
     print("  GET  /api/video/info             - 获取视频信息 (支持 &q=auto 参数获取全部视频和音频流)")
     print("  GET  /api/video/quality          - 获取视频质量选项")
     print("  GET  /api/video/download         - 下载视频")
+    print("  GET  /api/video/stream           - 边下载边推流 (实时返回fMP4)")
     print("  GET  /api/download/status/<id>   - 查询下载状态")
+    print("  GET  /api/download/events        - 实时推送下载进度 (SSE，可选 ?task_id=)")
+    print("  WS   /api/download/ws            - 实时推送下载进度 (WebSocket，可选 ?task_id=)")
     print("  GET  /api/download/file/<id>     - 下载文件")
     print("  GET  /api/download/merge/<id>    - 合并下载视频音频")
+    print("  GET  /api/download/extra/<id>    - 下载弹幕、字幕或预览图")
+    print("  GET  /api/download/cancel/<id>   - 取消下载任务")
+    print("  GET  /api/download/pause/<id>    - 暂停下载任务")
+    print("  GET  /api/download/resume/<id>   - 恢复已暂停的任务")
     print("  GET  /api/tasks                  - 获取所有任务")
+    print("  GET  /api/batch/status/<id>      - 查询批量下载进度")
+    print("  GET  /api/system/disk            - 查看磁盘空间与预留情况")
+    print("  GET  /api/system/mux             - 查看合并进程池状态")
+    print("  GET  /api/system/scheduler       - 查看和调整任务调度器")
+    print("  GET  /api/system/workers         - 查看共享任务队列和工作节点")
+    print("  GET  /api/v2/...                 - 以上接口的JSON版本，API文档见 /openapi.json")
     print("\n服务器将在 http://localhost:8000 启动")
     
 
@@ -0,0 +1,307 @@
+import os
+import re
+import stat
+import uuid
+from email.utils import formatdate, parsedate_to_datetime
+from functools import partial
+from urllib.parse import quote
+
+import anyio
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import Response
+
+# 非零拷贝发送时每次读取的字节数
+CHUNK_SIZE = 1024 * 1024
+
+# 单个请求最多允许的区间数（合并相邻和重叠区间之后），超过时忽略Range返回完整文件
+MAX_RANGES = 16
+
+# ASGI服务器支持零拷贝发送时在scope['extensions']中声明的扩展名
+ZEROCOPY_EXTENSION = 'http.response.zerocopysend'
+
+
+def make_etag(stat_result):
+    """
+    由文件的inode、大小和修改时间生成强ETag
+
+    下载目录和合并缓存中的文件都是写完后原子重命名到位的，完成后内容不再变化，
+    因此不必读取整个文件计算哈希。
+
+    Returns:
+        str: 带引号的ETag
+    """
+    return f'"{stat_result.st_ino:x}-{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}"'
+
+
+def parse_range_header(header, size):
+    """
+    解析Range请求头
+
+    Args:
+        header (str): Range头的值，如 bytes=0-499,1000-
+        size (int): 文件大小
+
+    Returns:
+        list: 按起始位置排序、已合并重叠和相邻区间的(start, end)列表（end包含在内）；
+              头无效、不是bytes单位或区间过多时返回None（应忽略Range返回完整文件），
+              所有区间都超出文件范围时返回空列表（应返回416）
+    """
+    match = re.fullmatch(r'\s*bytes\s*=\s*(.+)', header or '', re.IGNORECASE)
+    if not match:
+        return None
+    ranges = []
+    for part in match.group(1).split(','):
+        part = part.strip()
+        if not part:
+            continue
+        range_match = re.fullmatch(r'(\d*)\s*-\s*(\d*)', part)
+        if not range_match or range_match.group(1) == range_match.group(2) == '':
+            return None
+        first, last = range_match.groups()
+        if first == '':
+            # 后缀区间：最后N个字节
+            length = int(last)
+            if length == 0:
+                continue
+            start, end = max(0, size - length), size - 1
+        else:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+            if last and int(last) < start:
+                return None
+            if start >= size:
+                continue
+        if start <= end:
+            ranges.append((start, end))
+
+    ranges.sort()
+    merged = []
+    for start, end in ranges:
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    if len(merged) > MAX_RANGES:
+        return None
+    return merged
+
+
+def etag_matches(header, etag, weak=False):
+    """
+    判断If-Match/If-None-Match/If-Range中的ETag列表是否包含etag
+
+    Args:
+        header (str): 请求头的值
+        etag (str): 当前的强ETag
+        weak (bool): 是否使用弱比较（If-None-Match使用弱比较，其余使用强比较）
+    """
+    if header.strip() == '*':
+        return True
+    for candidate in re.findall(r'(?:W/)?"[^"]*"', header):
+        if candidate.startswith('W/'):
+            if weak and candidate[2:] == etag:
+                return True
+        elif candidate == etag:
+            return True
+    return False
+
+
+def _parse_http_date(value):
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return None
+
+
+def evaluate_preconditions(headers, etag, mtime):
+    """
+    按RFC 9110的顺序处理条件请求头
+
+    Args:
+        headers: 请求头（大小写不敏感的映射）
+        etag (str): 文件的强ETag
+        mtime (float): 文件修改时间
+
+    Returns:
+        int: 412或304表示直接返回该状态码，None表示继续处理请求
+    """
+    last_modified = int(mtime)
+    if_match = headers.get('if-match')
+    if if_match is not None:
+        if not etag_matches(if_match, etag):
+            return 412
+    else:
+        if_unmodified_since = _parse_http_date(headers.get('if-unmodified-since'))
+        if if_unmodified_since is not None and last_modified > if_unmodified_since:
+            return 412
+
+    if_none_match = headers.get('if-none-match')
+    if if_none_match is not None:
+        if etag_matches(if_none_match, etag, weak=True):
+            return 304
+    else:
+        if_modified_since = _parse_http_date(headers.get('if-modified-since'))
+        if if_modified_since is not None and last_modified <= if_modified_since:
+            return 304
+    return None
+
+
+def range_applies(headers, etag, mtime):
+    """If-Range与当前文件一致（或没有If-Range）时才按Range返回部分内容，否则返回完整文件"""
+    if_range = headers.get('if-range')
+    if if_range is None:
+        return True
+    if_range = if_range.strip()
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        return if_range == etag
+    date = _parse_http_date(if_range)
+    return date is not None and int(mtime) == int(date)
+
+
+def content_disposition(filename):
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
+
+class FileRangeResponse(Response):
+    """
+    发送文件的全部或部分区间
+
+    ASGI服务器声明了 http.response.zerocopysend 扩展时由服务器用sendfile零拷贝发送，
+    否则在线程池中按块pread读取后发送。客户端断开连接后立即停止读取。
+    HEAD请求只发送响应头。
+    """
+
+    def __init__(self, file, size, ranges, headers, media_type, status_code):
+        super().__init__(status_code=status_code, headers=headers)
+        self.file = file
+        self.size = size
+        self.ranges = ranges
+        self.file_media_type = media_type
+        if len(ranges) > 1:
+            self.boundary = uuid.uuid4().hex
+            self.parts = [
+                (f"--{self.boundary}\r\nContent-Type: {media_type}\r\n"
+                 f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n").encode('latin-1')
+                for start, end in ranges
+            ]
+            self.closing = f"--{self.boundary}--\r\n".encode('latin-1')
+            length = sum(len(part) + end - start + 1 + 2 for part, (start, end) in zip(self.parts, ranges)) + len(self.closing)
+            self.headers['content-type'] = f"multipart/byteranges; boundary={self.boundary}"
+        else:
+            length = sum(end - start + 1 for start, end in ranges)
+            self.headers['content-type'] = media_type
+        self.headers['content-length'] = str(length)
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await send({'type': 'http.response.start', 'status': self.status_code, 'headers': self.raw_headers})
+            if scope.get('method') == 'HEAD':
+                await send({'type': 'http.response.body', 'body': b''})
+                return
+            async with anyio.create_task_group() as task_group:
+                async def run_until_first_complete(function):
+                    await function()
+                    task_group.cancel_scope.cancel()
+
+                task_group.start_soon(run_until_first_complete, partial(self.send_ranges, scope, send))
+                await run_until_first_complete(partial(self.listen_for_disconnect, receive))
+        finally:
+            self.file.close()
+
+    async def listen_for_disconnect(self, receive):
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                break
+
+    async def send_ranges(self, scope, send):
+        zerocopy = ZEROCOPY_EXTENSION in (scope.get('extensions') or {})
+        if not self.ranges:
+            # 空文件
+            await send({'type': 'http.response.body', 'body': b''})
+            return
+        if len(self.ranges) == 1:
+            start, end = self.ranges[0]
+            await self.send_range(send, start, end - start + 1, zerocopy, more_body=False)
+            return
+        for part, (start, end) in zip(self.parts, self.ranges):
+            await send({'type': 'http.response.body', 'body': part, 'more_body': True})
+            await self.send_range(send, start, end - start + 1, zerocopy, more_body=True)
+            await send({'type': 'http.response.body', 'body': b'\r\n', 'more_body': True})
+        await send({'type': 'http.response.body', 'body': self.closing, 'more_body': False})
+
+    async def send_range(self, send, offset, count, zerocopy, more_body):
+        if zerocopy:
+            await send({'type': ZEROCOPY_EXTENSION, 'file': self.file, 'offset': offset, 'count': count,
+                        'more_body': more_body})
+            return
+        fd = self.file.fileno()
+        while count > 0:
+            chunk = await run_in_threadpool(os.pread, fd, min(CHUNK_SIZE, count), offset)
+            if not chunk:
+                # 文件在发送过程中被截断
+                raise OSError(f"文件在发送过程中被截断: 偏移 {offset}")
+            offset += len(chunk)
+            count -= len(chunk)
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': more_body or count > 0})
+
+
+def serve_file(request, path, filename=None, media_type='application/octet-stream'):
+    """
+    生成文件下载响应，支持Range/多区间请求、强ETag和条件请求
+
+    - Range: 单个区间返回206，多个区间返回multipart/byteranges，超出文件范围返回416
+    - If-None-Match / If-Modified-Since 命中时返回304，If-Match / If-Unmodified-Since 不满足时返回412
+    - If-Range 与当前文件不一致时忽略Range，返回完整文件
+
+    Args:
+        request (Request): 当前请求
+        path (str): 文件路径
+        filename (str): 下载时的文件名，None表示不设置Content-Disposition
+        media_type (str): 文件的MIME类型
+
+    Returns:
+        Response: 响应对象
+
+    Raises:
+        FileNotFoundError: 文件不存在或不是普通文件
+    """
+    # 打开后对同一个文件描述符取stat，ETag与实际发送的内容一致
+    file = open(path, 'rb', buffering=0)
+    try:
+        stat_result = os.fstat(file.fileno())
+        if not stat.S_ISREG(stat_result.st_mode):
+            raise FileNotFoundError(path)
+        etag = make_etag(stat_result)
+        headers = {
+            'accept-ranges': 'bytes',
+            'etag': etag,
+            'last-modified': formatdate(stat_result.st_mtime, usegmt=True)
+        }
+        if filename:
+            headers['content-disposition'] = content_disposition(filename)
+
+        status_code = evaluate_preconditions(request.headers, etag, stat_result.st_mtime)
+        if status_code is not None:
+            file.close()
+            return Response(status_code=status_code, headers=headers if status_code == 304 else {'etag': etag})
+
+        size = stat_result.st_size
+        ranges = None
+        range_header = request.headers.get('range')
+        if range_header is not None and range_applies(request.headers, etag, stat_result.st_mtime):
+            ranges = parse_range_header(range_header, size)
+            if ranges == []:
+                file.close()
+                return Response(status_code=416, headers={'content-range': f"bytes */{size}", 'accept-ranges': 'bytes', 'etag': etag})
+        if ranges:
+            if len(ranges) == 1:
+                headers['content-range'] = f"bytes {ranges[0][0]}-{ranges[0][1]}/{size}"
+            return FileRangeResponse(file, size, ranges, headers, media_type, 206)
+        return FileRangeResponse(file, size, [(0, size - 1)] if size else [], headers, media_type, 200)
+    except BaseException:
+        file.close()
+        raise
@@ -0,0 +1,672 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+from scheduler import PRIORITY_CLASSES
+
+# 工作节点超过该时间（秒）没有心跳时，其正在执行的任务重新排队
+DEFAULT_STALE_TIMEOUT = 60
+
+# 一个任务因工作节点失联被重新排队的最大次数，超过后标记为失败
+DEFAULT_MAX_ATTEMPTS = 3
+
+# 一次最多取出的状态更新条数
+DEFAULT_UPDATE_BATCH = 200
+
+
+def make_worker_id():
+    """生成工作节点标识：主机名:进程号"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def mark_resume(payload):
+    """重新排队的任务从已下载的部分文件继续"""
+    return {**payload, 'resume': True}
+
+
+class SQLiteJobQueue:
+    """
+    基于SQLite(WAL模式)的共享任务队列
+
+    API进程和同一台机器上的多个工作进程打开同一个数据库文件：
+    API进程入队，工作进程用IMMEDIATE事务认领任务（同一任务只会被一个工作进程认领），
+    执行过程中的状态更新写入job_updates表，由API进程取出后写入任务存储。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " task_id TEXT PRIMARY KEY,"
+            " payload TEXT NOT NULL,"
+            " priority INTEGER NOT NULL,"
+            " status TEXT NOT NULL,"
+            " worker_id TEXT,"
+            " heartbeat_at REAL,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " stop_request TEXT,"
+            " enqueued_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_queue ON jobs(status, priority, enqueued_at)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS job_updates ("
+            " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " task_id TEXT NOT NULL,"
+            " fields TEXT NOT NULL)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS workers ("
+            " worker_id TEXT PRIMARY KEY,"
+            " heartbeat_at REAL NOT NULL,"
+            " running INTEGER NOT NULL,"
+            " capacity INTEGER NOT NULL)"
+        )
+
+    def _conn(self):
+        # sqlite3连接不能跨线程共享，每个线程使用自己的连接
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA busy_timeout=30000")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def _transaction(self, function):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = function(conn)
+            conn.execute("COMMIT")
+            return result
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def enqueue(self, task_id, payload, priority='normal'):
+        """
+        任务入队
+
+        Args:
+            task_id (str): 任务ID
+            payload (dict): 下载选项，由工作进程原样取出
+            priority (str): 优先级类别（PRIORITY_CLASSES）
+        """
+        self._conn().execute(
+            "INSERT OR REPLACE INTO jobs (task_id, payload, priority, status, enqueued_at) VALUES (?, ?, ?, 'queued', ?)",
+            (task_id, json.dumps(payload, ensure_ascii=False), PRIORITY_CLASSES.get(priority, PRIORITY_CLASSES['normal']),
+             time.time())
+        )
+
+    def claim(self, worker_id):
+        """
+        认领优先级最高、入队最早的任务
+
+        Returns:
+            dict: 包含task_id、payload和attempts，队列为空时返回None
+        """
+        def claim_next(conn):
+            row = conn.execute(
+                "SELECT task_id, payload, attempts FROM jobs WHERE status = 'queued' ORDER BY priority, enqueued_at LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', worker_id = ?, heartbeat_at = ? WHERE task_id = ?",
+                (worker_id, time.time(), row[0])
+            )
+            return {'task_id': row[0], 'payload': json.loads(row[1]), 'attempts': row[2]}
+        return self._transaction(claim_next)
+
+    def heartbeat(self, worker_id, task_ids, capacity):
+        """
+        刷新工作节点和其正在执行任务的心跳
+
+        Args:
+            worker_id (str): 工作节点标识
+            task_ids (list): 正在执行的任务ID
+            capacity (int): 工作节点的并发数
+
+        Returns:
+            tuple: (收到停止请求的任务ID到'cancel'/'pause'的映射,
+                    已不再由该节点认领的任务ID列表：心跳超时后被重新排队、标记为失败或已被删除)
+        """
+        now = time.time()
+        task_ids = list(task_ids)
+
+        def beat(conn):
+            conn.execute(
+                "INSERT OR REPLACE INTO workers (worker_id, heartbeat_at, running, capacity) VALUES (?, ?, ?, ?)",
+                (worker_id, now, len(task_ids), capacity)
+            )
+            stops, lost = {}, []
+            for task_id in task_ids:
+                cursor = conn.execute("UPDATE jobs SET heartbeat_at = ? WHERE task_id = ? AND worker_id = ?",
+                                      (now, task_id, worker_id))
+                if cursor.rowcount == 0:
+                    lost.append(task_id)
+                    continue
+                row = conn.execute("SELECT stop_request FROM jobs WHERE task_id = ?", (task_id,)).fetchone()
+                if row and row[0]:
+                    stops[task_id] = row[0]
+            return stops, lost
+        return self._transaction(beat)
+
+    def complete(self, task_id, worker_id):
+        """
+        任务执行结束（完成、失败、取消或暂停），从队列中删除
+
+        任务已被重新排队并由其他节点认领时不做任何操作。
+
+        Returns:
+            bool: 任务是否仍由该节点认领并已删除
+        """
+        cursor = self._conn().execute("DELETE FROM jobs WHERE task_id = ? AND worker_id = ?", (task_id, worker_id))
+        return cursor.rowcount > 0
+
+    def release(self, task_id, worker_id):
+        """
+        工作节点退出前放回未完成的任务，不计入失败次数
+
+        Returns:
+            bool: 任务是否仍由该节点认领并已放回队列
+        """
+        def put_back(conn):
+            row = conn.execute("SELECT payload FROM jobs WHERE task_id = ? AND status = 'running' AND worker_id = ?",
+                               (task_id, worker_id)).fetchone()
+            if row is None:
+                return False
+            conn.execute(
+                "UPDATE jobs SET status = 'queued', worker_id = NULL, heartbeat_at = NULL, payload = ? WHERE task_id = ?",
+                (json.dumps(mark_resume(json.loads(row[0])), ensure_ascii=False), task_id)
+            )
+            self._publish(conn, task_id, {'status': 'pending', 'message': f"工作节点 {worker_id} 已退出，任务已重新排队"})
+            return True
+        return self._transaction(put_back)
+
+    def remove(self, task_id):
+        """
+        移除尚未被认领的任务
+
+        Returns:
+            bool: 任务是否仍在排队并已被移除
+        """
+        cursor = self._conn().execute("DELETE FROM jobs WHERE task_id = ? AND status = 'queued'", (task_id,))
+        return cursor.rowcount > 0
+
+    def request_stop(self, task_id, mode):
+        """
+        请求执行中的任务停止，由工作节点在下次心跳时取到
+
+        Args:
+            task_id (str): 任务ID
+            mode (str): 'cancel'或'pause'
+
+        Returns:
+            bool: 任务是否在队列中
+        """
+        cursor = self._conn().execute("UPDATE jobs SET stop_request = ? WHERE task_id = ?", (mode, task_id))
+        return cursor.rowcount > 0
+
+    def requeue_stale(self, timeout=DEFAULT_STALE_TIMEOUT, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        """
+        将心跳超时的工作节点正在执行的任务重新排队，超过最大次数的任务标记为失败
+
+        Returns:
+            tuple: (重新排队的任务ID列表, 标记为失败的任务ID列表)
+        """
+        cutoff = time.time() - timeout
+
+        def reap(conn):
+            requeued, failed = [], []
+            rows = conn.execute(
+                "SELECT task_id, payload, attempts, worker_id FROM jobs WHERE status = 'running' AND heartbeat_at < ?",
+                (cutoff,)
+            ).fetchall()
+            for task_id, payload, attempts, worker_id in rows:
+                if attempts + 1 >= max_attempts:
+                    conn.execute("DELETE FROM jobs WHERE task_id = ?", (task_id,))
+                    self._publish(conn, task_id, {
+                        'status': 'failed', 'message': f"工作节点 {worker_id} 失联，任务已重试{attempts + 1}次",
+                        'error': "工作节点失联"
+                    })
+                    failed.append(task_id)
+                    continue
+                conn.execute(
+                    "UPDATE jobs SET status = 'queued', worker_id = NULL, heartbeat_at = NULL, attempts = ?, payload = ?"
+                    " WHERE task_id = ?",
+                    (attempts + 1, json.dumps(mark_resume(json.loads(payload)), ensure_ascii=False), task_id)
+                )
+                self._publish(conn, task_id, {'status': 'pending', 'message': f"工作节点 {worker_id} 失联，任务已重新排队"})
+                requeued.append(task_id)
+            conn.execute("DELETE FROM workers WHERE heartbeat_at < ?", (cutoff,))
+            return requeued, failed
+        return self._transaction(reap)
+
+    def _publish(self, conn, task_id, fields):
+        conn.execute("INSERT INTO job_updates (task_id, fields) VALUES (?, ?)", (task_id, json.dumps(fields, ensure_ascii=False)))
+
+    def publish(self, task_id, fields, worker_id=None):
+        """
+        工作节点发布任务状态更新
+
+        Args:
+            task_id (str): 任务ID
+            fields (dict): 更新字段
+            worker_id (str): 发布的工作节点，任务已不再由该节点认领时丢弃更新；为None时不检查
+        """
+        if worker_id is None:
+            self._publish(self._conn(), task_id, fields)
+            return
+        self._conn().execute(
+            "INSERT INTO job_updates (task_id, fields) SELECT ?, ? WHERE EXISTS"
+            " (SELECT 1 FROM jobs WHERE task_id = ? AND worker_id = ?)",
+            (task_id, json.dumps(fields, ensure_ascii=False), task_id, worker_id)
+        )
+
+    def consume_updates(self, limit=DEFAULT_UPDATE_BATCH):
+        """
+        按发布顺序取出并删除状态更新
+
+        Returns:
+            list: (任务ID, 更新字段)列表
+        """
+        def take(conn):
+            rows = conn.execute("SELECT seq, task_id, fields FROM job_updates ORDER BY seq LIMIT ?", (limit,)).fetchall()
+            if rows:
+                conn.execute("DELETE FROM job_updates WHERE seq <= ?", (rows[-1][0],))
+            return [(task_id, json.loads(fields)) for _, task_id, fields in rows]
+        return self._transaction(take)
+
+    def get_position(self, task_id):
+        """
+        查询排队中任务的位置
+
+        Returns:
+            dict: 包含position(从1开始)、ahead和priority，任务不在排队时返回None
+        """
+        return self.get_positions([task_id]).get(task_id)
+
+    def get_positions(self, task_ids):
+        """
+        批量查询排队中任务的位置，一次查询完成
+
+        Returns:
+            dict: 任务ID到位置信息的映射，不在排队的任务不包含在内
+        """
+        task_ids = list(dict.fromkeys(task_ids))
+        if not task_ids:
+            return {}
+        # RANK()-1 即排在前面的任务数，与逐个统计 priority/enqueued_at 更小的任务一致
+        rows = self._conn().execute(
+            "SELECT task_id, priority, ahead FROM ("
+            "SELECT task_id, priority, RANK() OVER (ORDER BY priority, enqueued_at) - 1 AS ahead "
+            "FROM jobs WHERE status = 'queued') "
+            f"WHERE task_id IN ({','.join('?' * len(task_ids))})",
+            task_ids
+        ).fetchall()
+        names = {value: name for name, value in PRIORITY_CLASSES.items()}
+        return {task_id: {'position': ahead + 1, 'ahead': ahead, 'priority': names.get(priority, 'normal')}
+                for task_id, priority, ahead in rows}
+
+    def get_stats(self):
+        conn = self._conn()
+        counts = dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        workers = conn.execute("SELECT worker_id, heartbeat_at, running, capacity FROM workers ORDER BY worker_id").fetchall()
+        return {
+            'backend': 'sqlite',
+            'path': self.path,
+            'queued': counts.get('queued', 0),
+            'running': counts.get('running', 0),
+            'pending_updates': conn.execute("SELECT COUNT(*) FROM job_updates").fetchone()[0],
+            'workers': {worker_id: {'heartbeat_at': heartbeat_at, 'running': running, 'capacity': capacity}
+                        for worker_id, heartbeat_at, running, capacity in workers}
+        }
+
+    def close(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self.local.conn = None
+
+
+# 原子地取出分数最小的任务并记入执行中集合
+CLAIM_SCRIPT = """
+local item = redis.call('ZPOPMIN', KEYS[1])
+if #item == 0 then return false end
+redis.call('ZADD', KEYS[2], ARGV[1], item[1])
+redis.call('HSET', ARGV[3] .. item[1], 'worker_id', ARGV[2])
+return item[1]
+"""
+
+# 心跳仍早于截止时间时才从执行中集合移除，与工作节点的心跳(ZADD XX)互斥：
+# 分开执行ZRANGEBYSCORE和ZREM时，期间刚刚恢复心跳的任务也会被重新排队
+REMOVE_STALE_SCRIPT = """
+local score = redis.call('ZSCORE', KEYS[1], ARGV[1])
+if not score or tonumber(score) >= tonumber(ARGV[2]) then return 0 end
+redis.call('ZREM', KEYS[1], ARGV[1])
+return 1
+"""
+
+
+# 心跳只刷新仍由该工作节点认领的任务；已不再认领的任务返回0，其他任务返回停止请求（没有时为空字符串）
+HEARTBEAT_SCRIPT = """
+local result = {}
+for i = 4, #ARGV do
+    local job = ARGV[3] .. ARGV[i]
+    if redis.call('HGET', job, 'worker_id') == ARGV[2] then
+        redis.call('ZADD', KEYS[1], 'XX', ARGV[1], ARGV[i])
+        result[#result + 1] = redis.call('HGET', job, 'stop_request') or ''
+    else
+        result[#result + 1] = 0
+    end
+end
+return result
+"""
+
+# 任务仍由该工作节点认领时才从执行中集合移除（ARGV[3]为1时同时删除任务）：
+# 任务因心跳超时被重新排队并由其他节点认领后，原节点不能再结束或放回它
+REMOVE_OWNED_SCRIPT = """
+if redis.call('HGET', KEYS[2], 'worker_id') ~= ARGV[2] then return 0 end
+redis.call('ZREM', KEYS[1], ARGV[1])
+if ARGV[3] == '1' then redis.call('DEL', KEYS[2]) end
+return 1
+"""
+
+# 任务仍由该工作节点认领时才发布状态更新
+PUBLISH_OWNED_SCRIPT = """
+if redis.call('HGET', KEYS[2], 'worker_id') ~= ARGV[1] then return 0 end
+redis.call('RPUSH', KEYS[1], ARGV[2])
+return 1
+"""
+
+
+class RedisJobQueue:
+    """
+    基于Redis（及兼容Redis协议的服务）的共享任务队列，API节点和工作节点可以分布在不同机器上
+
+    - {prefix}:queue       有序集合，分数由优先级和入队时间组成
+    - {prefix}:running     有序集合，分数为最近一次心跳时间
+    - {prefix}:job:<id>    哈希，保存下载选项、认领的工作节点、重试次数和停止请求
+    - {prefix}:updates     列表，工作节点发布的状态更新
+    - {prefix}:workers     哈希，工作节点的心跳和并发信息
+
+    需要安装redis包（pip install redis），Redis 5.0以上。
+    """
+
+    def __init__(self, url, prefix='bilibili:jobs'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("使用Redis任务队列需要先安装redis包: pip install redis")
+        self.url = url
+        self.prefix = prefix
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self.claim_script = self.client.register_script(CLAIM_SCRIPT)
+        self.remove_stale_script = self.client.register_script(REMOVE_STALE_SCRIPT)
+        self.heartbeat_script = self.client.register_script(HEARTBEAT_SCRIPT)
+        self.remove_owned_script = self.client.register_script(REMOVE_OWNED_SCRIPT)
+        self.publish_owned_script = self.client.register_script(PUBLISH_OWNED_SCRIPT)
+
+    def _key(self, name):
+        return f"{self.prefix}:{name}"
+
+    def _job_key(self, task_id):
+        return f"{self.prefix}:job:{task_id}"
+
+    @staticmethod
+    def _score(priority, enqueued_at):
+        # 优先级在前，同一优先级内按入队时间（毫秒）排序
+        return PRIORITY_CLASSES.get(priority, PRIORITY_CLASSES['normal']) * 10 ** 13 + int(enqueued_at * 1000)
+
+    def enqueue(self, task_id, payload, priority='normal'):
+        """
+        任务入队
+
+        Args:
+            task_id (str): 任务ID
+            payload (dict): 下载选项，由工作节点原样取出
+            priority (str): 优先级类别（PRIORITY_CLASSES）
+        """
+        now = time.time()
+        pipe = self.client.pipeline()
+        pipe.delete(self._job_key(task_id))
+        pipe.hset(self._job_key(task_id), mapping={
+            'payload': json.dumps(payload, ensure_ascii=False), 'priority': priority, 'attempts': 0, 'enqueued_at': now
+        })
+        pipe.zadd(self._key('queue'), {task_id: self._score(priority, now)})
+        pipe.execute()
+
+    def claim(self, worker_id):
+        """
+        认领优先级最高、入队最早的任务
+
+        Returns:
+            dict: 包含task_id、payload和attempts，队列为空时返回None
+        """
+        task_id = self.claim_script(keys=[self._key('queue'), self._key('running')],
+                                    args=[time.time(), worker_id, f"{self.prefix}:job:"])
+        if not task_id:
+            return None
+        job = self.client.hgetall(self._job_key(task_id))
+        if not job.get('payload'):
+            # 认领前任务已被删除
+            self.client.zrem(self._key('running'), task_id)
+            return None
+        return {'task_id': task_id, 'payload': json.loads(job['payload']), 'attempts': int(job.get('attempts', 0))}
+
+    def heartbeat(self, worker_id, task_ids, capacity):
+        """
+        刷新工作节点和其正在执行任务的心跳
+
+        Returns:
+            tuple: (收到停止请求的任务ID到'cancel'/'pause'的映射, 已不再由该节点认领的任务ID列表)
+        """
+        now = time.time()
+        task_ids = list(task_ids)
+        self.client.hset(self._key('workers'), worker_id,
+                         json.dumps({'heartbeat_at': now, 'running': len(task_ids), 'capacity': capacity}))
+        if not task_ids:
+            return {}, []
+        results = self.heartbeat_script(keys=[self._key('running')], args=[now, worker_id, f"{self.prefix}:job:", *task_ids])
+        # 不再认领的任务结果为0，没有停止请求的为空字符串
+        stops = {task_id: mode for task_id, mode in zip(task_ids, results) if mode}
+        lost = [task_id for task_id, mode in zip(task_ids, results) if mode == 0]
+        return stops, lost
+
+    def _remove_owned(self, task_id, worker_id, delete):
+        return bool(self.remove_owned_script(keys=[self._key('running'), self._job_key(task_id)],
+                                             args=[task_id, worker_id, 1 if delete else 0]))
+
+    def complete(self, task_id, worker_id):
+        """
+        任务执行结束（完成、失败、取消或暂停），从队列中删除
+
+        任务已被重新排队并由其他节点认领时不做任何操作。
+
+        Returns:
+            bool: 任务是否仍由该节点认领并已删除
+        """
+        return self._remove_owned(task_id, worker_id, delete=True)
+
+    def _put_back(self, task_id, count_attempt):
+        # 调用方已把任务从执行中集合移除
+        job = self.client.hgetall(self._job_key(task_id))
+        if not job.get('payload'):
+            return False
+        attempts = int(job.get('attempts', 0)) + (1 if count_attempt else 0)
+        pipe = self.client.pipeline()
+        pipe.hset(self._job_key(task_id), mapping={
+            'payload': json.dumps(mark_resume(json.loads(job['payload'])), ensure_ascii=False), 'attempts': attempts
+        })
+        pipe.hdel(self._job_key(task_id), 'worker_id')
+        pipe.zadd(self._key('queue'), {task_id: self._score(job.get('priority'), float(job.get('enqueued_at', time.time())))})
+        pipe.execute()
+        return True
+
+    def release(self, task_id, worker_id):
+        """
+        工作节点退出前放回未完成的任务，不计入失败次数
+
+        Returns:
+            bool: 任务是否仍由该节点认领并已放回队列
+        """
+        if not self._remove_owned(task_id, worker_id, delete=False) or not self._put_back(task_id, count_attempt=False):
+            return False
+        self.publish(task_id, {'status': 'pending', 'message': f"工作节点 {worker_id} 已退出，任务已重新排队"})
+        return True
+
+    def remove(self, task_id):
+        """
+        移除尚未被认领的任务
+
+        Returns:
+            bool: 任务是否仍在排队并已被移除
+        """
+        if self.client.zrem(self._key('queue'), task_id):
+            self.client.delete(self._job_key(task_id))
+            return True
+        return False
+
+    def request_stop(self, task_id, mode):
+        """
+        请求执行中的任务停止，由工作节点在下次心跳时取到
+
+        Returns:
+            bool: 任务是否在队列中
+        """
+        if not self.client.exists(self._job_key(task_id)):
+            return False
+        self.client.hset(self._job_key(task_id), 'stop_request', mode)
+        return True
+
+    def requeue_stale(self, timeout=DEFAULT_STALE_TIMEOUT, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        """
+        将心跳超时的工作节点正在执行的任务重新排队，超过最大次数的任务标记为失败
+
+        Returns:
+            tuple: (重新排队的任务ID列表, 标记为失败的任务ID列表)
+        """
+        cutoff = time.time() - timeout
+        requeued, failed = [], []
+        for task_id in self.client.zrangebyscore(self._key('running'), '-inf', cutoff):
+            # 原子地确认心跳仍然超时并移除，移除成功的一方负责后续处理
+            if not self.remove_stale_script(keys=[self._key('running')], args=[task_id, cutoff]):
+                continue
+            job = self.client.hgetall(self._job_key(task_id))
+            worker_id = job.get('worker_id')
+            if int(job.get('attempts', 0)) + 1 >= max_attempts:
+                self.client.delete(self._job_key(task_id))
+                self.publish(task_id, {
+                    'status': 'failed', 'message': f"工作节点 {worker_id} 失联，任务已重试{int(job.get('attempts', 0)) + 1}次",
+                    'error': "工作节点失联"
+                })
+                failed.append(task_id)
+            elif self._put_back(task_id, count_attempt=True):
+                self.publish(task_id, {'status': 'pending', 'message': f"工作节点 {worker_id} 失联，任务已重新排队"})
+                requeued.append(task_id)
+        for worker_id, info in self.client.hgetall(self._key('workers')).items():
+            if json.loads(info)['heartbeat_at'] < cutoff:
+                self.client.hdel(self._key('workers'), worker_id)
+        return requeued, failed
+
+    def publish(self, task_id, fields, worker_id=None):
+        """
+        工作节点发布任务状态更新
+
+        Args:
+            task_id (str): 任务ID
+            fields (dict): 更新字段
+            worker_id (str): 发布的工作节点，任务已不再由该节点认领时丢弃更新；为None时不检查
+        """
+        update = json.dumps({'task_id': task_id, 'fields': fields}, ensure_ascii=False)
+        if worker_id is None:
+            self.client.rpush(self._key('updates'), update)
+        else:
+            self.publish_owned_script(keys=[self._key('updates'), self._job_key(task_id)], args=[worker_id, update])
+
+    def consume_updates(self, limit=DEFAULT_UPDATE_BATCH):
+        """
+        按发布顺序取出并删除状态更新
+
+        Returns:
+            list: (任务ID, 更新字段)列表
+        """
+        pipe = self.client.pipeline()
+        pipe.lrange(self._key('updates'), 0, limit - 1)
+        pipe.ltrim(self._key('updates'), limit, -1)
+        items, _ = pipe.execute()
+        updates = [json.loads(item) for item in items]
+        return [(update['task_id'], update['fields']) for update in updates]
+
+    def get_position(self, task_id):
+        """
+        查询排队中任务的位置
+
+        Returns:
+            dict: 包含position(从1开始)、ahead和priority，任务不在排队时返回None
+        """
+        return self.get_positions([task_id]).get(task_id)
+
+    def get_positions(self, task_ids):
+        """
+        批量查询排队中任务的位置，所有查询在一个pipeline中发送
+
+        Returns:
+            dict: 任务ID到位置信息的映射，不在排队的任务不包含在内
+        """
+        task_ids = list(dict.fromkeys(task_ids))
+        if not task_ids:
+            return {}
+        pipe = self.client.pipeline(transaction=True)
+        for task_id in task_ids:
+            pipe.zrank(self._key('queue'), task_id)
+            pipe.hget(self._job_key(task_id), 'priority')
+        results = pipe.execute()
+        positions = {}
+        for task_id, ahead, priority in zip(task_ids, results[0::2], results[1::2]):
+            if ahead is not None:
+                positions[task_id] = {'position': ahead + 1, 'ahead': ahead, 'priority': priority or 'normal'}
+        return positions
+
+    def get_stats(self):
+        workers = {worker_id: json.loads(info) for worker_id, info in self.client.hgetall(self._key('workers')).items()}
+        return {
+            'backend': 'redis',
+            'url': self.url,
+            'queued': self.client.zcard(self._key('queue')),
+            'running': self.client.zcard(self._key('running')),
+            'pending_updates': self.client.llen(self._key('updates')),
+            'workers': dict(sorted(workers.items()))
+        }
+
+    def close(self):
+        self.client.close()
+
+
+def create_job_queue(backend='sqlite', path=None, url=None):
+    """
+    按配置创建共享任务队列
+
+    Args:
+        backend (str): 'sqlite'（同一台机器上的多个工作进程）或'redis'（多台机器）
+        path (str): SQLite数据库路径
+        url (str): Redis连接地址，如 redis://localhost:6379/0
+
+    Returns:
+        SQLiteJobQueue or RedisJobQueue: 任务队列实例
+    """
+    if backend == 'sqlite':
+        return SQLiteJobQueue(path or 'jobs.db')
+    if backend == 'redis':
+        return RedisJobQueue(url or 'redis://localhost:6379/0')
+    raise ValueError(f"未知的任务队列类型: {backend}")
@@ -0,0 +1,240 @@
+import os
+import struct
+
+
+def read_box_header(data, offset=0):
+    """
+    解析MP4 box头部
+
+    Args:
+        data (bytes): 包含box的数据
+        offset (int): box在数据中的起始位置
+
+    Returns:
+        tuple: (box类型, box总大小, 头部大小)，数据不足时返回None
+    """
+    if offset + 8 > len(data):
+        return None
+    size, box_type = struct.unpack_from('>I4s', data, offset)
+    header_size = 8
+    if size == 1:
+        if offset + 16 > len(data):
+            return None
+        size = struct.unpack_from('>Q', data, offset + 8)[0]
+        header_size = 16
+    elif size == 0:
+        # size为0表示box延伸到数据末尾
+        size = len(data) - offset
+    return box_type.decode('latin-1'), size, header_size
+
+
+def iter_boxes(data, offset=0, end=None):
+    """
+    遍历数据中的同级MP4 box
+
+    Args:
+        data (bytes): 包含box的数据
+        offset (int): 起始位置
+        end (int): 结束位置，默认为数据末尾
+
+    Yields:
+        tuple: (box类型, box起始位置, box总大小, 头部大小)
+    """
+    if end is None:
+        end = len(data)
+    while offset < end:
+        header = read_box_header(data, offset)
+        if not header:
+            return
+        box_type, size, header_size = header
+        if size < header_size:
+            return
+        yield box_type, offset, size, header_size
+        offset += size
+
+
+def find_box(data, box_type, offset=0, end=None):
+    """
+    查找第一个指定类型的同级box
+
+    Args:
+        data (bytes): 包含box的数据
+        box_type (str): box类型，如'sidx'
+        offset (int): 起始位置
+        end (int): 结束位置
+
+    Returns:
+        tuple: (box起始位置, box总大小, 头部大小)，未找到返回None
+    """
+    for current_type, start, size, header_size in iter_boxes(data, offset, end):
+        if current_type == box_type:
+            return start, size, header_size
+    return None
+
+
+def parse_sidx(data, offset=0):
+    """
+    解析sidx(Segment Index) box
+
+    Args:
+        data (bytes): 包含sidx box的数据
+        offset (int): sidx box在数据中的起始位置
+
+    Returns:
+        dict: 包含timescale、earliest_presentation_time、first_offset、
+              box_end(sidx结束位置，相对data)和references列表，
+              每个reference包含size、duration、starts_with_sap、reference_type
+    """
+    header = read_box_header(data, offset)
+    if not header or header[0] != 'sidx':
+        raise ValueError("数据中不存在sidx box")
+    _, size, header_size = header
+
+    pos = offset + header_size
+    version = data[pos]
+    pos += 4  # version(1) + flags(3)
+    _reference_id, timescale = struct.unpack_from('>II', data, pos)
+    pos += 8
+    if version == 0:
+        earliest_presentation_time, first_offset = struct.unpack_from('>II', data, pos)
+        pos += 8
+    else:
+        earliest_presentation_time, first_offset = struct.unpack_from('>QQ', data, pos)
+        pos += 16
+    pos += 2  # reserved
+    reference_count = struct.unpack_from('>H', data, pos)[0]
+    pos += 2
+
+    references = []
+    for _ in range(reference_count):
+        ref_info, duration, sap_info = struct.unpack_from('>III', data, pos)
+        pos += 12
+        references.append({
+            'reference_type': ref_info >> 31,
+            'size': ref_info & 0x7FFFFFFF,
+            'duration': duration,
+            'starts_with_sap': sap_info >> 31
+        })
+
+    return {
+        'timescale': timescale,
+        'earliest_presentation_time': earliest_presentation_time,
+        'first_offset': first_offset,
+        'box_end': offset + size,
+        'references': references
+    }
+
+
+def sidx_segments(sidx, anchor):
+    """
+    将sidx索引展开为带绝对字节范围和时间范围的分段列表
+
+    Args:
+        sidx (dict): parse_sidx的返回值
+        anchor (int): sidx在文件中的结束位置（文件内绝对偏移）
+
+    Returns:
+        list: 每个分段为dict，包含start_byte、end_byte(含)、start_time、end_time(秒)
+    """
+    timescale = sidx['timescale'] or 1
+    byte_offset = anchor + sidx['first_offset']
+    time_offset = sidx['earliest_presentation_time']
+    segments = []
+    for reference in sidx['references']:
+        if reference['reference_type'] != 0:
+            raise ValueError("暂不支持多级sidx索引")
+        segments.append({
+            'start_byte': byte_offset,
+            'end_byte': byte_offset + reference['size'] - 1,
+            'start_time': time_offset / timescale,
+            'end_time': (time_offset + reference['duration']) / timescale
+        })
+        byte_offset += reference['size']
+        time_offset += reference['duration']
+    return segments
+
+
+def select_segments(segments, start_time, end_time):
+    """
+    选出覆盖指定时间范围的连续分段
+
+    Args:
+        segments (list): sidx_segments的返回值
+        start_time (float): 起始时间（秒）
+        end_time (float): 结束时间（秒），None表示到结尾
+
+    Returns:
+        list: 覆盖时间范围的分段列表，可能为空
+    """
+    selected = []
+    for segment in segments:
+        if segment['end_time'] <= start_time:
+            continue
+        if end_time is not None and segment['start_time'] >= end_time:
+            break
+        selected.append(segment)
+    return selected
+
+
+def verify_mp4_file(path, expected_size=None):
+    """
+    快速校验MP4文件的完整性：只读取顶层box头部，不解码媒体数据
+
+    检查内容：
+    - 文件大小与expected_size(如content-length)一致
+    - 顶层box依次排列且恰好覆盖整个文件，没有被截断的box
+    - 存在ftyp(或分片的styp)和moov；分片文件的每个moof都有对应的mdat
+
+    Args:
+        path (str): 文件路径
+        expected_size (int): 期望的文件大小，None表示不检查
+
+    Returns:
+        dict: 包含ok(是否通过)、size(文件大小)、valid_bytes(最后一个完整box的结束位置)
+              和error(失败原因)字段
+    """
+    result = {'ok': False, 'size': 0, 'valid_bytes': 0, 'error': None}
+    try:
+        file_size = os.path.getsize(path)
+    except OSError as e:
+        result['error'] = f"无法读取文件: {e}"
+        return result
+    result['size'] = file_size
+
+    if expected_size is not None and file_size != expected_size:
+        result['error'] = f"文件大小不一致: {file_size}/{expected_size} 字节"
+        return result
+
+    seen = []
+    offset = 0
+    with open(path, 'rb') as f:
+        while offset < file_size:
+            f.seek(offset)
+            data = f.read(16)
+            header = read_box_header(data, 0)
+            if not header:
+                result['error'] = f"偏移 {offset} 处box头部不完整"
+                return result
+            box_type, size, header_size = header
+            if struct.unpack_from('>I', data, 0)[0] == 0:
+                # size为0表示box延伸到文件末尾
+                size = file_size - offset
+            if size < header_size:
+                result['error'] = f"偏移 {offset} 处box大小无效: {box_type}"
+                return result
+            if offset + size > file_size:
+                result['error'] = f"{box_type} 被截断: 需要 {offset + size} 字节，实际 {file_size} 字节"
+                return result
+            seen.append(box_type)
+            offset += size
+            result['valid_bytes'] = offset
+
+    if 'ftyp' not in seen and 'styp' not in seen:
+        result['error'] = "缺少ftyp"
+    elif 'moov' not in seen:
+        result['error'] = "缺少moov"
+    elif seen.count('moof') > seen.count('mdat'):
+        result['error'] = "分片缺少mdat"
+    else:
+        result['ok'] = True
+    return result
@@ -0,0 +1,678 @@
+import os
+import struct
+import subprocess
+import sys
+import time
+
+import mp4box
+
+
+def make_box(box_type, payload):
+    """
+    构造一个MP4 box
+
+    Args:
+        box_type (str): box类型
+        payload (bytes): box内容
+
+    Returns:
+        bytes: 完整的box数据
+    """
+    size = 8 + len(payload)
+    if size > 0xFFFFFFFF:
+        return struct.pack('>I4sQ', 1, box_type.encode('latin-1'), size + 8) + payload
+    return struct.pack('>I4s', size, box_type.encode('latin-1')) + payload
+
+
+def child_boxes(box_data):
+    """
+    解析容器box的直接子box
+
+    Args:
+        box_data (bytes): 完整的容器box数据
+
+    Returns:
+        list: [(box类型, 完整box数据), ...]
+    """
+    _, size, header_size = mp4box.read_box_header(box_data, 0)
+    return [
+        (box_type, box_data[start:start + box_size])
+        for box_type, start, box_size, _ in mp4box.iter_boxes(box_data, header_size, size)
+    ]
+
+
+def find_child(box_data, path):
+    """
+    按路径查找子box，如find_child(trak, ['mdia', 'mdhd'])
+
+    Returns:
+        bytes: 找到的box数据，未找到返回None
+    """
+    current = box_data
+    for box_type in path:
+        for child_type, child_data in child_boxes(current):
+            if child_type == box_type:
+                current = child_data
+                break
+        else:
+            return None
+    return current
+
+
+def patch_uint32(box_data, offset, value):
+    """替换box中指定位置的32位无符号整数"""
+    return box_data[:offset] + struct.pack('>I', value) + box_data[offset + 4:]
+
+
+def box_payload_offset(box_data):
+    """返回box内容（跳过头部）的起始位置"""
+    return mp4box.read_box_header(box_data, 0)[2]
+
+
+def set_track_id(box_data, box_type, track_id):
+    """
+    修改tkhd/trex/tfhd中的track_ID
+
+    Args:
+        box_data (bytes): 完整的box数据
+        box_type (str): box类型
+        track_id (int): 新的track_ID
+
+    Returns:
+        bytes: 修改后的box数据
+    """
+    payload = box_payload_offset(box_data)
+    if box_type == 'tkhd':
+        version = box_data[payload]
+        # version(1)+flags(3) + creation_time + modification_time
+        offset = payload + 4 + (16 if version == 1 else 8)
+    else:
+        # trex/tfhd: version(1)+flags(3)后紧跟track_ID
+        offset = payload + 4
+    return patch_uint32(box_data, offset, track_id)
+
+
+def rebuild_container(box_data, replacements):
+    """
+    重建容器box，对指定类型的子box应用替换函数
+
+    Args:
+        box_data (bytes): 完整的容器box数据
+        replacements (dict): {box类型: 函数(子box数据) -> 新数据}
+
+    Returns:
+        bytes: 重建后的容器box
+    """
+    box_type = mp4box.read_box_header(box_data, 0)[0]
+    payload = b''.join(
+        replacements[child_type](child_data) if child_type in replacements else child_data
+        for child_type, child_data in child_boxes(box_data)
+    )
+    return make_box(box_type, payload)
+
+
+def full_box(box_type, version, flags, payload):
+    """构造一个FullBox（带version和flags字段）"""
+    return make_box(box_type, struct.pack('>I', (version << 24) | flags) + payload)
+
+
+def detect_image_type(image_data):
+    """
+    根据文件头判断封面图片类型
+
+    Returns:
+        int: iTunes data box的类型码（13为JPEG，14为PNG），不支持的格式返回None
+    """
+    if image_data.startswith(b'\xff\xd8'):
+        return 13
+    if image_data.startswith(b'\x89PNG'):
+        return 14
+    return None
+
+
+def build_metadata_box(metadata=None, cover_data=None):
+    """
+    构造iTunes风格的udta/meta/ilst元数据box，写入标题、作者、注释和封面
+
+    Args:
+        metadata (dict): 标签信息，支持title、artist、comment、date
+        cover_data (bytes): JPEG或PNG封面图片数据
+
+    Returns:
+        bytes: udta box，没有任何可写入的内容时返回None
+    """
+    item_types = {'title': '\xa9nam', 'artist': '\xa9ART', 'comment': '\xa9cmt', 'date': '\xa9day'}
+    items = b''
+    for key, item_type in item_types.items():
+        value = (metadata or {}).get(key)
+        if value:
+            # data box: 类型1(UTF-8) + locale 0
+            data = make_box('data', struct.pack('>II', 1, 0) + str(value).encode('utf-8'))
+            items += make_box(item_type, data)
+    image_type = detect_image_type(cover_data) if cover_data else None
+    if image_type:
+        items += make_box('covr', make_box('data', struct.pack('>II', image_type, 0) + cover_data))
+    if not items:
+        return None
+
+    hdlr = full_box('hdlr', 0, 0, b'\0' * 4 + b'mdirappl' + b'\0' * 9)
+    meta = full_box('meta', 0, 0, hdlr + make_box('ilst', items))
+    return make_box('udta', meta)
+
+
+def read_top_level_boxes(path):
+    """
+    扫描分片MP4文件的顶层box，只读取ftyp/moov/moof等小box的内容，mdat仅记录位置
+
+    Args:
+        path (str): 文件路径
+
+    Returns:
+        dict: 包含ftyp、moov和fragments列表，每个分片包含moof数据和mdat的位置、大小
+    """
+    result = {'ftyp': None, 'moov': None, 'fragments': []}
+    file_size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        offset = 0
+        while offset + 8 <= file_size:
+            f.seek(offset)
+            header = f.read(16)
+            size, box_type = struct.unpack_from('>I4s', header, 0)
+            box_type = box_type.decode('latin-1')
+            if size == 1:
+                size = struct.unpack_from('>Q', header, 8)[0]
+            elif size == 0:
+                size = file_size - offset
+            if size < 8 or offset + size > file_size:
+                raise ValueError(f"{path} 在偏移 {offset} 处box不完整")
+
+            if box_type in ('ftyp', 'moov', 'moof'):
+                f.seek(offset)
+                data = f.read(size)
+                if box_type == 'moof':
+                    result['fragments'].append({'moof': data, 'moof_offset': offset, 'mdat_offset': None, 'mdat_size': 0})
+                else:
+                    result[box_type] = data
+            elif box_type == 'mdat' and result['fragments']:
+                fragment = result['fragments'][-1]
+                # trun中的data_offset相对于moof起始位置，要求mdat紧跟在moof之后
+                if fragment['mdat_offset'] is None and fragment['moof_offset'] + len(fragment['moof']) == offset:
+                    fragment['mdat_offset'] = offset
+                    fragment['mdat_size'] = size
+            offset += size
+    return result
+
+
+def traf_timing(traf, trex):
+    """
+    根据trun中的样本时长计算一个traf的总时长，并判断首个样本是否为同步样本（关键帧）
+
+    样本时长和标志依次取自trun逐样本字段、tfhd默认值、trex默认值
+
+    Args:
+        traf (bytes): 完整的traf box
+        trex (bytes): 对应轨道的trex box
+
+    Returns:
+        tuple: (时长，单位为轨道timescale, 首个样本是否为同步样本)
+    """
+    trex_payload = box_payload_offset(trex)
+    default_duration, _, default_flags = struct.unpack_from('>III', trex, trex_payload + 12)
+
+    tfhd = find_child(traf, ['tfhd'])
+    pos = box_payload_offset(tfhd)
+    tfhd_flags = struct.unpack_from('>I', tfhd, pos)[0] & 0xFFFFFF
+    pos += 8  # version/flags + track_ID
+    if tfhd_flags & 0x000001:
+        pos += 8
+    if tfhd_flags & 0x000002:
+        pos += 4
+    if tfhd_flags & 0x000008:
+        default_duration = struct.unpack_from('>I', tfhd, pos)[0]
+        pos += 4
+    if tfhd_flags & 0x000010:
+        pos += 4
+    if tfhd_flags & 0x000020:
+        default_flags = struct.unpack_from('>I', tfhd, pos)[0]
+
+    duration = 0
+    first_flags = None
+    for box_type, trun in child_boxes(traf):
+        if box_type != 'trun':
+            continue
+        pos = box_payload_offset(trun)
+        trun_flags = struct.unpack_from('>I', trun, pos)[0] & 0xFFFFFF
+        sample_count = struct.unpack_from('>I', trun, pos + 4)[0]
+        pos += 8
+        if trun_flags & 0x000001:
+            pos += 4
+        trun_first_flags = None
+        if trun_flags & 0x000004:
+            trun_first_flags = struct.unpack_from('>I', trun, pos)[0]
+            pos += 4
+        for index in range(sample_count):
+            sample_flags = default_flags
+            if trun_flags & 0x000100:
+                duration += struct.unpack_from('>I', trun, pos)[0]
+                pos += 4
+            else:
+                duration += default_duration
+            if trun_flags & 0x000200:
+                pos += 4
+            if trun_flags & 0x000400:
+                sample_flags = struct.unpack_from('>I', trun, pos)[0]
+                pos += 4
+            if trun_flags & 0x000800:
+                pos += 4
+            if index == 0 and trun_first_flags is not None:
+                sample_flags = trun_first_flags
+            if first_flags is None:
+                first_flags = sample_flags
+
+    # sample_is_non_sync_sample位为0表示同步样本
+    return duration, first_flags is not None and not first_flags & 0x00010000
+
+
+def parse_track(path):
+    """
+    解析单轨道分片MP4（B站DASH流）的结构
+
+    Args:
+        path (str): 文件路径
+
+    Returns:
+        dict: 包含ftyp、moov、trak、trex、mehd、timescale、handler和fragments
+
+    Raises:
+        ValueError: 文件不是可直接交织的单轨道分片MP4
+    """
+    boxes = read_top_level_boxes(path)
+    if not boxes['moov']:
+        raise ValueError(f"{path} 缺少moov")
+    if not boxes['fragments']:
+        raise ValueError(f"{path} 不是分片MP4")
+
+    traks = [data for box_type, data in child_boxes(boxes['moov']) if box_type == 'trak']
+    if len(traks) != 1:
+        raise ValueError(f"{path} 包含 {len(traks)} 个轨道，仅支持单轨道文件")
+    trak = traks[0]
+
+    mdhd = find_child(trak, ['mdia', 'mdhd'])
+    hdlr = find_child(trak, ['mdia', 'hdlr'])
+    mvex = find_child(boxes['moov'], ['mvex'])
+    if not mdhd or not hdlr or not mvex:
+        raise ValueError(f"{path} 缺少mdhd/hdlr/mvex")
+
+    payload = box_payload_offset(mdhd)
+    version = mdhd[payload]
+    timescale = struct.unpack_from('>I', mdhd, payload + 4 + (16 if version == 1 else 8))[0]
+    handler = hdlr[box_payload_offset(hdlr) + 8:box_payload_offset(hdlr) + 12].decode('latin-1')
+
+    trex = find_child(mvex, ['trex'])
+    if trex is None:
+        raise ValueError(f"{path} 缺少trex")
+
+    fragments = []
+    for fragment in boxes['fragments']:
+        if fragment['mdat_offset'] is None:
+            raise ValueError(f"{path} 的moof之后没有紧跟mdat")
+        base_time = None
+        duration = 0
+        starts_with_sap = False
+        for box_type, traf in child_boxes(fragment['moof']):
+            if box_type != 'traf':
+                continue
+            tfhd = find_child(traf, ['tfhd'])
+            tfhd_payload = box_payload_offset(tfhd)
+            flags = struct.unpack_from('>I', tfhd, tfhd_payload)[0] & 0xFFFFFF
+            if flags & 0x000001:
+                # 显式base_data_offset是文件内绝对偏移，重新排列后会失效
+                raise ValueError(f"{path} 使用了显式base_data_offset")
+            tfdt = find_child(traf, ['tfdt'])
+            if tfdt is None:
+                raise ValueError(f"{path} 的分片缺少tfdt")
+            tfdt_payload = box_payload_offset(tfdt)
+            if tfdt[tfdt_payload] == 1:
+                base_time = struct.unpack_from('>Q', tfdt, tfdt_payload + 4)[0]
+            else:
+                base_time = struct.unpack_from('>I', tfdt, tfdt_payload + 4)[0]
+            duration, starts_with_sap = traf_timing(traf, trex)
+        if base_time is None:
+            raise ValueError(f"{path} 的分片缺少traf")
+        fragments.append({
+            'moof': fragment['moof'],
+            'mdat_offset': fragment['mdat_offset'],
+            'mdat_size': fragment['mdat_size'],
+            'base_time': base_time,
+            'duration': duration,
+            'starts_with_sap': starts_with_sap,
+            'time': base_time / timescale
+        })
+
+    return {
+        'ftyp': boxes['ftyp'],
+        'moov': boxes['moov'],
+        'trak': trak,
+        'trex': trex,
+        'mehd': find_child(mvex, ['mehd']),
+        'timescale': timescale,
+        'handler': handler,
+        'fragments': fragments
+    }
+
+
+def build_moov(video, audio, extra_boxes=None):
+    """
+    合并两个单轨道moov：视频轨道ID为1，音频轨道ID为2
+
+    Args:
+        video (dict): parse_track返回的视频轨道
+        audio (dict): parse_track返回的音频轨道
+        extra_boxes (list): 追加到moov中的其他box（如udta）
+
+    Returns:
+        bytes: 新的moov box
+    """
+    mvhd = find_child(video['moov'], ['mvhd'])
+    # next_track_ID位于mvhd末尾
+    mvhd = patch_uint32(mvhd, len(mvhd) - 4, 3)
+
+    video_trak = rebuild_container(video['trak'], {'tkhd': lambda data: set_track_id(data, 'tkhd', 1)})
+    audio_trak = rebuild_container(audio['trak'], {'tkhd': lambda data: set_track_id(data, 'tkhd', 2)})
+
+    mvex_payload = b''
+    if video['mehd']:
+        mvex_payload += video['mehd']
+    mvex_payload += set_track_id(video['trex'], 'trex', 1)
+    mvex_payload += set_track_id(audio['trex'], 'trex', 2)
+
+    other_boxes = [
+        data for box_type, data in child_boxes(video['moov'])
+        if box_type not in ('mvhd', 'trak', 'mvex', 'udta')
+    ]
+    return make_box('moov', mvhd + video_trak + audio_trak + make_box('mvex', mvex_payload)
+                    + b''.join(other_boxes) + b''.join(extra_boxes or []))
+
+
+def patch_moof(moof, sequence_number, track_id):
+    """
+    重写moof中的分片序号和轨道ID，保持box大小不变，trun中相对moof的data_offset仍然有效
+
+    Args:
+        moof (bytes): 原始moof数据
+        sequence_number (int): 新的分片序号
+        track_id (int): 新的轨道ID
+
+    Returns:
+        bytes: 修改后的moof数据
+    """
+    def patch_mfhd(data):
+        return patch_uint32(data, box_payload_offset(data) + 4, sequence_number)
+
+    def patch_traf(data):
+        return rebuild_container(data, {'tfhd': lambda tfhd: set_track_id(tfhd, 'tfhd', track_id)})
+
+    patched = rebuild_container(moof, {'mfhd': patch_mfhd, 'traf': patch_traf})
+    if len(patched) != len(moof):
+        raise ValueError("moof大小发生变化")
+    return patched
+
+
+def build_sidx(track, layout, anchor, end_offset):
+    """
+    为交织后的输出文件构造sidx，以视频轨道为参考轨道
+
+    每个子分段从一个视频moof开始，延伸到下一个视频moof之前（包含其间交织的音频分片），
+    最后一个子分段延伸到end_offset，播放器可据此直接按时间定位到字节范围。
+
+    Args:
+        track (dict): parse_track返回的视频轨道
+        layout (list): [(轨道序号, 分片, moof在输出中的偏移), ...]，按写出顺序排列
+        anchor (int): sidx结束位置（即第一个分片的起始偏移）
+        end_offset (int): 最后一个子分段的结束偏移
+
+    Returns:
+        bytes: sidx box
+
+    Raises:
+        ValueError: 单个子分段超过sidx可表示的大小
+    """
+    video_entries = [(fragment, offset) for track_index, fragment, offset in layout if track_index == 0]
+    references = b''
+    for index, (fragment, offset) in enumerate(video_entries):
+        next_offset = video_entries[index + 1][1] if index + 1 < len(video_entries) else end_offset
+        size = next_offset - offset
+        if size >= 1 << 31:
+            raise ValueError("子分段过大，无法写入sidx")
+        sap = (1 << 31) | (1 << 28) if fragment['starts_with_sap'] else 0
+        references += struct.pack('>III', size, fragment['duration'], sap)
+
+    first_fragment, first_offset = video_entries[0]
+    payload = struct.pack('>IIQQHH', 1, track['timescale'], first_fragment['base_time'],
+                          first_offset - anchor, 0, len(video_entries))
+    return full_box('sidx', 1, 0, payload + references)
+
+
+def sidx_size(fragment_count):
+    """version 1的sidx大小：固定头部40字节，每个引用12字节"""
+    return 40 + 12 * fragment_count
+
+
+def build_mfra(tracks, layout):
+    """
+    构造mfra随机访问索引，为每个轨道的每个分片记录起始时间和moof偏移
+
+    Args:
+        tracks (tuple): (视频轨道, 音频轨道)
+        layout (list): [(轨道序号, 分片, moof在输出中的偏移), ...]
+
+    Returns:
+        bytes: mfra box（末尾包含mfro）
+    """
+    tfras = b''
+    for track_index in range(len(tracks)):
+        entries = [
+            # traf/trun/sample序号都是1，各占1字节
+            struct.pack('>QQBBB', fragment['base_time'], offset, 1, 1, 1)
+            for index, fragment, offset in layout if index == track_index
+        ]
+        tfras += full_box('tfra', 1, 0, struct.pack('>III', track_index + 1, 0, len(entries)) + b''.join(entries))
+    # mfro记录整个mfra的大小（mfro自身16字节）
+    size = 8 + len(tfras) + 16
+    return make_box('mfra', tfras + full_box('mfro', 0, 0, struct.pack('>I', size)))
+
+
+def write_all(fd, data):
+    """将数据完整写入文件描述符"""
+    view = memoryview(data)
+    while view:
+        written = os.write(fd, view)
+        view = view[written:]
+
+
+def copy_range(src_fd, dst_fd, offset, length):
+    """
+    零拷贝地将源文件的一段数据追加到目标文件当前位置
+    依次尝试copy_file_range、sendfile，都不可用时退回普通读写
+
+    Args:
+        src_fd (int): 源文件描述符
+        dst_fd (int): 目标文件描述符
+        offset (int): 源文件起始偏移
+        length (int): 复制长度
+    """
+    remaining = length
+    position = offset
+
+    if hasattr(os, 'copy_file_range'):
+        try:
+            while remaining > 0:
+                copied = os.copy_file_range(src_fd, dst_fd, min(remaining, 1 << 30), position)
+                if copied == 0:
+                    break
+                remaining -= copied
+                position += copied
+        except OSError:
+            pass  # 跨文件系统等情况下不支持，继续尝试其他方式
+
+    if remaining > 0 and hasattr(os, 'sendfile') and sys.platform.startswith('linux'):
+        try:
+            while remaining > 0:
+                copied = os.sendfile(dst_fd, src_fd, position, min(remaining, 1 << 30))
+                if copied == 0:
+                    break
+                remaining -= copied
+                position += copied
+        except OSError:
+            pass
+
+    while remaining > 0:
+        chunk = os.pread(src_fd, min(remaining, 1 << 20), position) if hasattr(os, 'pread') else None
+        if chunk is None:
+            os.lseek(src_fd, position, os.SEEK_SET)
+            chunk = os.read(src_fd, min(remaining, 1 << 20))
+        if not chunk:
+            raise IOError("源文件数据不足")
+        write_all(dst_fd, chunk)
+        remaining -= len(chunk)
+        position += len(chunk)
+
+
+def remux_fragmented_mp4(video_path, audio_path, output_path, extra_moov_boxes=None, cancel_event=None):
+    """
+    纯Python合并B站DASH视频流和音频流（均为单轨道分片MP4），不依赖ffmpeg
+
+    按时间交织两个轨道的moof/mdat分片写出一个分片MP4，mdat数据通过零拷贝方式复制。
+    moov之后写入以视频轨道为参考的sidx，文件末尾写入mfra，便于播放器定位。
+    先写入临时文件，成功后原子重命名为output_path。
+
+    Args:
+        video_path (str): 视频文件路径
+        audio_path (str): 音频文件路径
+        output_path (str): 输出文件路径
+        extra_moov_boxes (list): 追加到moov中的其他box（如元数据udta）
+        cancel_event (threading.Event): 被设置时中止合并并删除临时文件
+
+    Returns:
+        bool: 合并是否成功，输入不是可交织的分片MP4时返回False
+    """
+    part_path = f"{output_path}.part"
+    try:
+        video = parse_track(video_path)
+        audio = parse_track(audio_path)
+        if video['handler'] != 'vide' or audio['handler'] != 'soun':
+            print(f"纯Python合并不支持的轨道类型: {video['handler']}/{audio['handler']}", flush=True)
+            return False
+
+        ftyp = video['ftyp'] or default_ftyp()
+        moov = build_moov(video, audio, extra_moov_boxes)
+
+        # 按分片起始时间交织，时间相同时视频在前
+        fragments = [(f['time'], 0, i, f) for i, f in enumerate(video['fragments'])]
+        fragments += [(f['time'], 1, i, f) for i, f in enumerate(audio['fragments'])]
+        fragments.sort(key=lambda item: item[:3])
+
+        # 分片大小在写出前就已确定，先算出每个moof在输出中的偏移，sidx才能写在分片之前
+        anchor = len(ftyp) + len(moov) + sidx_size(len(video['fragments']))
+        layout = []
+        offset = anchor
+        for _, track_index, _, fragment in fragments:
+            layout.append((track_index, fragment, offset))
+            offset += len(fragment['moof']) + fragment['mdat_size']
+        sidx = build_sidx(video, layout, anchor, offset)
+        mfra = build_mfra((video, audio), layout)
+
+        with open(video_path, 'rb') as video_file, open(audio_path, 'rb') as audio_file, \
+                open(part_path, 'wb', buffering=0) as output_file:
+            src_fds = (video_file.fileno(), audio_file.fileno())
+            dst_fd = output_file.fileno()
+            write_all(dst_fd, ftyp + moov + sidx)
+            for sequence_number, (_, track_index, _, fragment) in enumerate(fragments, 1):
+                if cancel_event is not None and cancel_event.is_set():
+                    raise InterruptedError("合并已取消")
+                write_all(dst_fd, patch_moof(fragment['moof'], sequence_number, track_index + 1))
+                copy_range(src_fds[track_index], dst_fd, fragment['mdat_offset'], fragment['mdat_size'])
+            write_all(dst_fd, mfra)
+
+        os.replace(part_path, output_path)
+        print(f"纯Python合并成功: {output_path}", flush=True)
+        return True
+
+    except Exception as e:
+        if isinstance(e, InterruptedError):
+            print(f"纯Python合并已取消: {output_path}", flush=True)
+        else:
+            print(f"纯Python合并失败，将回退到FFmpeg: {e}", flush=True)
+        if os.path.exists(part_path):
+            try:
+                os.remove(part_path)
+            except OSError:
+                pass
+        return False
+
+
+def default_ftyp():
+    """输入缺少ftyp时使用的默认ftyp"""
+    return make_box('ftyp', b'iso5' + struct.pack('>I', 512) + b'iso5iso6mp41')
+
+
+def benchmark_merge(video_path, audio_path, output_dir=None, rounds=3):
+    """
+    对比纯Python合并与ffmpeg合并的耗时
+
+    Args:
+        video_path (str): 视频文件路径
+        audio_path (str): 音频文件路径
+        output_dir (str): 临时输出目录，默认与视频文件相同
+        rounds (int): 每种方式运行的次数，取最短耗时
+
+    Returns:
+        dict: {'size': 输入总字节数, 'python': 每GB秒数, 'ffmpeg': 每GB秒数或None}
+    """
+    output_dir = output_dir or os.path.dirname(os.path.abspath(video_path))
+    output_path = os.path.join(output_dir, f"benchmark_{os.getpid()}.mp4")
+    input_size = os.path.getsize(video_path) + os.path.getsize(audio_path)
+    size_gb = input_size / (1024 ** 3)
+
+    def measure(merge_function):
+        best = None
+        for _ in range(rounds):
+            start_time = time.perf_counter()
+            success = merge_function()
+            elapsed = time.perf_counter() - start_time
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            if not success:
+                return None
+            best = elapsed if best is None else min(best, elapsed)
+        return best / size_gb if size_gb else None
+
+    def ffmpeg_merge():
+        cmd = ['ffmpeg', '-nostdin', '-loglevel', 'error', '-i', video_path, '-i', audio_path,
+               '-c:v', 'copy', '-c:a', 'copy', '-y', output_path]
+        try:
+            return subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode == 0
+        except FileNotFoundError:
+            return False
+
+    return {
+        'size': input_size,
+        'python': measure(lambda: remux_fragmented_mp4(video_path, audio_path, output_path)),
+        'ffmpeg': measure(ffmpeg_merge)
+    }
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 5 and sys.argv[1] == 'merge':
+        sys.exit(0 if remux_fragmented_mp4(sys.argv[2], sys.argv[3], sys.argv[4]) else 1)
+    elif len(sys.argv) == 4 and sys.argv[1] == 'bench':
+        result = benchmark_merge(sys.argv[2], sys.argv[3])
+        print(f"\n输入大小: {result['size'] / (1024 ** 2):.1f}MB")
+        for method in ('python', 'ffmpeg'):
+            seconds = result[method]
+            print(f"{method:>7}: {f'{seconds:.2f} 秒/GB' if seconds is not None else '不可用'}")
+    else:
+        print("用法:")
+        print("  python mp4remux.py merge <视频文件> <音频文件> <输出文件>")
+        print("  python mp4remux.py bench <视频文件> <音频文件>")
+        sys.exit(2)
@@ -0,0 +1,547 @@
+import asyncio
+import collections
+import concurrent.futures
+import hashlib
+import os
+import struct
+import threading
+import time
+import uuid
+
+import mp4box
+
+# 同时运行的ffmpeg合并进程数上限，与下载线程池相互独立
+MAX_CONCURRENT_MERGES = 2
+
+# 转码任务使用独立的并发上限，避免CPU密集的转码占满合并通道、饿死流复制合并
+MAX_CONCURRENT_TRANSCODES = 1
+
+# 每个转码任务允许使用的编码线程数
+TRANSCODE_THREADS = max(1, (os.cpu_count() or 2) // 2)
+
+# 单个合并进程的默认超时时间（秒），超时后强制结束进程
+DEFAULT_MERGE_TIMEOUT = 1800
+
+# 合并结果缓存的默认容量上限（字节）
+DEFAULT_MERGE_CACHE_BYTES = 20 * 1024 ** 3
+
+
+class MuxResult:
+    """ffmpeg合并进程的执行结果"""
+
+    def __init__(self, returncode, stderr_tail, elapsed, stop_reason=None):
+        self.returncode = returncode
+        self.stderr_tail = stderr_tail
+        self.elapsed = elapsed
+        # 进程被提前结束的原因：'cancelled'(任务取消)或'timeout'(超时)，正常结束为None
+        self.stop_reason = stop_reason
+
+    @property
+    def cancelled(self):
+        """进程是否因取消或超时被强制结束"""
+        return self.stop_reason is not None
+
+    @property
+    def stderr(self):
+        """最后若干行错误输出"""
+        return '\n'.join(self.stderr_tail)
+
+
+class MuxWorkerPool:
+    """
+    合并(mux)子系统：在专用事件循环线程中以asyncio子进程运行ffmpeg
+
+    - 拥有独立的并发上限和等待队列，不占用网络下载线程
+    - 流复制合并(copy)与转码(transcode)分通道排队，各自有并发上限，转码不会阻塞流复制合并
+    - 错误输出按行流式读取，只保留最后若干行，不会把全部输出缓存在内存中
+    - 同步代码通过run()等待结果，异步代码通过run_async()等待结果，均不阻塞事件循环
+    """
+
+    def __init__(self, max_workers=MAX_CONCURRENT_MERGES, max_transcodes=MAX_CONCURRENT_TRANSCODES, stderr_tail_lines=50):
+        """
+        Args:
+            max_workers (int): 流复制合并的最大并发进程数
+            max_transcodes (int): 转码的最大并发进程数
+            stderr_tail_lines (int): 每个进程保留的错误输出行数
+        """
+        self.max_workers = max_workers
+        self.stderr_tail_lines = stderr_tail_lines
+        self.lane_limits = {'copy': max_workers, 'transcode': max_transcodes}
+        self.lane_running = {lane: 0 for lane in self.lane_limits}
+        self.lane_queued = {lane: 0 for lane in self.lane_limits}
+        self.running = 0
+        self.queued = 0
+        self.completed = 0
+        self.loop = asyncio.new_event_loop()
+        self.slot_condition = None
+        self.thread = threading.Thread(target=self._run_loop, name="mux-loop", daemon=True)
+        self.thread.start()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    async def _acquire_slot(self, lane, cancel_event=None):
+        """
+        在通道中排队获取并发槽位
+
+        cancel_event是线程事件，无法唤醒asyncio.Condition，排队期间按间隔检查
+
+        Returns:
+            bool: 是否获取成功，排队期间cancel_event被设置时放弃排队并返回False
+        """
+        if self.slot_condition is None:
+            self.slot_condition = asyncio.Condition()
+        async with self.slot_condition:
+            self.queued += 1
+            self.lane_queued[lane] += 1
+            try:
+                while self.lane_running[lane] >= self.lane_limits[lane]:
+                    if cancel_event is not None and cancel_event.is_set():
+                        return False
+                    try:
+                        await asyncio.wait_for(self.slot_condition.wait(), 0.2)
+                    except asyncio.TimeoutError:
+                        pass
+            finally:
+                self.queued -= 1
+                self.lane_queued[lane] -= 1
+            self.running += 1
+            self.lane_running[lane] += 1
+            return True
+
+    async def _release_slot(self, lane):
+        async with self.slot_condition:
+            self.running -= 1
+            self.lane_running[lane] -= 1
+            self.completed += 1
+            self.slot_condition.notify_all()
+
+    async def _pump_lines(self, stream, tail, line_callback):
+        """按行读取子进程输出（兼容\r分隔的ffmpeg状态行）"""
+        buffer = b''
+        while True:
+            chunk = await stream.read(4096)
+            if not chunk:
+                break
+            buffer += chunk.replace(b'\r', b'\n')
+            *lines, buffer = buffer.split(b'\n')
+            for line in lines:
+                text = line.decode('utf-8', errors='replace').strip()
+                if not text:
+                    continue
+                if tail is not None:
+                    tail.append(text)
+                if line_callback:
+                    line_callback(text)
+        if buffer.strip():
+            text = buffer.decode('utf-8', errors='replace').strip()
+            if tail is not None:
+                tail.append(text)
+            if line_callback:
+                line_callback(text)
+
+    async def _watch_process(self, process, cancel_event, deadline, state):
+        """轮询取消标志和超时时间，触发时强制结束进程"""
+        while process.returncode is None:
+            if cancel_event is not None and cancel_event.is_set():
+                state['stop_reason'] = 'cancelled'
+            elif deadline is not None and time.time() >= deadline:
+                state['stop_reason'] = 'timeout'
+            if state['stop_reason']:
+                try:
+                    process.kill()
+                except ProcessLookupError:
+                    pass
+                return
+            await asyncio.sleep(0.2)
+
+    async def _execute(self, cmd, stdout_callback=None, stderr_callback=None, cancel_event=None, timeout=None, lane='copy'):
+        if not await self._acquire_slot(lane, cancel_event):
+            # 排队期间任务已被取消或暂停，立即返回，不再等待槽位
+            return MuxResult(None, [], 0, 'cancelled')
+        start_time = time.time()
+        try:
+            if cancel_event is not None and cancel_event.is_set():
+                # 获得槽位时任务已被取消，不再启动进程
+                return MuxResult(None, [], 0, 'cancelled')
+            process = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
+            )
+            stderr_tail = collections.deque(maxlen=self.stderr_tail_lines)
+            state = {'stop_reason': None}
+            deadline = time.time() + timeout if timeout else None
+            watcher = self.loop.create_task(self._watch_process(process, cancel_event, deadline, state))
+            try:
+                await asyncio.gather(
+                    self._pump_lines(process.stdout, None, stdout_callback),
+                    self._pump_lines(process.stderr, stderr_tail, stderr_callback)
+                )
+                returncode = await process.wait()
+            except asyncio.CancelledError:
+                if process.returncode is None:
+                    process.kill()
+                    await process.wait()
+                raise
+            finally:
+                watcher.cancel()
+            return MuxResult(returncode, list(stderr_tail), time.time() - start_time, state['stop_reason'])
+        finally:
+            await self._release_slot(lane)
+
+    def submit(self, cmd, stdout_callback=None, stderr_callback=None, cancel_event=None, timeout=None, lane='copy'):
+        """
+        提交一个ffmpeg命令到合并队列
+
+        Args:
+            cmd (list): 命令及参数
+            stdout_callback (function): 每读到一行标准输出时调用，接收(line)参数
+            stderr_callback (function): 每读到一行错误输出时调用，接收(line)参数
+            cancel_event (threading.Event): 被设置时强制结束进程
+            timeout (float): 进程最长运行时间（秒，不含排队时间），None表示不限制
+            lane (str): 排队通道，'copy'为流复制合并，'transcode'为转码
+
+        Returns:
+            concurrent.futures.Future: 结果为MuxResult；可执行文件不存在时抛出FileNotFoundError
+        """
+        if lane not in self.lane_limits:
+            raise ValueError(f"未知的合并通道: {lane}")
+        return asyncio.run_coroutine_threadsafe(
+            self._execute(cmd, stdout_callback, stderr_callback, cancel_event, timeout, lane), self.loop
+        )
+
+    def run(self, cmd, stdout_callback=None, stderr_callback=None, cancel_event=None, timeout=None, lane='copy'):
+        """
+        同步执行ffmpeg命令（在合并池中排队），阻塞当前线程直到完成
+
+        Returns:
+            MuxResult: 执行结果，被取消或超时时stop_reason不为None
+        """
+        return self.submit(cmd, stdout_callback, stderr_callback, cancel_event, timeout, lane).result()
+
+    async def run_async(self, cmd, stdout_callback=None, stderr_callback=None, cancel_event=None, timeout=None, lane='copy'):
+        """
+        在其他事件循环中异步等待ffmpeg命令完成，不阻塞调用方的事件循环
+
+        Returns:
+            MuxResult: 执行结果
+        """
+        return await asyncio.wrap_future(self.submit(cmd, stdout_callback, stderr_callback, cancel_event, timeout, lane))
+
+    def resize(self, lane, limit):
+        """
+        运行时调整通道的并发上限，调大时排队中的合并立即开始
+
+        Args:
+            lane (str): 'copy'或'transcode'
+            limit (int): 新的并发上限
+        """
+        if lane not in self.lane_limits:
+            raise ValueError(f"未知的合并通道: {lane}")
+        limit = max(1, int(limit))
+
+        async def apply():
+            if self.slot_condition is None:
+                self.slot_condition = asyncio.Condition()
+            async with self.slot_condition:
+                self.lane_limits[lane] = limit
+                if lane == 'copy':
+                    self.max_workers = limit
+                self.slot_condition.notify_all()
+
+        asyncio.run_coroutine_threadsafe(apply(), self.loop).result()
+
+    def get_stats(self):
+        """
+        获取合并池状态
+
+        Returns:
+            dict: 包含max_workers、running、queued、completed字段，
+                  以及lanes（每个通道的limit、running、queued）
+        """
+        return {
+            'max_workers': self.max_workers,
+            'running': self.running,
+            'queued': self.queued,
+            'completed': self.completed,
+            'lanes': {
+                lane: {
+                    'limit': self.lane_limits[lane],
+                    'running': self.lane_running[lane],
+                    'queued': self.lane_queued[lane]
+                }
+                for lane in self.lane_limits
+            }
+        }
+
+
+
+class SingleFlight:
+    """
+    相同key的并发调用只执行一次，其余调用方等待并共享同一个结果
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def _join(self, key):
+        with self.lock:
+            future = self.calls.get(key)
+            if future is not None:
+                return future, False
+            future = concurrent.futures.Future()
+            self.calls[key] = future
+            return future, True
+
+    def _finish(self, key, future, result=None, error=None):
+        with self.lock:
+            self.calls.pop(key, None)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def run(self, key, function):
+        """
+        同步执行：第一个调用方执行function，其他调用方阻塞等待其结果
+
+        Args:
+            key (str): 去重键
+            function (function): 无参数的执行函数
+
+        Returns:
+            function的返回值
+        """
+        future, leader = self._join(key)
+        if not leader:
+            return future.result()
+        try:
+            result = function()
+        except Exception as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result)
+        return result
+
+    async def run_async(self, key, coroutine_function):
+        """
+        异步执行：第一个调用方await coroutine_function()，其他调用方异步等待其结果
+
+        Args:
+            key (str): 去重键
+            coroutine_function (function): 无参数、返回协程的函数
+
+        Returns:
+            协程的返回值
+        """
+        future, leader = self._join(key)
+        if not leader:
+            return await asyncio.wrap_future(future)
+        try:
+            result = await coroutine_function()
+        except BaseException as e:
+            self._finish(key, future, error=e if isinstance(e, Exception) else RuntimeError("合并已中断"))
+            raise
+        self._finish(key, future, result)
+        return result
+
+
+class MergeCache:
+    """
+    按输入内容寻址的合并结果缓存
+
+    - 缓存键由输入文件的大小、完整的MP4索引（moov/sidx/每个moof中的逐样本大小）和首尾数据的哈希计算，
+      与任务ID和文件名无关；无法解析为MP4的输入对完整内容计算哈希
+    - 合并结果先写入临时文件，完成后通过os.replace原子发布，不会出现半成品缓存
+    - 总大小超过上限时按最近最少使用(LRU)顺序淘汰
+    """
+
+    SAMPLE_BYTES = 1024 * 1024
+
+    # 完整计入缓存键的索引类box，mdat等媒体数据box只计入头部
+    INDEX_BOXES = ('ftyp', 'styp', 'moov', 'sidx', 'moof', 'mfra')
+
+    def __init__(self, directory, max_bytes=DEFAULT_MERGE_CACHE_BYTES):
+        """
+        Args:
+            directory (str): 缓存目录
+            max_bytes (int): 缓存总大小上限（字节）
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict()  # key -> 文件大小，按访问时间从旧到新排列（重启后按文件的atime恢复）
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    def _load(self):
+        """扫描缓存目录，重建索引并清理上次异常退出遗留的临时文件"""
+        os.makedirs(self.directory, exist_ok=True)
+        files = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith('.tmp.mp4') or name.endswith('.part'):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            elif name.endswith('.mp4'):
+                stat = os.stat(path)
+                files.append((stat.st_atime, name[:-4], stat.st_size))
+        for _, key, size in sorted(files):
+            self.entries[key] = size
+        self._evict()
+
+    def make_key(self, input_paths, variant='copy'):
+        """
+        计算输入文件的内容键
+
+        Args:
+            input_paths (list): 输入文件路径列表（顺序有意义）
+            variant (str): 输出方式，不同输出方式使用不同的缓存项
+
+        Returns:
+            str: 缓存键
+        """
+        digest = hashlib.sha1(variant.encode('utf-8'))
+        for path in input_paths:
+            size = os.path.getsize(path)
+            digest.update(str(size).encode('ascii'))
+            with open(path, 'rb') as f:
+                if not self._update_with_index(digest, f, size):
+                    # 不是完整的MP4结构，退回到对全部内容计算哈希
+                    digest.update(b'full')
+                    f.seek(0)
+                    for chunk in iter(lambda: f.read(self.SAMPLE_BYTES), b''):
+                        digest.update(chunk)
+                    continue
+                f.seek(0)
+                digest.update(f.read(self.SAMPLE_BYTES))
+                if size > self.SAMPLE_BYTES:
+                    f.seek(max(size - self.SAMPLE_BYTES, self.SAMPLE_BYTES))
+                    digest.update(f.read(self.SAMPLE_BYTES))
+        return digest.hexdigest()
+
+    def _update_with_index(self, digest, f, size):
+        """
+        按顺序遍历顶层box，将索引类box的完整内容和其他box的头部计入哈希
+
+        moof中的trun记录了分片内每个样本的大小，moov/sidx记录了整体结构，
+        大小相同但内容不同的输入几乎不可能拥有完全相同的索引。
+
+        Args:
+            digest: hashlib哈希对象
+            f: 以二进制模式打开的输入文件
+            size (int): 文件大小
+
+        Returns:
+            bool: 文件是否由完整的顶层box构成，否则调用方需要退回到全量哈希
+        """
+        offset = 0
+        while offset < size:
+            f.seek(offset)
+            data = f.read(16)
+            header = mp4box.read_box_header(data, 0)
+            if not header:
+                return False
+            box_type, box_size, header_size = header
+            if struct.unpack_from('>I', data, 0)[0] == 0:
+                box_size = size - offset
+            if box_size < header_size or offset + box_size > size:
+                return False
+            digest.update(data[:header_size])
+            if box_type in self.INDEX_BOXES:
+                f.seek(offset + header_size)
+                digest.update(f.read(box_size - header_size))
+            offset += box_size
+        return offset > 0
+
+    def path_for(self, key):
+        """返回缓存项的文件路径"""
+        return os.path.join(self.directory, f"{key}.mp4")
+
+    def temp_path_for(self, key):
+        """返回一个唯一的临时输出路径（保留.mp4后缀，便于ffmpeg识别输出格式）"""
+        return os.path.join(self.directory, f"{key}.{uuid.uuid4().hex[:8]}.tmp.mp4")
+
+    def get(self, key):
+        """
+        查询缓存
+
+        Returns:
+            str: 缓存文件路径，未命中返回None
+        """
+        path = self.path_for(key)
+        with self.lock:
+            if key in self.entries and os.path.exists(path):
+                self.entries.move_to_end(key)
+                self.hits += 1
+                try:
+                    # 只更新访问时间：修改时间参与文件的ETag，改变后客户端的条件请求和If-Range都会失效
+                    os.utime(path, ns=(time.time_ns(), os.stat(path).st_mtime_ns))
+                except OSError:
+                    pass
+                return path
+            self.entries.pop(key, None)
+            self.misses += 1
+            return None
+
+    def put(self, key, temp_path):
+        """
+        将已完成的临时文件原子地发布为缓存项
+
+        Args:
+            key (str): 缓存键
+            temp_path (str): 合并完成的临时文件
+
+        Returns:
+            str: 缓存文件路径
+        """
+        path = self.path_for(key)
+        os.replace(temp_path, path)
+        with self.lock:
+            self.entries[key] = os.path.getsize(path)
+            self.entries.move_to_end(key)
+            self._evict(keep=key)
+        return path
+
+    def _evict(self, keep=None):
+        """淘汰最久未使用的缓存项，直到总大小不超过上限（调用方持有锁或处于初始化阶段）"""
+        total = sum(self.entries.values())
+        for key in list(self.entries):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            try:
+                os.remove(self.path_for(key))
+            except FileNotFoundError:
+                pass
+            except OSError:
+                continue  # 文件正在被读取（Windows），下次再淘汰
+            total -= self.entries.pop(key)
+
+    def get_stats(self):
+        """
+        获取缓存状态
+
+        Returns:
+            dict: 包含entries、total_bytes、max_bytes、hits、misses字段
+        """
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'total_bytes': sum(self.entries.values()),
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+
+# 全局合并进程池
+mux_pool = MuxWorkerPool()
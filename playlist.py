@@ -0,0 +1,241 @@
+import requests
+import hashlib
+import math
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+FAVORITES_API = "https://api.bilibili.com/x/v3/fav/resource/list"
+COLLECTION_API = "https://api.bilibili.com/x/polymer/web-space/seasons_archives_list"
+UPLOADER_API = "https://api.bilibili.com/x/space/wbi/arc/search"
+NAV_API = "https://api.bilibili.com/x/web-interface/nav"
+
+VIDEO_URL_TEMPLATE = "https://www.bilibili.com/video/{}"
+
+# 批量下载支持的视频来源
+SOURCE_TYPES = {
+    'favorites': '收藏夹',
+    'collection': '合集',
+    'uploader': 'UP主投稿'
+}
+
+# 各来源接口每页返回的视频数
+SOURCE_PAGE_SIZES = {'favorites': 20, 'collection': 30, 'uploader': 30}
+
+# 需要跟随跳转才能得到视频地址的短链接域名
+SHORT_URL_HOSTS = ('b23.tv', 'bili2233.cn')
+
+# 默认的并发请求数
+DEFAULT_RESOLVE_WORKERS = 4
+
+# WBI签名的密钥重排表
+MIXIN_KEY_ENC_TAB = [
+    46, 47, 18, 2, 53, 8, 23, 32, 15, 50, 10, 31, 58, 3, 45, 35, 27, 43, 5, 49,
+    33, 9, 42, 19, 29, 28, 14, 39, 12, 38, 41, 13, 37, 48, 7, 16, 24, 55, 40,
+    61, 26, 17, 0, 1, 60, 51, 30, 4, 22, 25, 54, 21, 56, 59, 6, 63, 57, 62, 11,
+    36, 20, 34, 44, 52
+]
+
+# WBI密钥每天更换，缓存一小时
+WBI_KEY_TTL = 3600
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Referer': 'https://www.bilibili.com/',
+    'Accept': 'application/json, text/plain, */*'
+}
+
+_wbi_lock = threading.Lock()
+_wbi_cache = {'key': None, 'time': 0}
+
+
+def parse_cookies(cookies):
+    if isinstance(cookies, str):
+        return dict(item.strip().split('=', 1) for item in cookies.split(';') if '=' in item)
+    return cookies or {}
+
+
+def get_wbi_mixin_key(cookies=None):
+    """
+    获取WBI签名使用的混合密钥（UP主投稿列表接口需要签名）
+
+    Returns:
+        str: 32位混合密钥，失败返回None
+    """
+    with _wbi_lock:
+        if _wbi_cache['key'] and time.time() - _wbi_cache['time'] < WBI_KEY_TTL:
+            return _wbi_cache['key']
+    try:
+        response = requests.get(NAV_API, headers=HEADERS, cookies=parse_cookies(cookies), timeout=10)
+        response.raise_for_status()
+        # 未登录时code为-101，但仍然返回wbi_img
+        wbi_img = (response.json().get('data') or {}).get('wbi_img') or {}
+        img_key = wbi_img.get('img_url', '').rsplit('/', 1)[-1].split('.')[0]
+        sub_key = wbi_img.get('sub_url', '').rsplit('/', 1)[-1].split('.')[0]
+    except (requests.RequestException, ValueError) as e:
+        print(f"获取WBI密钥失败: {e}", flush=True)
+        return None
+    raw_key = img_key + sub_key
+    if len(raw_key) < 64:
+        print("获取WBI密钥失败: 返回数据不完整", flush=True)
+        return None
+    mixin_key = ''.join(raw_key[i] for i in MIXIN_KEY_ENC_TAB)[:32]
+    with _wbi_lock:
+        _wbi_cache.update(key=mixin_key, time=time.time())
+    return mixin_key
+
+
+def sign_wbi_params(params, mixin_key):
+    """
+    为请求参数添加WBI签名(wts和w_rid)
+
+    Returns:
+        dict: 签名后的参数
+    """
+    params = dict(params, wts=int(time.time()))
+    filtered = {key: re.sub(r"[!'()*]", '', str(value)) for key, value in sorted(params.items())}
+    query = urlencode(filtered)
+    filtered['w_rid'] = hashlib.md5((query + mixin_key).encode('utf-8')).hexdigest()
+    return filtered
+
+
+def fetch_source_page(source_type, source_id, page, mid=None, cookies=None):
+    """
+    获取来源列表的一页
+
+    Args:
+        source_type (str): 'favorites'、'collection'或'uploader'
+        source_id (int): 收藏夹media_id、合集season_id或UP主mid
+        page (int): 页码，从1开始
+        mid (int): 合集所属UP主的mid
+        cookies (str or dict): Cookie信息，私密收藏夹需要登录
+
+    Returns:
+        tuple: (BV号列表, 视频总数)，失败返回None
+    """
+    page_size = SOURCE_PAGE_SIZES[source_type]
+    if source_type == 'favorites':
+        url, params = FAVORITES_API, {'media_id': source_id, 'pn': page, 'ps': page_size, 'platform': 'web'}
+    elif source_type == 'collection':
+        url, params = COLLECTION_API, {'season_id': source_id, 'page_num': page, 'page_size': page_size,
+                                       'sort_reverse': 'false'}
+        if mid:
+            params['mid'] = mid
+    else:
+        mixin_key = get_wbi_mixin_key(cookies)
+        if not mixin_key:
+            return None
+        url, params = UPLOADER_API, sign_wbi_params({'mid': source_id, 'pn': page, 'ps': page_size, 'order': 'pubdate'}, mixin_key)
+
+    try:
+        response = requests.get(url, params=params, headers=HEADERS, cookies=parse_cookies(cookies), timeout=15)
+        response.raise_for_status()
+        result = response.json()
+    except (requests.RequestException, ValueError) as e:
+        print(f"获取{SOURCE_TYPES[source_type]}列表失败 (第{page}页): {e}", flush=True)
+        return None
+    if result.get('code') != 0:
+        print(f"获取{SOURCE_TYPES[source_type]}列表失败 (第{page}页): {result.get('message')}", flush=True)
+        return None
+
+    data = result.get('data') or {}
+    if source_type == 'favorites':
+        # type为2的是视频，其余为音频等其他内容
+        items = [media for media in data.get('medias') or [] if media.get('type', 2) == 2]
+        total = (data.get('info') or {}).get('media_count', 0)
+    elif source_type == 'collection':
+        items = data.get('archives') or []
+        total = (data.get('page') or {}).get('total', 0)
+    else:
+        items = (data.get('list') or {}).get('vlist') or []
+        total = (data.get('page') or {}).get('count', 0)
+    return [item['bvid'] for item in items if item.get('bvid')], total
+
+
+def list_source_videos(source_type, source_id, cookies=None, mid=None, max_videos=500, max_workers=DEFAULT_RESOLVE_WORKERS):
+    """
+    列出收藏夹、合集或UP主投稿中的全部视频
+
+    先获取第一页得到视频总数，其余页并发获取，结果保持来源中的顺序。
+
+    Args:
+        source_type (str): 'favorites'、'collection'或'uploader'
+        source_id (str or int): 收藏夹media_id（可带ml前缀）、合集season_id或UP主mid
+        cookies (str or dict): Cookie信息
+        mid (int): 合集所属UP主的mid
+        max_videos (int): 最多返回的视频数
+        max_workers (int): 并发请求数
+
+    Returns:
+        list: 视频URL列表，失败返回None
+    """
+    if source_type not in SOURCE_TYPES:
+        return None
+    id_match = re.search(r'\d+', str(source_id))
+    if not id_match:
+        return None
+    source_id = int(id_match.group())
+
+    first_page = fetch_source_page(source_type, source_id, 1, mid, cookies)
+    if first_page is None:
+        return None
+    bvids, total = first_page
+    page_size = SOURCE_PAGE_SIZES[source_type]
+    page_count = math.ceil(min(total, max_videos) / page_size)
+
+    if page_count > 1:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pages = list(executor.map(lambda page: fetch_source_page(source_type, source_id, page, mid, cookies),
+                                      range(2, page_count + 1)))
+        for page in pages:
+            if page is None:
+                # 部分页获取失败时返回已获取的视频
+                print(f"{SOURCE_TYPES[source_type]} {source_id} 有列表页获取失败，部分视频未加入", flush=True)
+                continue
+            bvids.extend(page[0])
+
+    print(f"{SOURCE_TYPES[source_type]} {source_id}: 共 {total} 个视频，获取到 {len(bvids)} 个", flush=True)
+    return [VIDEO_URL_TEMPLATE.format(bvid) for bvid in bvids[:max_videos]]
+
+
+def resolve_video_url(url):
+    """
+    把批量提交的一项转换为视频地址：BV号/av号补全为视频页面地址，短链接跟随跳转
+
+    Args:
+        url (str): 视频URL、短链接、BV号或av号
+
+    Returns:
+        str: 视频地址，无法识别时返回None
+    """
+    url = (url or '').strip()
+    if re.fullmatch(r'BV[a-zA-Z0-9]{10}', url):
+        return VIDEO_URL_TEMPLATE.format(url)
+    if re.fullmatch(r'av\d+', url, re.IGNORECASE):
+        return VIDEO_URL_TEMPLATE.format(url.lower())
+    if not re.match(r'https?://', url):
+        return None
+    host = re.sub(r'^https?://', '', url).split('/', 1)[0].lower()
+    if host in SHORT_URL_HOSTS:
+        try:
+            response = requests.head(url, headers=HEADERS, allow_redirects=True, timeout=10)
+            return response.url
+        except requests.RequestException as e:
+            print(f"解析短链接失败 {url}: {e}", flush=True)
+            return None
+    return url
+
+
+def resolve_video_urls(urls, max_workers=DEFAULT_RESOLVE_WORKERS):
+    """
+    并发解析一批视频地址（只有短链接需要网络请求）
+
+    Returns:
+        list: 与urls顺序对应的视频地址，无法识别的项为None
+    """
+    if not any(host in (url or '') for url in urls for host in SHORT_URL_HOSTS):
+        return [resolve_video_url(url) for url in urls]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(resolve_video_url, urls))
@@ -0,0 +1,233 @@
+import json
+import os
+import shutil
+import uuid
+
+from mp4remux import parse_track, write_all, copy_range
+from muxer import mux_pool
+
+# 雪碧图布局：最多PREVIEW_MAX_TILES张缩略图，每行PREVIEW_COLUMNS张
+PREVIEW_MAX_TILES = 100
+PREVIEW_COLUMNS = 10
+PREVIEW_TILE_WIDTH = 160
+
+# 封面取自视频约三分之一处的关键帧，避开片头黑屏
+POSTER_POSITION = 1 / 3
+
+# 预览生成的超时时间（秒）
+DEFAULT_PREVIEW_TIMEOUT = 300
+
+
+def get_preview_paths(output_path):
+    """
+    获取与输出文件放在一起的预览文件路径
+
+    Args:
+        output_path (str): 合并后的视频文件路径
+
+    Returns:
+        dict: 包含sprite(雪碧图)、poster(封面)和index(描述文件)路径
+    """
+    root, _ = os.path.splitext(output_path)
+    return {
+        'sprite': f"{root}.sprite.jpg",
+        'poster': f"{root}.poster.jpg",
+        'index': f"{root}.preview.json"
+    }
+
+
+def load_cached_preview(output_path):
+    """
+    读取已生成的预览，描述文件比视频文件旧时视为失效
+
+    Args:
+        output_path (str): 合并后的视频文件路径
+
+    Returns:
+        dict: 预览描述信息，不存在或已失效时返回None
+    """
+    paths = get_preview_paths(output_path)
+    try:
+        if os.path.getmtime(paths['index']) < os.path.getmtime(output_path):
+            return None
+        with open(paths['index'], 'r', encoding='utf-8') as f:
+            preview = json.load(f)
+        if not os.path.exists(preview.get('sprite') or ''):
+            return None
+        return preview
+    except (OSError, ValueError):
+        return None
+
+
+def pick_evenly(items, count):
+    """从列表中均匀选出最多count项，保持原有顺序"""
+    if len(items) <= count:
+        return list(items)
+    step = len(items) / count
+    return [items[int(i * step)] for i in range(count)]
+
+
+def build_keyframe_source(video_path, source_path, max_tiles=PREVIEW_MAX_TILES):
+    """
+    按分片索引从视频流中抽取关键帧所在的分片，写成一个只包含这些分片的小文件
+
+    B站DASH视频流的每个分片都以关键帧开始，只复制选中分片的moof/mdat，
+    后续只需解码这些分片的关键帧，不必读取和解码整个视频。
+
+    Args:
+        video_path (str): 下载得到的单轨道分片MP4视频流
+        source_path (str): 抽取结果的保存路径
+        max_tiles (int): 最多抽取的分片数
+
+    Returns:
+        list: 选中分片的起始时间（秒）
+
+    Raises:
+        ValueError: 视频流不是单轨道分片MP4
+    """
+    track = parse_track(video_path)
+    if track['handler'] != 'vide':
+        raise ValueError(f"{video_path} 不是视频轨道")
+    fragments = pick_evenly(track['fragments'], max_tiles)
+    with open(video_path, 'rb') as video_file, open(source_path, 'wb', buffering=0) as source_file:
+        src_fd = video_file.fileno()
+        dst_fd = source_file.fileno()
+        write_all(dst_fd, (track['ftyp'] or b'') + track['moov'])
+        for fragment in fragments:
+            # moof中的数据偏移相对于moof自身，mdat紧跟其后即可原样复制
+            write_all(dst_fd, fragment['moof'])
+            copy_range(src_fd, dst_fd, fragment['mdat_offset'], fragment['mdat_size'])
+    return [fragment['time'] for fragment in fragments]
+
+
+def build_preview_command(source_path, sprite_path, poster_path, tile_count, min_interval,
+                          columns=PREVIEW_COLUMNS, tile_width=PREVIEW_TILE_WIDTH):
+    """
+    构建生成雪碧图和封面的ffmpeg命令
+
+    解码器只解码关键帧（-skip_frame nokey），按最小间隔选取后拼接为雪碧图，
+    同一次解码中取第tile_count*POSTER_POSITION张作为原始分辨率的封面。
+
+    Args:
+        source_path (str): 输入文件
+        sprite_path (str): 雪碧图输出路径
+        poster_path (str): 封面输出路径
+        tile_count (int): 缩略图数量
+        min_interval (float): 相邻两张缩略图的最小时间间隔（秒）
+        columns (int): 雪碧图每行缩略图数量
+        tile_width (int): 缩略图宽度
+
+    Returns:
+        list: ffmpeg命令及参数
+    """
+    columns = max(1, min(columns, tile_count))
+    rows = max(1, -(-tile_count // columns))
+    poster_index = int(tile_count * POSTER_POSITION)
+    filter_graph = (
+        f"[0:v]select='isnan(prev_selected_t)+gte(t-prev_selected_t\\,{min_interval:.3f})',split[s][p];"
+        f"[s]scale={tile_width}:-2,tile={columns}x{rows}[sprite];"
+        f"[p]select='eq(n\\,{poster_index})'[poster]"
+    )
+    return [
+        'ffmpeg',
+        '-nostdin',
+        '-hide_banner',
+        '-skip_frame', 'nokey',  # 只解码关键帧
+        '-i', source_path,
+        '-an',
+        '-filter_complex', filter_graph,
+        '-map', '[sprite]', '-frames:v', '1', '-q:v', '4', '-y', sprite_path,
+        '-map', '[poster]', '-frames:v', '1', '-q:v', '2', '-y', poster_path
+    ]
+
+
+def generate_preview(output_path, video_stream_path=None, duration=None, cancel_event=None,
+                     timeout=DEFAULT_PREVIEW_TIMEOUT, max_tiles=PREVIEW_MAX_TILES):
+    """
+    为合并后的视频生成预览雪碧图和封面，结果与视频文件放在一起并在之后直接复用
+
+    优先使用下载得到的视频流的分片索引只抽取关键帧分片；视频流不可用时
+    对输出文件只解码关键帧。ffmpeg在合并进程池中排队执行。
+
+    Args:
+        output_path (str): 合并后的视频文件路径
+        video_stream_path (str): 下载得到的视频流文件（合并前的临时文件），可选
+        duration (float): 视频时长（秒），没有分片索引时用于计算缩略图间隔
+        cancel_event (threading.Event): 被设置时结束ffmpeg进程
+        timeout (float): ffmpeg超时时间（秒）
+        max_tiles (int): 最多生成的缩略图数量
+
+    Returns:
+        dict: 预览描述信息（sprite、poster、index路径及布局和各缩略图时间），失败时返回None
+    """
+    cached = load_cached_preview(output_path)
+    if cached:
+        return cached
+    if shutil.which('ffmpeg') is None:
+        print("未检测到FFmpeg，跳过预览图生成", flush=True)
+        return None
+
+    paths = get_preview_paths(output_path)
+    token = uuid.uuid4().hex[:8]
+    source_path = None
+    temp_sprite = f"{paths['sprite']}.{token}.tmp.jpg"
+    temp_poster = f"{paths['poster']}.{token}.tmp.jpg"
+    try:
+        times = None
+        if video_stream_path and os.path.exists(video_stream_path):
+            source_path = f"{output_path}.{token}.keyframes.mp4"
+            try:
+                times = build_keyframe_source(video_stream_path, source_path, max_tiles)
+            except (ValueError, OSError) as e:
+                print(f"无法按分片索引抽取关键帧，改为直接读取输出文件: {e}", flush=True)
+                times = None
+
+        if times:
+            input_path = source_path
+            # 取相邻选中分片最小间隔的一半，足以过滤掉分片内部的其他关键帧
+            min_interval = min((b - a for a, b in zip(times, times[1:])), default=0) / 2
+        else:
+            if not duration:
+                print("缺少视频时长，无法生成预览图", flush=True)
+                return None
+            input_path = output_path
+            min_interval = duration / max_tiles
+            times = [i * min_interval for i in range(max_tiles)]
+
+        cmd = build_preview_command(input_path, temp_sprite, temp_poster, len(times), min_interval)
+        result = mux_pool.run(cmd, cancel_event=cancel_event, timeout=timeout)
+        if result.returncode != 0 or result.cancelled or not os.path.exists(temp_sprite):
+            print(f"预览图生成失败: {result.stop_reason or result.stderr}", flush=True)
+            return None
+
+        os.replace(temp_sprite, paths['sprite'])
+        poster_path = None
+        if os.path.exists(temp_poster):
+            os.replace(temp_poster, paths['poster'])
+            poster_path = paths['poster']
+        columns = max(1, min(PREVIEW_COLUMNS, len(times)))
+        preview = {
+            'sprite': paths['sprite'],
+            'poster': poster_path,
+            'index': paths['index'],
+            'columns': columns,
+            'rows': -(-len(times) // columns),
+            'tile_width': PREVIEW_TILE_WIDTH,
+            'times': [round(t, 3) for t in times]
+        }
+        # 描述文件最后写入，作为预览已完整生成的标记
+        with open(paths['index'], 'w', encoding='utf-8') as f:
+            json.dump(preview, f, ensure_ascii=False)
+        print(f"预览图已生成: {paths['sprite']}", flush=True)
+        return preview
+
+    except FileNotFoundError:
+        print("未检测到FFmpeg，跳过预览图生成", flush=True)
+        return None
+    finally:
+        for path in (source_path, temp_sprite, temp_poster):
+            if path and os.path.exists(path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
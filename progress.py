@@ -0,0 +1,254 @@
+import asyncio
+import threading
+import time
+import uuid
+
+# 推送给同一订阅者的两次事件之间的最小间隔（秒），间隔内的多次更新合并为一次
+DEFAULT_PUSH_INTERVAL = 0.25
+
+# 没有事件时发送保活消息的间隔（秒）
+KEEPALIVE_INTERVAL = 15
+
+# 速度的指数移动平均系数，越大越跟随瞬时速度
+SPEED_SMOOTHING = 0.3
+
+# 进程之间转发进度事件的间隔（秒）：写出本进程的事件并读取其他进程的事件
+RELAY_INTERVAL = 0.2
+
+# 已结束的任务状态，单任务订阅收到后结束推送
+FINAL_STATUSES = ('completed', 'failed', 'cancelled', 'paused')
+
+
+class TransferTracker:
+    """
+    根据字节进度估算单个任务的下载速度和剩余时间
+
+    下载阶段按已下载字节数计算速度（指数移动平均）和剩余时间；
+    合并等只有百分比进度的阶段按进度增长速率估算剩余时间，进度回退（进入新阶段）时重新计时。
+    """
+
+    def __init__(self):
+        self.last_time = None
+        self.last_bytes = 0
+        self.speed = None
+        self.eta = None
+        self.window_start = None
+
+    def record_bytes(self, current, total):
+        now = time.time()
+        if self.last_time is not None and current >= self.last_bytes:
+            elapsed = now - self.last_time
+            if elapsed >= 0.2:
+                instant = (current - self.last_bytes) / elapsed
+                self.speed = instant if self.speed is None else self.speed * (1 - SPEED_SMOOTHING) + instant * SPEED_SMOOTHING
+                self.last_time, self.last_bytes = now, current
+        else:
+            # 新的流开始下载
+            self.last_time, self.last_bytes = now, current
+        self.eta = (total - current) / self.speed if self.speed and total > 0 else None
+
+    def record_progress(self, progress):
+        now = time.time()
+        if self.last_time is not None:
+            if now - self.last_time < 2:
+                # 下载阶段由字节进度计算
+                return
+            # 字节传输已结束，进入合并等阶段
+            self.last_time = None
+            self.speed = None
+            self.window_start = None
+        if self.window_start is None or progress < self.window_start[1]:
+            self.window_start = (now, progress)
+            self.eta = None
+            return
+        start_time, start_progress = self.window_start
+        if progress > start_progress and now > start_time:
+            self.eta = (100 - progress) * (now - start_time) / (progress - start_progress)
+
+    def snapshot(self):
+        return {
+            'speed': round(self.speed) if self.speed is not None else None,
+            'eta': round(self.eta, 1) if self.eta is not None else None
+        }
+
+
+class Subscription:
+    """一个订阅者（一个SSE或WebSocket连接）的待推送事件，按任务合并"""
+
+    def __init__(self, task_id, loop):
+        self.task_id = task_id
+        self.loop = loop
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.signaled = False
+        self.wakeup = asyncio.Event()
+
+    def push(self, event):
+        # 可能在任意线程中调用：合并到待推送事件后唤醒事件循环中的推送协程
+        with self.lock:
+            self.pending.setdefault(event['task_id'], {}).update(event)
+            if self.signaled:
+                return
+            self.signaled = True
+        try:
+            self.loop.call_soon_threadsafe(self.wakeup.set)
+        except RuntimeError:
+            # 事件循环已关闭
+            pass
+
+    async def next_events(self, timeout=KEEPALIVE_INTERVAL):
+        """
+        等待并取出待推送的事件
+
+        Returns:
+            list: 每个任务合并后的事件，超时时返回空列表
+        """
+        try:
+            await asyncio.wait_for(self.wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            return []
+        with self.lock:
+            events = list(self.pending.values())
+            self.pending.clear()
+            self.signaled = False
+            self.wakeup.clear()
+        return events
+
+
+class ProgressBroker:
+    """
+    任务进度的发布/订阅中心
+
+    update_task_status的每次更新都发布到这里，SSE和WebSocket连接订阅单个任务或全部任务。
+    发布只做内存中的合并，不阻塞下载线程；订阅者按DEFAULT_PUSH_INTERVAL节流推送，
+    每个任务只推送最新状态（间隔内的多次更新合并为一个事件）。
+    调用start_relay后，本进程发布的事件按任务合并后定期写入共享的事件表，
+    同时读取其他工作进程写入的事件推送给本进程的订阅者。
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscriptions = set()
+        self.trackers = {}
+        self.origin = uuid.uuid4().hex
+        self.relay_store = None
+        self.relay_seq = 0
+        self.outbox = {}
+
+    def subscribe(self, task_id=None):
+        """
+        订阅进度事件，必须在事件循环中调用
+
+        Args:
+            task_id (str): 只订阅该任务，None表示订阅全部任务
+
+        Returns:
+            Subscription: 订阅对象，用完后调用unsubscribe
+        """
+        subscription = Subscription(task_id, asyncio.get_running_loop())
+        with self.lock:
+            self.subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscriptions.discard(subscription)
+
+    def start_relay(self, store, interval=RELAY_INTERVAL):
+        """
+        启动进程之间的事件转发线程
+
+        Args:
+            store: 提供append_progress_events/read_progress_events/last_progress_seq的共享存储（SQLiteTaskStore）
+            interval (float): 转发间隔（秒）
+        """
+        self.relay_seq = store.last_progress_seq()
+        self.relay_store = store
+        thread = threading.Thread(target=self._relay_loop, args=(interval,), name="progress-relay", daemon=True)
+        thread.start()
+
+    def _relay_loop(self, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                self._relay_once()
+            except Exception as e:
+                print(f"转发进度事件失败: {e}", flush=True)
+
+    def _relay_once(self):
+        with self.lock:
+            outgoing, self.outbox = self.outbox, {}
+        if outgoing:
+            try:
+                self.relay_store.append_progress_events(self.origin, list(outgoing.values()))
+            except Exception:
+                # 写入失败时放回待发送事件，已有的新值优先
+                with self.lock:
+                    for task_id, event in outgoing.items():
+                        self.outbox[task_id] = {**event, **self.outbox.get(task_id, {})}
+                raise
+        while True:
+            rows = self.relay_store.read_progress_events(self.relay_seq)
+            for seq, origin, event in rows:
+                self.relay_seq = seq
+                if origin != self.origin:
+                    self._deliver(event)
+            if len(rows) < 1000:
+                break
+
+    def _deliver(self, event):
+        """把其他进程转发来的事件推送给本进程的订阅者"""
+        with self.lock:
+            subscriptions = [s for s in self.subscriptions if s.task_id is None or s.task_id == event['task_id']]
+        for subscription in subscriptions:
+            subscription.push(event)
+
+    def record_transfer(self, task_id, current, total):
+        """记录字节进度，用于计算速度和剩余时间"""
+        with self.lock:
+            tracker = self.trackers.setdefault(task_id, TransferTracker())
+            tracker.record_bytes(current, total)
+
+    def publish(self, task_id, fields):
+        """
+        发布任务更新
+
+        Args:
+            task_id (str): 任务ID
+            fields (dict): 更新的任务字段
+        """
+        with self.lock:
+            tracker = self.trackers.get(task_id)
+            if 'progress' in fields:
+                tracker = tracker or self.trackers.setdefault(task_id, TransferTracker())
+                tracker.record_progress(fields['progress'])
+            if fields.get('status') in FINAL_STATUSES:
+                self.trackers.pop(task_id, None)
+                tracker = None
+            subscriptions = [s for s in self.subscriptions if s.task_id is None or s.task_id == task_id]
+            relay = self.relay_store is not None
+        if not subscriptions and not relay:
+            return
+        event = {'task_id': task_id, **fields, 'time': time.time()}
+        event.update(tracker.snapshot() if tracker is not None else {'speed': None, 'eta': None})
+        if relay:
+            with self.lock:
+                self.outbox.setdefault(task_id, {}).update(event)
+        for subscription in subscriptions:
+            subscription.push(event)
+
+    def get_stats(self):
+        with self.lock:
+            return {'subscribers': len(self.subscriptions), 'tracked_tasks': len(self.trackers),
+                    'relay': self.relay_store is not None, 'relay_seq': self.relay_seq}
+
+
+def make_task_event(task):
+    """由任务记录生成初始快照事件"""
+    return {
+        'task_id': task['id'],
+        'status': task.get('status'),
+        'progress': task.get('progress', 0),
+        'message': task.get('message'),
+        'time': time.time()
+    }
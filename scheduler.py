@@ -0,0 +1,342 @@
+import contextlib
+import functools
+import itertools
+import math
+import threading
+import time
+
+# 优先级类别，数值越小越先调度
+PRIORITY_CLASSES = {'high': 0, 'normal': 1, 'low': 2}
+
+# 同时进行网络传输（下载流数据）的任务数上限，解析和合并阶段不占用
+DEFAULT_TRANSFER_LIMIT = 5
+
+# 同时解析视频页面的请求数上限
+DEFAULT_RESOLVE_LIMIT = 4
+
+# 每个客户端同时运行的任务数上限，避免单个客户端占满所有传输槽位
+DEFAULT_PER_CLIENT_LIMIT = 2
+
+# 还没有完成任何任务时使用的单个任务预计耗时（秒）
+DEFAULT_JOB_SECONDS = 120
+
+
+class CancelToken(threading.Event):
+    """
+    任务的协作式停止标志
+
+    与threading.Event兼容：下载、合并等阶段只需检查is_set()。
+    pause()同样会设置标志，但paused为True，表示保留已下载的部分文件以便之后续传；
+    cancel()表示放弃任务并立即清理临时文件。
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.paused = False
+
+    def cancel(self):
+        self.paused = False
+        self.set()
+
+    def pause(self):
+        if not self.is_set():
+            self.paused = True
+            self.set()
+
+
+class ResizableSemaphore:
+    """
+    可在运行时调整上限的信号量
+
+    调大上限时立即唤醒等待者；调小上限时已持有的槽位不受影响，
+    释放后才按新上限控制并发。
+    """
+
+    def __init__(self, limit):
+        self.limit = max(1, int(limit))
+        self.active = 0
+        self.waiting = 0
+        self.condition = threading.Condition()
+
+    def acquire(self, cancel_event=None):
+        """
+        获取一个槽位
+
+        Args:
+            cancel_event (threading.Event): 等待期间被设置时放弃获取
+
+        Returns:
+            bool: 是否获取成功
+        """
+        with self.condition:
+            self.waiting += 1
+            try:
+                while self.active >= self.limit:
+                    if cancel_event is not None and cancel_event.is_set():
+                        return False
+                    self.condition.wait(0.5)
+            finally:
+                self.waiting -= 1
+            self.active += 1
+            return True
+
+    def release(self):
+        with self.condition:
+            self.active -= 1
+            self.condition.notify()
+
+    def resize(self, limit):
+        with self.condition:
+            self.limit = max(1, int(limit))
+            self.condition.notify_all()
+
+    @contextlib.contextmanager
+    def slot(self, cancel_event=None, on_release=None):
+        """
+        占用一个槽位的上下文管理器
+
+        Args:
+            cancel_event (threading.Event): 等待期间被设置时不再等待，直接进入代码块，
+                                            由代码块自身的停止检查处理暂停或取消
+            on_release (function): 释放槽位后调用
+        """
+        acquired = self.acquire(cancel_event)
+        try:
+            yield
+        finally:
+            if acquired:
+                self.release()
+                if on_release:
+                    on_release()
+
+    def get_stats(self):
+        with self.condition:
+            return {'limit': self.limit, 'running': self.active, 'queued': self.waiting}
+
+
+class Job:
+    """调度队列中的一个任务"""
+
+    def __init__(self, task_id, function, priority, client, sequence, fair_round):
+        self.task_id = task_id
+        self.function = function
+        self.priority = priority
+        self.client = client
+        self.sequence = sequence
+        # 提交时该客户端已有的排队和运行任务数，同一优先级内按轮次轮流调度各客户端
+        self.fair_round = fair_round
+        self.submitted_at = time.time()
+        self.started_at = None
+        # 是否已经结束网络传输阶段，之后的合并阶段不再占用调度名额
+        self.transferred = False
+
+    @property
+    def sort_key(self):
+        return (PRIORITY_CLASSES.get(self.priority, PRIORITY_CLASSES['normal']), self.fair_round, self.sequence)
+
+
+class JobScheduler:
+    """
+    下载任务调度器
+
+    - 按优先级类别（high/normal/low）调度，同一类别内按客户端轮流调度，
+      一个客户端排入大量任务时不会阻塞其他客户端的任务
+    - 每个客户端同时运行的任务数受配额限制
+    - 解析(resolve)和网络传输(transfer)使用各自的并发槽位，任务只在对应阶段占用；
+      合并阶段只受muxer合并进程池的限制；所有上限都可以在运行时调整
+    - 尚未结束网络传输的任务数不超过 传输上限+解析上限，超出的任务留在队列中按优先级等待，
+      进入合并阶段的任务不再占用名额
+    - 可以查询任务的排队位置和预计开始时间
+    """
+
+    def __init__(self, transfer_limit=DEFAULT_TRANSFER_LIMIT, resolve_limit=DEFAULT_RESOLVE_LIMIT,
+                 per_client_limit=DEFAULT_PER_CLIENT_LIMIT):
+        self.transfer_limit = max(1, int(transfer_limit))
+        self.per_client_limit = max(1, int(per_client_limit))
+        self.pools = {'resolve': ResizableSemaphore(resolve_limit), 'transfer': ResizableSemaphore(self.transfer_limit)}
+        self.local = threading.local()
+        self.condition = threading.Condition()
+        self.queue = []
+        self.running = {}
+        self.client_running = {}
+        self.client_queued = {}
+        self.sequence = itertools.count(1)
+        self.completed = 0
+        self.average_seconds = DEFAULT_JOB_SECONDS
+        self.dispatcher = threading.Thread(target=self._dispatch_loop, name="scheduler-dispatch", daemon=True)
+        self.dispatcher.start()
+
+    def submit(self, task_id, function, priority='normal', client='anonymous'):
+        """
+        提交任务到调度队列
+
+        Args:
+            task_id (str): 任务ID
+            function (callable): 任务函数，在调度到的工作线程中无参数调用
+            priority (str): 优先级类别（PRIORITY_CLASSES）
+            client (str): 客户端标识，用于公平调度和配额
+        """
+        if priority not in PRIORITY_CLASSES:
+            raise ValueError(f"未知的优先级: {priority}")
+        with self.condition:
+            fair_round = self.client_queued.get(client, 0) + self.client_running.get(client, 0)
+            self.queue.append(Job(task_id, function, priority, client, next(self.sequence), fair_round))
+            self.client_queued[client] = self.client_queued.get(client, 0) + 1
+            self.condition.notify_all()
+
+    def remove(self, task_id):
+        """
+        从队列中移除尚未开始的任务
+
+        Returns:
+            bool: 任务是否仍在排队并已被移除
+        """
+        with self.condition:
+            for job in self.queue:
+                if job.task_id == task_id:
+                    self.queue.remove(job)
+                    self._decrement(self.client_queued, job.client)
+                    return True
+        return False
+
+    def stage(self, name, cancel_event=None):
+        """
+        获取阶段并发槽位的上下文管理器，如 with scheduler.stage('resolve'): ...
+
+        在调度线程中释放transfer槽位后，该任务不再计入调度名额，队列中的下一个任务随即开始
+
+        Args:
+            name (str): 阶段名称（'resolve'或'transfer'）
+            cancel_event (threading.Event): 等待槽位期间被设置时停止等待
+        """
+        on_release = None
+        job = getattr(self.local, 'job', None)
+        if name == 'transfer' and job is not None:
+            on_release = functools.partial(self._transfer_done, job)
+        return self.pools[name].slot(cancel_event, on_release)
+
+    def _transfer_done(self, job):
+        with self.condition:
+            job.transferred = True
+            self.condition.notify_all()
+
+    def resize(self, transfer=None, resolve=None, per_client=None):
+        """运行时调整并发上限，调大时排队中的任务立即开始"""
+        with self.condition:
+            if transfer:
+                self.transfer_limit = max(1, int(transfer))
+                self.pools['transfer'].resize(transfer)
+            if per_client:
+                self.per_client_limit = max(1, int(per_client))
+            self.condition.notify_all()
+        if resolve:
+            self.pools['resolve'].resize(resolve)
+
+    def _decrement(self, counter, client):
+        counter[client] -= 1
+        if counter[client] <= 0:
+            del counter[client]
+
+    def _ordered_queue(self):
+        return sorted(self.queue, key=lambda job: job.sort_key)
+
+    def _admit_limit(self):
+        # 传输槽位之外再预留解析槽位数的名额，使解析与其他任务的传输并行进行
+        return self.transfer_limit + self.pools['resolve'].limit
+
+    def _active_count(self):
+        return sum(1 for job in self.running.values() if not job.transferred)
+
+    def _next_job(self):
+        if self._active_count() >= self._admit_limit():
+            return None
+        for job in self._ordered_queue():
+            if self.client_running.get(job.client, 0) < self.per_client_limit:
+                return job
+        return None
+
+    def _dispatch_loop(self):
+        while True:
+            with self.condition:
+                job = self._next_job()
+                while job is None:
+                    self.condition.wait()
+                    job = self._next_job()
+                self.queue.remove(job)
+                self._decrement(self.client_queued, job.client)
+                self.client_running[job.client] = self.client_running.get(job.client, 0) + 1
+                self.running[job.task_id] = job
+                job.started_at = time.time()
+            threading.Thread(target=self._run, args=(job,), name=f"download-{job.sequence}", daemon=True).start()
+
+    def _run(self, job):
+        self.local.job = job
+        try:
+            job.function()
+        except Exception as e:
+            print(f"调度任务 {job.task_id} 执行失败: {e}", flush=True)
+        finally:
+            elapsed = time.time() - job.started_at
+            with self.condition:
+                self.running.pop(job.task_id, None)
+                self._decrement(self.client_running, job.client)
+                self.completed += 1
+                # 以指数移动平均估计单个任务耗时，用于计算预计开始时间
+                self.average_seconds = self.average_seconds * 0.8 + elapsed * 0.2
+                self.condition.notify_all()
+
+    def get_position(self, task_id):
+        """
+        查询排队中任务的位置和预计开始时间
+
+        Returns:
+            dict: 包含position(从1开始)、ahead(前面的任务数)、estimated_wait(秒)和
+                  estimated_start(时间戳)，任务不在队列中时返回None
+        """
+        return self.get_positions([task_id]).get(task_id)
+
+    def get_positions(self, task_ids):
+        """
+        批量查询排队中任务的位置，队列只排序一次
+
+        Args:
+            task_ids: 任务ID列表
+
+        Returns:
+            dict: 任务ID到位置信息的映射，不在队列中的任务不包含在内
+        """
+        wanted = set(task_ids)
+        if not wanted:
+            return {}
+        now = time.time()
+        positions = {}
+        with self.condition:
+            free_slots = max(0, self._admit_limit() - self._active_count())
+            for index, job in enumerate(self._ordered_queue()):
+                if job.task_id not in wanted:
+                    continue
+                waves = math.ceil(max(0, index + 1 - free_slots) / self.transfer_limit)
+                estimated_wait = waves * self.average_seconds
+                positions[job.task_id] = {
+                    'position': index + 1,
+                    'ahead': index,
+                    'priority': job.priority,
+                    'estimated_wait': round(estimated_wait),
+                    'estimated_start': now + estimated_wait
+                }
+        return positions
+
+    def get_stats(self):
+        with self.condition:
+            stats = {
+                'jobs': {'limit': self._admit_limit(), 'running': len(self.running), 'active': self._active_count(),
+                         'queued': len(self.queue)},
+                'per_client_limit': self.per_client_limit,
+                'clients': {client: {'running': self.client_running.get(client, 0), 'queued': self.client_queued.get(client, 0)}
+                            for client in set(self.client_running) | set(self.client_queued)},
+                'queued_by_priority': {name: sum(1 for job in self.queue if job.priority == name) for name in PRIORITY_CLASSES},
+                'completed': self.completed,
+                'average_seconds': round(self.average_seconds)
+            }
+        stats.update({name: pool.get_stats() for name, pool in self.pools.items()})
+        return stats
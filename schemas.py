@@ -0,0 +1,235 @@
+import json
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel, Field
+from starlette.responses import JSONResponse
+
+# orjson为可选依赖：安装后JSON接口使用它序列化，否则使用标准库json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON接口的响应类
+
+    直接序列化接口构建好的dict/list，不经过响应模型的校验和转换；
+    响应模型只用于生成接口文档。中文原样输出，不转义为\\uXXXX。
+    """
+
+    def render(self, content):
+        if orjson is not None:
+            return orjson.dumps(content, default=str, option=orjson.OPT_NON_STR_KEYS)
+        return json.dumps(content, ensure_ascii=False, separators=(',', ':'), default=str).encode('utf-8')
+
+
+class ErrorResponse(BaseModel):
+    error: str
+
+
+class StreamInfo(BaseModel):
+    quality_id: int
+    quality_name: str
+    width: Optional[int] = None
+    height: Optional[int] = None
+    frame_rate: Optional[Any] = None
+    bandwidth: int = 0
+    codecs: str = ''
+    url: Optional[str] = None
+
+
+class VideoInfoResponse(BaseModel):
+    url: str
+    title: Optional[str] = None
+    cover: Optional[str] = None
+    duration: int = 0
+    highest_video: Optional[StreamInfo] = None
+    highest_audio: Optional[StreamInfo] = None
+    video_streams: List[StreamInfo] = []
+    audio_streams: List[StreamInfo] = []
+
+
+class QualityOption(StreamInfo):
+    index: int
+
+
+class QualityOptionsResponse(BaseModel):
+    url: str
+    duration: int = 0
+    video_options: List[QualityOption] = []
+    audio_options: List[QualityOption] = []
+
+
+class DownloadOptions(BaseModel):
+    """下载选项，字段含义与 /api/video/download 的参数相同"""
+    merge: bool = True
+    filename: Optional[str] = None
+    video_quality: int = 0
+    audio_quality: int = 0
+    streaming: bool = False
+    audio_only: bool = False
+    audio_format: Optional[str] = None
+    start: Optional[str] = None
+    end: Optional[str] = None
+    profile: str = 'copy'
+    policy: str = 'quality'
+    min_height: Optional[int] = None
+    max_bandwidth: Optional[int] = None
+    codec: Optional[str] = None
+    embed_metadata: bool = True
+    danmaku: bool = False
+    subtitles: bool = False
+    preview: bool = False
+    priority: str = 'normal'
+    client: Optional[str] = None
+
+
+# DownloadOptions中与build_download_task参数同名的字段（client单独处理）
+DOWNLOAD_OPTION_FIELDS = (
+    'merge', 'filename', 'video_quality', 'audio_quality', 'streaming', 'audio_only', 'audio_format', 'start', 'end',
+    'profile', 'policy', 'min_height', 'max_bandwidth', 'codec', 'embed_metadata', 'danmaku', 'subtitles', 'preview',
+    'priority'
+)
+
+
+class DownloadRequest(DownloadOptions):
+    """POST /api/v2/video/download 的请求体"""
+    url: str
+
+
+class BatchSource(BaseModel):
+    # 'favorites'收藏夹(media_id)、'collection'合集(season_id)、'uploader'UP主投稿(mid)
+    type: str
+    id: str
+    # 合集所属UP主的mid
+    mid: Optional[int] = None
+
+
+class BatchRequest(DownloadOptions):
+    """POST /api/v2/batch 的请求体：urls和source至少提供一个，下载选项对批次内的全部视频生效"""
+    urls: List[str] = []
+    source: Optional[BatchSource] = None
+    # 从source中最多取的视频数
+    max_videos: int = Field(500, ge=1, le=500)
+
+
+class QueuePosition(BaseModel):
+    position: int
+    ahead: int
+    priority: str
+    estimated_wait: Optional[int] = None
+    estimated_start: Optional[float] = None
+
+
+class TaskResponse(BaseModel):
+    id: str
+    status: str
+    progress: float = 0
+    message: Optional[str] = None
+    created_at: Optional[str] = None
+    url: str
+    merge: bool = True
+    audio_only: bool = False
+    audio_format: Optional[str] = None
+    clip_start: Optional[float] = None
+    clip_end: Optional[float] = None
+    profile: str = 'copy'
+    priority: str = 'normal'
+    client: Optional[str] = None
+    filename: Optional[str] = None
+    video_quality_index: int = 0
+    audio_quality_index: int = 0
+    worker: Optional[str] = None
+    batch_id: Optional[str] = None
+    file_path: Optional[str] = None
+    video_path: Optional[str] = None
+    audio_path: Optional[str] = None
+    danmaku_path: Optional[str] = None
+    subtitle_files: List[Dict[str, Any]] = []
+    preview_info: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    queue: Optional[QueuePosition] = None
+    links: Dict[str, str] = {}
+
+
+class TaskCreatedResponse(BaseModel):
+    created: bool
+    task: TaskResponse
+
+
+class TaskListResponse(BaseModel):
+    # 符合条件的任务总数，请求with_total时才统计
+    total: Optional[int] = None
+    offset: int
+    limit: int
+    # 下一页的游标，没有下一页时为null
+    next_cursor: Optional[str] = None
+    items: List[TaskResponse]
+
+
+class BatchResponse(BaseModel):
+    id: str
+    created_at: str
+    source: Optional[Dict[str, Any]] = None
+    # 提交的视频数、其中重复的视频数、无法识别的地址
+    requested: int
+    duplicates: int = 0
+    invalid: List[str] = []
+    # 批次关联的任务数、其中新建的任务数（其余关联到已有的相同任务）
+    total: int
+    created: int = 0
+    progress: float = 0
+    by_status: Dict[str, int] = {}
+    finished: bool = False
+    items: List[TaskResponse] = []
+
+
+class TaskActionResponse(BaseModel):
+    id: str
+    status: str
+    message: Optional[str] = None
+    # 请求是否已立即生效，False表示已向执行中的任务发出请求，任务稍后停止
+    done: bool = True
+
+
+# 任务记录中对外公开的字段，其余（去重键、工作进程号、部分文件路径等）只在服务内部使用
+TASK_PUBLIC_FIELDS = (
+    'id', 'status', 'progress', 'message', 'created_at', 'url', 'merge', 'audio_only', 'audio_format',
+    'clip_start', 'clip_end', 'profile', 'priority', 'client', 'filename', 'video_quality_index',
+    'audio_quality_index', 'worker', 'batch_id', 'file_path', 'video_path', 'audio_path', 'danmaku_path',
+    'subtitle_files', 'preview_info', 'error'
+)
+
+
+def serialize_task(task, queue=None):
+    """
+    把任务记录转换为JSON接口返回的结构（TaskResponse）
+
+    Args:
+        task (dict): 任务记录
+        queue (dict): 排队位置信息，任务不在排队时为None
+
+    Returns:
+        dict: 可直接交给FastJSONResponse序列化的任务数据
+    """
+    data = {field: task.get(field) for field in TASK_PUBLIC_FIELDS}
+    data['subtitle_files'] = data['subtitle_files'] or []
+    data['queue'] = queue
+
+    task_id = task['id']
+    status = task.get('status')
+    links = {'status': f"/api/v2/download/status/{task_id}"}
+    if status in ('pending', 'downloading', 'paused'):
+        links['cancel'] = f"/api/v2/download/{task_id}/cancel"
+    if status in ('pending', 'downloading') and not task.get('live_stream'):
+        links['pause'] = f"/api/v2/download/{task_id}/pause"
+    elif status == 'paused':
+        links['resume'] = f"/api/v2/download/{task_id}/resume"
+    elif status == 'completed':
+        links['file'] = f"/api/download/file/{task_id}"
+        if not task.get('merge') and task.get('video_path') and task.get('audio_path'):
+            links['merge'] = f"/api/download/merge/{task_id}"
+    data['links'] = links
+    return data
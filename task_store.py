@@ -0,0 +1,856 @@
+import base64
+import bisect
+import heapq
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# 任务的全部状态
+TASK_STATUSES = ('pending', 'downloading', 'paused', 'completed', 'failed', 'cancelled')
+
+# 已结束的任务状态，只有这些状态的任务会被按保留时间淘汰
+TERMINAL_STATUSES = ('completed', 'failed', 'cancelled')
+
+# 处于这些状态的任务参与去重，相同去重键的新请求直接关联到已有任务
+DEDUPE_STATUSES = ('pending', 'downloading', 'paused', 'completed')
+
+# 只包含这些字段的更新视为进度更新，合并后批量写入
+PROGRESS_FIELDS = frozenset(('progress', 'message'))
+
+# 批量写入进度的间隔（秒）
+DEFAULT_FLUSH_INTERVAL = 1.0
+
+# 已结束任务的默认保留时间（秒）
+DEFAULT_RETENTION_SECONDS = 7 * 24 * 3600
+
+# 两次淘汰检查之间的间隔（秒）
+EVICT_INTERVAL = 300
+
+# 分页列出任务时每页的默认任务数
+DEFAULT_PAGE_SIZE = 50
+
+# 进度事件在共享事件表中保留的时间（秒），各工作进程只读取最新的事件，同时也是清理间隔
+PROGRESS_EVENT_RETENTION = 60
+
+
+def encode_cursor(task):
+    """
+    由任务生成分页游标，游标指向该任务之后（更早创建）的任务
+
+    Args:
+        task (dict): 当前页的最后一个任务
+
+    Returns:
+        str: 不透明的游标字符串
+    """
+    raw = json.dumps([task.get('created_at') or '', task['id']], ensure_ascii=False)
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    解析分页游标
+
+    Returns:
+        tuple: (created_at, id)
+
+    Raises:
+        ValueError: 游标无效
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, task_id = json.loads(raw.decode('utf-8'))
+    except Exception:
+        raise ValueError("无效的分页游标")
+    if not isinstance(created_at, str) or not isinstance(task_id, str):
+        raise ValueError("无效的分页游标")
+    return created_at, task_id
+
+
+def _order_key(task):
+    return (task.get('created_at') or '', task['id'])
+
+
+class MemoryTaskStore:
+    """
+    进程内的任务存储，按任务ID、视频标识和状态建立索引
+
+    另外维护全部任务和每个状态的按(创建时间, ID)排序的列表，
+    分页列出任务时二分查找起点，只读取当前页的任务。
+    重启后任务丢失，也不能在多个工作进程之间共享，适合单进程调试使用。
+    """
+
+    def __init__(self, retention_seconds=DEFAULT_RETENTION_SECONDS):
+        self.retention_seconds = retention_seconds
+        self.lock = threading.Lock()
+        self.tasks = {}
+        self.updated_at = {}
+        self.by_video_key = {}
+        self.by_status = {}
+        self.by_dedupe_key = {}
+        # 按(创建时间, ID)升序排列的全部任务和每个状态的任务
+        self.order = []
+        self.order_by_status = {}
+        self.batches = {}
+        self.last_evict = time.time()
+
+    def _index(self, task_id, task):
+        self.by_video_key.setdefault(task.get('video_key'), set()).add(task_id)
+        self.by_status.setdefault(task.get('status'), set()).add(task_id)
+        bisect.insort(self.order_by_status.setdefault(task.get('status'), []), _order_key(task))
+
+    def _unindex(self, task_id, task):
+        self.by_video_key.get(task.get('video_key'), set()).discard(task_id)
+        self.by_status.get(task.get('status'), set()).discard(task_id)
+        self._remove_ordered(self.order_by_status.get(task.get('status'), []), _order_key(task))
+
+    def _remove_ordered(self, ordered, key):
+        index = bisect.bisect_left(ordered, key)
+        if index < len(ordered) and ordered[index] == key:
+            del ordered[index]
+
+    def _add(self, task):
+        self.tasks[task['id']] = task
+        self.updated_at[task['id']] = time.time()
+        self._index(task['id'], task)
+        bisect.insort(self.order, _order_key(task))
+
+    def create(self, task):
+        """
+        保存新任务
+
+        Args:
+            task (dict): 任务数据，必须包含id，可包含video_key和status
+        """
+        with self.lock:
+            self._add(dict(task))
+        self._maybe_evict()
+
+    def create_or_get(self, task):
+        """
+        按task中的dedupe_key原子地查找或创建任务
+
+        Args:
+            task (dict): 任务数据，必须包含id和dedupe_key
+
+        Returns:
+            tuple: (任务数据副本, 是否新建)，已存在去重键相同的进行中或已完成任务时返回该任务
+        """
+        with self.lock:
+            task, created = self._create_or_get(task)
+        self._maybe_evict()
+        return task, created
+
+    def _create_or_get(self, task):
+        existing = self.tasks.get(self.by_dedupe_key.get(task['dedupe_key']))
+        if existing is not None and existing.get('status') in DEDUPE_STATUSES:
+            return dict(existing), False
+        task = dict(task)
+        self._add(task)
+        self.by_dedupe_key[task['dedupe_key']] = task['id']
+        return dict(task), True
+
+    def create_batch(self, batch, tasks):
+        """
+        原子地按去重键查找或创建一批任务，并保存批次记录
+
+        Args:
+            batch (dict): 批次数据，必须包含id
+            tasks (list): 任务数据列表，每个任务必须包含id和dedupe_key
+
+        Returns:
+            list: 与tasks顺序对应的(任务数据副本, 是否新建)列表；
+                  批次记录的task_ids为实际关联的任务ID（已有任务时为该任务的ID）
+        """
+        with self.lock:
+            results = [self._create_or_get(task) for task in tasks]
+            self.batches[batch['id']] = (time.time(), dict(batch, task_ids=[task['id'] for task, _ in results]))
+        self._maybe_evict()
+        return results
+
+    def get_batch(self, batch_id):
+        """
+        获取批次记录
+
+        Returns:
+            dict: 批次数据，不存在时返回None
+        """
+        with self.lock:
+            entry = self.batches.get(batch_id)
+            return dict(entry[1]) if entry is not None else None
+
+    def get_many(self, task_ids):
+        """
+        批量获取任务
+
+        Returns:
+            list: 按task_ids顺序排列的任务数据副本，不存在的任务被跳过
+        """
+        with self.lock:
+            return [dict(self.tasks[task_id]) for task_id in task_ids if task_id in self.tasks]
+
+    def get(self, task_id):
+        """
+        获取任务数据的副本
+
+        Returns:
+            dict: 任务数据，不存在时返回None
+        """
+        with self.lock:
+            task = self.tasks.get(task_id)
+            return dict(task) if task is not None else None
+
+    def update(self, task_id, **fields):
+        """
+        更新任务字段，任务不存在时忽略
+
+        Returns:
+            bool: 任务是否存在
+        """
+        with self.lock:
+            task = self.tasks.get(task_id)
+            if task is None:
+                return False
+            # 进度更新不涉及索引字段，只在状态或视频标识变化时重建索引
+            reindex = 'status' in fields or 'video_key' in fields
+            if reindex:
+                self._unindex(task_id, task)
+            task.update(fields)
+            if reindex:
+                self._index(task_id, task)
+            self.updated_at[task_id] = time.time()
+            return True
+
+    def list_tasks(self, statuses=None, video_key=None, limit=None, offset=0):
+        """
+        按条件列出任务，按创建时间倒序
+
+        Args:
+            statuses (list): 只返回这些状态的任务
+            video_key (str): 只返回该视频标识的任务
+            limit (int): 最多返回的任务数
+            offset (int): 跳过的任务数，用于分页
+
+        Returns:
+            list: 任务数据副本列表
+        """
+        with self.lock:
+            if video_key is not None:
+                task_ids = set(self.by_video_key.get(video_key, ()))
+                if statuses is not None:
+                    task_ids &= set().union(*(self.by_status.get(status, ()) for status in statuses))
+                keys = sorted((_order_key(self.tasks[task_id]) for task_id in task_ids), reverse=True)
+            else:
+                keys = heapq.merge(*(reversed(ordered) for ordered in self._ordered_sources(statuses)), reverse=True)
+            end = offset + limit if limit else None
+            tasks = []
+            for index, (_, task_id) in enumerate(keys):
+                if end is not None and index >= end:
+                    break
+                if index >= offset:
+                    tasks.append(dict(self.tasks[task_id]))
+        return tasks
+
+    def _ordered_sources(self, statuses):
+        if statuses is None:
+            return [self.order]
+        return [self.order_by_status.get(status, []) for status in set(statuses)]
+
+    def _bounds(self, ordered, since, until, before):
+        low = bisect.bisect_left(ordered, (since,)) if since else 0
+        high = bisect.bisect_left(ordered, (until,)) if until else len(ordered)
+        if before is not None:
+            high = min(high, bisect.bisect_left(ordered, before))
+        return low, high
+
+    def list_page(self, statuses=None, since=None, until=None, cursor=None, limit=DEFAULT_PAGE_SIZE):
+        """
+        按创建时间倒序分页列出任务，耗时只与页大小有关，与任务总数无关
+
+        Args:
+            statuses (list): 只返回这些状态的任务
+            since (str): 只返回创建时间不早于该时间的任务（ISO格式）
+            until (str): 只返回创建时间早于该时间的任务（ISO格式）
+            cursor (str): 上一页返回的游标，None表示第一页
+            limit (int): 每页任务数
+
+        Returns:
+            tuple: (任务数据副本列表, 下一页的游标)，没有下一页时游标为None
+
+        Raises:
+            ValueError: 游标无效
+        """
+        before = decode_cursor(cursor) if cursor else None
+        with self.lock:
+            iterators = []
+            for ordered in self._ordered_sources(statuses):
+                low, high = self._bounds(ordered, since, until, before)
+                iterators.append(map(ordered.__getitem__, range(high - 1, low - 1, -1)))
+            keys = []
+            for key in heapq.merge(*iterators, reverse=True):
+                keys.append(key)
+                if len(keys) > limit:
+                    break
+            tasks = [dict(self.tasks[task_id]) for _, task_id in keys[:limit]]
+        next_cursor = encode_cursor(tasks[-1]) if len(keys) > limit else None
+        return tasks, next_cursor
+
+    def count(self, statuses=None, since=None, until=None):
+        with self.lock:
+            if statuses is None and not since and not until:
+                return len(self.tasks)
+            total = 0
+            for ordered in self._ordered_sources(statuses):
+                low, high = self._bounds(ordered, since, until, None)
+                total += max(0, high - low)
+            return total
+
+    def evict(self, retention_seconds=None):
+        """
+        删除结束时间超过保留时间的已结束任务
+
+        Returns:
+            int: 删除的任务数
+        """
+        retention = self.retention_seconds if retention_seconds is None else retention_seconds
+        cutoff = time.time() - retention
+        with self.lock:
+            expired = [task_id for status in TERMINAL_STATUSES for task_id in self.by_status.get(status, ())
+                       if self.updated_at.get(task_id, 0) < cutoff]
+            for task_id in expired:
+                task = self.tasks.pop(task_id)
+                self._unindex(task_id, task)
+                self._remove_ordered(self.order, _order_key(task))
+                self.updated_at.pop(task_id, None)
+                if self.by_dedupe_key.get(task.get('dedupe_key')) == task_id:
+                    del self.by_dedupe_key[task['dedupe_key']]
+            for batch_id in [batch_id for batch_id, (created, _) in self.batches.items() if created < cutoff]:
+                del self.batches[batch_id]
+            self.last_evict = time.time()
+        return len(expired)
+
+    def _maybe_evict(self):
+        if self.retention_seconds and time.time() - self.last_evict >= EVICT_INTERVAL:
+            self.evict()
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                'backend': 'memory',
+                'total': len(self.tasks),
+                'batches': len(self.batches),
+                'by_status': {status: len(ids) for status, ids in self.by_status.items() if ids},
+                'pending_writes': 0,
+                'retention_seconds': self.retention_seconds
+            }
+
+
+class SQLiteTaskStore:
+    """
+    基于SQLite(WAL模式)的任务存储
+
+    任务数据以JSON保存，id为主键，video_key、status、去重键和更新时间单独成列并建立索引；
+    去重键在进行中和已完成的任务之间唯一，由部分唯一索引保证。
+    (创建时间, ID)和(状态, 创建时间, ID)索引用于按时间倒序的游标分页。
+    批量提交的任务另在batches表中记录批次及其关联的任务ID。
+    多个工作进程可以同时打开同一个数据库：读操作不阻塞写操作，
+    写操作使用IMMEDIATE事务读改写，避免进程之间相互覆盖字段。
+    只更新进度和消息时先合并到内存中，由后台线程按间隔批量写入，
+    状态变化等其他更新立即写入（连同尚未写入的进度）。
+    progress_events表是按序号递增的进度事件流，每个工作进程写入自己发布的事件并读取其他进程的事件，
+    使SSE/WebSocket订阅者收到所有进程中任务的实时进度。
+    """
+
+    def __init__(self, path, retention_seconds=DEFAULT_RETENTION_SECONDS, flush_interval=DEFAULT_FLUSH_INTERVAL):
+        self.path = path
+        self.retention_seconds = retention_seconds
+        self.flush_interval = flush_interval
+        self.local = threading.local()
+        self.pending_lock = threading.Lock()
+        self.pending = {}
+        self.stop_event = threading.Event()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS tasks ("
+            " id TEXT PRIMARY KEY,"
+            " video_key TEXT,"
+            " dedupe_key TEXT,"
+            " status TEXT,"
+            " created_at TEXT,"
+            " updated_at REAL,"
+            " data TEXT NOT NULL)"
+        )
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(tasks)")]
+        if 'dedupe_key' not in columns:
+            # 早期创建的数据库没有去重键列；其他工作进程可能已同时添加
+            try:
+                conn.execute("ALTER TABLE tasks ADD COLUMN dedupe_key TEXT")
+            except sqlite3.OperationalError:
+                pass
+        # 去重状态集合变化后索引条件随之变化，旧版本的索引需要重建
+        conn.execute("DROP INDEX IF EXISTS idx_tasks_dedupe")
+        conn.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_tasks_dedupe_active ON tasks(dedupe_key)"
+            f" WHERE dedupe_key IS NOT NULL AND status IN ({', '.join(repr(status) for status in DEDUPE_STATUSES)})"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_video_key ON tasks(video_key, status)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks(status, updated_at)")
+        conn.execute("CREATE TABLE IF NOT EXISTS batches (id TEXT PRIMARY KEY, created_at REAL, data TEXT NOT NULL)")
+        # 游标分页按(created_at, id)排序，旧版本只按created_at建立的索引由新索引代替
+        conn.execute("DROP INDEX IF EXISTS idx_tasks_created_at")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_created ON tasks(created_at, id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_status_created ON tasks(status, created_at, id)")
+        # AUTOINCREMENT保证删除旧事件后序号也不会被重用，读取方按序号增量读取
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS progress_events ("
+            " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " origin TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " data TEXT NOT NULL)"
+        )
+
+        self.flusher = threading.Thread(target=self._flush_loop, name="task-store-flush", daemon=True)
+        self.flusher.start()
+
+    def _conn(self):
+        # sqlite3连接不能跨线程共享，每个线程使用自己的连接
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA busy_timeout=30000")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def _write(self, conn, task_id, fields):
+        row = conn.execute("SELECT data FROM tasks WHERE id = ?", (task_id,)).fetchone()
+        if row is None:
+            return False
+        task = json.loads(row[0])
+        task.update(fields)
+        conn.execute(
+            "UPDATE tasks SET data = ?, status = ?, video_key = ?, updated_at = ? WHERE id = ?",
+            (json.dumps(task, ensure_ascii=False), task.get('status'), task.get('video_key'), time.time(), task_id)
+        )
+        return True
+
+    def create(self, task):
+        """
+        保存新任务
+
+        Args:
+            task (dict): 任务数据，必须包含id，可包含video_key和status
+        """
+        self._insert(self._conn(), task)
+
+    def _insert(self, conn, task):
+        conn.execute(
+            "INSERT INTO tasks (id, video_key, dedupe_key, status, created_at, updated_at, data) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (task['id'], task.get('video_key'), task.get('dedupe_key'), task.get('status'), task.get('created_at'),
+             time.time(), json.dumps(task, ensure_ascii=False))
+        )
+
+    def create_or_get(self, task):
+        """
+        按task中的dedupe_key原子地查找或创建任务
+
+        查找和插入在同一个IMMEDIATE事务中完成，多个线程或工作进程同时提交
+        相同的请求时只有一个会创建任务，其余都返回该任务。
+
+        Args:
+            task (dict): 任务数据，必须包含id和dedupe_key
+
+        Returns:
+            tuple: (任务数据, 是否新建)，已存在去重键相同的进行中或已完成任务时返回该任务
+        """
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = self._create_or_get(conn, task)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return self._with_pending([result])[0]
+
+    def _create_or_get(self, conn, task):
+        row = conn.execute(
+            f"SELECT data FROM tasks WHERE dedupe_key = ? AND status IN ({', '.join('?' * len(DEDUPE_STATUSES))}) LIMIT 1",
+            (task['dedupe_key'], *DEDUPE_STATUSES)
+        ).fetchone()
+        if row is None:
+            self._insert(conn, task)
+            return dict(task), True
+        return json.loads(row[0]), False
+
+    def _with_pending(self, results):
+        # 已有任务合并本进程中尚未写入的进度
+        with self.pending_lock:
+            for task, created in results:
+                if not created:
+                    task.update(self.pending.get(task.get('id'), {}))
+        return results
+
+    def create_batch(self, batch, tasks):
+        """
+        在一个IMMEDIATE事务中按去重键查找或创建一批任务，并保存批次记录
+
+        整批任务只提交一次事务，其他工作进程同时提交的相同任务同样按去重键关联。
+
+        Args:
+            batch (dict): 批次数据，必须包含id
+            tasks (list): 任务数据列表，每个任务必须包含id和dedupe_key
+
+        Returns:
+            list: 与tasks顺序对应的(任务数据, 是否新建)列表；
+                  批次记录的task_ids为实际关联的任务ID（已有任务时为该任务的ID）
+        """
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            results = [self._create_or_get(conn, task) for task in tasks]
+            batch = dict(batch, task_ids=[task['id'] for task, _ in results])
+            conn.execute("INSERT INTO batches (id, created_at, data) VALUES (?, ?, ?)",
+                         (batch['id'], time.time(), json.dumps(batch, ensure_ascii=False)))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return self._with_pending(results)
+
+    def get_batch(self, batch_id):
+        """
+        获取批次记录
+
+        Returns:
+            dict: 批次数据，不存在时返回None
+        """
+        row = self._conn().execute("SELECT data FROM batches WHERE id = ?", (batch_id,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def get_many(self, task_ids):
+        """
+        批量获取任务（包含本进程中尚未写入的进度）
+
+        Returns:
+            list: 按task_ids顺序排列的任务数据，不存在的任务被跳过
+        """
+        task_ids = list(task_ids)
+        found = {}
+        conn = self._conn()
+        # 分组查询，避免超过SQLite的参数个数上限
+        for start in range(0, len(task_ids), 500):
+            chunk = task_ids[start:start + 500]
+            rows = conn.execute(f"SELECT id, data FROM tasks WHERE id IN ({', '.join('?' * len(chunk))})", chunk).fetchall()
+            found.update((task_id, json.loads(data)) for task_id, data in rows)
+        with self.pending_lock:
+            for task_id, task in found.items():
+                task.update(self.pending.get(task_id, {}))
+        return [found[task_id] for task_id in task_ids if task_id in found]
+
+    def get(self, task_id):
+        """
+        获取任务数据（包含本进程中尚未写入的进度）
+
+        Returns:
+            dict: 任务数据，不存在时返回None
+        """
+        row = self._conn().execute("SELECT data FROM tasks WHERE id = ?", (task_id,)).fetchone()
+        if row is None:
+            return None
+        task = json.loads(row[0])
+        with self.pending_lock:
+            task.update(self.pending.get(task_id, {}))
+        return task
+
+    def update(self, task_id, **fields):
+        """
+        更新任务字段，任务不存在时忽略
+
+        Returns:
+            bool: 任务是否存在（进度更新延迟写入时总是返回True）
+        """
+        if fields.keys() <= PROGRESS_FIELDS:
+            with self.pending_lock:
+                self.pending.setdefault(task_id, {}).update(fields)
+            return True
+
+        with self.pending_lock:
+            merged = self.pending.pop(task_id, {})
+        merged.update(fields)
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            found = self._write(conn, task_id, merged)
+            conn.execute("COMMIT")
+            return found
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def flush(self):
+        """将缓存的进度更新在一个事务中写入数据库"""
+        with self.pending_lock:
+            pending, self.pending = self.pending, {}
+        if not pending:
+            return
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for task_id, fields in pending.items():
+                self._write(conn, task_id, fields)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            # 写入失败时放回缓存，已有的新值优先
+            with self.pending_lock:
+                for task_id, fields in pending.items():
+                    self.pending[task_id] = {**fields, **self.pending.get(task_id, {})}
+            raise
+
+    def list_tasks(self, statuses=None, video_key=None, limit=None, offset=0):
+        """
+        按条件列出任务，按创建时间倒序
+
+        Args:
+            statuses (list): 只返回这些状态的任务
+            video_key (str): 只返回该视频标识的任务
+            limit (int): 最多返回的任务数
+            offset (int): 跳过的任务数，用于分页
+
+        Returns:
+            list: 任务数据列表
+        """
+        conditions = []
+        params = []
+        if video_key is not None:
+            conditions.append("video_key = ?")
+            params.append(video_key)
+        if statuses is not None:
+            statuses = list(statuses)
+            if not statuses:
+                return []
+            conditions.append(f"status IN ({', '.join('?' * len(statuses))})")
+            params.extend(statuses)
+        sql = "SELECT data FROM tasks"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY created_at DESC, id DESC"
+        if limit:
+            sql += " LIMIT ? OFFSET ?"
+            params.extend([int(limit), int(offset)])
+        elif offset:
+            sql += " LIMIT -1 OFFSET ?"
+            params.append(int(offset))
+        rows = self._conn().execute(sql, params).fetchall()
+        with self.pending_lock:
+            pending = {task_id: dict(fields) for task_id, fields in self.pending.items()}
+        tasks = []
+        for (data,) in rows:
+            task = json.loads(data)
+            task.update(pending.get(task.get('id'), {}))
+            tasks.append(task)
+        return tasks
+
+    def _time_conditions(self, since, until, before):
+        conditions = []
+        params = []
+        if since:
+            conditions.append("created_at >= ?")
+            params.append(since)
+        if until:
+            conditions.append("created_at < ?")
+            params.append(until)
+        if before is not None:
+            conditions.append("(created_at < ? OR (created_at = ? AND id < ?))")
+            params.extend([before[0], before[0], before[1]])
+        return conditions, params
+
+    def _page_rows(self, status, since, until, before, limit):
+        conditions, params = self._time_conditions(since, until, before)
+        if status is not None:
+            conditions.insert(0, "status = ?")
+            params.insert(0, status)
+        sql = "SELECT created_at, id, data FROM tasks"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY created_at DESC, id DESC LIMIT ?"
+        params.append(limit)
+        return self._conn().execute(sql, params).fetchall()
+
+    def list_page(self, statuses=None, since=None, until=None, cursor=None, limit=DEFAULT_PAGE_SIZE):
+        """
+        按创建时间倒序分页列出任务，耗时只与页大小有关，与任务总数无关
+
+        每个状态分别沿(状态, 创建时间, ID)索引读取至多一页再归并，
+        避免 status IN (...) 时对全部匹配的任务排序。
+
+        Args:
+            statuses (list): 只返回这些状态的任务
+            since (str): 只返回创建时间不早于该时间的任务（ISO格式）
+            until (str): 只返回创建时间早于该时间的任务（ISO格式）
+            cursor (str): 上一页返回的游标，None表示第一页
+            limit (int): 每页任务数
+
+        Returns:
+            tuple: (任务数据列表, 下一页的游标)，没有下一页时游标为None
+
+        Raises:
+            ValueError: 游标无效
+        """
+        before = decode_cursor(cursor) if cursor else None
+        sources = [None] if statuses is None else sorted(set(statuses))
+        row_lists = [self._page_rows(status, since, until, before, limit + 1) for status in sources]
+        rows = list(heapq.merge(*row_lists, key=lambda row: (row[0] or '', row[1]), reverse=True))[:limit + 1]
+        with self.pending_lock:
+            pending = {row[1]: dict(self.pending[row[1]]) for row in rows if row[1] in self.pending}
+        tasks = []
+        for _, task_id, data in rows[:limit]:
+            task = json.loads(data)
+            task.update(pending.get(task_id, {}))
+            tasks.append(task)
+        next_cursor = encode_cursor(tasks[-1]) if len(rows) > limit else None
+        return tasks, next_cursor
+
+    def count(self, statuses=None, since=None, until=None):
+        conditions, params = self._time_conditions(since, until, None)
+        if statuses is not None:
+            statuses = list(statuses)
+            if not statuses:
+                return 0
+            conditions.insert(0, f"status IN ({', '.join('?' * len(statuses))})")
+            params[:0] = statuses
+        sql = "SELECT COUNT(*) FROM tasks"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        return self._conn().execute(sql, params).fetchone()[0]
+
+    def evict(self, retention_seconds=None):
+        """
+        删除结束时间超过保留时间的已结束任务
+
+        Returns:
+            int: 删除的任务数
+        """
+        retention = self.retention_seconds if retention_seconds is None else retention_seconds
+        conn = self._conn()
+        cursor = conn.execute(
+            f"DELETE FROM tasks WHERE status IN ({', '.join('?' * len(TERMINAL_STATUSES))}) AND updated_at < ?",
+            (*TERMINAL_STATUSES, time.time() - retention)
+        )
+        conn.execute("DELETE FROM batches WHERE created_at < ?", (time.time() - retention,))
+        return cursor.rowcount
+
+    def append_progress_events(self, origin, events):
+        """
+        在一个事务中追加一批进度事件
+
+        写事务之间互斥，序号的分配顺序与提交顺序一致，读取方按序号增量读取不会漏掉事件。
+
+        Args:
+            origin (str): 发布事件的进程标识，读取时用于跳过自己发布的事件
+            events (list): 事件字典列表
+        """
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT INTO progress_events (origin, created_at, data) VALUES (?, ?, ?)",
+                [(origin, now, json.dumps(event, ensure_ascii=False)) for event in events]
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def read_progress_events(self, after_seq, limit=1000):
+        """
+        读取序号大于after_seq的进度事件
+
+        Returns:
+            list: 按序号排列的(序号, 进程标识, 事件字典)列表
+        """
+        rows = self._conn().execute(
+            "SELECT seq, origin, data FROM progress_events WHERE seq > ? ORDER BY seq LIMIT ?", (after_seq, limit)
+        ).fetchall()
+        return [(seq, origin, json.loads(data)) for seq, origin, data in rows]
+
+    def last_progress_seq(self):
+        """返回当前最新进度事件的序号，新订阅方从这里开始读取"""
+        row = self._conn().execute("SELECT MAX(seq) FROM progress_events").fetchone()
+        return row[0] or 0
+
+    def prune_progress_events(self, max_age=PROGRESS_EVENT_RETENTION):
+        """删除超过max_age秒的进度事件"""
+        self._conn().execute("DELETE FROM progress_events WHERE created_at < ?", (time.time() - max_age,))
+
+    def _flush_loop(self):
+        last_evict = 0
+        last_prune = time.time()
+        while not self.stop_event.wait(self.flush_interval):
+            try:
+                self.flush()
+                if time.time() - last_prune >= PROGRESS_EVENT_RETENTION:
+                    last_prune = time.time()
+                    self.prune_progress_events()
+                if self.retention_seconds and time.time() - last_evict >= EVICT_INTERVAL:
+                    last_evict = time.time()
+                    evicted = self.evict()
+                    if evicted:
+                        print(f"已淘汰 {evicted} 个过期任务", flush=True)
+            except sqlite3.Error as e:
+                print(f"任务存储后台写入失败: {e}", flush=True)
+
+    def close(self):
+        """停止后台线程并写入剩余的进度更新"""
+        self.stop_event.set()
+        self.flusher.join(timeout=5)
+        self.flush()
+
+    def get_stats(self):
+        conn = self._conn()
+        rows = conn.execute("SELECT status, COUNT(*) FROM tasks GROUP BY status").fetchall()
+        batches = conn.execute("SELECT COUNT(*) FROM batches").fetchone()[0]
+        with self.pending_lock:
+            pending_writes = len(self.pending)
+        return {
+            'backend': 'sqlite',
+            'path': self.path,
+            'total': sum(count for _, count in rows),
+            'batches': batches,
+            'by_status': dict(rows),
+            'pending_writes': pending_writes,
+            'retention_seconds': self.retention_seconds
+        }
+
+
+def create_task_store(backend='sqlite', path=None, retention_seconds=DEFAULT_RETENTION_SECONDS):
+    """
+    按配置创建任务存储
+
+    Args:
+        backend (str): 'sqlite'或'memory'
+        path (str): SQLite数据库路径
+        retention_seconds (float): 已结束任务的保留时间（秒），0表示不淘汰
+
+    Returns:
+        MemoryTaskStore or SQLiteTaskStore: 任务存储实例
+    """
+    if backend == 'memory':
+        return MemoryTaskStore(retention_seconds)
+    if backend == 'sqlite':
+        return SQLiteTaskStore(path or 'tasks.db', retention_seconds)
+    raise ValueError(f"未知的任务存储类型: {backend}")
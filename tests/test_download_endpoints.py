@@ -0,0 +1,140 @@
+import os
+import uuid
+from urllib.parse import quote
+
+import pytest
+from fastapi.testclient import TestClient
+
+from muxer import MergeCache
+from task_store import create_task_store
+
+pytestmark = pytest.mark.skipif(not hasattr(os, 'pread'), reason="需要 os.pread")
+
+
+@pytest.fixture(scope='module')
+def app_module(tmp_path_factory):
+    # fastapi_app 导入时在当前目录下创建 downloads 目录和任务数据库
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp('app'))
+    try:
+        import fastapi_app
+        # 进度转发线程稍后才打开数据库连接，使用绝对路径
+        fastapi_app.task_store.path = os.path.abspath(fastapi_app.task_store.path)
+    finally:
+        os.chdir(cwd)
+    return fastapi_app
+
+
+@pytest.fixture
+def app_env(app_module, monkeypatch, tmp_path):
+    store = create_task_store('memory')
+    monkeypatch.setattr(app_module, 'task_store', store)
+    monkeypatch.setattr(app_module, 'merge_cache', MergeCache(str(tmp_path / 'cache'), 1024 ** 3))
+    return TestClient(app_module.app), store
+
+
+def write_file(directory, name, size=50000):
+    path = directory / name
+    data = os.urandom(size)
+    path.write_bytes(data)
+    return str(path), data
+
+
+def add_task(store, **fields):
+    task = {'id': str(uuid.uuid4()), 'url': 'https://www.bilibili.com/video/BV1xx411c7mu', 'status': 'completed',
+            'merge': True, 'audio_only': False, 'progress': 100, 'message': "下载完成"}
+    task.update(fields)
+    store.create(task)
+    return task['id']
+
+
+def check_file_requests(client, url, data, filename):
+    """对真实接口检查 HEAD、Range 和 304"""
+    head = client.head(url)
+    assert head.status_code == 200
+    assert head.headers['content-length'] == str(len(data))
+    assert head.headers['accept-ranges'] == 'bytes'
+    assert quote(filename) in head.headers['content-disposition']
+    assert head.content == b''
+
+    response = client.get(url, headers={'Range': 'bytes=100-199'})
+    assert response.status_code == 206
+    assert response.headers['content-range'] == f'bytes 100-199/{len(data)}'
+    assert response.content == data[100:200]
+
+    response = client.get(url, headers={'Range': 'bytes=-10'})
+    assert response.status_code == 206
+    assert response.content == data[-10:]
+
+    response = client.get(url, headers={'If-None-Match': head.headers['etag']})
+    assert response.status_code == 304
+    assert response.content == b''
+
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.content == data
+
+
+def test_file_endpoint(app_env, tmp_path):
+    client, store = app_env
+    path, data = write_file(tmp_path, 'BV1xx411c7mu_高清_1080P_320K.mp4')
+    task_id = add_task(store, file_path=path)
+    check_file_requests(client, f'/api/download/file/{task_id}', data, os.path.basename(path))
+
+
+def test_file_endpoint_serves_video_of_separate_task(app_env, tmp_path):
+    client, store = app_env
+    video_path, data = write_file(tmp_path, 'video.m4v')
+    audio_path, _ = write_file(tmp_path, 'audio.m4a')
+    task_id = add_task(store, merge=False, video_path=video_path, audio_path=audio_path)
+    response = client.get(f'/api/download/file/{task_id}', headers={'Range': 'bytes=0-9'})
+    assert response.status_code == 206
+    assert response.content == data[:10]
+
+
+def test_merge_endpoint(app_module, app_env, tmp_path):
+    client, store = app_env
+    video_path, _ = write_file(tmp_path, 'BV1xx411c7mu_video.m4v')
+    audio_path, _ = write_file(tmp_path, 'BV1xx411c7mu_audio.m4a')
+    task_id = add_task(store, merge=False, video_path=video_path, audio_path=audio_path)
+
+    # 预先放入合并结果，接口命中缓存后直接返回（不需要FFmpeg）
+    merge_cache = app_module.merge_cache
+    key = merge_cache.make_key([video_path, audio_path])
+    temp_path = merge_cache.temp_path_for(key)
+    data = os.urandom(80000)
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+    merge_cache.put(key, temp_path)
+
+    check_file_requests(client, f'/api/download/merge/{task_id}', data, 'BV1xx411c7mu_merged.mp4')
+
+
+def test_missing_file_returns_404(app_env, tmp_path):
+    client, store = app_env
+    path, _ = write_file(tmp_path, 'gone.mp4')
+    file_task = add_task(store, file_path=path)
+    video_path, _ = write_file(tmp_path, 'gone_video.m4v')
+    audio_path, _ = write_file(tmp_path, 'gone_audio.m4a')
+    merge_task = add_task(store, merge=False, video_path=video_path, audio_path=audio_path)
+    os.remove(path)
+    os.remove(audio_path)
+
+    for url in (f'/api/download/file/{file_task}', f'/api/download/merge/{merge_task}'):
+        assert client.get(url).status_code == 404
+        assert client.head(url).status_code == 404
+    assert client.get(f'/api/download/file/{uuid.uuid4()}').status_code == 404
+
+
+def test_incomplete_task_returns_400(app_env, tmp_path):
+    client, store = app_env
+    path, _ = write_file(tmp_path, 'partial.mp4')
+    task_id = add_task(store, status='downloading', progress=40, file_path=path)
+    for url in (f'/api/download/file/{task_id}', f'/api/download/merge/{task_id}'):
+        response = client.get(url, headers={'Range': 'bytes=0-9'})
+        assert response.status_code == 400
+        assert client.head(url).status_code == 400
+
+    # 已经合并的任务没有可合并的分离文件
+    merged_task = add_task(store, file_path=path)
+    assert client.get(f'/api/download/merge/{merged_task}').status_code == 400
@@ -0,0 +1,263 @@
+import asyncio
+import os
+import re
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+import file_serving
+from file_serving import ZEROCOPY_EXTENSION, serve_file
+
+# file_serving 用 os.pread 读取文件
+pytestmark = pytest.mark.skipif(not hasattr(os, 'pread'), reason="需要 os.pread")
+
+# 稀疏文件大小：超过4GB，覆盖32位偏移溢出
+BIG_SIZE = 5 * 1024 ** 3 + 12345
+
+# 写入稀疏文件的数据块(偏移, 长度)，其余位置读出为0
+BLOCKS = [(0, 4096), (2 ** 32 - 2048, 4096), (3 * 1024 ** 3, 65536), (BIG_SIZE - 4096, 4096)]
+
+
+def expected(blocks, start, end):
+    """稀疏文件中 start..end(包含) 的内容"""
+    data = bytearray(end - start + 1)
+    for offset, chunk in blocks.items():
+        lo, hi = max(start, offset), min(end + 1, offset + len(chunk))
+        if lo < hi:
+            data[lo - start:hi - start] = chunk[lo - offset:hi - offset]
+    return bytes(data)
+
+
+def parse_multipart(response):
+    boundary = response.headers['content-type'].split('boundary=')[1].encode()
+    assert response.content.endswith(b'--' + boundary + b'--\r\n')
+    parts = []
+    for part in response.content.split(b'--' + boundary)[1:-1]:
+        head, body = part.split(b'\r\n\r\n', 1)
+        match = re.search(rb'Content-Range: bytes (\d+)-(\d+)/(\d+)', head)
+        assert body.endswith(b'\r\n')
+        parts.append((int(match[1]), int(match[2]), int(match[3]), body[:-2]))
+    return parts
+
+
+@pytest.fixture(scope='module')
+def big_file(tmp_path_factory):
+    path = tmp_path_factory.mktemp('serve') / 'big.bin'
+    blocks = {}
+    with open(path, 'wb') as f:
+        f.truncate(BIG_SIZE)
+        for offset, length in BLOCKS:
+            blocks[offset] = os.urandom(length)
+            f.seek(offset)
+            f.write(blocks[offset])
+    return str(path), blocks
+
+
+@pytest.fixture
+def small_file(tmp_path):
+    path = tmp_path / 'small.bin'
+    data = os.urandom(100000)
+    path.write_bytes(data)
+    return str(path), data
+
+
+def make_client(path):
+    app = FastAPI()
+
+    @app.api_route('/file', methods=['GET', 'HEAD'])
+    async def download(request: Request):
+        return serve_file(request, path, os.path.basename(path))
+
+    return TestClient(app)
+
+
+@pytest.fixture
+def big_client(big_file):
+    return make_client(big_file[0])
+
+
+def test_single_range_across_4gb(big_client, big_file):
+    start, end = 2 ** 32 - 4096, 2 ** 32 + 4095
+    response = big_client.get('/file', headers={'Range': f'bytes={start}-{end}'})
+    assert response.status_code == 206
+    assert response.headers['content-range'] == f'bytes {start}-{end}/{BIG_SIZE}'
+    assert response.headers['content-length'] == str(end - start + 1)
+    assert response.headers['accept-ranges'] == 'bytes'
+    assert response.content == expected(big_file[1], start, end)
+
+
+def test_open_ended_range(big_client, big_file):
+    start = BIG_SIZE - 10000
+    response = big_client.get('/file', headers={'Range': f'bytes={start}-'})
+    assert response.status_code == 206
+    assert response.headers['content-range'] == f'bytes {start}-{BIG_SIZE - 1}/{BIG_SIZE}'
+    assert response.content == expected(big_file[1], start, BIG_SIZE - 1)
+
+
+def test_suffix_range(big_client, big_file):
+    response = big_client.get('/file', headers={'Range': 'bytes=-5000'})
+    assert response.status_code == 206
+    assert response.headers['content-range'] == f'bytes {BIG_SIZE - 5000}-{BIG_SIZE - 1}/{BIG_SIZE}'
+    assert response.content == expected(big_file[1], BIG_SIZE - 5000, BIG_SIZE - 1)
+
+
+def test_multi_range(big_client, big_file):
+    offset = 3 * 1024 ** 3
+    # 第二、三个区间重叠，合并为一个
+    header = f'bytes=0-99,{offset}-{offset + 999},{offset + 500}-{offset + 1999},-100'
+    response = big_client.get('/file', headers={'Range': header})
+    assert response.status_code == 206
+    assert response.headers['content-type'].startswith('multipart/byteranges; boundary=')
+    assert 'content-range' not in response.headers
+    assert int(response.headers['content-length']) == len(response.content)
+    parts = parse_multipart(response)
+    assert [(start, end) for start, end, _, _ in parts] == [(0, 99), (offset, offset + 1999), (BIG_SIZE - 100, BIG_SIZE - 1)]
+    for start, end, total, body in parts:
+        assert total == BIG_SIZE
+        assert body == expected(big_file[1], start, end)
+
+
+def test_unsatisfiable_range(big_client):
+    response = big_client.get('/file', headers={'Range': f'bytes={BIG_SIZE}-'})
+    assert response.status_code == 416
+    assert response.headers['content-range'] == f'bytes */{BIG_SIZE}'
+    assert response.content == b''
+
+
+def test_invalid_range_returns_full_file(small_file):
+    path, data = small_file
+    response = make_client(path).get('/file', headers={'Range': 'items=0-10'})
+    assert response.status_code == 200
+    assert response.content == data
+
+
+def test_if_range(small_file):
+    path, data = small_file
+    client = make_client(path)
+    etag = client.head('/file').headers['etag']
+    response = client.get('/file', headers={'Range': 'bytes=10-19', 'If-Range': etag})
+    assert response.status_code == 206
+    assert response.content == data[10:20]
+
+    # ETag已过期时忽略Range，返回完整文件
+    response = client.get('/file', headers={'Range': 'bytes=10-19', 'If-Range': '"stale"'})
+    assert response.status_code == 200
+    assert 'content-range' not in response.headers
+    assert response.content == data
+
+    # 弱ETag不能用于If-Range
+    response = client.get('/file', headers={'Range': 'bytes=10-19', 'If-Range': 'W/' + etag})
+    assert response.status_code == 200
+
+
+def test_not_modified(big_client):
+    head = big_client.head('/file')
+    etag, last_modified = head.headers['etag'], head.headers['last-modified']
+    for headers in ({'If-None-Match': etag}, {'If-None-Match': f'"other", W/{etag}'},
+                    {'If-Modified-Since': last_modified}):
+        response = big_client.get('/file', headers={**headers, 'Range': 'bytes=0-99'})
+        assert response.status_code == 304
+        assert response.headers['etag'] == etag
+        assert response.content == b''
+
+    # If-None-Match存在时忽略If-Modified-Since
+    response = big_client.get('/file', headers={'If-None-Match': '"other"', 'If-Modified-Since': last_modified,
+                                                'Range': 'bytes=0-99'})
+    assert response.status_code == 206
+
+
+def test_precondition_failed(big_client):
+    etag = big_client.head('/file').headers['etag']
+    response = big_client.get('/file', headers={'If-Match': '"other"', 'Range': 'bytes=0-99'})
+    assert response.status_code == 412
+    assert response.content == b''
+
+    response = big_client.get('/file', headers={'If-Unmodified-Since': 'Mon, 01 Jan 2001 00:00:00 GMT',
+                                                'Range': 'bytes=0-99'})
+    assert response.status_code == 412
+
+    response = big_client.get('/file', headers={'If-Match': etag, 'Range': 'bytes=0-99'})
+    assert response.status_code == 206
+
+
+def test_head(big_client):
+    response = big_client.head('/file')
+    assert response.status_code == 200
+    assert response.headers['content-length'] == str(BIG_SIZE)
+    assert response.headers['accept-ranges'] == 'bytes'
+    assert response.headers['content-disposition'] == 'attachment; filename="big.bin"'
+    assert response.content == b''
+
+    response = big_client.head('/file', headers={'Range': 'bytes=100-199'})
+    assert response.status_code == 206
+    assert response.headers['content-length'] == '100'
+    assert response.content == b''
+
+
+def call_asgi(path, headers, receive, extensions=None):
+    """不经过TestClient直接调用serve_file返回的响应，记录发送的所有消息"""
+    scope = {
+        'type': 'http', 'method': 'GET', 'path': '/file', 'query_string': b'', 'root_path': '',
+        'headers': [(name.lower().encode(), value.encode()) for name, value in headers.items()],
+        'extensions': extensions or {}
+    }
+    messages = []
+    response = serve_file(Request(scope), path)
+
+    async def send(message):
+        messages.append(message)
+        await asyncio.sleep(0)
+
+    asyncio.run(response(scope, receive, send))
+    return response, messages
+
+
+def test_client_disconnect_stops_reading(big_file, monkeypatch):
+    monkeypatch.setattr(file_serving, 'CHUNK_SIZE', 64 * 1024)
+    reads = []
+    pread = os.pread
+    monkeypatch.setattr(file_serving.os, 'pread', lambda fd, n, offset: reads.append(offset) or pread(fd, n, offset))
+    count = 256 * 1024 * 1024
+
+    async def receive():
+        # 收到前几块数据后断开连接
+        await asyncio.sleep(0.001)
+        while len(reads) < 3:
+            await asyncio.sleep(0.001)
+        return {'type': 'http.disconnect'}
+
+    response, messages = call_asgi(big_file[0], {'Range': f'bytes=0-{count - 1}'}, receive)
+    bodies = [message for message in messages if message['type'] == 'http.response.body']
+    assert messages[0]['status'] == 206
+    assert bodies and all(message['more_body'] for message in bodies)
+    assert sum(len(message['body']) for message in bodies) < count
+    assert len(reads) < count // file_serving.CHUNK_SIZE
+    assert response.file.closed
+
+
+async def wait_forever():
+    await asyncio.Event().wait()
+
+
+def test_zerocopy_send(big_file):
+    path = big_file[0]
+    extensions = {ZEROCOPY_EXTENSION: {}}
+    response, messages = call_asgi(path, {'Range': 'bytes=100-199'}, wait_forever, extensions)
+    assert messages[0]['status'] == 206
+    assert [(m['type'], m['offset'], m['count'], m['more_body']) for m in messages[1:]] == [
+        (ZEROCOPY_EXTENSION, 100, 100, False)]
+    assert messages[1]['file'] is response.file
+    assert response.file.closed
+
+    response, messages = call_asgi(path, {'Range': 'bytes=0-9,-10'}, wait_forever, extensions)
+    types = [message['type'] for message in messages[1:]]
+    assert types == ['http.response.body', ZEROCOPY_EXTENSION, 'http.response.body'] * 2 + ['http.response.body']
+    assert [(m['offset'], m['count']) for m in messages[1:] if m['type'] == ZEROCOPY_EXTENSION] == [
+        (0, 10), (BIG_SIZE - 10, 10)]
+    assert all(message['more_body'] for message in messages[1:-1])
+    assert messages[-1]['more_body'] is False
+    # 零拷贝发送的字节数加上分隔部分与Content-Length一致
+    headers = dict(messages[0]['headers'])
+    sent = sum(m['count'] if m['type'] == ZEROCOPY_EXTENSION else len(m['body']) for m in messages[1:])
+    assert int(headers[b'content-length']) == sent
@@ -0,0 +1,357 @@
+import argparse
+import os
+import threading
+
+from bilibili import select_quality_and_download, load_cookies_from_file, task_file_tag
+from job_queue import create_job_queue, make_worker_id, DEFAULT_STALE_TIMEOUT, DEFAULT_MAX_ATTEMPTS
+from scheduler import CancelToken
+from task_store import PROGRESS_FIELDS
+
+# 工作节点发送心跳、检查停止请求和失联节点的间隔（秒）
+DEFAULT_HEARTBEAT_INTERVAL = 10
+
+# 合并后发布进度更新的间隔（秒）
+DEFAULT_PUBLISH_INTERVAL = 1.0
+
+# 队列为空时两次认领之间的间隔（秒）
+DEFAULT_POLL_INTERVAL = 1.0
+
+# 与API服务相同的磁盘等待和合并超时（秒）
+DEFAULT_DISK_WAIT_TIMEOUT = 600
+DEFAULT_MERGE_TIMEOUT = 1800
+
+# 下载阶段随进度发布的字节数，API节点据此推送速度和剩余时间，不写入任务存储
+TRANSFER_FIELDS = frozenset(('current_bytes', 'total_bytes'))
+
+# 入队时从任务记录中取出、交给工作节点的下载选项
+JOB_OPTION_FIELDS = (
+    'url', 'merge', 'filename', 'video_quality_index', 'audio_quality_index', 'streaming', 'audio_only',
+    'audio_format', 'clip_start', 'clip_end', 'profile', 'selection', 'embed_metadata',
+    'danmaku', 'subtitles', 'preview'
+)
+
+
+def build_job_payload(task, resume=False):
+    """
+    由任务记录生成入队的下载选项（不包含cookies，工作节点使用自己的cookie文件）
+
+    Args:
+        task (dict): 任务记录
+        resume (bool): 从暂停时保留的部分文件继续下载
+
+    Returns:
+        dict: 下载选项
+    """
+    payload = {field: task.get(field) for field in JOB_OPTION_FIELDS}
+    payload['resume'] = resume
+    return payload
+
+
+class StatusPublisher:
+    """
+    把任务状态更新发布到任务队列
+
+    与任务存储相同，只更新进度和消息时先合并，按间隔发布；
+    其他更新（状态变化等）连同尚未发布的进度立即发布，保证顺序。
+    指定worker_id时，只发布仍由该工作节点认领的任务的更新。
+    """
+
+    def __init__(self, job_queue, interval=DEFAULT_PUBLISH_INTERVAL, worker_id=None):
+        self.job_queue = job_queue
+        self.worker_id = worker_id
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._publish_loop, args=(interval,), name="status-publisher", daemon=True)
+        self.thread.start()
+
+    def update(self, task_id, **fields):
+        if fields.keys() <= PROGRESS_FIELDS | TRANSFER_FIELDS:
+            with self.lock:
+                self.pending.setdefault(task_id, {}).update(fields)
+            return
+        with self.lock:
+            merged = self.pending.pop(task_id, {})
+        merged.update(fields)
+        self.job_queue.publish(task_id, merged, self.worker_id)
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        for task_id, fields in pending.items():
+            self.job_queue.publish(task_id, fields, self.worker_id)
+
+    def _publish_loop(self, interval):
+        while not self.stop_event.wait(interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"发布任务进度失败: {e}", flush=True)
+
+    def close(self):
+        self.stop_event.set()
+        self.thread.join(timeout=5)
+        self.flush()
+
+
+def run_download_job(task_id, options, cookies, output_dir, update_status, cancel_event,
+                     disk_wait_timeout=DEFAULT_DISK_WAIT_TIMEOUT, merge_timeout=DEFAULT_MERGE_TIMEOUT):
+    """
+    在工作节点上执行一个下载任务，结果通过update_status发布
+
+    Args:
+        task_id (str): 任务ID
+        options (dict): build_job_payload生成的下载选项
+        cookies (dict): 请求使用的cookies
+        output_dir (str): 输出目录（应与API服务的下载目录为同一共享目录）
+        update_status (function): 接收(task_id, **fields)，发布任务状态
+        cancel_event (CancelToken): 任务的停止标志
+        disk_wait_timeout (float): 磁盘空间不足时排队等待的最长秒数
+        merge_timeout (float): 合并阶段的超时时间（秒）
+
+    Returns:
+        str: 任务的最终状态（completed/paused/cancelled/failed）
+    """
+    extra_files = {}
+
+    def discard_if_cancelled(paths):
+        # 取消请求在最后一步完成之后才生效时删除输出文件，按取消处理；
+        # 暂停请求到达时任务已经完成，按完成处理
+        if not cancel_event.is_set() or cancel_event.paused:
+            return False
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        update_status(task_id, status="cancelled", progress=0, message="任务已取消")
+        return True
+
+    def progress_callback(current, total, message):
+        if total > 100:
+            # 下载阶段回调的是字节数（阶段标记和合并进度以100为总数）
+            update_status(task_id, progress=int((current / total) * 100), message=message,
+                          current_bytes=current, total_bytes=total)
+        elif total > 0:
+            update_status(task_id, progress=int((current / total) * 100), message=message)
+        else:
+            update_status(task_id, message=message)
+
+    try:
+        result = select_quality_and_download(
+            options['url'], cookies=cookies, output_dir=output_dir, merge=options['merge'],
+            video_quality_index=options['video_quality_index'],
+            audio_quality_index=options['audio_quality_index'],
+            filename=options['filename'],
+            progress_callback=progress_callback,
+            streaming=options['streaming'],
+            audio_only=options['audio_only'],
+            audio_format=options['audio_format'],
+            clip_start=options['clip_start'],
+            clip_end=options['clip_end'],
+            disk_wait_timeout=disk_wait_timeout,
+            cancel_event=cancel_event,
+            merge_timeout=merge_timeout,
+            profile=options['profile'],
+            embed_metadata=options['embed_metadata'],
+            danmaku=options['danmaku'],
+            subtitles=options['subtitles'],
+            preview=options['preview'],
+            extra_files=extra_files,
+            resume=options.get('resume', False),
+            name_tag=task_file_tag(task_id),
+            **(options['selection'] or {})
+        )
+        update_status(task_id, danmaku_path=extra_files.get('danmaku'),
+                      subtitle_files=extra_files.get('subtitles') or [],
+                      preview_info=extra_files.get('preview'),
+                      partial_files=extra_files.get('partial_files') or [])
+
+        if result and isinstance(result, str):
+            if discard_if_cancelled([result]):
+                return "cancelled"
+            if options['audio_only']:
+                update_status(task_id, status="completed", progress=100, message="音频下载完成", file_path=result, audio_path=result)
+            else:
+                update_status(task_id, status="completed", progress=100, message="下载完成", file_path=result)
+            return "completed"
+        if result and isinstance(result, tuple) and len(result) == 2 and all(result):
+            if discard_if_cancelled(result):
+                return "cancelled"
+            update_status(task_id, status="completed", progress=100, message="下载完成",
+                          video_path=result[0], audio_path=result[1])
+            return "completed"
+        if cancel_event.paused:
+            update_status(task_id, status="paused", message="任务已暂停，可通过恢复接口继续下载")
+            return "paused"
+        if cancel_event.is_set():
+            update_status(task_id, status="cancelled", progress=0, message="任务已取消")
+            return "cancelled"
+        update_status(task_id, status="failed", message="下载失败")
+        return "failed"
+    except Exception as e:
+        print(f"下载任务执行失败: {e}", flush=True)
+        update_status(task_id, status="failed", message=f"下载失败: {str(e)}", error=str(e))
+        return "failed"
+
+
+class Worker:
+    """
+    分布式模式下的下载工作节点
+
+    从共享任务队列认领任务并在本地线程中执行，执行过程中发送心跳；
+    API节点的取消和暂停请求随心跳取回。心跳超时的节点的任务由其他节点重新排队，
+    新节点从共享下载目录中已下载的部分文件继续。
+    """
+
+    def __init__(self, job_queue, concurrency=2, output_dir="downloads", cookie_file="cookies.txt", worker_id=None,
+                 heartbeat_interval=DEFAULT_HEARTBEAT_INTERVAL, stale_timeout=DEFAULT_STALE_TIMEOUT,
+                 disk_wait_timeout=DEFAULT_DISK_WAIT_TIMEOUT, merge_timeout=DEFAULT_MERGE_TIMEOUT):
+        self.job_queue = job_queue
+        self.concurrency = max(1, int(concurrency))
+        self.output_dir = output_dir
+        self.cookie_file = cookie_file
+        self.worker_id = worker_id or make_worker_id()
+        self.heartbeat_interval = heartbeat_interval
+        self.stale_timeout = stale_timeout
+        self.disk_wait_timeout = disk_wait_timeout
+        self.merge_timeout = merge_timeout
+        self.publisher = StatusPublisher(job_queue, worker_id=self.worker_id)
+        self.lock = threading.Lock()
+        self.running = {}
+        self.requested_stops = {}
+        self.stop_event = threading.Event()
+        # 退出时等执行中的任务全部结束后才停止心跳，否则等待期间其他节点会把仍在执行的任务重新排队
+        self.heartbeat_stop = threading.Event()
+
+    def load_cookies(self):
+        try:
+            return load_cookies_from_file(self.cookie_file)
+        except Exception as e:
+            print(f"加载cookies失败: {e}", flush=True)
+            return None
+
+    def _run_job(self, job, cancel_event):
+        task_id = job['task_id']
+        status = "failed"
+        try:
+            self.publisher.update(task_id, status="downloading", message="正在下载视频...", worker=self.worker_id)
+            status = run_download_job(task_id, job['payload'], self.load_cookies(), self.output_dir, self.publisher.update,
+                                      cancel_event, self.disk_wait_timeout, self.merge_timeout)
+        finally:
+            with self.lock:
+                self.running.pop(task_id, None)
+                requested = self.requested_stops.pop(task_id, None)
+            if requested == 'lost':
+                # 任务已被重新排队，由新认领的节点负责，不能再结束或放回
+                return
+            if self.stop_event.is_set() and status == "paused" and requested is None:
+                # 工作节点退出导致的暂停：放回队列，由其他节点继续
+                if self.job_queue.release(task_id, self.worker_id):
+                    return
+            self.job_queue.complete(task_id, self.worker_id)
+
+    def _heartbeat(self):
+        with self.lock:
+            task_ids = list(self.running)
+        stops, lost = self.job_queue.heartbeat(self.worker_id, task_ids, self.concurrency)
+        with self.lock:
+            for task_id in lost:
+                cancel_event = self.running.get(task_id)
+                if cancel_event is None or self.requested_stops.get(task_id) == 'lost':
+                    continue
+                # 心跳超时期间任务已被重新排队：停止本地执行。按暂停处理，
+                # 保留新认领的节点续传所用的部分文件；之后的状态更新不再发布
+                self.requested_stops[task_id] = 'lost'
+                cancel_event.pause()
+                print(f"任务 {task_id} 已不再由本节点认领（心跳超时后被重新排队），停止执行", flush=True)
+            for task_id, mode in stops.items():
+                cancel_event = self.running.get(task_id)
+                if cancel_event is None or task_id in self.requested_stops:
+                    continue
+                self.requested_stops[task_id] = mode
+                if mode == 'pause':
+                    cancel_event.pause()
+                else:
+                    cancel_event.cancel()
+                print(f"任务 {task_id} 收到{'暂停' if mode == 'pause' else '取消'}请求", flush=True)
+        requeued, failed = self.job_queue.requeue_stale(self.stale_timeout, DEFAULT_MAX_ATTEMPTS)
+        for task_id in requeued:
+            print(f"任务 {task_id} 所在的工作节点失联，已重新排队", flush=True)
+        for task_id in failed:
+            print(f"任务 {task_id} 多次因工作节点失联而中断，已标记为失败", flush=True)
+
+    def _heartbeat_loop(self):
+        while not self.heartbeat_stop.wait(self.heartbeat_interval):
+            try:
+                self._heartbeat()
+            except Exception as e:
+                print(f"发送心跳失败: {e}", flush=True)
+
+    def run(self):
+        """认领并执行任务，直到stop()被调用"""
+        print(f"工作节点 {self.worker_id} 已启动，并发数 {self.concurrency}", flush=True)
+        heartbeat_thread = threading.Thread(target=self._heartbeat_loop, name="worker-heartbeat", daemon=True)
+        heartbeat_thread.start()
+        threads = []
+        try:
+            while not self.stop_event.is_set():
+                with self.lock:
+                    has_capacity = len(self.running) < self.concurrency
+                job = None
+                if has_capacity:
+                    try:
+                        job = self.job_queue.claim(self.worker_id)
+                    except Exception as e:
+                        print(f"认领任务失败: {e}", flush=True)
+                if job is None:
+                    self.stop_event.wait(DEFAULT_POLL_INTERVAL)
+                    continue
+                cancel_event = CancelToken()
+                with self.lock:
+                    self.running[job['task_id']] = cancel_event
+                print(f"认领任务 {job['task_id']}{' (继续已下载的部分)' if job['payload'].get('resume') else ''}", flush=True)
+                thread = threading.Thread(target=self._run_job, args=(job, cancel_event), name=f"job-{job['task_id'][:8]}", daemon=True)
+                thread.start()
+                threads = [t for t in threads if t.is_alive()] + [thread]
+        except KeyboardInterrupt:
+            print("\n正在退出，执行中的任务将暂停并放回队列...", flush=True)
+            self.stop_event.set()
+
+        # 退出：暂停正在执行的任务，保留部分文件并放回队列；等待期间继续发送心跳
+        with self.lock:
+            for cancel_event in self.running.values():
+                cancel_event.pause()
+        for thread in threads:
+            thread.join()
+        self.heartbeat_stop.set()
+        heartbeat_thread.join()
+        self.publisher.close()
+        self.job_queue.close()
+        print(f"工作节点 {self.worker_id} 已退出", flush=True)
+
+    def stop(self):
+        self.stop_event.set()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="B站视频下载工作节点：从共享任务队列认领并执行下载任务")
+    parser.add_argument("--backend", choices=["sqlite", "redis"], default="sqlite", help="任务队列类型")
+    parser.add_argument("--db", default=os.path.join("downloads", "jobs.db"), help="SQLite任务队列路径")
+    parser.add_argument("--redis-url", default="redis://localhost:6379/0", help="Redis连接地址")
+    parser.add_argument("--concurrency", type=int, default=2, help="同时执行的任务数")
+    parser.add_argument("--output-dir", default="downloads", help="下载目录（与API服务共享）")
+    parser.add_argument("--cookies", default="cookies.txt", help="cookie文件路径")
+    parser.add_argument("--heartbeat", type=float, default=DEFAULT_HEARTBEAT_INTERVAL, help="心跳间隔（秒）")
+    parser.add_argument("--stale-timeout", type=float, default=DEFAULT_STALE_TIMEOUT, help="判定工作节点失联的心跳超时（秒）")
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    job_queue = create_job_queue(args.backend, path=args.db, url=args.redis_url)
+    worker = Worker(job_queue, concurrency=args.concurrency, output_dir=args.output_dir, cookie_file=args.cookies,
+                    heartbeat_interval=args.heartbeat, stale_timeout=args.stale_timeout)
+    worker.run()
+
+
+if __name__ == "__main__":
+    main()